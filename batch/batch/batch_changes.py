@@ -0,0 +1,119 @@
+from typing import Any, Awaitable, Callable, Dict, Iterator, List, Optional
+import asyncio
+import collections
+import contextlib
+import logging
+
+from hailtop.utils import secret_alnum_string
+
+log = logging.getLogger('batch_changes')
+
+
+class BatchChangeLog:
+    """The batches the driver has completed jobs of, most recent last, for
+    the front ends to follow with :class:`.BatchChangeListener`.
+
+    Each change has a sequence number. Only the last change of each of the
+    `max_batches` most recently changed batches is kept, so a listener that
+    falls further behind, or that followed another driver process (another
+    `epoch`), is told that any batch may have changed.
+    """
+
+    def __init__(self, *, max_batches: int = 100_000):
+        self.epoch = secret_alnum_string(10)
+        self.seq = 0
+        self.max_batches = max_batches
+        # batch id => the sequence number of its last change, oldest first
+        self._last_changes: 'collections.OrderedDict[int, int]' = collections.OrderedDict()
+        # changes after this one are all in _last_changes
+        self._min_seq = 0
+        self._changed = asyncio.Event()
+
+    def changed(self, batch_id: int):
+        self.seq += 1
+        self._last_changes.pop(batch_id, None)
+        self._last_changes[batch_id] = self.seq
+        while len(self._last_changes) > self.max_batches:
+            _, self._min_seq = self._last_changes.popitem(last=False)
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    def changes_since(self, epoch: Optional[str], seq: int) -> Optional[List[int]]:
+        """The batches changed after change `seq` of `epoch`, or None if they
+        are not known."""
+        if epoch != self.epoch or seq < self._min_seq or seq > self.seq:
+            return None
+        batch_ids = []
+        for batch_id, batch_seq in reversed(self._last_changes.items()):
+            if batch_seq <= seq:
+                break
+            batch_ids.append(batch_id)
+        return batch_ids
+
+    async def wait(self, epoch: Optional[str], seq: int, *, timeout: float, coalesce_secs: float) -> Dict[str, Any]:
+        """Wait up to `timeout` seconds for a change after change `seq` of
+        `epoch`. Changes in the `coalesce_secs` after the first are returned
+        with it."""
+        if epoch == self.epoch and seq == self.seq:
+            try:
+                await asyncio.wait_for(self._changed.wait(), timeout)
+                await asyncio.sleep(coalesce_secs)
+            except asyncio.TimeoutError:
+                pass
+        return {'epoch': self.epoch, 'seq': self.seq, 'batch_ids': self.changes_since(epoch, seq)}
+
+
+class BatchChangeListener:
+    """Follows the :class:`.BatchChangeLog` of the driver for a front end, so
+    requests can wait for a batch to change instead of polling the database.
+
+    `get_changes(epoch, seq)` requests the changes after change `seq` of
+    `epoch` from the driver. If it fails, every waiting request is woken
+    every `retry_secs`, so they fall back to polling.
+    """
+
+    def __init__(self,
+                 get_changes: Callable[[Optional[str], int], Awaitable[Dict[str, Any]]],
+                 *,
+                 retry_secs: float):
+        self.get_changes = get_changes
+        self.retry_secs = retry_secs
+        self.epoch: Optional[str] = None
+        self.seq = 0
+        self._subscribers: Dict[int, List[asyncio.Event]] = collections.defaultdict(list)
+
+    @contextlib.contextmanager
+    def subscribe(self, batch_id: int) -> Iterator[asyncio.Event]:
+        """An event that is set when batch `batch_id` may have changed."""
+        event = asyncio.Event()
+        self._subscribers[batch_id].append(event)
+        try:
+            yield event
+        finally:
+            subscribers = self._subscribers[batch_id]
+            subscribers.remove(event)
+            if not subscribers:
+                del self._subscribers[batch_id]
+
+    def _notify(self, batch_ids: Optional[List[int]]):
+        if batch_ids is None:
+            batch_ids = list(self._subscribers)
+        for batch_id in batch_ids:
+            for event in self._subscribers.get(batch_id, []):
+                event.set()
+
+    async def run(self):
+        while True:
+            try:
+                changes = await self.get_changes(self.epoch, self.seq)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                log.exception('while getting batch changes from the driver')
+                self.epoch = None
+                self._notify(None)
+                await asyncio.sleep(self.retry_secs)
+                continue
+            self._notify(changes['batch_ids'])
+            self.epoch = changes['epoch']
+            self.seq = changes['seq']
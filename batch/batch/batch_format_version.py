@@ -19,6 +19,9 @@ class BatchFormatVersion:
     def has_attempt_in_log_path(self):
         return self.format_version > 1
 
+    def has_chunked_logs(self):
+        return self.format_version > 6
+
     def db_spec(self, spec):
         if self.format_version == 1:
             return spec
@@ -2,7 +2,7 @@ import logging
 import math
 from typing import Tuple, Dict, List, Optional
 
-from ..globals import RESERVED_STORAGE_GB_PER_CORE
+from ..globals import RESERVED_IMAGE_STORAGE_GB, RESERVED_STORAGE_GB_PER_CORE
 from .azure.resource_utils import (azure_worker_memory_per_core_mib,
                                    azure_requested_to_actual_storage_bytes,
                                    azure_machine_type_to_worker_type_and_cores,
@@ -89,9 +89,8 @@ def adjust_cores_for_memory_request(cloud: str, cores_in_mcpu: int, memory_in_by
 
 
 def unreserved_worker_data_disk_size_gib(data_disk_size_gib: int, cores: int) -> int:
-    reserved_image_size = 30
     reserved_container_size = RESERVED_STORAGE_GB_PER_CORE * cores
-    return data_disk_size_gib - reserved_image_size - reserved_container_size
+    return data_disk_size_gib - RESERVED_IMAGE_STORAGE_GB - reserved_container_size
 
 
 def requested_storage_bytes_to_actual_storage_gib(cloud: str, storage_bytes: int, allow_zero_storage: bool) -> Optional[int]:
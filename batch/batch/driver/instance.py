@@ -194,6 +194,16 @@ VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s);
 
         await retry_transient_errors(make_request)
 
+    async def prefetch_images(self, images):
+        try:
+            async with self.client_session.post(
+                    f'http://{self.ip_address}:5000/api/v1alpha/images/prefetch',
+                    json={'images': images},
+                    timeout=aiohttp.ClientTimeout(total=5)):
+                pass
+        except Exception:
+            log.info(f'could not prefetch images on {self}', exc_info=True)
+
     async def mark_deleted(self, reason, timestamp):
         if self._state == 'deleted':
             return
@@ -1,4 +1,4 @@
-from typing import Optional
+from typing import Any, Dict, List, Optional
 import sortedcontainers
 import logging
 import asyncio
@@ -20,15 +20,18 @@ from hailtop.utils import (
 
 from ...batch_configuration import STANDING_WORKER_MAX_IDLE_TIME_MSECS
 from ...inst_coll_config import PoolConfig
-from ...utils import Box, ExceededSharesCounter
+from ...utils import ExceededSharesCounter
 from ..instance import Instance
 from ..resource_manager import CloudResourceManager
-from ..job import schedule_job
+from ..job import schedule_jobs
+from ..packing import InstancePacker, pack_jobs
 
 from .base import InstanceCollectionManager, InstanceCollection
 
 log = logging.getLogger('pool')
 
+MAX_PREFETCH_INSTANCES_PER_IMAGE = 10
+
 
 class Pool(InstanceCollection):
     @staticmethod
@@ -139,20 +142,22 @@ class Pool(InstanceCollection):
         if instance.state == 'active' and instance.failed_request_count <= 1:
             self.healthy_instances_by_free_cores.add(instance)
 
-    def get_instance(self, user, cores_mcpu):
-        i = self.healthy_instances_by_free_cores.bisect_key_left(cores_mcpu)
-        while i < len(self.healthy_instances_by_free_cores):
-            instance = self.healthy_instances_by_free_cores[i]
-            assert cores_mcpu <= instance.free_cores_mcpu
-            if user != 'ci' or (user == 'ci' and instance.location == self._default_location()):
-                return instance
-            i += 1
-        histogram = collections.defaultdict(int)
-        for instance in self.healthy_instances_by_free_cores:
-            histogram[instance.free_cores_mcpu] += 1
-        log.info(f'schedule {self}: no viable instances for {cores_mcpu}: {histogram}')
-
-        return None
+    def instance_packer(self) -> InstancePacker[Instance]:
+        return InstancePacker(
+            (instance, instance.free_cores_mcpu, instance.location) for instance in self.healthy_instances_by_free_cores
+        )
+
+    async def prefetch_images(self, n_ready_jobs_by_image: Dict[str, int]):
+        """Have the healthy instances with the most free cores pull the images of
+        Ready jobs before the jobs are scheduled on them, one instance per job
+        and at most MAX_PREFETCH_INSTANCES_PER_IMAGE instances per image."""
+        instances = list(reversed(self.healthy_instances_by_free_cores))
+        images_by_instance: Dict[Instance, List[str]] = collections.defaultdict(list)
+        for image, n_ready_jobs in n_ready_jobs_by_image.items():
+            for instance in instances[: min(n_ready_jobs, MAX_PREFETCH_INSTANCES_PER_IMAGE)]:
+                images_by_instance[instance].append(image)
+        log.info(f'prefetching {len(n_ready_jobs_by_image)} images on {len(images_by_instance)} instances of {self}')
+        await asyncio.gather(*[instance.prefetch_images(images) for instance, images in images_by_instance.items()])
 
     async def create_instance(self,
                               cores: int,
@@ -354,6 +359,51 @@ HAVING n_ready_jobs + n_running_jobs > 0;
 
         return result
 
+    async def runnable_jobs(self, user_share: Dict[str, int]) -> Dict[str, List[dict]]:
+        """Fetch up to `user_share[user]` Ready jobs of the running batches of
+        each user in one query. Jobs that run even if their batch is
+        cancelled come first."""
+        runnable_jobs: Dict[str, List[dict]] = {user: [] for user in user_share}
+        if not user_share:
+            return runnable_jobs
+
+        subqueries = []
+        args = []
+        for user, share in user_share.items():
+            subqueries.append(
+                '''
+(SELECT jobs.batch_id, jobs.job_id, jobs.spec, jobs.cores_mcpu,
+   batches.userdata, batches.user, batches.format_version
+ FROM batches
+ STRAIGHT_JOIN jobs FORCE INDEX(jobs_batch_id_state_always_run_inst_coll_cancelled)
+   ON jobs.batch_id = batches.id
+ WHERE batches.user = %s AND batches.`state` = 'running'
+   AND jobs.state = 'Ready' AND jobs.always_run = 1 AND jobs.inst_coll = %s
+ LIMIT %s)
+UNION ALL
+(SELECT jobs.batch_id, jobs.job_id, jobs.spec, jobs.cores_mcpu,
+   batches.userdata, batches.user, batches.format_version
+ FROM batches
+ STRAIGHT_JOIN jobs FORCE INDEX(jobs_batch_id_state_always_run_cancelled)
+   ON jobs.batch_id = batches.id
+ WHERE batches.user = %s AND batches.`state` = 'running' AND NOT batches.cancelled
+   AND jobs.state = 'Ready' AND jobs.always_run = 0 AND jobs.inst_coll = %s AND jobs.cancelled = 0
+ LIMIT %s)
+'''
+            )
+            args.extend([user, self.pool.name, share, user, self.pool.name, share])
+
+        async for record in self.db.select_and_fetchall(
+            '\nUNION ALL\n'.join(subqueries) + ';',
+            args,
+            timer_description=f'in schedule {self.pool}: get runnable jobs',
+        ):
+            jobs = runnable_jobs[record['user']]
+            if len(jobs) < user_share[record['user']]:
+                jobs.append(record)
+
+        return runnable_jobs
+
     async def schedule_loop_body(self):
         if self.app['frozen']:
             log.info(f'not scheduling any jobs for {self.pool}; batch is frozen')
@@ -361,7 +411,6 @@ HAVING n_ready_jobs + n_running_jobs > 0;
 
         log.info(f'schedule {self.pool}: starting')
         start = time_msecs()
-        n_scheduled = 0
 
         user_resources = await self.compute_fair_share()
 
@@ -375,97 +424,65 @@ HAVING n_ready_jobs + n_running_jobs > 0;
             for user, resources in user_resources.items()
         }
 
-        async def user_runnable_jobs(user, remaining):
-            async for batch in self.db.select_and_fetchall(
-                '''
-SELECT id, cancelled, userdata, user, format_version
-FROM batches
-WHERE user = %s AND `state` = 'running';
-''',
-                (user,),
-                timer_description=f'in schedule {self.pool}: get {user} running batches',
-            ):
-                async for record in self.db.select_and_fetchall(
-                    '''
-SELECT job_id, spec, cores_mcpu
-FROM jobs FORCE INDEX(jobs_batch_id_state_always_run_inst_coll_cancelled)
-WHERE batch_id = %s AND state = 'Ready' AND always_run = 1 AND inst_coll = %s
-LIMIT %s;
-''',
-                    (batch['id'], self.pool.name, remaining.value),
-                    timer_description=f'in schedule {self.pool}: get {user} batch {batch["id"]} runnable jobs (1)',
-                ):
-                    record['batch_id'] = batch['id']
-                    record['userdata'] = batch['userdata']
-                    record['user'] = batch['user']
-                    record['format_version'] = batch['format_version']
-                    yield record
-                if not batch['cancelled']:
-                    async for record in self.db.select_and_fetchall(
-                        '''
-SELECT job_id, spec, cores_mcpu
-FROM jobs FORCE INDEX(jobs_batch_id_state_always_run_cancelled)
-WHERE batch_id = %s AND state = 'Ready' AND always_run = 0 AND inst_coll = %s AND cancelled = 0
-LIMIT %s;
-''',
-                        (batch['id'], self.pool.name, remaining.value),
-                        timer_description=f'in schedule {self.pool}: get {user} batch {batch["id"]} runnable jobs (2)',
-                    ):
-                        record['batch_id'] = batch['id']
-                        record['userdata'] = batch['userdata']
-                        record['user'] = batch['user']
-                        record['format_version'] = batch['format_version']
-                        yield record
-
-        waitable_pool = WaitableSharedPool(self.async_worker_pool)
+        runnable_jobs = await self.runnable_jobs(user_share)
 
-        should_wait = True
+        # place each user's jobs in turn, in fair share order, so a user's
+        # share bounds the cores of the jobs actually placed for them
+        packer = self.pool.instance_packer()
+        default_location = self.pool._default_location()
+        placed = []
+        n_unplaced = 0
         for user, resources in user_resources.items():
             allocated_cores_mcpu = resources['allocated_cores_mcpu']
             if allocated_cores_mcpu == 0:
                 continue
 
-            scheduled_cores_mcpu = 0
             share = user_share[user]
 
             log.info(f'schedule {self.pool}: user-share: {user}: {allocated_cores_mcpu} {share}')
 
-            remaining = Box(share)
-            async for record in user_runnable_jobs(user, remaining):
-                batch_id = record['batch_id']
-                job_id = record['job_id']
-                id = (batch_id, job_id)
-                attempt_id = secret_alnum_string(6)
-                record['attempt_id'] = attempt_id
-
+            def admit(record, scheduled_cores_mcpu, allocated_cores_mcpu=allocated_cores_mcpu):
                 if scheduled_cores_mcpu + record['cores_mcpu'] > allocated_cores_mcpu:
                     if random.random() > self.exceeded_shares_counter.rate():
                         self.exceeded_shares_counter.push(True)
                         self.scheduler_state_changed.set()
-                        break
+                        return False
                     self.exceeded_shares_counter.push(False)
+                return True
+
+            user_placed, user_unplaced = pack_jobs(
+                packer,
+                runnable_jobs[user],
+                cores_mcpu=lambda record: record['cores_mcpu'],
+                location=lambda record: default_location if record['user'] == 'ci' else None,
+                admit=admit,
+            )
+            placed.extend(user_placed)
+            n_unplaced += len(user_unplaced)
+        if n_unplaced:
+            log.info(f'schedule {self.pool}: did not place {n_unplaced} jobs: {dict(packer.histogram())}')
+
+        records_by_instance: Dict[Instance, List[Dict[str, Any]]] = collections.defaultdict(list)
+        for record, instance in placed:
+            record['attempt_id'] = secret_alnum_string(6)
+            records_by_instance[instance].append(record)
+        for instance, records in records_by_instance.items():
+            instance.adjust_free_cores_in_memory(-sum(record['cores_mcpu'] for record in records))
+
+        async def schedule_with_error_handling(app, records, instance):
+            try:
+                await schedule_jobs(app, records, instance)
+            except Exception:
+                log.info(f'scheduling {len(records)} jobs on {instance} for {self.pool}', exc_info=True)
 
-                instance = self.pool.get_instance(user, record['cores_mcpu'])
-                if instance:
-                    instance.adjust_free_cores_in_memory(-record['cores_mcpu'])
-                    scheduled_cores_mcpu += record['cores_mcpu']
-                    n_scheduled += 1
-                    should_wait = False
-
-                    async def schedule_with_error_handling(app, record, id, instance):
-                        try:
-                            await schedule_job(app, record, instance)
-                        except Exception:
-                            log.info(f'scheduling job {id} on {instance} for {self.pool}', exc_info=True)
-
-                    await waitable_pool.call(schedule_with_error_handling, self.app, record, id, instance)
-
-                remaining.value -= 1
-                if remaining.value <= 0:
-                    break
-
+        waitable_pool = WaitableSharedPool(self.async_worker_pool)
+        for instance, records in records_by_instance.items():
+            await waitable_pool.call(schedule_with_error_handling, self.app, records, instance)
         await waitable_pool.wait()
 
+        n_scheduled = len(placed)
+        should_wait = n_scheduled == 0
+
         end = time_msecs()
         log.info(f'schedule: scheduled {n_scheduled} jobs in {end - start}ms for {self.pool}')
 
@@ -9,9 +9,10 @@ import traceback
 from hailtop.aiotools import BackgroundTaskManager
 from hailtop.utils import time_msecs, Notice, retry_transient_errors
 from hailtop import httpx
-from gear import Database
+from gear import Database, transaction
 
 from ..batch import batch_record_to_dict
+from ..batch_changes import BatchChangeLog
 from ..globals import complete_states, tasks, STATUS_FORMAT_VERSION
 from ..batch_configuration import KUBERNETES_SERVER_URL
 from ..batch_format_version import BatchFormatVersion
@@ -19,6 +20,7 @@ from ..spec_writer import SpecWriter
 from ..file_store import FileStore
 from ..instance_config import QuantifiedResource
 from .instance import Instance
+from .worker_jobs import create_jobs_on_worker
 
 from .k8s_cache import K8sCache
 
@@ -68,23 +70,41 @@ GROUP BY batches.id;
 
 
 async def add_attempt_resources(db, batch_id, job_id, attempt_id, resources):
-    if attempt_id:
-        try:
-            resource_args = [
-                (batch_id, job_id, attempt_id, resource['name'], resource['quantity']) for resource in resources
-            ]
+    await add_attempts_resources(db, [(batch_id, job_id, attempt_id, resources)])
 
-            await db.execute_many(
-                '''
+
+async def add_attempts_resources(db, attempts):
+    resource_args = [
+        (batch_id, job_id, attempt_id, resource['name'], resource['quantity'])
+        for batch_id, job_id, attempt_id, resources in attempts
+        if attempt_id
+        for resource in (resources or [])
+    ]
+    if not resource_args:
+        return
+
+    try:
+        await db.execute_many(
+            '''
 INSERT INTO `attempt_resources` (batch_id, job_id, attempt_id, resource, quantity)
 VALUES (%s, %s, %s, %s, %s)
 ON DUPLICATE KEY UPDATE quantity = quantity;
 ''',
-                resource_args,
-            )
-        except Exception:
-            log.exception(f'error while inserting resources for job {id}, attempt {attempt_id}')
-            raise
+            resource_args,
+        )
+    except Exception:
+        attempt_ids = [(batch_id, job_id, attempt_id) for batch_id, job_id, attempt_id, _ in attempts]
+        log.exception(f'error while inserting resources for attempts {attempt_ids}')
+        raise
+
+
+def job_state_from_worker_state(state: str) -> str:
+    if state == 'succeeded':
+        return 'Success'
+    if state == 'error':
+        return 'Error'
+    assert state == 'failed', state
+    return 'Failed'
 
 
 async def mark_job_complete(
@@ -152,6 +172,9 @@ async def mark_job_complete(
 
     log.info(f'job {id} changed state: {rv["old_state"]} => {new_state}')
 
+    batch_change_log: BatchChangeLog = app['batch_change_log']
+    batch_change_log.changed(batch_id)
+
     await notify_batch_job_complete(db, client_session, batch_id)
 
     if instance and not instance.inst_coll.is_pool and instance.state == 'active':
@@ -182,6 +205,140 @@ CALL mark_job_started(%s, %s, %s, %s, %s);
     await add_attempt_resources(db, batch_id, job_id, attempt_id, resources)
 
 
+# statuses applied in one transaction, so that the row locks of only a few
+# jobs are held at a time
+MAX_STATUSES_PER_TRANSACTION = 20
+
+
+def validate_job_statuses(started: List[dict], complete: List[dict]):
+    """Raise a ValueError unless `started` and `complete` are statuses as
+    posted by workers, so a bad status is rejected rather than failing
+    the transaction of the statuses posted with it."""
+    for job_status in started + complete:
+        if not isinstance(job_status, dict):
+            raise ValueError(f'job status is not an object: {job_status!r}')
+        for key in ('batch_id', 'job_id'):
+            if not isinstance(job_status.get(key), int):
+                raise ValueError(f'job status has no integer {key}: {job_status!r}')
+        if not isinstance(job_status.get('attempt_id'), str):
+            raise ValueError(f'job status has no attempt_id: {job_status!r}')
+        if not isinstance(job_status.get('start_time'), (int, type(None))):
+            raise ValueError(f'job status has an invalid start_time: {job_status!r}')
+    for job_status in complete:
+        if job_status.get('state') not in ('succeeded', 'error', 'failed'):
+            raise ValueError(f'job status has an invalid state: {job_status!r}')
+        if not isinstance(job_status.get('end_time'), (int, type(None))):
+            raise ValueError(f'job status has an invalid end_time: {job_status!r}')
+        if 'status' not in job_status:
+            raise ValueError(f'job status has no status: {job_status!r}')
+
+
+async def mark_job_statuses(app, instance: Instance, started: List[dict], complete: List[dict]):
+    """Mark the jobs of `started` started and those of `complete` complete, as
+    reported together by the worker of `instance`, in transactions of at most
+    `MAX_STATUSES_PER_TRANSACTION` statuses.
+
+    Statuses are applied in job order, so concurrent calls take their row
+    locks in the same order, and started statuses before complete ones.
+    Marking a job started or complete again does nothing, so the worker may
+    post all of them again if a later transaction fails."""
+
+    def job_order(job_status):
+        return (job_status['batch_id'], job_status['job_id'])
+
+    started = sorted(started, key=job_order)
+    complete = sorted(complete, key=job_order)
+
+    log.info(f'marking {len(started)} jobs started and {len(complete)} jobs complete on {instance}')
+
+    n = MAX_STATUSES_PER_TRANSACTION
+    for i in range(0, len(started), n):
+        await _mark_job_statuses_in_transaction(app, instance, started[i:i + n], [])
+    for i in range(0, len(complete), n):
+        await _mark_job_statuses_in_transaction(app, instance, [], complete[i:i + n])
+
+
+async def _mark_job_statuses_in_transaction(app, instance: Instance, started: List[dict], complete: List[dict]):
+    scheduler_state_changed: Notice = app['scheduler_state_changed']
+    cancel_ready_state_changed: asyncio.Event = app['cancel_ready_state_changed']
+    db: Database = app['db']
+    client_session: httpx.ClientSession = app['client_session']
+    task_manager: BackgroundTaskManager = app['task_manager']
+
+    started_args = [
+        {
+            'batch_id': job_status['batch_id'],
+            'job_id': job_status['job_id'],
+            'attempt_id': job_status['attempt_id'],
+            'start_time': job_status['start_time'],
+        }
+        for job_status in started
+    ]
+    complete_args = [
+        {
+            'batch_id': job_status['batch_id'],
+            'job_id': job_status['job_id'],
+            'attempt_id': job_status['attempt_id'],
+            'state': job_state_from_worker_state(job_status['state']),
+            'status': json.dumps(job_status['status']) if job_status['status'] is not None else None,
+            'start_time': job_status['start_time'],
+            'end_time': job_status['end_time'],
+            'reason': 'completed',
+        }
+        for job_status in complete
+    ]
+
+    try:
+        rv = await db.execute_and_fetchone(
+            'CALL mark_job_statuses(%s, %s, %s, %s);',
+            (instance.name, json.dumps(started_args), json.dumps(complete_args), time_msecs()),
+        )
+    except Exception:
+        log.exception(f'error while marking job statuses on {instance}')
+        raise
+
+    started_results = json.loads(rv['started_results'])
+    complete_results = json.loads(rv['complete_results'])
+
+    if complete:
+        scheduler_state_changed.notify()
+        cancel_ready_state_changed.set()
+
+    delta_cores_mcpu = sum(result['delta_cores_mcpu'] for result in started_results + complete_results)
+    if delta_cores_mcpu != 0 and instance.state == 'active':
+        instance.adjust_free_cores_in_memory(delta_cores_mcpu)
+
+    await add_attempts_resources(
+        db,
+        [
+            (job_status['batch_id'], job_status['job_id'], job_status['attempt_id'], job_status.get('resources'))
+            for job_status in started + complete
+        ],
+    )
+
+    completed_batch_ids = []
+    for job_status, args, result in zip(complete, complete_args, complete_results):
+        id = (job_status['batch_id'], job_status['job_id'])
+        if result['rc'] != 0:
+            log.info(f'mark_job_complete returned {result} for job {id}')
+            continue
+        old_state = result['old_state']
+        if old_state in complete_states:
+            log.info(f'old_state {old_state} complete for job {id}, doing nothing')
+            continue
+        log.info(f'job {id} changed state: {old_state} => {args["state"]}')
+        if job_status['batch_id'] not in completed_batch_ids:
+            completed_batch_ids.append(job_status['batch_id'])
+
+    batch_change_log: BatchChangeLog = app['batch_change_log']
+    for batch_id in completed_batch_ids:
+        batch_change_log.changed(batch_id)
+        await notify_batch_job_complete(db, client_session, batch_id)
+
+    if completed_batch_ids and not instance.inst_coll.is_pool and instance.state == 'active':
+        task_manager.ensure_future(instance.kill())
+
+
 async def mark_job_creating(app,
                             batch_id: int,
                             job_id: int,
@@ -393,47 +550,73 @@ users:
     }
 
 
+async def job_config_or_error(app, record, instance):
+    """Make the config of the job in `record` for `instance`. If that fails, the
+    job is marked complete with state Error and the exception is re-raised."""
+    file_store: FileStore = app['file_store']
+
+    batch_id = record['batch_id']
+    job_id = record['job_id']
+    attempt_id = record['attempt_id']
+    format_version = BatchFormatVersion(record['format_version'])
+
+    try:
+        return await job_config(app, record, attempt_id)
+    except Exception:
+        log.exception('while making job config')
+        status = {
+            'version': STATUS_FORMAT_VERSION,
+            'worker': None,
+            'batch_id': batch_id,
+            'job_id': job_id,
+            'attempt_id': attempt_id,
+            'user': record['user'],
+            'state': 'error',
+            'error': traceback.format_exc(),
+            'container_statuses': {k: None for k in tasks},
+        }
+
+        if format_version.has_full_status_in_gcs():
+            await file_store.write_status_file(batch_id, job_id, attempt_id, json.dumps(status))
+
+        db_status = format_version.db_status(status)
+        resources = []
+
+        await mark_job_complete(
+            app, batch_id, job_id, attempt_id, instance.name, 'Error', db_status, None, None, 'error', resources
+        )
+        raise
+
+
+def log_schedule_job_result(record, instance, rv):
+    id = (record['batch_id'], record['job_id'])
+
+    if rv['delta_cores_mcpu'] != 0 and instance.state == 'active':
+        instance.adjust_free_cores_in_memory(rv['delta_cores_mcpu'])
+
+    log.info(f'schedule job {id} on {instance}: updated database')
+
+    if rv['rc'] != 0:
+        log.info(f'could not schedule job {id}, attempt {record["attempt_id"]} on {instance}, {rv}')
+        return
+
+    log.info(f'success scheduling job {id} on {instance}')
+
+
 async def schedule_job(app, record, instance):
     assert instance.state == 'active'
 
-    file_store: FileStore = app['file_store']
     db: Database = app['db']
     client_session: httpx.ClientSession = app['client_session']
 
     batch_id = record['batch_id']
     job_id = record['job_id']
     attempt_id = record['attempt_id']
-    format_version = BatchFormatVersion(record['format_version'])
 
     id = (batch_id, job_id)
 
     try:
-        try:
-            body = await job_config(app, record, attempt_id)
-        except Exception:
-            log.exception('while making job config')
-            status = {
-                'version': STATUS_FORMAT_VERSION,
-                'worker': None,
-                'batch_id': batch_id,
-                'job_id': job_id,
-                'attempt_id': attempt_id,
-                'user': record['user'],
-                'state': 'error',
-                'error': traceback.format_exc(),
-                'container_statuses': {k: None for k in tasks},
-            }
-
-            if format_version.has_full_status_in_gcs():
-                await file_store.write_status_file(batch_id, job_id, attempt_id, json.dumps(status))
-
-            db_status = format_version.db_status(status)
-            resources = []
-
-            await mark_job_complete(
-                app, batch_id, job_id, attempt_id, instance.name, 'Error', db_status, None, None, 'error', resources
-            )
-            raise
+        body = await job_config_or_error(app, record, instance)
 
         log.info(f'schedule job {id} on {instance}: made job config')
 
@@ -468,13 +651,107 @@ CALL schedule_job(%s, %s, %s, %s);
             instance.adjust_free_cores_in_memory(record['cores_mcpu'])
         return
 
-    if rv['delta_cores_mcpu'] != 0 and instance.state == 'active':
-        instance.adjust_free_cores_in_memory(rv['delta_cores_mcpu'])
+    log_schedule_job_result(record, instance, rv)
 
-    log.info(f'schedule job {id} on {instance}: updated database')
 
-    if rv['rc'] != 0:
-        log.info(f'could not schedule job {id}, attempt {attempt_id} on {instance}, {rv}')
+async def schedule_jobs(app, records, instance):
+    """Schedule the jobs in `records`, all placed on `instance`, with one
+    request to the worker and one database transaction."""
+    assert instance.state == 'active'
+
+    db: Database = app['db']
+    client_session: httpx.ClientSession = app['client_session']
+
+    def release_cores(record):
+        if instance.state == 'active':
+            instance.adjust_free_cores_in_memory(record['cores_mcpu'])
+
+    bodies = await asyncio.gather(
+        *[job_config_or_error(app, record, instance) for record in records], return_exceptions=True
+    )
+
+    configured = []
+    for record, body in zip(records, bodies):
+        id = (record['batch_id'], record['job_id'])
+        if isinstance(body, BaseException):
+            log.error(f'error while scheduling job {id} on {instance}', exc_info=body)
+            release_cores(record)
+        else:
+            configured.append((record, body))
+
+    if not configured:
         return
 
-    log.info(f'success scheduling job {id} on {instance}')
+    log.info(f'schedule {len(configured)} jobs on {instance}: made job configs')
+
+    try:
+        statuses = await create_jobs_on_worker(client_session, instance, [body for _, body in configured])
+        await instance.mark_healthy()
+    except aiohttp.ClientResponseError:
+        await instance.mark_healthy()
+        log.exception(f'error while scheduling {len(configured)} jobs on {instance}')
+        for record, _ in configured:
+            release_cores(record)
+        return
+    except Exception:
+        await instance.incr_failed_request_count()
+        log.exception(f'error while scheduling {len(configured)} jobs on {instance}')
+        for record, _ in configured:
+            release_cores(record)
+        return
+
+    created = []
+    for (record, _), status in zip(configured, statuses):
+        id = (record['batch_id'], record['job_id'])
+        if status == 200:
+            created.append(record)
+            continue
+        if status == 403:
+            log.info(f'attempt already exists for job {id} on {instance}, aborting')
+        elif status == 503:
+            log.info(f'job {id} cannot be scheduled because {instance} is shutting down, aborting')
+        else:
+            log.info(f'could not create job {id} on {instance}: status {status}')
+        release_cores(record)
+
+    if not created:
+        return
+
+    log.info(f'schedule {len(created)} jobs on {instance}: called create jobs')
+
+    @transaction(db)
+    async def update_database(tx):
+        return [
+            await tx.execute_and_fetchone(
+                '''
+CALL schedule_job_in_transaction(%s, %s, %s, %s);
+''',
+                (record['batch_id'], record['job_id'], record['attempt_id'], instance.name),
+            )
+            for record in created
+        ]
+
+    try:
+        rvs = await update_database()  # pylint: disable=no-value-for-parameter
+    except Exception:
+        # one failing job rolls back the whole transaction, so record the
+        # jobs one at a time rather than lose all of them
+        log.exception(f'error while scheduling {len(created)} jobs on {instance}, retrying one job at a time')
+        for record in created:
+            id = (record['batch_id'], record['job_id'])
+            try:
+                rv = await db.execute_and_fetchone(
+                    '''
+CALL schedule_job(%s, %s, %s, %s);
+''',
+                    (record['batch_id'], record['job_id'], record['attempt_id'], instance.name),
+                )
+            except Exception:
+                log.exception(f'error while scheduling job {id} on {instance}')
+                release_cores(record)
+                continue
+            log_schedule_job_result(record, instance, rv)
+        return
+
+    for record, rv in zip(created, rvs):
+        log_schedule_job_result(record, instance, rv)
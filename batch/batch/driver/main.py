@@ -40,6 +40,7 @@ import uvloop
 
 from ..file_store import FileStore
 from ..batch import cancel_batch_in_db
+from ..batch_changes import BatchChangeLog
 from ..batch_configuration import (
     CLOUD,
     REFRESH_INTERVAL_IN_SECONDS,
@@ -55,7 +56,13 @@ from ..inst_coll_config import InstanceCollectionConfigs, PoolConfig
 
 from .canceller import Canceller
 from .instance_collection import InstanceCollectionManager, JobPrivateInstanceManager
-from .job import mark_job_complete, mark_job_started
+from .job import (
+    job_state_from_worker_state,
+    mark_job_complete,
+    mark_job_started,
+    mark_job_statuses,
+    validate_job_statuses,
+)
 from .k8s_cache import K8sCache
 from .instance_collection import Pool
 from .driver import CloudDriver
@@ -78,6 +85,11 @@ routes = web.RouteTableDef()
 
 deploy_config = get_deploy_config()
 
+# the front ends wait this long for batch changes, and changes in the second
+# after the first are sent with it
+BATCH_CHANGES_TIMEOUT_SECS = 30
+BATCH_CHANGES_COALESCE_SECS = 1
+
 
 def ignore_failed_to_collect_and_upload_profile(record):
     if 'Failed to collect and upload profile: [Errno 32] Broken pipe' in record.msg:
@@ -206,12 +218,35 @@ SELECT state FROM batches WHERE user = %s AND id = %s;
     return web.Response()
 
 
+@routes.post('/api/v1alpha/inst_colls/{inst_coll}/prefetch_images')
+@batch_only
+async def prefetch_images(request):
+    inst_coll_manager: InstanceCollectionManager = request.app['driver'].inst_coll_manager
+    pool = inst_coll_manager.pools.get(request.match_info['inst_coll'])
+    if pool:
+        body = await request.json()
+        request.app['task_manager'].ensure_future(pool.prefetch_images(body['n_ready_jobs_by_image']))
+    return web.Response()
+
+
 def set_cancel_state_changed(app):
     app['cancel_running_state_changed'].set()
     app['cancel_creating_state_changed'].set()
     app['cancel_ready_state_changed'].set()
 
 
+@routes.get('/api/v1alpha/batches/changes')
+@batch_only
+async def get_batch_changes(request):
+    batch_change_log: BatchChangeLog = request.app['batch_change_log']
+    epoch = request.query.get('epoch')
+    seq = int(request.query.get('seq', 0))
+    changes = await batch_change_log.wait(
+        epoch, seq, timeout=BATCH_CHANGES_TIMEOUT_SECS, coalesce_secs=BATCH_CHANGES_COALESCE_SECS
+    )
+    return web.json_response(changes)
+
+
 @routes.post('/api/v1alpha/batches/cancel')
 @batch_only
 async def cancel_batch(request):
@@ -294,14 +329,7 @@ async def job_complete_1(request, instance):
     job_id = job_status['job_id']
     attempt_id = job_status['attempt_id']
 
-    state = job_status['state']
-    if state == 'succeeded':
-        new_state = 'Success'
-    elif state == 'error':
-        new_state = 'Error'
-    else:
-        assert state == 'failed', state
-        new_state = 'Failed'
+    new_state = job_state_from_worker_state(job_status['state'])
 
     start_time = job_status['start_time']
     end_time = job_status['end_time']
@@ -356,6 +384,28 @@ async def job_started(request, instance):
     return await asyncio.shield(job_started_1(request, instance))
 
 
+async def job_statuses_1(request, instance):
+    body = await request.json()
+    try:
+        started, complete = body['started'], body['complete']
+        validate_job_statuses(started, complete)
+    except (KeyError, TypeError, ValueError) as e:
+        log.warning(f'invalid job statuses from {instance}: {e}')
+        raise web.HTTPBadRequest(reason=str(e))
+
+    await mark_job_statuses(request.app, instance, started, complete)
+
+    await instance.mark_healthy()
+
+    return web.Response()
+
+
+@routes.post('/api/v1alpha/instances/job_statuses')
+@active_instances_only
+async def job_statuses(request, instance):
+    return await asyncio.shield(job_statuses_1(request, instance))
+
+
 @routes.get('/')
 @routes.get('')
 @web_authenticated_developers_only()
@@ -1125,6 +1175,8 @@ SELECT instance_id, internal_token, frozen FROM globals;
     scheduler_state_changed = Notice()
     app['scheduler_state_changed'] = scheduler_state_changed
 
+    app['batch_change_log'] = BatchChangeLog()
+
     cancel_ready_state_changed = asyncio.Event()
     app['cancel_ready_state_changed'] = cancel_ready_state_changed
 
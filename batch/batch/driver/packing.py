@@ -0,0 +1,100 @@
+from typing import Any, Callable, Dict, Generic, Hashable, Iterable, List, Optional, Tuple, TypeVar
+import collections
+
+import sortedcontainers
+
+T = TypeVar('T', bound=Hashable)
+J = TypeVar('J')
+
+
+class InstancePacker(Generic[T]):
+    """Places jobs on the free cores of a set of instances.
+
+    Each job is placed on the instance with the fewest free cores that still
+    fit it (best fit). Instances are kept sorted by free cores, overall and
+    for each location, so a placement, with or without a location
+    constraint, is a bisection and not a scan.
+    """
+
+    def __init__(self, instances: Iterable[Tuple[T, int, str]]):
+        # entries are (free_cores_mcpu, seq, instance); seq breaks ties
+        # without comparing instances
+        self._free_cores_mcpu: Dict[T, int] = {}
+        self._seq: Dict[T, int] = {}
+        self._location: Dict[T, str] = {}
+        self._by_free_cores = sortedcontainers.SortedList()
+        self._by_location_and_free_cores: Dict[str, sortedcontainers.SortedList] = collections.defaultdict(
+            sortedcontainers.SortedList
+        )
+        for seq, (instance, free_cores_mcpu, location) in enumerate(instances):
+            self._free_cores_mcpu[instance] = free_cores_mcpu
+            self._seq[instance] = seq
+            self._location[instance] = location
+            entry = (free_cores_mcpu, seq, instance)
+            self._by_free_cores.add(entry)
+            self._by_location_and_free_cores[location].add(entry)
+
+    def free_cores_mcpu(self, instance: T) -> int:
+        return self._free_cores_mcpu[instance]
+
+    def place(self, cores_mcpu: int, location: Optional[str] = None) -> Optional[T]:
+        """Reserve `cores_mcpu` on the best fitting instance, in `location` if
+        given, and return it, or return ``None`` if no instance fits."""
+        if location is None:
+            entries = self._by_free_cores
+        else:
+            entries = self._by_location_and_free_cores.get(location)
+            if not entries:
+                return None
+        i = entries.bisect_left((cores_mcpu,))
+        if i == len(entries):
+            return None
+        free_cores_mcpu, seq, instance = entries[i]
+        entry = (free_cores_mcpu, seq, instance)
+        new_entry = (free_cores_mcpu - cores_mcpu, seq, instance)
+        self._by_free_cores.remove(entry)
+        self._by_free_cores.add(new_entry)
+        by_location = self._by_location_and_free_cores[self._location[instance]]
+        by_location.remove(entry)
+        by_location.add(new_entry)
+        self._free_cores_mcpu[instance] = free_cores_mcpu - cores_mcpu
+        return instance
+
+    def histogram(self) -> Dict[int, int]:
+        histogram: Dict[int, int] = collections.defaultdict(int)
+        for free_cores_mcpu in self._free_cores_mcpu.values():
+            histogram[free_cores_mcpu] += 1
+        return histogram
+
+
+def pack_jobs(
+    packer: InstancePacker[T],
+    jobs: List[J],
+    cores_mcpu: Callable[[J], int],
+    location: Callable[[J], Optional[str]] = lambda job: None,
+    admit: Callable[[J, int], bool] = lambda job, placed_cores_mcpu: True,
+) -> Tuple[List[Tuple[J, T]], List[J]]:
+    """Place `jobs` with best fit decreasing: the largest jobs are placed
+    first, each on the instance with the fewest free cores that fits it.
+    Jobs of equal size are placed in the order given.
+
+    Before each job is placed, `admit` is called with the job and the cores
+    of the jobs placed so far; packing stops at the first job it rejects.
+
+    Returns the placed jobs with their instances and the jobs that were not
+    placed.
+    """
+    placed: List[Tuple[J, Any]] = []
+    unplaced: List[J] = []
+    placed_cores_mcpu = 0
+    stopped = False
+    for job in sorted(jobs, key=cores_mcpu, reverse=True):
+        if not stopped and not admit(job, placed_cores_mcpu):
+            stopped = True
+        instance = None if stopped else packer.place(cores_mcpu(job), location(job))
+        if instance is None:
+            unplaced.append(job)
+        else:
+            placed.append((job, instance))
+            placed_cores_mcpu += cores_mcpu(job)
+    return placed, unplaced
@@ -0,0 +1,35 @@
+from typing import List
+import asyncio
+
+import aiohttp
+
+from hailtop import httpx
+
+
+async def create_jobs_on_worker(client_session: httpx.ClientSession, instance, bodies) -> List[int]:
+    """Create the jobs with configs `bodies` on `instance` with one request and
+    return the HTTP status of each creation. Workers without the bulk endpoint
+    are sent one request per job."""
+    try:
+        async with client_session.post(
+            f'http://{instance.ip_address}:5000/api/v1alpha/batches/jobs/create_many',
+            json={'jobs': bodies},
+            timeout=aiohttp.ClientTimeout(total=2 + 0.1 * len(bodies)),
+        ) as resp:
+            return (await resp.json())['statuses']
+    except aiohttp.ClientResponseError as e:
+        if e.status != 404:
+            raise
+
+    async def create(body):
+        try:
+            async with client_session.post(
+                f'http://{instance.ip_address}:5000/api/v1alpha/batches/jobs/create',
+                json=body,
+                timeout=aiohttp.ClientTimeout(total=2),
+            ):
+                return 200
+        except aiohttp.ClientResponseError as e:
+            return e.status
+
+    return await asyncio.gather(*[create(body) for body in bodies])
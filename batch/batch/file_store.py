@@ -1,5 +1,8 @@
+from typing import Dict, Optional
 import logging
 import asyncio
+import gzip
+import json
 
 from hailtop.aiotools.fs import AsyncFS
 
@@ -9,6 +12,9 @@ from .batch_format_version import BatchFormatVersion
 
 log = logging.getLogger('logstore')
 
+# uncompressed bytes in each chunk of a chunked log
+LOG_CHUNK_SIZE = 1024 * 1024
+
 
 class FileStore:
     def __init__(self, fs: AsyncFS, batch_logs_storage_uri, instance_id):
@@ -30,9 +36,66 @@ class FileStore:
             return f'{self.batch_log_dir(batch_id)}/{job_id}/{task}/log'
         return f'{self.batch_log_dir(batch_id)}/{job_id}/{attempt_id}/{task}/log'
 
-    async def read_log_file(self, format_version, batch_id, job_id, attempt_id, task):
+    def log_index_path(self, format_version, batch_id, job_id, attempt_id, task):
+        return f'{self.log_path(format_version, batch_id, job_id, attempt_id, task)}.index'
+
+    def log_chunk_path(self, format_version, batch_id, job_id, attempt_id, task, chunk):
+        return f'{self.log_path(format_version, batch_id, job_id, attempt_id, task)}.{chunk}.gz'
+
+    # A chunked log (see BatchFormatVersion.has_chunked_logs) is stored as
+    # gzipped chunks of `chunk_size` uncompressed bytes, the last of which may
+    # be shorter, and an index {'size': int, 'chunk_size': int}, so any range
+    # of it is read from the chunks that hold it. Chunks are written before
+    # the index that covers them. Other logs are one object, and their index
+    # is {'size': int, 'chunk_size': None}.
+    async def read_log_index(self, format_version, batch_id, job_id, attempt_id, task) -> Dict[str, Optional[int]]:
+        if format_version.has_chunked_logs():
+            url = self.log_index_path(format_version, batch_id, job_id, attempt_id, task)
+            try:
+                return json.loads(await self.fs.read(url))
+            except FileNotFoundError:
+                # written whole by a worker from before chunked logs
+                pass
         url = self.log_path(format_version, batch_id, job_id, attempt_id, task)
-        data = await self.fs.read(url)
+        return {'size': await (await self.fs.statfile(url)).size(), 'chunk_size': None}
+
+    async def write_log_index(self, format_version, batch_id, job_id, attempt_id, task, size, chunk_size):
+        url = self.log_index_path(format_version, batch_id, job_id, attempt_id, task)
+        await self.fs.write(url, json.dumps({'size': size, 'chunk_size': chunk_size}).encode('utf-8'))
+
+    async def write_log_chunk(self, format_version, batch_id, job_id, attempt_id, task, chunk, compressed_data):
+        url = self.log_chunk_path(format_version, batch_id, job_id, attempt_id, task, chunk)
+        await self.fs.write(url, compressed_data)
+
+    async def read_log_range(self, format_version, batch_id, job_id, attempt_id, task, index, start, end) -> bytes:
+        """The bytes [start, end) of a log with `index`."""
+        end = min(end, index['size'])
+        if start >= end:
+            return b''
+
+        chunk_size = index['chunk_size']
+        if chunk_size is None:
+            url = self.log_path(format_version, batch_id, job_id, attempt_id, task)
+            return await self.fs.read_range(url, start, end - 1)
+
+        async def read_chunk(chunk):
+            url = self.log_chunk_path(format_version, batch_id, job_id, attempt_id, task, chunk)
+            return gzip.decompress(await self.fs.read(url))
+
+        first_chunk = start // chunk_size
+        chunks = await asyncio.gather(*[read_chunk(chunk) for chunk in range(first_chunk, (end - 1) // chunk_size + 1)])
+        offset = first_chunk * chunk_size
+        return b''.join(chunks)[start - offset:end - offset]
+
+    async def read_log_file(self, format_version, batch_id, job_id, attempt_id, task):
+        if format_version.has_chunked_logs():
+            index = await self.read_log_index(format_version, batch_id, job_id, attempt_id, task)
+            data = await self.read_log_range(
+                format_version, batch_id, job_id, attempt_id, task, index, 0, index['size']
+            )
+        else:
+            url = self.log_path(format_version, batch_id, job_id, attempt_id, task)
+            data = await self.fs.read(url)
         return data.decode('utf-8')
 
     async def write_log_file(self, format_version, batch_id, job_id, attempt_id, task, data):
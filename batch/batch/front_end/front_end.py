@@ -1,10 +1,11 @@
-from typing import Optional, Union
+from typing import Dict, List, Optional, Tuple, Union
 from numbers import Number
 import os
 import logging
 import json
 import random
 import datetime
+import time
 import collections
 from functools import wraps
 import asyncio
@@ -53,7 +54,13 @@ from web_common import setup_aiohttp_jinja2, setup_common_static_routes, render_
 
 # import uvloop
 
-from ..utils import coalesce, query_billing_projects
+from ..utils import (
+    byte_range_response,
+    coalesce,
+    parse_byte_range,
+    parse_content_range,
+    query_billing_projects,
+)
 from ..cloud.resource_utils import (
     is_valid_cores_mcpu,
     cost_from_msec_mcpu,
@@ -62,6 +69,7 @@ from ..cloud.resource_utils import (
     valid_machine_types,
 )
 from ..batch import batch_record_to_dict, job_record_to_dict, cancel_batch_in_db
+from ..batch_changes import BatchChangeListener
 from ..exceptions import (
     BatchUserError,
     NonExistentBillingProjectError,
@@ -73,7 +81,7 @@ from ..inst_coll_config import InstanceCollectionConfigs
 from ..file_store import FileStore
 from ..database import CallError, check_call_procedure
 from ..batch_configuration import BATCH_STORAGE_URI, DEFAULT_NAMESPACE, SCOPE, CLOUD
-from ..globals import HTTP_CLIENT_MAX_SIZE, BATCH_FORMAT_VERSION
+from ..globals import HTTP_CLIENT_MAX_SIZE, BATCH_FORMAT_VERSION, complete_states
 from ..spec_writer import SpecWriter
 from ..batch_format_version import BatchFormatVersion
 
@@ -92,6 +100,12 @@ BATCH_JOB_DEFAULT_MEMORY = os.environ.get('HAIL_BATCH_JOB_DEFAULT_MEMORY', 'stan
 BATCH_JOB_DEFAULT_STORAGE = os.environ.get('HAIL_BATCH_JOB_DEFAULT_STORAGE', '0Gi')
 BATCH_JOB_DEFAULT_PREEMPTIBLE = True
 
+# the job page shows the end of each log
+UI_JOB_LOG_TAIL_BYTES = 256 * 1024
+
+# requests to wait for a batch or job to change return after at most this long
+MAX_WAIT_TIMEOUT_SECS = 60
+
 
 def rest_authenticated_developers_or_auth_only(fun):
     @rest_authenticated_users_only
@@ -203,21 +217,24 @@ async def _handle_api_error(f, *args, **kwargs):
         raise e.http_response()
 
 
-async def _query_batch_jobs(request, batch_id):
-    state_query_values = {
-        'pending': ['Pending'],
-        'ready': ['Ready'],
-        'creating': ['Creating'],
-        'running': ['Running'],
-        'live': ['Ready', 'Creating', 'Running'],
-        'cancelled': ['Cancelled'],
-        'error': ['Error'],
-        'failed': ['Failed'],
-        'bad': ['Error', 'Failed'],
-        'success': ['Success'],
-        'done': ['Cancelled', 'Error', 'Failed', 'Success'],
-    }
+JOB_STATE_QUERY_VALUES = {
+    'pending': ['Pending'],
+    'ready': ['Ready'],
+    'creating': ['Creating'],
+    'running': ['Running'],
+    'live': ['Ready', 'Creating', 'Running'],
+    'cancelled': ['Cancelled'],
+    'error': ['Error'],
+    'failed': ['Failed'],
+    'bad': ['Error', 'Failed'],
+    'success': ['Success'],
+    'done': ['Cancelled', 'Error', 'Failed', 'Success'],
+}
+
+EXPORT_JOBS_PAGE_SIZE = 1000
 
+
+async def _query_batch_jobs(request, batch_id):
     db = request.app['db']
 
     # batch has already been validated
@@ -255,8 +272,8 @@ async def _query_batch_jobs(request, batch_id):
   WHERE `key` = %s))
 '''
             args = [k]
-        elif t in state_query_values:
-            values = state_query_values[t]
+        elif t in JOB_STATE_QUERY_VALUES:
+            values = JOB_STATE_QUERY_VALUES[t]
             condition = ' OR '.join(['(jobs.state = %s)' for v in values])
             condition = f'({condition})'
             args = values
@@ -323,6 +340,145 @@ WHERE id = %s AND NOT deleted;
     return web.json_response(resp)
 
 
+async def _export_batch_jobs(db, batch, states: Optional[List[str]], last_job_id: int):
+    """Yields pages of the jobs of `batch` after `last_job_id` in the states
+    `states` (all if None), in job id order.
+
+    Pages are read by primary key, keyed on the last job id of the previous
+    page, and the names and costs of the jobs of a page are looked up by
+    primary key too, so every page costs the same however far into the
+    batch it is.
+    """
+    batch_id = batch['id']
+    rates = {
+        record['resource']: record['rate']
+        async for record in db.select_and_fetchall('SELECT resource, rate FROM resources;')
+    }
+
+    while True:
+        where_conditions = ['batch_id = %s', 'job_id > %s']
+        where_args = [batch_id, last_job_id]
+        if states is not None:
+            where_conditions.append(f'state IN ({", ".join(["%s"] * len(states))})')
+            where_args.extend(states)
+
+        records = [
+            record
+            async for record in db.select_and_fetchall(
+                f'''
+SELECT batch_id, job_id, state, status, msec_mcpu
+FROM jobs FORCE INDEX (PRIMARY)
+WHERE {' AND '.join(where_conditions)}
+ORDER BY batch_id, job_id
+LIMIT %s;
+''',
+                (*where_args, EXPORT_JOBS_PAGE_SIZE),
+            )
+        ]
+        if not records:
+            return
+
+        job_ids = [record['job_id'] for record in records]
+        job_ids_list = ', '.join(['%s'] * len(job_ids))
+
+        names = {
+            record['job_id']: record['value']
+            async for record in db.select_and_fetchall(
+                f'''
+SELECT job_id, `value` FROM job_attributes
+WHERE batch_id = %s AND job_id IN ({job_ids_list}) AND `key` = 'name';
+''',
+                (batch_id, *job_ids),
+            )
+        }
+
+        costs: Dict[int, float] = {}
+        async for record in db.select_and_fetchall(
+            f'''
+SELECT job_id, resource, `usage` FROM aggregated_job_resources
+WHERE batch_id = %s AND job_id IN ({job_ids_list});
+''',
+            (batch_id, *job_ids),
+        ):
+            rate = rates.get(record['resource'])
+            if rate is not None:
+                costs[record['job_id']] = costs.get(record['job_id'], 0) + record['usage'] * rate
+
+        yield [
+            job_record_to_dict(
+                {
+                    **record,
+                    'user': batch['user'],
+                    'billing_project': batch['billing_project'],
+                    'format_version': batch['format_version'],
+                    'cost': costs.get(record['job_id']),
+                },
+                names.get(record['job_id']),
+            )
+            for record in records
+        ]
+
+        last_job_id = job_ids[-1]
+        if len(records) < EXPORT_JOBS_PAGE_SIZE:
+            return
+
+
+@routes.get('/api/v1alpha/batches/{batch_id}/jobs/export')
+@rest_billing_project_users_only
+async def export_jobs(request, userdata, batch_id):  # pylint: disable=unused-argument
+    db = request.app['db']
+    record = await db.select_and_fetchone(
+        '''
+SELECT id, user, billing_project, format_version FROM batches
+WHERE id = %s AND NOT deleted;
+''',
+        (batch_id,),
+    )
+    if not record:
+        raise web.HTTPNotFound()
+
+    state = request.query.get('state')
+    if state is None:
+        states = None
+    elif state in JOB_STATE_QUERY_VALUES:
+        states = JOB_STATE_QUERY_VALUES[state]
+    else:
+        raise web.HTTPBadRequest(reason=f'invalid state: {state}')
+
+    try:
+        last_job_id = int(request.query.get('last_job_id', 0))
+    except ValueError as e:
+        raise web.HTTPBadRequest(reason=f'invalid last_job_id: {request.query["last_job_id"]}') from e
+
+    # one job per line, compressed if the client accepts it
+    response = web.StreamResponse()
+    response.content_type = 'application/x-ndjson'
+    response.enable_compression()
+    await response.prepare(request)
+    async for jobs in _export_batch_jobs(db, record, states, last_job_id):
+        await response.write(''.join(json.dumps(job) + '\n' for job in jobs).encode('utf-8'))
+    await response.write_eof()
+    return response
+
+
+def _job_log_tasks(record) -> List[str]:
+    batch_format_version = BatchFormatVersion(record['format_version'])
+    spec = json.loads(record['spec'])
+    tasks = []
+
+    has_input_files = batch_format_version.get_spec_has_input_files(spec)
+    if has_input_files:
+        tasks.append('input')
+
+    tasks.append('main')
+
+    has_output_files = batch_format_version.get_spec_has_output_files(spec)
+    if has_output_files:
+        tasks.append('output')
+
+    return tasks
+
+
 async def _get_job_log_from_record(app, batch_id, job_id, record):
     client_session: httpx.ClientSession = app['client_session']
     state = record['state']
@@ -353,25 +509,55 @@ async def _get_job_log_from_record(app, batch_id, job_id, record):
                 data = 'ERROR: could not find log file'
             return task, data
 
-        spec = json.loads(record['spec'])
-        tasks = []
+        return dict(await asyncio.gather(*[_read_log_from_gcs(task) for task in _job_log_tasks(record)]))
 
-        has_input_files = batch_format_version.get_spec_has_input_files(spec)
-        if has_input_files:
-            tasks.append('input')
+    return None
 
-        tasks.append('main')
 
-        has_output_files = batch_format_version.get_spec_has_output_files(spec)
-        if has_output_files:
-            tasks.append('output')
+async def _read_job_log_range_from_record(
+    app, batch_id, job_id, record, task, range_header: Optional[str]
+) -> Optional[Tuple[bytes, int, int, int]]:
+    """The bytes of the `task` log of a job that `range_header` requests,
+    their start and end offsets and the size of the log, or None if the log
+    does not exist (yet). The log of a running job is read from its worker,
+    the others from the file store, neither reading more of it than
+    requested."""
+    client_session: httpx.ClientSession = app['client_session']
+    file_store: FileStore = app['file_store']
+    state = record['state']
 
-        return dict(await asyncio.gather(*[_read_log_from_gcs(task) for task in tasks]))
+    if state == 'Running':
+        try:
+            resp = await request_retry_transient_errors(
+                client_session,
+                'GET',
+                f'http://{record["ip_address"]}:5000/api/v1alpha/batches/{batch_id}/jobs/{job_id}/log/{task}',
+                headers={'Range': range_header} if range_header is not None else None,
+            )
+            data = await resp.read()
+            return (data, *parse_content_range(resp.headers.get('Content-Range'), len(data)))
+        except aiohttp.ClientResponseError as e:
+            if e.status == 416:
+                raise web.HTTPRequestRangeNotSatisfiable() from e
+            if e.status != 404:
+                raise
+        # the job finished on the worker, so its log may already be in the
+        # file store
+    elif state not in ('Error', 'Failed', 'Success'):
+        return None
 
-    return None
+    batch_format_version = BatchFormatVersion(record['format_version'])
+    attempt_id = record['attempt_id']
+    try:
+        index = await file_store.read_log_index(batch_format_version, batch_id, job_id, attempt_id, task)
+    except FileNotFoundError:
+        return None
+    start, end = parse_byte_range(range_header, index['size'])
+    data = await file_store.read_log_range(batch_format_version, batch_id, job_id, attempt_id, task, index, start, end)
+    return (data, start, end, index['size'])
 
 
-async def _get_job_log(app, batch_id, job_id):
+async def _get_job_log_record(app, batch_id, job_id):
     db: Database = app['db']
 
     record = await db.select_and_fetchone(
@@ -390,9 +576,43 @@ WHERE jobs.batch_id = %s AND NOT deleted AND jobs.job_id = %s;
     )
     if not record:
         raise web.HTTPNotFound()
+    return record
+
+
+async def _get_job_log(app, batch_id, job_id):
+    record = await _get_job_log_record(app, batch_id, job_id)
     return await _get_job_log_from_record(app, batch_id, job_id, record)
 
 
+async def _get_job_log_tail(app, batch_id, job_id, n_bytes):
+    record = await _get_job_log_record(app, batch_id, job_id)
+
+    async def read_tail(task):
+        try:
+            result = await _read_job_log_range_from_record(app, batch_id, job_id, record, task, f'bytes=-{n_bytes}')
+        except web.HTTPRequestRangeNotSatisfiable:
+            # empty
+            return task, ''
+        if result is None:
+            if record['state'] in ('Error', 'Failed', 'Success'):
+                id = (batch_id, job_id)
+                log.error(f'missing log file for {id} and task {task}')
+                return task, 'ERROR: could not find log file'
+            return task, None
+        data, start, _, _ = result
+        text = data.decode('utf-8', errors='replace')
+        if start > 0:
+            text = f'[showing the last {len(data)} of {start + len(data)} bytes]\n{text}'
+        return task, text
+
+    job_log = {
+        task: text
+        for task, text in await asyncio.gather(*[read_tail(task) for task in _job_log_tasks(record)])
+        if text is not None
+    }
+    return job_log or None
+
+
 async def _get_attributes(app, record):
     db: Database = app['db']
 
@@ -485,6 +705,22 @@ async def get_job_log(request, userdata, batch_id):  # pylint: disable=unused-ar
     return web.json_response(job_log)
 
 
+@routes.get('/api/v1alpha/batches/{batch_id}/jobs/{job_id}/log/{task}')
+@rest_billing_project_users_only
+async def get_job_log_range(request, userdata, batch_id):  # pylint: disable=unused-argument
+    job_id = int(request.match_info['job_id'])
+    task = request.match_info['task']
+    record = await _get_job_log_record(request.app, batch_id, job_id)
+    if task not in _job_log_tasks(record):
+        raise web.HTTPNotFound()
+    range_header = request.headers.get('Range')
+    result = await _read_job_log_range_from_record(request.app, batch_id, job_id, record, task, range_header)
+    if result is None:
+        raise web.HTTPNotFound()
+    data, start, end, size = result
+    return byte_range_response(data, range_header, start, end, size)
+
+
 async def _query_batches(request, user, q):
     db = request.app['db']
 
@@ -683,6 +919,10 @@ WHERE user = %s AND id = %s AND NOT deleted;
                 }
             )
 
+            n_ready_jobs_by_inst_coll_image: Dict[str, Dict[str, int]] = collections.defaultdict(
+                collections.Counter
+            )
+
             prev_job_idx = None
             start_job_id = None
 
@@ -869,6 +1109,8 @@ WHERE user = %s AND id = %s AND NOT deleted;
                     if not always_run:
                         icr['n_ready_cancellable_jobs'] += 1
                         icr['ready_cancellable_cores_mcpu'] += cores_mcpu
+                    if spec['process']['type'] == 'docker':
+                        n_ready_jobs_by_inst_coll_image[inst_coll_name][spec['process']['image']] += 1
                 else:
                     state = 'Pending'
 
@@ -1016,9 +1258,26 @@ VALUES (%s, %s, %s);
                     f'jobs_args={json.dumps(jobs_args)}'
                     f'job_parents_args={json.dumps(job_parents_args)}'
                 ) from err
+
+    for inst_coll_name, n_ready_jobs_by_image in n_ready_jobs_by_inst_coll_image.items():
+        app['task_manager'].ensure_future(_prefetch_images(app, inst_coll_name, n_ready_jobs_by_image))
+
     return web.Response()
 
 
+async def _prefetch_images(app, inst_coll_name, n_ready_jobs_by_image):
+    client_session: httpx.ClientSession = app['client_session']
+    try:
+        async with client_session.post(
+            deploy_config.url('batch-driver', f'/api/v1alpha/inst_colls/{inst_coll_name}/prefetch_images'),
+            headers=app['batch_headers'],
+            json={'n_ready_jobs_by_image': dict(n_ready_jobs_by_image)},
+        ):
+            pass
+    except Exception:
+        log.info(f'could not prefetch images for {inst_coll_name}', exc_info=True)
+
+
 @routes.post('/api/v1alpha/batches/create')
 @rest_authenticated_users_only
 async def create_batch(request, userdata):
@@ -1169,6 +1428,53 @@ async def get_batch(request, userdata, batch_id):  # pylint: disable=unused-argu
     return web.json_response(await _get_batch(request.app, batch_id))
 
 
+async def _wait_for_change(app, batch_id, get_status, changed, timeout):
+    """Get the status with `get_status` again whenever the driver changes
+    batch `batch_id`, until `changed` is true of it or `timeout` seconds have
+    passed, and return it."""
+    listener: BatchChangeListener = app['batch_change_listener']
+    deadline = time.monotonic() + timeout
+    with listener.subscribe(batch_id) as batch_changed:
+        while True:
+            batch_changed.clear()
+            status = await get_status()
+            remaining = deadline - time.monotonic()
+            if changed(status) or remaining <= 0:
+                return status
+            try:
+                await asyncio.wait_for(batch_changed.wait(), remaining)
+            except asyncio.TimeoutError:
+                return status
+
+
+def _wait_timeout(request) -> float:
+    try:
+        timeout = float(request.query.get('timeout', MAX_WAIT_TIMEOUT_SECS))
+    except ValueError as e:
+        raise web.HTTPBadRequest(reason=f'invalid timeout: {request.query["timeout"]}') from e
+    return min(max(timeout, 0), MAX_WAIT_TIMEOUT_SECS)
+
+
+# Returns the status of the batch once it is complete or, if n_completed is
+# given, once its number of completed jobs is no longer n_completed, or
+# after timeout seconds.
+@routes.get('/api/v1alpha/batches/{batch_id}/wait')
+@rest_billing_project_users_only
+async def wait_batch(request, userdata, batch_id):  # pylint: disable=unused-argument
+    timeout = _wait_timeout(request)
+    n_completed = request.query.get('n_completed')
+    if n_completed is not None:
+        n_completed = int(n_completed)
+
+    def changed(status):
+        return status['complete'] or (n_completed is not None and status['n_completed'] != n_completed)
+
+    status = await _wait_for_change(
+        request.app, batch_id, lambda: _get_batch(request.app, batch_id), changed, timeout
+    )
+    return web.json_response(status)
+
+
 @routes.patch('/api/v1alpha/batches/{batch_id}/cancel')
 @rest_billing_project_users_only
 async def cancel_batch(request, userdata, batch_id):  # pylint: disable=unused-argument
@@ -1394,6 +1700,23 @@ async def get_job(request, userdata, batch_id):  # pylint: disable=unused-argume
     return web.json_response(status)
 
 
+# Returns the status of the job once it is complete, or after timeout
+# seconds.
+@routes.get('/api/v1alpha/batches/{batch_id}/jobs/{job_id}/wait')
+@rest_billing_project_users_only
+async def wait_job(request, userdata, batch_id):  # pylint: disable=unused-argument
+    job_id = int(request.match_info['job_id'])
+    timeout = _wait_timeout(request)
+    status = await _wait_for_change(
+        request.app,
+        batch_id,
+        lambda: _get_job(request.app, batch_id, job_id),
+        lambda status: status['state'] in complete_states,
+        timeout,
+    )
+    return web.json_response(status)
+
+
 @routes.get('/batches/{batch_id}/jobs/{job_id}')
 @web_billing_project_users_only()
 @catch_ui_error_in_dev
@@ -1402,7 +1725,9 @@ async def ui_get_job(request, userdata, batch_id):
     job_id = int(request.match_info['job_id'])
 
     job, attempts, job_log = await asyncio.gather(
-        _get_job(app, batch_id, job_id), _get_attempts(app, batch_id, job_id), _get_job_log(app, batch_id, job_id)
+        _get_job(app, batch_id, job_id),
+        _get_attempts(app, batch_id, job_id),
+        _get_job_log_tail(app, batch_id, job_id, UI_JOB_LOG_TAIL_BYTES),
     )
 
     job['duration'] = humanize_timedelta_msecs(job['duration'])
@@ -2195,6 +2520,22 @@ SELECT instance_id, internal_token, n_tokens, frozen FROM globals;
 
     app['task_manager'].ensure_future(periodically_call(5, _refresh, app))
 
+    async def get_batch_changes(epoch, seq):
+        params = {'seq': seq}
+        if epoch is not None:
+            params['epoch'] = epoch
+        resp = await app['client_session'].get(
+            deploy_config.url('batch-driver', '/api/v1alpha/batches/changes'),
+            params=params,
+            headers=app['batch_headers'],
+            timeout=aiohttp.ClientTimeout(total=60),
+        )
+        return await resp.json()
+
+    batch_change_listener = BatchChangeListener(get_batch_changes, retry_secs=5)
+    app['batch_change_listener'] = batch_change_listener
+    app['task_manager'].ensure_future(batch_change_listener.run())
+
 
 async def on_cleanup(app):
     try:
@@ -19,9 +19,11 @@ memory_types = ('lowmem', 'standard', 'highmem')
 
 HTTP_CLIENT_MAX_SIZE = 8 * 1024 * 1024
 
-BATCH_FORMAT_VERSION = 6
+BATCH_FORMAT_VERSION = 7
 STATUS_FORMAT_VERSION = 5
 INSTANCE_VERSION = 21
 
 MAX_PERSISTENT_SSD_SIZE_GIB = 64 * 1024
 RESERVED_STORAGE_GB_PER_CORE = 5
+# data disk storage of a worker not given to jobs, for its images
+RESERVED_IMAGE_STORAGE_GB = 30
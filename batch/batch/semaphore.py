@@ -36,8 +36,7 @@ class FIFOWeightedSemaphore:
         self.queue = collections.deque()
 
     async def acquire(self, weight):
-        if not self.queue and self.value >= weight:
-            self.value -= weight
+        if self.try_acquire(weight):
             return
 
         event = asyncio.Event()
@@ -45,6 +44,12 @@ class FIFOWeightedSemaphore:
         event.clear()
         await event.wait()
 
+    def try_acquire(self, weight) -> bool:
+        if not self.queue and self.value >= weight:
+            self.value -= weight
+            return True
+        return False
+
     def release(self, weight):
         self.value += weight
         n_notified = 0
@@ -1,6 +1,7 @@
-from typing import Deque, Set, Tuple
+from typing import Deque, Optional, Set, Tuple
 import logging
 import json
+import re
 import secrets
 from aiohttp import web
 from functools import wraps
@@ -46,6 +47,54 @@ def coalesce(x, default):
     return default
 
 
+def parse_byte_range(range_header: Optional[str], size: int) -> Tuple[int, int]:
+    """The bytes [start, end) of a `size` byte object requested by the HTTP
+    Range header `range_header`, one range of the form ``bytes=a-b``,
+    ``bytes=a-`` or ``bytes=-n`` (the last `n` bytes), or all of them if
+    `range_header` is None."""
+    if range_header is None:
+        return (0, size)
+
+    m = re.fullmatch(r'bytes=(\d*)-(\d*)', range_header.strip())
+    if not m or not (m[1] or m[2]):
+        raise web.HTTPBadRequest(reason=f'invalid Range header: {range_header}')
+
+    if m[1]:
+        start = int(m[1])
+        end = min(int(m[2]) + 1, size) if m[2] else size
+        satisfiable = start < end
+    else:
+        start = max(size - int(m[2]), 0)
+        end = size
+        satisfiable = int(m[2]) > 0 and size > 0
+
+    if not satisfiable:
+        raise web.HTTPRequestRangeNotSatisfiable(headers={'Content-Range': f'bytes */{size}'})
+    return (start, end)
+
+
+def byte_range_response(data: bytes, range_header: Optional[str], start: int, end: int, size: int) -> web.Response:
+    headers = {'Accept-Ranges': 'bytes'}
+    if range_header is None:
+        status = 200
+    else:
+        status = 206
+        headers['Content-Range'] = f'bytes {start}-{end - 1}/{size}'
+    return web.Response(body=data, status=status, headers=headers, content_type='text/plain', charset='utf-8')
+
+
+def parse_content_range(content_range: Optional[str], size: int) -> Tuple[int, int, int]:
+    """The start, end and size of the object in a response with the HTTP
+    Content-Range header `content_range`, or of the whole `size` byte object
+    if it is None."""
+    if content_range is None:
+        return (0, size, size)
+    m = re.fullmatch(r'bytes (\d+)-(\d+)/(\d+)', content_range.strip())
+    if not m:
+        raise ValueError(f'invalid Content-Range header: {content_range}')
+    return (int(m[1]), int(m[2]) + 1, int(m[3]))
+
+
 class Box:
     def __init__(self, value):
         self.value = value
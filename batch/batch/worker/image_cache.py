@@ -0,0 +1,159 @@
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+import asyncio
+
+from hailtop.utils import time_msecs, time_msecs_str
+
+
+def layer_sizes(layers: List[str], history: List[dict], image_size: int) -> List[Tuple[str, int]]:
+    """Pair the layers of an image, oldest first as in ``RootFS.Layers`` of
+    ``docker inspect``, with their sizes from the image history.
+
+    The history lists the steps that built the image, newest first, and only
+    steps with a nonzero size added a layer. If those steps do not line up with
+    the layers, the image size is split evenly across them.
+    """
+    if not layers:
+        return []
+    sizes = [entry['Size'] for entry in reversed(history) if entry.get('Size', 0) > 0]
+    if len(sizes) != len(layers):
+        sizes = [image_size // len(layers)] * len(layers)
+    return list(zip(layers, sizes))
+
+
+class CachedImage:
+    def __init__(self, image_id: str, layers: List[Tuple[str, int]], rootfs_size_bytes: int):
+        self.image_id = image_id
+        self.layers = layers
+        self.rootfs_size_bytes = rootfs_size_bytes
+        self.ref_count = 0
+        self.n_uses = 0
+        self.time_created = time_msecs()
+        self.last_accessed = time_msecs()
+        self.lock = asyncio.Lock()
+
+    def __str__(self):
+        return (
+            f'CachedImage('
+            f'ref_count={self.ref_count}, '
+            f'n_uses={self.n_uses}, '
+            f'time_created={time_msecs_str(self.time_created)}, '
+            f'last_accessed={time_msecs_str(self.last_accessed)}'
+            f')'
+        )
+
+
+class ImageCache:
+    """The container images on a worker, tracked by layer and size.
+
+    Docker stores a layer once however many images share it, and each image
+    used by a job is also extracted to its own root filesystem. Evicting an
+    image therefore frees its root filesystem and the layers no other cached
+    image uses. Unused images are evicted least recently used first, and only
+    once the cache exceeds `max_bytes`.
+    """
+
+    def __init__(self, max_bytes: int, pinned: Iterable[str] = ()):
+        self.max_bytes = max_bytes
+        self.pinned: Set[str] = set(pinned)
+        self.images: Dict[str, CachedImage] = {}
+        # layer -> (size, number of cached images with the layer)
+        self.layers: Dict[str, Tuple[int, int]] = {}
+        self.n_hits = 0
+        self.n_misses = 0
+        self.n_layer_bytes_hit = 0
+        self.n_layer_bytes_missed = 0
+
+    def get(self, image_id: str) -> Optional[CachedImage]:
+        return self.images.get(image_id)
+
+    def cached_layer_bytes(self, layers: List[Tuple[str, int]]) -> int:
+        return sum(size for layer, size in layers if layer in self.layers)
+
+    def add(self, image_id: str, layers: List[Tuple[str, int]], rootfs_size_bytes: int) -> CachedImage:
+        """Add an image that was just pulled and return it. The bytes of its
+        layers that were already cached count towards the layer hit ratio."""
+        image = self.images.get(image_id)
+        if image is not None:
+            return image
+        cached_bytes = self.cached_layer_bytes(layers)
+        self.n_layer_bytes_hit += cached_bytes
+        self.n_layer_bytes_missed += sum(size for _, size in layers) - cached_bytes
+        for layer, size in layers:
+            _, n_images = self.layers.get(layer, (size, 0))
+            self.layers[layer] = (size, n_images + 1)
+        image = CachedImage(image_id, layers, rootfs_size_bytes)
+        self.images[image_id] = image
+        return image
+
+    def remove(self, image_id: str):
+        image = self.images.pop(image_id)
+        for layer, _ in image.layers:
+            size, n_images = self.layers[layer]
+            if n_images == 1:
+                del self.layers[layer]
+            else:
+                self.layers[layer] = (size, n_images - 1)
+
+    def acquire(self, image_id: str, hit: bool):
+        image = self.images[image_id]
+        image.ref_count += 1
+        image.n_uses += 1
+        image.last_accessed = time_msecs()
+        if hit:
+            self.n_hits += 1
+        else:
+            self.n_misses += 1
+
+    def release(self, image_id: str):
+        image = self.images[image_id]
+        image.ref_count -= 1
+        assert image.ref_count >= 0
+        image.last_accessed = time_msecs()
+
+    def size_bytes(self) -> int:
+        return sum(size for size, _ in self.layers.values()) + sum(
+            image.rootfs_size_bytes for image in self.images.values()
+        )
+
+    def eviction_candidates(self) -> List[str]:
+        """The unused images to evict, least recently used first, to bring the
+        cache under its budget. The cache is not modified."""
+        excess = self.size_bytes() - self.max_bytes
+        if excess <= 0:
+            return []
+        unused = sorted(
+            (image for image in self.images.values() if image.ref_count == 0 and image.image_id not in self.pinned),
+            key=lambda image: image.last_accessed,
+        )
+        n_images_by_layer = {layer: n_images for layer, (_, n_images) in self.layers.items()}
+        evicted = []
+        for image in unused:
+            if excess <= 0:
+                break
+            freed = image.rootfs_size_bytes
+            for layer, size in image.layers:
+                n_images_by_layer[layer] -= 1
+                if n_images_by_layer[layer] == 0:
+                    freed += size
+            excess -= freed
+            evicted.append(image.image_id)
+        return evicted
+
+    def hit_ratio(self) -> Optional[float]:
+        n = self.n_hits + self.n_misses
+        return self.n_hits / n if n else None
+
+    def layer_hit_ratio(self) -> Optional[float]:
+        n = self.n_layer_bytes_hit + self.n_layer_bytes_missed
+        return self.n_layer_bytes_hit / n if n else None
+
+    def __str__(self):
+        return (
+            f'ImageCache('
+            f'size_bytes={self.size_bytes()}, '
+            f'max_bytes={self.max_bytes}, '
+            f'hit_ratio={self.hit_ratio()}, '
+            f'layer_hit_ratio={self.layer_hit_ratio()}, '
+            f'images={{{", ".join(f"{image_id}: {image}" for image_id, image in self.images.items())}}}'
+            f')'
+        )
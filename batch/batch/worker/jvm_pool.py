@@ -0,0 +1,280 @@
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+import asyncio
+import logging
+import math
+import struct
+import zipfile
+
+from hailtop import aiotools
+
+from ..semaphore import FIFOWeightedSemaphore
+
+log = logging.getLogger('jvm_pool')
+
+ENTRYWAY_CLASS = 'is.hail.backend.service.JVMEntryway'
+
+
+def _encode_string(s: str) -> bytes:
+    b = s.encode('utf-8')
+    return struct.pack('>i', len(b)) + b
+
+
+def encode_job(env: Dict[str, str], log_path: str, command: List[str]) -> bytes:
+    """Encode a job for ``is.hail.backend.service.JVMEntryway``: its
+    environment, the file its output goes to and its main class and
+    arguments."""
+    parts = [struct.pack('>i', len(env))]
+    for key, value in env.items():
+        parts.append(_encode_string(key))
+        parts.append(_encode_string(value))
+    parts.append(_encode_string(log_path))
+    parts.append(struct.pack('>i', len(command)))
+    parts.extend(_encode_string(arg) for arg in command)
+    return b''.join(parts)
+
+
+def jar_has_entryway(jar_path: str) -> bool:
+    """Whether the JAR at `jar_path` can run in a pooled JVM. JARs built
+    before the entryway existed must run in a JVM of their own."""
+    entry = ENTRYWAY_CLASS.replace('.', '/') + '.class'
+    with zipfile.ZipFile(jar_path) as jar:
+        try:
+            jar.getinfo(entry)
+            return True
+        except KeyError:
+            return False
+
+
+def rss_bytes(pid: int) -> Optional[int]:
+    try:
+        with open(f'/proc/{pid}/status', encoding='utf-8') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) * 1024
+    except (FileNotFoundError, ProcessLookupError):
+        pass
+    return None
+
+
+class JVM:
+    """A JVM started ahead of its jobs, which it runs one at a time with
+    ``is.hail.backend.service.JVMEntryway``, so a job does not pay for JVM
+    startup and class loading. Its output outside of jobs goes to the worker
+    log."""
+
+    def __init__(self,
+                 key: Tuple[str, str, int],
+                 process: asyncio.subprocess.Process,
+                 reader: asyncio.StreamReader,
+                 writer: asyncio.StreamWriter):
+        self.key = key
+        self.process = process
+        self.reader = reader
+        self.writer = writer
+        self.n_jobs = 0
+        # the worker's cores held while idle
+        self.mcpu = 0
+        self._log_tasks = [asyncio.ensure_future(self._log_lines(process.stdout)),
+                           asyncio.ensure_future(self._log_lines(process.stderr))]
+
+    @staticmethod
+    async def create(key: Tuple[str, str, int], command: List[str]) -> 'JVM':
+        process = await asyncio.create_subprocess_exec(
+            *command,
+            ENTRYWAY_CLASS,
+            stdin=asyncio.subprocess.DEVNULL,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+            # a job's environment is sent with the job, and the worker's is not for jobs
+            env={})
+        try:
+            line = (await process.stdout.readline()).decode()
+            port, token = line.split()
+            reader, writer = await asyncio.open_connection('127.0.0.1', int(port))
+            writer.write(_encode_string(token))
+            await writer.drain()
+        except Exception:
+            if process.returncode is None:
+                process.kill()
+            await process.wait()
+            raise
+        return JVM(key, process, reader, writer)
+
+    async def _log_lines(self, strm: asyncio.StreamReader):
+        while not strm.at_eof():
+            line = await strm.readline()
+            if line:
+                log.info(f'{self}: {line.decode(errors="replace").rstrip()}')
+
+    @property
+    def alive(self) -> bool:
+        return self.process.returncode is None
+
+    def rss_bytes(self) -> Optional[int]:
+        return rss_bytes(self.process.pid)
+
+    async def execute(self, env: Dict[str, str], log_path: str, command: List[str]) -> int:
+        """Run the main class and arguments of `command` with `env`, sending
+        its output to `log_path`, and return its exit code. If the JVM dies,
+        its exit code is returned."""
+        self.n_jobs += 1
+        try:
+            self.writer.write(encode_job(env, log_path, command))
+            await self.writer.drain()
+            return struct.unpack('>i', await self.reader.readexactly(4))[0]
+        except (asyncio.IncompleteReadError, ConnectionError):
+            return await self.process.wait()
+
+    async def close(self):
+        if self.alive:
+            self.process.kill()
+        self.writer.close()
+        await self.process.wait()
+        await asyncio.gather(*self._log_tasks, return_exceptions=True)
+
+    def __str__(self):
+        user, revision, heap_size = self.key
+        return f'JVM {self.process.pid} ({user}, {revision}, heap {heap_size})'
+
+
+class JVMPool:
+    """The JVMs of a worker by user, JAR revision and heap size. JVMs are not
+    shared between users, as a job may leave state behind in its JVM.
+
+    A JVM returns to the pool after a job unless it has run
+    `max_jobs_per_jvm` jobs or is resident in more than its heap and
+    `non_heap_bytes`, in which case it is closed. Once a JVM has been taken
+    from the pool, another one for the same user, revision and heap size is
+    started in the background, so the next job finds one ready.
+
+    An idle JVM holds as many of the worker's cores, `cpu_sem`, as a job with
+    its resident memory, up to its heap, would, so the memory of idle JVMs is
+    never given to jobs. A JVM is kept idle only if those cores are free once
+    its job has released its own, and idle JVMs are closed, the least
+    recently used first, when a job needs their cores or more than
+    `max_idle` are idle.
+    """
+
+    def __init__(self,
+                 command: Callable[[str, int], List[str]],
+                 task_manager: aiotools.BackgroundTaskManager,
+                 cpu_sem: FIFOWeightedSemaphore,
+                 memory_per_core_bytes: int,
+                 *,
+                 max_idle: int,
+                 non_heap_bytes: int,
+                 max_jobs_per_jvm: int,
+                 create_jvm: Callable[[Tuple[str, str, int], List[str]], Awaitable[JVM]] = JVM.create):
+        self.command = command
+        self.task_manager = task_manager
+        self.cpu_sem = cpu_sem
+        self.memory_per_core_bytes = memory_per_core_bytes
+        self.max_idle = max_idle
+        self.non_heap_bytes = non_heap_bytes
+        self.max_jobs_per_jvm = max_jobs_per_jvm
+        self.create_jvm = create_jvm
+        # least recently used first
+        self.idle: List[JVM] = []
+        self.n_starting: Dict[Tuple[str, str, int], int] = {}
+        self.n_warm_starts = 0
+        self.n_cold_starts = 0
+        self.closed = False
+
+    def _n_idle(self, key: Tuple[str, str, int]) -> int:
+        return sum(1 for jvm in self.idle if jvm.key == key)
+
+    async def _start(self, key: Tuple[str, str, int]) -> JVM:
+        _, revision, heap_size = key
+        return await self.create_jvm(key, self.command(revision, heap_size))
+
+    def _prestart(self, key: Tuple[str, str, int]):
+        if self.closed or self._n_idle(key) + self.n_starting.get(key, 0) > 0:
+            return
+        self.n_starting[key] = self.n_starting.get(key, 0) + 1
+
+        async def start():
+            try:
+                jvm = await self._start(key)
+            except Exception:
+                log.exception(f'while starting a JVM for {key}')
+                return
+            finally:
+                self.n_starting[key] -= 1
+            self._add_idle(jvm)
+
+        self.task_manager.ensure_future(start())
+
+    def _add_idle(self, jvm: JVM):
+        if self.closed:
+            self.task_manager.ensure_future(jvm.close())
+            return
+        heap_size = jvm.key[2]
+        mcpu = math.ceil(min(jvm.rss_bytes() or 0, heap_size) * 1000 / self.memory_per_core_bytes)
+        while len(self.idle) >= self.max_idle or not self.cpu_sem.try_acquire(mcpu):
+            if not self.idle:
+                self.task_manager.ensure_future(jvm.close())
+                return
+            self._close_least_recently_used()
+        jvm.mcpu = mcpu
+        self.idle.append(jvm)
+
+    def _take_idle(self, i: int) -> JVM:
+        jvm = self.idle.pop(i)
+        self.cpu_sem.release(jvm.mcpu)
+        jvm.mcpu = 0
+        return jvm
+
+    def _close_least_recently_used(self):
+        self.task_manager.ensure_future(self._take_idle(0).close())
+
+    def make_room(self, mcpu: int):
+        """Close idle JVMs until a job can have `mcpu` of the worker's cores
+        without waiting for them."""
+        while self.idle and (self.cpu_sem.queue or self.cpu_sem.value < mcpu):
+            self._close_least_recently_used()
+
+    def take_idle(self, user: str, revision: str, heap_size: int) -> Optional[JVM]:
+        """An idle JVM for `user`, `revision` and `heap_size`, if there is
+        one. A job takes it before acquiring its cores, which then cover the
+        memory of the JVM."""
+        key = (user, revision, heap_size)
+        for i in reversed(range(len(self.idle))):
+            if self.idle[i].key == key:
+                jvm = self._take_idle(i)
+                if jvm.alive:
+                    self.n_warm_starts += 1
+                    self._prestart(key)
+                    return jvm
+                self.task_manager.ensure_future(jvm.close())
+        return None
+
+    async def acquire(self, user: str, revision: str, heap_size: int) -> JVM:
+        jvm = self.take_idle(user, revision, heap_size)
+        if jvm is None:
+            key = (user, revision, heap_size)
+            self.n_cold_starts += 1
+            jvm = await self._start(key)
+            self._prestart(key)
+        return jvm
+
+    def release(self, jvm: JVM):
+        """Return a JVM to the pool once its job has released its cores."""
+        heap_size = jvm.key[2]
+        rss = jvm.rss_bytes()
+        if (not jvm.alive
+                or jvm.n_jobs >= self.max_jobs_per_jvm
+                or (rss is not None and rss > heap_size + self.non_heap_bytes)):
+            log.info(f'recycling {jvm} after {jvm.n_jobs} jobs with {rss} bytes resident')
+            self.task_manager.ensure_future(jvm.close())
+            self._prestart(jvm.key)
+        else:
+            self._add_idle(jvm)
+
+    async def close(self):
+        self.closed = True
+        idle = [self._take_idle(0) for _ in range(len(self.idle))]
+        await asyncio.gather(*[jvm.close() for jvm in idle], return_exceptions=True)
+
+    def __str__(self):
+        return (f'JVMPool(n_idle={len(self.idle)}, n_warm_starts={self.n_warm_starts}, '
+                f'n_cold_starts={self.n_cold_starts})')
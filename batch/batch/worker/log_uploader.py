@@ -0,0 +1,110 @@
+from typing import Optional
+import asyncio
+import concurrent.futures
+import gzip
+import logging
+
+from hailtop.utils import blocking_to_async
+
+from ..batch_format_version import BatchFormatVersion
+from ..file_store import FileStore, LOG_CHUNK_SIZE
+
+log = logging.getLogger('log_uploader')
+
+
+def read_file_range(path: str, start: int, n: int) -> bytes:
+    try:
+        with open(path, 'rb') as f:
+            f.seek(start)
+            return f.read(n)
+    except FileNotFoundError:
+        return b''
+
+
+class LogUploader:
+    """Uploads the log a job task writes to `path` as a chunked log of the
+    file store while the task runs, every `upload_interval_secs`, and once
+    more when it is closed.
+
+    Only the chunk being written is read back and re-uploaded, so an upload
+    holds at most `chunk_size` bytes of the log in memory however large it
+    grows.
+    """
+
+    def __init__(self,
+                 file_store: FileStore,
+                 format_version: BatchFormatVersion,
+                 batch_id: int,
+                 job_id: int,
+                 attempt_id: str,
+                 task: str,
+                 path: str,
+                 pool: concurrent.futures.Executor,
+                 *,
+                 upload_interval_secs: float,
+                 chunk_size: int = LOG_CHUNK_SIZE):
+        self.file_store = file_store
+        self.format_version = format_version
+        self.batch_id = batch_id
+        self.job_id = job_id
+        self.attempt_id = attempt_id
+        self.task = task
+        self.path = path
+        self.pool = pool
+        self.upload_interval_secs = upload_interval_secs
+        self.chunk_size = chunk_size
+        # the chunk being written and how much of it has been uploaded
+        self.chunk = 0
+        self.chunk_bytes_uploaded = 0
+        self.size_uploaded: Optional[int] = None
+        self.lock = asyncio.Lock()
+        self.task_future: Optional[asyncio.Future] = None
+
+    def start(self):
+        self.task_future = asyncio.ensure_future(self._run())
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.upload_interval_secs)
+            try:
+                await self.upload()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                log.exception(f'while uploading the {self.task} log of job {(self.batch_id, self.job_id)}')
+
+    async def upload(self):
+        async with self.lock:
+            while True:
+                data = await blocking_to_async(
+                    self.pool, read_file_range, self.path, self.chunk * self.chunk_size, self.chunk_size
+                )
+                if len(data) > self.chunk_bytes_uploaded:
+                    compressed_data = await blocking_to_async(self.pool, gzip.compress, data, compresslevel=6)
+                    await self.file_store.write_log_chunk(
+                        self.format_version,
+                        self.batch_id,
+                        self.job_id,
+                        self.attempt_id,
+                        self.task,
+                        self.chunk,
+                        compressed_data,
+                    )
+                    self.chunk_bytes_uploaded = len(data)
+                if len(data) < self.chunk_size:
+                    break
+                self.chunk += 1
+                self.chunk_bytes_uploaded = 0
+
+            size = self.chunk * self.chunk_size + self.chunk_bytes_uploaded
+            if size != self.size_uploaded:
+                await self.file_store.write_log_index(
+                    self.format_version, self.batch_id, self.job_id, self.attempt_id, self.task, size, self.chunk_size
+                )
+                self.size_uploaded = size
+
+    async def close(self):
+        if self.task_future is not None:
+            self.task_future.cancel()
+            await asyncio.gather(self.task_future, return_exceptions=True)
+        await self.upload()
@@ -0,0 +1,143 @@
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+import asyncio
+import logging
+import random
+
+import aiohttp
+
+log = logging.getLogger('status_reporter')
+
+
+class JobStatusReporter:
+    """Reports job started and job complete statuses to the driver together.
+
+    Statuses are buffered for `flush_interval_secs` after the first arrives
+    and then posted, at most `max_statuses` at a time, as one body
+    ``{'started': [...], 'complete': [...]}``. Requests are sent one at a
+    time and retried with exponential backoff until they succeed or the
+    driver rejects them with a 4xx. If the driver responds 404, the instance
+    is no longer active and the statuses are dropped. On any other 4xx, or
+    after `max_server_errors` 500s in a row, the body is split in half and
+    each half posted in turn, so a bad status is dropped, or posted again at
+    the next flush, alone. Started statuses are posted no later than
+    complete statuses reported after them.
+
+    `started` and `complete` return a future that is done when the status
+    has been posted.
+    """
+
+    def __init__(self,
+                 post: Callable[[Dict[str, List[dict]]], Awaitable[None]],
+                 *,
+                 flush_interval_secs: float,
+                 max_statuses: int,
+                 max_server_errors: int = 3):
+        self.post = post
+        self.flush_interval_secs = flush_interval_secs
+        self.max_statuses = max_statuses
+        self.max_server_errors = max_server_errors
+        self._started: List[Tuple[dict, asyncio.Future]] = []
+        self._complete: List[Tuple[dict, asyncio.Future]] = []
+        # statuses to post again at the next flush
+        self._deferred: List[Tuple[str, dict, asyncio.Future]] = []
+        self._pending = asyncio.Event()
+        self.n_requests = 0
+
+    def _add(self, statuses: List[Tuple[dict, asyncio.Future]], status: dict) -> asyncio.Future:
+        fut = asyncio.get_event_loop().create_future()
+        self._add_future(statuses, status, fut)
+        return fut
+
+    def _add_future(self, statuses: List[Tuple[dict, asyncio.Future]], status: dict, fut: asyncio.Future):
+        statuses.append((status, fut))
+        self._pending.set()
+
+    def started(self, status: dict) -> asyncio.Future:
+        return self._add(self._started, status)
+
+    def complete(self, status: dict) -> asyncio.Future:
+        return self._add(self._complete, status)
+
+    async def run(self):
+        while True:
+            await self._pending.wait()
+            await asyncio.sleep(self.flush_interval_secs)
+            await self.flush()
+
+    async def flush(self):
+        while self._started or self._complete:
+            started, self._started = self._started[:self.max_statuses], self._started[self.max_statuses:]
+            n_complete = self.max_statuses - len(started)
+            complete, self._complete = self._complete[:n_complete], self._complete[n_complete:]
+            await self._post_statuses([('started', status, fut) for status, fut in started]
+                                      + [('complete', status, fut) for status, fut in complete])
+
+        self._pending.clear()
+        deferred, self._deferred = self._deferred, []
+        for kind, status, fut in deferred:
+            self._add_future(self._started if kind == 'started' else self._complete, status, fut)
+
+    async def _post_statuses(self, statuses: List[Tuple[str, dict, asyncio.Future]]):
+        try:
+            await self._post({kind: [status for status_kind, status, _ in statuses if status_kind == kind]
+                              for kind in ('started', 'complete')})
+        except asyncio.CancelledError:
+            for _, _, fut in statuses:
+                fut.cancel()
+            raise
+        except Exception as e:
+            rejected_status = _rejected_status(e)
+            if rejected_status != 404 and len(statuses) > 1:
+                half = len(statuses) // 2
+                await self._post_statuses(statuses[:half])
+                await self._post_statuses(statuses[half:])
+                return
+            if rejected_status is None:
+                log.warning(f'driver keeps failing on job status {statuses[0][1]}, posting it again later',
+                            exc_info=True)
+                self._deferred.extend(statuses)
+                return
+            log.warning(f'driver rejected {len(statuses)} job statuses, dropping them', exc_info=True)
+            for _, _, fut in statuses:
+                if not fut.done():
+                    fut.set_exception(e)
+        else:
+            for _, _, fut in statuses:
+                if not fut.done():
+                    fut.set_result(None)
+
+    async def _post(self, body: Dict[str, List[dict]]):
+        delay_secs = 0.1
+        n_server_errors = 0
+        while True:
+            try:
+                self.n_requests += 1
+                await self.post(body)
+                return
+            except asyncio.CancelledError:  # pylint: disable=try-except-raise
+                raise
+            except Exception as e:
+                if _rejected_status(e) is not None:
+                    raise
+                # a 500 is an error in the driver, which may be in one of
+                # the statuses, unlike a connection error or a 502, 503 or 504
+                if isinstance(e, aiohttp.ClientResponseError) and e.status == 500:
+                    n_server_errors += 1
+                    if n_server_errors >= self.max_server_errors:
+                        raise
+                else:
+                    n_server_errors = 0
+                log.warning(f'failed to post {len(body["started"])} started and {len(body["complete"])} '
+                            'complete job statuses, retrying', exc_info=True)
+
+            await asyncio.sleep(delay_secs * random.uniform(0.7, 1.3))
+            # exponentially back off, up to (expected) max of 2m
+            delay_secs = min(delay_secs * 2, 2 * 60.0)
+
+
+def _rejected_status(e: Exception) -> Optional[int]:
+    """The status of a response with which the driver will not accept the
+    same body again, if `e` is one."""
+    if isinstance(e, aiohttp.ClientResponseError) and 400 <= e.status < 500 and e.status not in (408, 429):
+        return e.status
+    return None
@@ -1,11 +1,10 @@
-from typing import Optional, Dict, Callable, Tuple, Awaitable, Any
+from typing import Optional, Dict, Callable, Tuple, Awaitable, Any, Set
 import os
 import json
 import sys
 import re
 import logging
 import asyncio
-import random
 import traceback
 import base64
 import uuid
@@ -26,7 +25,6 @@ from gear.clients import get_compute_client, get_cloud_async_fs
 
 from hailtop.utils import (
     time_msecs,
-    time_msecs_str,
     request_retry_transient_errors,
     sleep_and_backoff,
     retry_all_errors,
@@ -44,6 +42,7 @@ from hailtop.utils import (
 )
 from hailtop.batch.hail_genetics_images import HAIL_GENETICS_IMAGES
 from hailtop.aiotools import RouterAsyncFS, LocalAsyncFS
+from hailtop.aiotools.staging_cache import evict_least_recently_used
 from hailtop import aiotools, httpx
 
 # import uvloop
@@ -57,17 +56,22 @@ from ..file_store import FileStore
 from ..globals import (
     HTTP_CLIENT_MAX_SIZE,
     STATUS_FORMAT_VERSION,
+    RESERVED_IMAGE_STORAGE_GB,
     RESERVED_STORAGE_GB_PER_CORE,
 )
 from ..batch_format_version import BatchFormatVersion
 from ..publicly_available_images import publicly_available_images
-from ..utils import Box
+from ..utils import Box, byte_range_response, parse_byte_range
 from ..worker.instance_env import CloudWorkerAPI
 from ..cloud.gcp.worker.instance_env import GCPWorkerAPI
 from ..cloud.azure.worker.instance_env import AzureWorkerAPI
-from ..cloud.resource_utils import storage_gib_to_bytes, is_valid_storage_request
+from ..cloud.resource_utils import storage_gib_to_bytes, is_valid_storage_request, worker_memory_per_core_bytes
 
 from .credentials import CloudUserCredentials
+from .image_cache import ImageCache, layer_sizes
+from .jvm_pool import JVMPool, jar_has_entryway
+from .log_uploader import LogUploader, read_file_range
+from .status_reporter import JobStatusReporter
 
 # uvloop.install()
 
@@ -93,6 +97,19 @@ MAX_DOCKER_OTHER_OPERATION_SECS = 1 * 60
 
 IPTABLES_WAIT_TIMEOUT_SECS = 60
 
+# a JVM that has run this many jobs is replaced by a fresh one
+MAX_JOBS_PER_JVM = 100
+# a JVM resident in more than this beyond its heap is replaced by a fresh one
+JVM_NON_HEAP_BYTES = 1024**3
+
+# job started and complete statuses are sent to the driver together, up to
+# this many in a request, this long after the first one
+JOB_STATUS_FLUSH_INTERVAL_SECS = 0.5
+MAX_JOB_STATUSES_PER_REQUEST = 200
+
+# how often the logs of running jobs are uploaded
+LOG_UPLOAD_INTERVAL_SECS = 5
+
 CLOUD = os.environ['CLOUD']
 CORES = int(os.environ['CORES'])
 NAME = os.environ['NAME']
@@ -111,6 +128,11 @@ BATCH_WORKER_IMAGE_ID = os.environ['BATCH_WORKER_IMAGE_ID']
 INTERNET_INTERFACE = os.environ['INTERNET_INTERFACE']
 UNRESERVED_WORKER_DATA_DISK_SIZE_GB = int(os.environ['UNRESERVED_WORKER_DATA_DISK_SIZE_GB'])
 assert UNRESERVED_WORKER_DATA_DISK_SIZE_GB >= 0
+# input files are cached per user across the jobs on this worker in this much
+# of the unreserved data disk
+INPUT_CACHE_SIZE_GB = int(os.environ.get('INPUT_CACHE_SIZE_GB', '0'))
+assert 0 <= INPUT_CACHE_SIZE_GB <= UNRESERVED_WORKER_DATA_DISK_SIZE_GB
+INPUT_CACHE_ROOT = '/batch/input_cache'
 
 CLOUD_WORKER_API: CloudWorkerAPI = GCPWorkerAPI.from_env() if CLOUD == 'gcp' else AzureWorkerAPI.from_env()
 
@@ -128,6 +150,7 @@ log.info(f'CLOUD_WORKER_API {CLOUD_WORKER_API}')
 log.info(f'MAX_IDLE_TIME_MSECS {MAX_IDLE_TIME_MSECS}')
 log.info(f'INTERNET_INTERFACE {INTERNET_INTERFACE}')
 log.info(f'UNRESERVED_WORKER_DATA_DISK_SIZE_GB {UNRESERVED_WORKER_DATA_DISK_SIZE_GB}')
+log.info(f'INPUT_CACHE_SIZE_GB {INPUT_CACHE_SIZE_GB}')
 
 instance_config = CLOUD_WORKER_API.instance_config_from_config_dict(INSTANCE_CONFIG)
 assert instance_config.cores == CORES
@@ -324,6 +347,27 @@ async def pull_docker_image(pool: concurrent.futures.ThreadPoolExecutor, image_r
     return await blocking_to_async(pool, docker_sync.images.pull, image_ref_str, auth_config=auth)
 
 
+def job_image_reference(image: str):
+    image_ref = parse_docker_image_reference(image)
+    if image_ref.tag is None and image_ref.digest is None:
+        log.info(f'adding latest tag to image {image}')
+        image_ref.tag = 'latest'
+
+    if image_ref.name() in HAIL_GENETICS_IMAGES:
+        # We want the "hailgenetics/python-dill" translate to (based on the prefix):
+        # * gcr.io/hail-vdc/hailgenetics/python-dill
+        # * us-central1-docker.pkg.dev/hail-vdc/hail/hailgenetics/python-dill
+        image_ref.path = image_ref.name()
+        image_ref.domain = DOCKER_PREFIX.split('/', maxsplit=1)[0]
+        image_ref.path = '/'.join(DOCKER_PREFIX.split('/')[1:] + [image_ref.path])
+
+    return image_ref
+
+
+def is_cloud_image(image_ref) -> bool:
+    return is_google_registry_domain(image_ref.domain) or is_azure_registry_domain(image_ref.domain)
+
+
 async def send_signal_and_wait(proc, signal, timeout=None):
     try:
         if signal == 'SIGTERM':
@@ -368,6 +412,7 @@ class ContainerStepManager:
         if self.is_deleted():
             raise JobDeletedError()
         self.timing['start_time'] = time_msecs()
+        return self
 
     def __exit__(self, exc_type, exc, tb):
         if self.is_deleted():
@@ -407,19 +452,7 @@ class Container:
         self.worker = worker
         self.deleted_event = asyncio.Event()
 
-        image_ref = parse_docker_image_reference(self.spec['image'])
-        if image_ref.tag is None and image_ref.digest is None:
-            log.info(f'adding latest tag to image {self.spec["image"]} for {self}')
-            image_ref.tag = 'latest'
-
-        if image_ref.name() in HAIL_GENETICS_IMAGES:
-            # We want the "hailgenetics/python-dill" translate to (based on the prefix):
-            # * gcr.io/hail-vdc/hailgenetics/python-dill
-            # * us-central1-docker.pkg.dev/hail-vdc/hail/hailgenetics/python-dill
-            image_ref.path = image_ref.name()
-            image_ref.domain = DOCKER_PREFIX.split('/', maxsplit=1)[0]
-            image_ref.path = '/'.join(DOCKER_PREFIX.split('/')[1:] + [image_ref.path])
-
+        image_ref = job_image_reference(self.spec['image'])
         self.image_ref = image_ref
         self.image_ref_str = str(image_ref)
         self.image_id = None
@@ -448,6 +481,7 @@ class Container:
         self.container_overlay_path = f'{self.container_scratch}/rootfs_overlay'
         self.config_path = f'{self.container_scratch}/config'
         self.log_path = f'{self.container_scratch}/container.log'
+        self.log_uploader: Optional[LogUploader] = None
 
         self.overlay_mounted = False
 
@@ -467,17 +501,18 @@ class Container:
                     # that a user has access to a cached image without pulling.
                     await self.pull_image()
                     self.image_config = image_configs[self.image_ref_str]
-                    self.image_id = self.image_config['Id'].split(":")[1]
-                    self.worker.image_data[self.image_id] += 1
+                    image_id = self.image_config['Id'].split(":")[1]
+                    cache_stats = await self.worker.acquire_image(image_id, self.image_config)
+                    self.image_id = image_id
 
                     self.rootfs_path = f'/host/rootfs/{self.image_id}'
-                    async with self.worker.image_data[self.image_id].lock:
-                        if not os.path.exists(self.rootfs_path):
-                            await asyncio.shield(self.extract_rootfs())
-                            log.info(f'Added expanded image to cache: {self.image_ref_str}, ID: {self.image_id}')
+                    cache_stats['rootfs_cache_hit'] = await self.worker.ensure_rootfs_is_extracted(
+                        self.image_id, self.image_ref_str
+                    )
+                    return cache_stats
 
-            with self.step('pulling'):
-                await self.run_until_done_or_deleted(localize_rootfs)
+            with self.step('pulling') as step:
+                step.timing.update(await self.run_until_done_or_deleted(localize_rootfs))
 
             with self.step('setting up overlay'):
                 await self.run_until_done_or_deleted(self.setup_overlay)
@@ -517,7 +552,7 @@ class Container:
                     await self.delete_container()
                 finally:
                     if self.image_id:
-                        self.worker.image_data[self.image_id] -= 1
+                        self.worker.image_cache.release(self.image_id)
 
     async def run_until_done_or_deleted(self, f: Callable[[], Awaitable[Any]]):
         step = asyncio.ensure_future(f())
@@ -544,12 +579,10 @@ class Container:
         return self.timings.step(name)
 
     async def pull_image(self):
-        is_cloud_image = (is_google_registry_domain(self.image_ref.domain)
-                          or is_azure_registry_domain(self.image_ref.domain))
         is_public_image = self.image_ref.name() in PUBLIC_IMAGES
 
         try:
-            if not is_cloud_image:
+            if not is_cloud_image(self.image_ref):
                 await self.ensure_image_is_pulled()
             elif is_public_image:
                 auth = await self.batch_worker_access_token()
@@ -597,14 +630,6 @@ class Container:
     def current_user_access_token(self):
         return {'username': self.job.credentials.username, 'password': self.job.credentials.password}
 
-    async def extract_rootfs(self):
-        assert self.rootfs_path
-        os.makedirs(self.rootfs_path)
-        await check_shell(
-            f'id=$(docker create {self.image_id}) && docker export $id | tar -C {self.rootfs_path} -xf - && docker rm $id'
-        )
-        log.info(f'Extracted rootfs for image {self.image_ref_str}')
-
     async def setup_overlay(self):
         lower_dir = self.rootfs_path
         upper_dir = f'{self.container_overlay_path}/upper'
@@ -634,6 +659,9 @@ class Container:
             await self.write_container_config()
             async with async_timeout.timeout(self.timeout):
                 with open(self.log_path, 'w') as container_log:
+                    if self.job.format_version.has_chunked_logs():
+                        self.log_uploader = self.job.create_log_uploader(self.name, self.log_path)
+                        self.log_uploader.start()
                     log.info(f'Creating the crun run process for {self}')
                     self.process = await asyncio.create_subprocess_exec(
                         'crun',
@@ -968,6 +996,12 @@ class Container:
         return self.process is not None and self.process.returncode is not None
 
     async def upload_log(self):
+        if self.job.format_version.has_chunked_logs():
+            if self.log_uploader is None:
+                self.log_uploader = self.job.create_log_uploader(self.name, self.log_path)
+            await self.log_uploader.close()
+            return
+
         await self.worker.file_store.write_log_file(
             self.job.format_version,
             self.job.batch_id,
@@ -1038,19 +1072,23 @@ def copy_container(
     requester_pays_project: str,
     client_session: httpx.ClientSession,
     worker: 'Worker',
+    cache_dir: Optional[str] = None,
 ) -> Container:
     assert files
+    command = [
+        '/usr/bin/python3',
+        '-m',
+        'hailtop.aiotools.copy',
+        json.dumps(requester_pays_project),
+        json.dumps(files),
+        '-v',
+    ]
+    if cache_dir is not None:
+        command.extend(['--cache-dir', cache_dir, '--cache-max-bytes', str(INPUT_CACHE_SIZE_GB * 1024**3)])
     copy_spec = {
         'image': BATCH_WORKER_IMAGE,
         'name': name,
-        'command': [
-            '/usr/bin/python3',
-            '-m',
-            'hailtop.aiotools.copy',
-            json.dumps(requester_pays_project),
-            json.dumps(files),
-            '-v',
-        ],
+        'command': command,
         'env': [f'{job.credentials.cloud_env_name}={job.credentials.mount_path}'],
         'cpu': cpu,
         'memory': memory,
@@ -1207,6 +1245,22 @@ class Job:
     async def get_log(self):
         pass
 
+    def log_file_path(self, task: str) -> Optional[str]:  # pylint: disable=unused-argument
+        return None
+
+    def create_log_uploader(self, task: str, path: str) -> LogUploader:
+        return LogUploader(
+            self.worker.file_store,
+            self.format_version,
+            self.batch_id,
+            self.job_id,
+            self.attempt_id,
+            task,
+            path,
+            self.pool,
+            upload_interval_secs=LOG_UPLOAD_INTERVAL_SECS,
+        )
+
     async def delete(self):
         log.info(f'deleting {self}')
         self.deleted = True
@@ -1289,6 +1343,19 @@ class DockerJob(Job):
         containers = {}
 
         if input_files:
+            input_cache_dir = None
+            if INPUT_CACHE_SIZE_GB > 0:
+                # jobs of the same user share a cache; files are only ever
+                # read from it by the copy container of a job of that user
+                input_cache_dir = '/input_cache'
+                self.input_volume_mounts.append(
+                    {
+                        'source': f'{INPUT_CACHE_ROOT}/{self.user}',
+                        'destination': input_cache_dir,
+                        'type': 'none',
+                        'options': ['rbind', 'rw'],
+                    }
+                )
             containers['input'] = copy_container(
                 self,
                 'input',
@@ -1300,6 +1367,7 @@ class DockerJob(Job):
                 requester_pays_project,
                 client_session,
                 worker,
+                cache_dir=input_cache_dir,
             )
 
         # main container
@@ -1376,8 +1444,12 @@ class DockerJob(Job):
 
         assert self.disk is None, self.disk
         os.makedirs(self.io_host_path())
+        if INPUT_CACHE_SIZE_GB > 0:
+            os.makedirs(f'{INPUT_CACHE_ROOT}/{self.user}', exist_ok=True)
 
     async def run(self):
+        # idle JVMs may hold the memory of the cores this job needs
+        self.worker.jvm_pool.make_room(self.cpu_in_mcpu)
         async with self.worker.cpu_sem(self.cpu_in_mcpu):
             self.start_time = time_msecs()
 
@@ -1506,6 +1578,12 @@ class DockerJob(Job):
     async def get_log(self):
         return {name: await c.get_log() for name, c in self.containers.items()}
 
+    def log_file_path(self, task: str) -> Optional[str]:
+        container = self.containers.get(task)
+        if container is None:
+            return None
+        return container.log_path
+
     async def delete(self):
         await super().delete()
         await asyncio.wait([c.delete() for c in self.containers.values()])
@@ -1575,22 +1653,14 @@ class JVMJob(Job):
 
         self.heap_size = self.memory_in_bytes - self.stack_size
 
-        user_command_string = job_spec['process']['command']
-        assert len(user_command_string) >= 3, user_command_string
-        self.revision = user_command_string[1]
-        self.jar_url = user_command_string[2]
-        classpath = f'{find_spark_home()}/jars/*:/hail-jars/{self.revision}.jar:/log4j.properties'
-
-        self.command_string = [
-            'java',
-            '-classpath',
-            classpath,
-            f'-Xmx{self.heap_size}',
-            f'-Xss{self.stack_size}',
-            *user_command_string,
-        ]
+        self.user_command_string = job_spec['process']['command']
+        assert len(self.user_command_string) >= 3, self.user_command_string
+        self.revision = self.user_command_string[1]
+        self.jar_url = self.user_command_string[2]
 
+        self.jvm = None
         self.process = None
+        self.exit_code = None
         self.deleted = False
         self.timings = Timings(lambda: self.deleted)
         self.state = 'pending'
@@ -1599,11 +1669,51 @@ class JVMJob(Job):
     def step(self, name):
         return self.timings.step(name)
 
-    async def pipe_to_log(self, strm: asyncio.StreamReader):
-        while not strm.at_eof():
-            self.logbuffer.extend(await strm.readline())
+    @staticmethod
+    def java_command(revision: str, heap_size: int):
+        classpath = f'{find_spark_home()}/jars/*:/hail-jars/{revision}.jar:/log4j.properties'
+        return ['java', '-classpath', classpath, f'-Xmx{heap_size}', f'-Xss{JVMJob.stack_size}']
+
+    def log_path(self):
+        return f'{self.scratch}/log'
+
+    async def run_in_process(self, env: Dict[str, str]) -> int:
+        # JARs built before JVMEntryway existed cannot run in a pooled JVM
+        with open(self.log_path(), 'ab') as log_file:
+            self.process = await asyncio.create_subprocess_exec(
+                *self.java_command(self.revision, self.heap_size),
+                *self.user_command_string,
+                stdout=log_file,
+                stderr=log_file,
+                env=env,
+            )
+        return await self.process.wait()
+
+    async def run_in_pool(self, env: Dict[str, str]) -> int:
+        if self.jvm is None:
+            self.jvm = await self.worker.jvm_pool.acquire(self.user, self.revision, self.heap_size)
+        return await self.jvm.execute(env, self.log_path(), self.user_command_string)
+
+    def read_log(self) -> bytes:
+        try:
+            with open(self.log_path(), 'rb') as f:
+                return f.read()
+        except FileNotFoundError:
+            return b''
 
     async def run(self):
+        # the JVM is taken before the job waits for its cores and returned once
+        # they are released, so that they cover its memory while it is not idle
+        self.jvm = self.worker.jvm_pool.take_idle(self.user, self.revision, self.heap_size)
+        self.worker.jvm_pool.make_room(self.cpu_in_mcpu)
+        try:
+            await self.run_with_cores()
+        finally:
+            if self.jvm is not None:
+                jvm, self.jvm = self.jvm, None
+                self.worker.jvm_pool.release(jvm)
+
+    async def run_with_cores(self):
         async with worker.cpu_sem(self.cpu_in_mcpu):
             self.start_time = time_msecs()
 
@@ -1641,26 +1751,36 @@ class JVMJob(Job):
                                             break
                                         written = await local_file.write(b)
                                         assert written == len(b)
+                        if self.revision not in self.worker.jar_has_entryway:
+                            self.worker.jar_has_entryway[self.revision] = await blocking_to_async(
+                                self.pool, jar_has_entryway, local_jar_location
+                            )
 
-                log.info(f'{self}: running jvm process')
+                log.info(f'{self}: running job in a jvm')
                 with self.step('running'):
-                    self.process = await asyncio.create_subprocess_exec(
-                        *self.command_string,
-                        stdout=asyncio.subprocess.PIPE,
-                        stderr=asyncio.subprocess.PIPE,
-                        env={envvar['name']: envvar['value'] for envvar in self.env},
-                    )
-
-                    await asyncio.gather(self.pipe_to_log(self.process.stdout), self.pipe_to_log(self.process.stderr))
-                    await self.process.wait()
+                    log_uploader = None
+                    if self.format_version.has_chunked_logs():
+                        log_uploader = self.create_log_uploader('main', self.log_path())
+                        log_uploader.start()
+                    try:
+                        env = {envvar['name']: envvar['value'] for envvar in self.env}
+                        if self.worker.jar_has_entryway[self.revision]:
+                            self.exit_code = await self.run_in_pool(env)
+                        else:
+                            self.exit_code = await self.run_in_process(env)
+                    finally:
+                        if log_uploader is not None:
+                            await log_uploader.close()
 
-                log.info(f'finished {self} with return code {self.process.returncode}')
+                log.info(f'finished {self} with return code {self.exit_code}')
 
-                await self.worker.file_store.write_log_file(
-                    self.format_version, self.batch_id, self.job_id, self.attempt_id, 'main', self.logbuffer.decode()
-                )
+                if not self.format_version.has_chunked_logs():
+                    self.logbuffer = bytearray(await blocking_to_async(self.pool, self.read_log))
+                    await self.worker.file_store.write_log_file(
+                        self.format_version, self.batch_id, self.job_id, self.attempt_id, 'main', self.logbuffer.decode()
+                    )
 
-                if self.process.returncode == 0:
+                if self.exit_code == 0:
                     self.state = 'succeeded'
                 else:
                     self.state = 'failed'
@@ -1693,11 +1813,30 @@ class JVMJob(Job):
             log.exception('while deleting volumes')
 
     async def get_log(self):
+        if self.state == 'running':
+            return {'main': (await blocking_to_async(self.pool, self.read_log)).decode()}
+        if self.format_version.has_chunked_logs():
+            try:
+                return {
+                    'main': await self.worker.file_store.read_log_file(
+                        self.format_version, self.batch_id, self.job_id, self.attempt_id, 'main'
+                    )
+                }
+            except FileNotFoundError:
+                return {'main': ''}
         return {'main': self.logbuffer.decode()}
 
+    def log_file_path(self, task: str) -> Optional[str]:
+        if task != 'main':
+            return None
+        return self.log_path()
+
     async def delete(self):
         log.info(f'deleting {self}')
         self.deleted = True
+        # the JVM is not returned to the pool once it is dead
+        if self.jvm is not None and self.jvm.alive:
+            self.jvm.process.kill()
         if self.process is not None and self.process.returncode is None:
             self.process.kill()
 
@@ -1720,58 +1859,50 @@ class JVMJob(Job):
         status = await super().status()
         status['container_statuses'] = dict()
         status['container_statuses']['main'] = {'name': 'main', 'state': self.state, 'timing': self.timings.to_dict()}
-        if self.process is not None and self.process.returncode is not None:
-            status['container_statuses']['main']['exit_code'] = self.process.returncode
+        if self.exit_code is not None:
+            status['container_statuses']['main']['exit_code'] = self.exit_code
         return status
 
     def __str__(self):
         return f'job {self.id}'
 
 
-class ImageData:
-    def __init__(self):
-        self.ref_count = 0
-        self.time_created = time_msecs()
-        self.last_accessed = time_msecs()
-        self.lock = asyncio.Lock()
-
-    def __add__(self, other):
-        self.ref_count += other
-        self.last_accessed = time_msecs()
-        return self
-
-    def __sub__(self, other):
-        self.ref_count -= other
-        assert self.ref_count >= 0
-        self.last_accessed = time_msecs()
-        return self
-
-    def __str__(self):
-        return (
-            f'ImageData('
-            f'ref_count={self.ref_count}, '
-            f'time_created={time_msecs_str(self.time_created)}, '
-            f'last_accessed={time_msecs_str(self.last_accessed)}'
-            f')'
-        )
-
-
 class Worker:
     def __init__(self, client_session: httpx.ClientSession):
         self.active = False
         self.cores_mcpu = CORES * 1000
         self.last_updated = time_msecs()
         self.cpu_sem = FIFOWeightedSemaphore(self.cores_mcpu)
-        self.data_disk_space_remaining = Box(UNRESERVED_WORKER_DATA_DISK_SIZE_GB)
+        self.data_disk_space_remaining = Box(UNRESERVED_WORKER_DATA_DISK_SIZE_GB - INPUT_CACHE_SIZE_GB)
         self.pool = concurrent.futures.ThreadPoolExecutor()
         self.jobs: Dict[Tuple[int, int], Job] = {}
         self.stop_event = asyncio.Event()
         self.task_manager = aiotools.BackgroundTaskManager()
         self.jar_download_locks: Dict[str, asyncio.Lock] = defaultdict(asyncio.Lock)
+        self.jvm_pool = JVMPool(
+            JVMJob.java_command,
+            self.task_manager,
+            self.cpu_sem,
+            worker_memory_per_core_bytes(CLOUD, instance_config.worker_type()),
+            max_idle=CORES,
+            non_heap_bytes=JVM_NON_HEAP_BYTES,
+            max_jobs_per_jvm=MAX_JOBS_PER_JVM,
+        )
+        # revision -> whether its JAR can run in a pooled JVM
+        self.jar_has_entryway: Dict[str, bool] = {}
         self.client_session = client_session
+        self.job_status_reporter = JobStatusReporter(
+            self.post_job_statuses,
+            flush_interval_secs=JOB_STATUS_FLUSH_INTERVAL_SECS,
+            max_statuses=MAX_JOB_STATUSES_PER_REQUEST,
+        )
 
-        self.image_data: Dict[str, ImageData] = defaultdict(ImageData)
-        self.image_data[BATCH_WORKER_IMAGE_ID] += 1
+        self.image_cache = ImageCache(
+            # only the storage the scheduler does not give to jobs
+            RESERVED_IMAGE_STORAGE_GB * 1024**3,
+            pinned=[BATCH_WORKER_IMAGE_ID],
+        )
+        self.images_being_prefetched: Set[str] = set()
 
         # filled in during activation
         self.fs = None
@@ -1782,6 +1913,8 @@ class Worker:
     async def shutdown(self):
         log.info('Worker.shutdown')
         try:
+            await self.jvm_pool.close()
+            log.info(f'closed {self.jvm_pool}')
             self.task_manager.shutdown()
             log.info('shutdown task manager')
         finally:
@@ -1814,7 +1947,9 @@ class Worker:
 
     async def create_job_1(self, request):
         body = await request.json()
+        return await self.create_job_from_config(body)
 
+    async def create_job_from_config(self, body):
         batch_id = body['batch_id']
         job_id = body['job_id']
 
@@ -1874,6 +2009,104 @@ class Worker:
     async def create_job(self, request):
         return await asyncio.shield(self.create_job_1(request))
 
+    async def create_jobs_1(self, request):
+        body = await request.json()
+
+        async def create(config):
+            try:
+                return (await self.create_job_from_config(config)).status
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                log.exception(f'while creating job {(config["batch_id"], config["job_id"])}')
+                return 500
+
+        statuses = await asyncio.gather(*[create(config) for config in body['jobs']])
+        return web.json_response({'statuses': statuses})
+
+    async def create_jobs(self, request):
+        return await asyncio.shield(self.create_jobs_1(request))
+
+    async def acquire_image(self, image_id: str, image_config: Dict[str, Any]) -> Dict[str, Any]:
+        """Add a pulled image to the image cache, if it is not there, and hold
+        it for a container. Returns how much of it was cached, for the job
+        timings."""
+        hit = self.image_cache.get(image_id) is not None
+        layer_cache_hit_ratio = 1.0 if hit else await self.add_image_to_cache(image_id, image_config)
+        self.image_cache.acquire(image_id, hit)
+        return {'image_cache_hit': hit, 'layer_cache_hit_ratio': layer_cache_hit_ratio}
+
+    async def add_image_to_cache(self, image_id: str, image_config: Dict[str, Any]) -> float:
+        assert docker
+        history = await docker_call_retry(MAX_DOCKER_OTHER_OPERATION_SECS, f'history of {image_id}')(
+            docker.images.history, image_id
+        )
+        layers = layer_sizes(image_config['RootFS'].get('Layers', []), history, image_config['Size'])
+        size_bytes = sum(size for _, size in layers)
+        cached_bytes = self.image_cache.cached_layer_bytes(layers)
+        self.image_cache.add(image_id, layers, image_config['Size'])
+        return cached_bytes / size_bytes if size_bytes else 1.0
+
+    async def ensure_rootfs_is_extracted(self, image_id: str, image_ref_str: str) -> bool:
+        """Extract the root filesystem of a cached image, if it is not extracted
+        yet. Returns whether it already was."""
+        rootfs_path = f'/host/rootfs/{image_id}'
+        async with self.image_cache.images[image_id].lock:
+            if os.path.exists(rootfs_path):
+                return True
+            await asyncio.shield(self.extract_rootfs(image_id, rootfs_path))
+            log.info(f'Added expanded image to cache: {image_ref_str}, ID: {image_id}')
+            return False
+
+    async def extract_rootfs(self, image_id: str, rootfs_path: str):
+        os.makedirs(rootfs_path)
+        await check_shell(
+            f'id=$(docker create {image_id}) && docker export $id | tar -C {rootfs_path} -xf - && docker rm $id'
+        )
+        log.info(f'Extracted rootfs for image {image_id}')
+
+    async def prefetch_image(self, image: str):
+        image_ref = job_image_reference(image)
+        image_ref_str = str(image_ref)
+        if is_cloud_image(image_ref) and image_ref.name() not in PUBLIC_IMAGES:
+            # the job's own pull checks that its user may access a private image
+            return
+        if image_ref_str in self.images_being_prefetched:
+            return
+
+        self.images_being_prefetched.add(image_ref_str)
+        try:
+            async with image_lock.reader_lock:
+                image_config = image_configs.get(image_ref_str)
+                if image_config is not None and self.image_cache.get(image_config['Id'].split(':')[1]):
+                    return
+                auth = None
+                if is_cloud_image(image_ref):
+                    auth = await CLOUD_WORKER_API.worker_access_token(self.client_session)
+                await docker_call_retry(MAX_DOCKER_IMAGE_PULL_SECS, f'prefetch of {image_ref_str}')(
+                    pull_docker_image, self.pool, image_ref_str, auth=auth
+                )
+                image_config, _ = await check_exec_output('docker', 'inspect', image_ref_str)
+                image_config = json.loads(image_config)[0]
+                image_configs[image_ref_str] = image_config
+                image_id = image_config['Id'].split(':')[1]
+                if self.image_cache.get(image_id) is None:
+                    await self.add_image_to_cache(image_id, image_config)
+                await self.ensure_rootfs_is_extracted(image_id, image_ref_str)
+                log.info(f'prefetched image {image_ref_str}, ID: {image_id}')
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            log.exception(f'while prefetching image {image_ref_str}, ignoring')
+        finally:
+            self.images_being_prefetched.remove(image_ref_str)
+
+    async def prefetch_images(self, request):
+        body = await request.json()
+        for image in body['images']:
+            self.task_manager.ensure_future(self.prefetch_image(image))
+        return web.Response()
+
     async def get_job_log(self, request):
         batch_id = int(request.match_info['batch_id'])
         job_id = int(request.match_info['job_id'])
@@ -1883,6 +2116,28 @@ class Worker:
             raise web.HTTPNotFound()
         return web.json_response(await job.get_log())
 
+    async def get_job_log_range(self, request):
+        batch_id = int(request.match_info['batch_id'])
+        job_id = int(request.match_info['job_id'])
+        id = (batch_id, job_id)
+        job = self.jobs.get(id)
+        if not job:
+            raise web.HTTPNotFound()
+        path = job.log_file_path(request.match_info['task'])
+        if path is None:
+            raise web.HTTPNotFound()
+        try:
+            size = os.stat(path).st_size
+        except FileNotFoundError as e:
+            raise web.HTTPNotFound() from e
+        range_header = request.headers.get('Range')
+        start, end = parse_byte_range(range_header, size)
+        data = await blocking_to_async(self.pool, read_file_range, path, start, end - start)
+        if len(data) < end - start:
+            # the log was removed while the job finished
+            raise web.HTTPNotFound()
+        return byte_range_response(data, range_header, start, end, size)
+
     async def get_job_status(self, request):
         batch_id = int(request.match_info['batch_id'])
         job_id = int(request.match_info['job_id'])
@@ -1922,8 +2177,11 @@ class Worker:
             [
                 web.post('/api/v1alpha/kill', self.kill),
                 web.post('/api/v1alpha/batches/jobs/create', self.create_job),
+                web.post('/api/v1alpha/batches/jobs/create_many', self.create_jobs),
+                web.post('/api/v1alpha/images/prefetch', self.prefetch_images),
                 web.delete('/api/v1alpha/batches/{batch_id}/jobs/{job_id}/delete', self.delete_job),
                 web.get('/api/v1alpha/batches/{batch_id}/jobs/{job_id}/log', self.get_job_log),
+                web.get('/api/v1alpha/batches/{batch_id}/jobs/{job_id}/log/{task}', self.get_job_log_range),
                 web.get('/api/v1alpha/batches/{batch_id}/jobs/{job_id}/status', self.get_job_status),
                 web.get('/healthcheck', self.healthcheck),
             ]
@@ -1939,7 +2197,10 @@ class Worker:
         site = web.TCPSite(app_runner, '0.0.0.0', 5000)
         await site.start()
 
+        self.task_manager.ensure_future(self.job_status_reporter.run())
         self.task_manager.ensure_future(periodically_call(60, self.cleanup_old_images))
+        if INPUT_CACHE_SIZE_GB > 0:
+            self.task_manager.ensure_future(periodically_call(60, self.cleanup_input_cache))
         try:
             while True:
                 try:
@@ -2005,36 +2266,17 @@ class Worker:
             'status': db_status,
         }
 
-        body = {'status': status}
-
-        start_time = time_msecs()
-        delay_secs = 0.1
-        while True:
-            try:
-                await self.client_session.post(
-                    deploy_config.url('batch-driver', '/api/v1alpha/instances/job_complete'),
-                    json=body,
-                    headers=self.headers,
-                )
-                return
-            except asyncio.CancelledError:  # pylint: disable=try-except-raise
-                raise
-            except Exception as e:
-                if isinstance(e, aiohttp.ClientResponseError) and e.status == 404:  # pylint: disable=no-member
-                    raise
-                log.warning(f'failed to mark {job} complete, retrying', exc_info=True)
+        reported = self.job_status_reporter.complete(status)
 
-            # unlist job after 3m or half the run duration
-            now = time_msecs()
-            elapsed = now - start_time
-            if job.id in self.jobs and elapsed > 180 * 1000 and elapsed > run_duration / 2:
+        # unlist job after 3m or half the run duration
+        try:
+            await asyncio.wait_for(asyncio.shield(reported), max(180, run_duration / 2 / 1000))
+        except asyncio.TimeoutError:
+            if job.id in self.jobs:
                 log.info(f'too much time elapsed marking {job} complete, removing from jobs, will keep retrying')
                 del self.jobs[job.id]
                 self.last_updated = time_msecs()
-
-            await asyncio.sleep(delay_secs * random.uniform(0.7, 1.3))
-            # exponentially back off, up to (expected) max of 2m
-            delay_secs = min(delay_secs * 2, 2 * 60.0)
+            await reported
 
     async def post_job_complete(self, job):
         try:
@@ -2061,15 +2303,7 @@ class Worker:
             'resources': full_status['resources'],
         }
 
-        body = {'status': status}
-
-        await request_retry_transient_errors(
-            self.client_session,
-            'POST',
-            deploy_config.url('batch-driver', '/api/v1alpha/instances/job_started'),
-            json=body,
-            headers=self.headers,
-        )
+        await self.job_status_reporter.started(status)
 
     async def post_job_started(self, job):
         try:
@@ -2079,6 +2313,13 @@ class Worker:
         except Exception:
             log.exception(f'error while posting {job} started')
 
+    async def post_job_statuses(self, body):
+        await self.client_session.post(
+            deploy_config.url('batch-driver', '/api/v1alpha/instances/job_statuses'),
+            json=body,
+            headers=self.headers,
+        )
+
     async def activate(self):
         resp = await request_retry_transient_errors(
             self.client_session,
@@ -2120,23 +2361,35 @@ class Worker:
     async def cleanup_old_images(self):
         try:
             async with image_lock.writer_lock:
-                log.info(f"Obtained writer lock. The image ref counts are: {self.image_data}")
-                for image_id in list(self.image_data.keys()):
-                    now = time_msecs()
-                    image_data = self.image_data[image_id]
-                    if image_data.ref_count == 0 and (now - image_data.last_accessed) > 10 * 60 * 1000:
-                        assert image_id != BATCH_WORKER_IMAGE_ID
-                        log.info(f'Found an unused image with ID {image_id}')
-                        await check_shell(f'docker rmi -f {image_id}')
-                        image_path = f'/host/rootfs/{image_id}'
+                log.info(f'Obtained writer lock. The image cache is: {self.image_cache}')
+                for image_id in self.image_cache.eviction_candidates():
+                    assert image_id != BATCH_WORKER_IMAGE_ID
+                    log.info(f'Evicting unused image with ID {image_id}')
+                    await check_shell(f'docker rmi -f {image_id}')
+                    image_path = f'/host/rootfs/{image_id}'
+                    if os.path.exists(image_path):
                         await blocking_to_async(self.pool, shutil.rmtree, image_path)
-                        del self.image_data[image_id]
-                        log.info(f'Deleted image from cache with ID {image_id}')
+                    self.image_cache.remove(image_id)
+                    log.info(f'Deleted image from cache with ID {image_id}')
         except asyncio.CancelledError:
             raise
         except Exception as e:
             log.exception(f'Error while deleting unused image: {e}')
 
+    async def cleanup_input_cache(self):
+        # each copy container keeps its user's cache under the budget; this
+        # keeps the caches of all users under it together
+        try:
+            n_bytes_removed = await blocking_to_async(
+                self.pool, evict_least_recently_used, INPUT_CACHE_ROOT, INPUT_CACHE_SIZE_GB * 1024**3
+            )
+            if n_bytes_removed:
+                log.info(f'Evicted {n_bytes_removed} bytes from the input cache')
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            log.exception(f'Error while evicting from the input cache: {e}')
+
 
 async def async_main():
     global port_allocator, network_allocator, worker, docker, docker_sync
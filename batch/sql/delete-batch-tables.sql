@@ -5,10 +5,14 @@ DROP PROCEDURE IF EXISTS deactivate_instance;
 DROP PROCEDURE IF EXISTS mark_instance_deleted;
 DROP PROCEDURE IF EXISTS close_batch;
 DROP PROCEDURE IF EXISTS schedule_job;
+DROP PROCEDURE IF EXISTS schedule_job_in_transaction;
 DROP PROCEDURE IF EXISTS unschedule_job;
 DROP PROCEDURE IF EXISTS mark_job_creating;
 DROP PROCEDURE IF EXISTS mark_job_started;
+DROP PROCEDURE IF EXISTS mark_job_started_in_transaction;
 DROP PROCEDURE IF EXISTS mark_job_complete;
+DROP PROCEDURE IF EXISTS mark_job_complete_in_transaction;
+DROP PROCEDURE IF EXISTS mark_job_statuses;
 DROP PROCEDURE IF EXISTS add_attempt;
 
 DROP TRIGGER IF EXISTS instances_before_update;
@@ -902,8 +902,8 @@ BEGIN
   END IF;
 END $$
 
-DROP PROCEDURE IF EXISTS schedule_job $$
-CREATE PROCEDURE schedule_job(
+DROP PROCEDURE IF EXISTS schedule_job_in_transaction $$
+CREATE PROCEDURE schedule_job_in_transaction(
   IN in_batch_id BIGINT,
   IN in_job_id INT,
   IN in_attempt_id VARCHAR(40),
@@ -918,8 +918,6 @@ BEGIN
   DECLARE delta_cores_mcpu INT;
   DECLARE cur_instance_is_pool BOOLEAN;
 
-  START TRANSACTION;
-
   SELECT state, cores_mcpu, attempt_id
   INTO cur_job_state, cur_cores_mcpu, cur_attempt_id
   FROM jobs
@@ -953,10 +951,8 @@ BEGIN
 
   IF (cur_job_state = 'Ready' OR cur_job_state = 'Creating') AND NOT cur_job_cancel AND cur_instance_state = 'active' THEN
     UPDATE jobs SET state = 'Running', attempt_id = in_attempt_id WHERE batch_id = in_batch_id AND job_id = in_job_id;
-    COMMIT;
     SELECT 0 as rc, in_instance_name, delta_cores_mcpu;
   ELSE
-    COMMIT;
     SELECT 1 as rc,
       cur_job_state,
       cur_job_cancel,
@@ -968,6 +964,19 @@ BEGIN
   END IF;
 END $$
 
+DROP PROCEDURE IF EXISTS schedule_job $$
+CREATE PROCEDURE schedule_job(
+  IN in_batch_id BIGINT,
+  IN in_job_id INT,
+  IN in_attempt_id VARCHAR(40),
+  IN in_instance_name VARCHAR(100)
+)
+BEGIN
+  START TRANSACTION;
+  CALL schedule_job_in_transaction(in_batch_id, in_job_id, in_attempt_id, in_instance_name);
+  COMMIT;
+END $$
+
 DROP PROCEDURE IF EXISTS unschedule_job $$
 CREATE PROCEDURE unschedule_job(
   IN in_batch_id BIGINT,
@@ -1068,13 +1077,14 @@ BEGIN
   SELECT 0 as rc, delta_cores_mcpu;
 END $$
 
-DROP PROCEDURE IF EXISTS mark_job_started $$
-CREATE PROCEDURE mark_job_started(
+DROP PROCEDURE IF EXISTS mark_job_started_in_transaction $$
+CREATE PROCEDURE mark_job_started_in_transaction(
   IN in_batch_id BIGINT,
   IN in_job_id INT,
   IN in_attempt_id VARCHAR(40),
   IN in_instance_name VARCHAR(100),
-  IN new_start_time BIGINT
+  IN new_start_time BIGINT,
+  OUT out_delta_cores_mcpu INT
 )
 BEGIN
   DECLARE cur_job_state VARCHAR(40);
@@ -1083,8 +1093,6 @@ BEGIN
   DECLARE cur_instance_state VARCHAR(40);
   DECLARE delta_cores_mcpu INT;
 
-  START TRANSACTION;
-
   SELECT state, cores_mcpu
   INTO cur_job_state, cur_cores_mcpu
   FROM jobs
@@ -1109,12 +1117,29 @@ BEGIN
     UPDATE jobs SET state = 'Running', attempt_id = in_attempt_id WHERE batch_id = in_batch_id AND job_id = in_job_id;
   END IF;
 
+  SET out_delta_cores_mcpu = delta_cores_mcpu;
+END $$
+
+DROP PROCEDURE IF EXISTS mark_job_started $$
+CREATE PROCEDURE mark_job_started(
+  IN in_batch_id BIGINT,
+  IN in_job_id INT,
+  IN in_attempt_id VARCHAR(40),
+  IN in_instance_name VARCHAR(100),
+  IN new_start_time BIGINT
+)
+BEGIN
+  DECLARE delta_cores_mcpu INT;
+
+  START TRANSACTION;
+  CALL mark_job_started_in_transaction(in_batch_id, in_job_id, in_attempt_id, in_instance_name, new_start_time,
+    delta_cores_mcpu);
   COMMIT;
   SELECT 0 as rc, delta_cores_mcpu;
 END $$
 
-DROP PROCEDURE IF EXISTS mark_job_complete $$
-CREATE PROCEDURE mark_job_complete(
+DROP PROCEDURE IF EXISTS mark_job_complete_in_transaction $$
+CREATE PROCEDURE mark_job_complete_in_transaction(
   IN in_batch_id BIGINT,
   IN in_job_id INT,
   IN in_attempt_id VARCHAR(40),
@@ -1124,7 +1149,11 @@ CREATE PROCEDURE mark_job_complete(
   IN new_start_time BIGINT,
   IN new_end_time BIGINT,
   IN new_reason VARCHAR(40),
-  IN new_timestamp BIGINT
+  IN new_timestamp BIGINT,
+  OUT out_rc INT,
+  OUT out_old_state VARCHAR(40),
+  OUT out_delta_cores_mcpu INT,
+  OUT out_message TEXT
 )
 BEGIN
   DECLARE cur_job_state VARCHAR(40);
@@ -1134,8 +1163,6 @@ BEGIN
   DECLARE delta_cores_mcpu INT DEFAULT 0;
   DECLARE expected_attempt_id VARCHAR(40);
 
-  START TRANSACTION;
-
   SELECT state, cores_mcpu
   INTO cur_job_state, cur_cores_mcpu
   FROM jobs
@@ -1165,12 +1192,12 @@ BEGIN
   WHERE batch_id = in_batch_id AND job_id = in_job_id
   FOR UPDATE;
 
+  SET out_old_state = cur_job_state;
+  SET out_message = NULL;
+
   IF expected_attempt_id IS NOT NULL AND expected_attempt_id != in_attempt_id THEN
-    COMMIT;
-    SELECT 2 as rc,
-      expected_attempt_id,
-      delta_cores_mcpu,
-      'input attempt id does not match expected attempt id' as message;
+    SET out_rc = 2;
+    SET out_message = CONCAT('input attempt id does not match expected attempt id ', expected_attempt_id);
   ELSEIF cur_job_state = 'Ready' OR cur_job_state = 'Creating' OR cur_job_state = 'Running' THEN
     UPDATE jobs
     SET state = new_state, status = new_status, attempt_id = in_attempt_id
@@ -1201,23 +1228,104 @@ BEGIN
             `job_parents`.batch_id = in_batch_id AND
             `job_parents`.parent_id = in_job_id;
 
-    COMMIT;
-    SELECT 0 as rc,
-      cur_job_state as old_state,
-      delta_cores_mcpu;
+    SET out_rc = 0;
   ELSEIF cur_job_state = 'Cancelled' OR cur_job_state = 'Error' OR
          cur_job_state = 'Failed' OR cur_job_state = 'Success' THEN
-    COMMIT;
-    SELECT 0 as rc,
-      cur_job_state as old_state,
-      delta_cores_mcpu;
+    SET out_rc = 0;
   ELSE
-    COMMIT;
-    SELECT 1 as rc,
-      cur_job_state,
-      delta_cores_mcpu,
-      'job state not Ready, Creating, Running or complete' as message;
+    SET out_rc = 1;
+    SET out_message = 'job state not Ready, Creating, Running or complete';
   END IF;
+
+  SET out_delta_cores_mcpu = delta_cores_mcpu;
+END $$
+
+DROP PROCEDURE IF EXISTS mark_job_complete $$
+CREATE PROCEDURE mark_job_complete(
+  IN in_batch_id BIGINT,
+  IN in_job_id INT,
+  IN in_attempt_id VARCHAR(40),
+  IN in_instance_name VARCHAR(100),
+  IN new_state VARCHAR(40),
+  IN new_status TEXT,
+  IN new_start_time BIGINT,
+  IN new_end_time BIGINT,
+  IN new_reason VARCHAR(40),
+  IN new_timestamp BIGINT
+)
+BEGIN
+  DECLARE rc INT;
+  DECLARE old_state VARCHAR(40);
+  DECLARE delta_cores_mcpu INT;
+  DECLARE message TEXT;
+
+  START TRANSACTION;
+  CALL mark_job_complete_in_transaction(in_batch_id, in_job_id, in_attempt_id, in_instance_name, new_state,
+    new_status, new_start_time, new_end_time, new_reason, new_timestamp,
+    rc, old_state, delta_cores_mcpu, message);
+  COMMIT;
+  SELECT rc, old_state, delta_cores_mcpu, message;
+END $$
+
+# Applies the job started and job complete statuses a worker sent together, in
+# one transaction. `in_started` and `in_complete` are JSON arrays of objects
+# with the arguments of mark_job_started and mark_job_complete; started
+# statuses are applied first. Returns the results of each as JSON arrays.
+DROP PROCEDURE IF EXISTS mark_job_statuses $$
+CREATE PROCEDURE mark_job_statuses(
+  IN in_instance_name VARCHAR(100),
+  IN in_started JSON,
+  IN in_complete JSON,
+  IN new_timestamp BIGINT
+)
+BEGIN
+  DECLARE i INT DEFAULT 0;
+  DECLARE job JSON;
+  DECLARE rc INT;
+  DECLARE old_state VARCHAR(40);
+  DECLARE delta_cores_mcpu INT;
+  DECLARE message TEXT;
+  DECLARE started_results JSON DEFAULT JSON_ARRAY();
+  DECLARE complete_results JSON DEFAULT JSON_ARRAY();
+
+  START TRANSACTION;
+
+  WHILE i < JSON_LENGTH(in_started) DO
+    SET job = JSON_EXTRACT(in_started, CONCAT('$[', i, ']'));
+    CALL mark_job_started_in_transaction(
+      JSON_UNQUOTE(JSON_EXTRACT(job, '$.batch_id')),
+      JSON_UNQUOTE(JSON_EXTRACT(job, '$.job_id')),
+      NULLIF(JSON_UNQUOTE(JSON_EXTRACT(job, '$.attempt_id')), 'null'),
+      in_instance_name,
+      NULLIF(JSON_UNQUOTE(JSON_EXTRACT(job, '$.start_time')), 'null'),
+      delta_cores_mcpu);
+    SET started_results = JSON_ARRAY_APPEND(started_results, '$',
+      JSON_OBJECT('delta_cores_mcpu', delta_cores_mcpu));
+    SET i = i + 1;
+  END WHILE;
+
+  SET i = 0;
+  WHILE i < JSON_LENGTH(in_complete) DO
+    SET job = JSON_EXTRACT(in_complete, CONCAT('$[', i, ']'));
+    CALL mark_job_complete_in_transaction(
+      JSON_UNQUOTE(JSON_EXTRACT(job, '$.batch_id')),
+      JSON_UNQUOTE(JSON_EXTRACT(job, '$.job_id')),
+      NULLIF(JSON_UNQUOTE(JSON_EXTRACT(job, '$.attempt_id')), 'null'),
+      in_instance_name,
+      JSON_UNQUOTE(JSON_EXTRACT(job, '$.state')),
+      NULLIF(JSON_UNQUOTE(JSON_EXTRACT(job, '$.status')), 'null'),
+      NULLIF(JSON_UNQUOTE(JSON_EXTRACT(job, '$.start_time')), 'null'),
+      NULLIF(JSON_UNQUOTE(JSON_EXTRACT(job, '$.end_time')), 'null'),
+      JSON_UNQUOTE(JSON_EXTRACT(job, '$.reason')),
+      new_timestamp,
+      rc, old_state, delta_cores_mcpu, message);
+    SET complete_results = JSON_ARRAY_APPEND(complete_results, '$',
+      JSON_OBJECT('rc', rc, 'old_state', old_state, 'delta_cores_mcpu', delta_cores_mcpu, 'message', message));
+    SET i = i + 1;
+  END WHILE;
+
+  COMMIT;
+  SELECT started_results, complete_results;
 END $$
 
 DELIMITER ;
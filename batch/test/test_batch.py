@@ -312,6 +312,35 @@ def test_list_jobs(client: BatchClient):
     b.cancel()
 
 
+def test_list_jobs_bulk(client: BatchClient):
+    b = client.create_batch()
+    j_success = b.create_job(DOCKER_ROOT_IMAGE, ['true'])
+    j_failure = b.create_job(DOCKER_ROOT_IMAGE, ['false'])
+    j_running = b.create_job(DOCKER_ROOT_IMAGE, ['sleep', '1800'])
+
+    b = b.submit()
+    j_success.wait()
+    j_failure.wait()
+
+    def assert_job_ids(expected, state=None):
+        jobs = list(b.jobs_bulk(state=state))
+        actual = [j['job_id'] for j in jobs]
+        assert actual == expected, str((jobs, b.debug_info()))
+
+    assert_job_ids([j_success.job_id], 'success')
+    assert_job_ids([j_success.job_id, j_failure.job_id], 'done')
+    assert_job_ids([j_success.job_id, j_failure.job_id, j_running.job_id])
+
+    jobs = {j['job_id']: j for j in b.jobs()}
+    for j in b.jobs_bulk('done'):
+        expected = jobs[j['job_id']]
+        assert set(j) == set(expected), str((j, expected, b.debug_info()))
+        for key in ('name', 'user', 'billing_project', 'state', 'exit_code', 'msec_mcpu'):
+            assert j[key] == expected[key], str((j, expected, b.debug_info()))
+
+    b.cancel()
+
+
 def test_include_jobs(client: BatchClient):
     b1 = client.create_batch()
     for i in range(2):
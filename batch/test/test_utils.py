@@ -1,5 +1,28 @@
+import asyncio
+import concurrent.futures
+import contextlib
+import os
+import struct
+import zipfile
+
+import aiohttp
+import pytest
+from aiohttp import web
+
 from hailtop.batch_client.parse import parse_memory_in_bytes
 from batch.cloud.resource_utils import adjust_cores_for_packability
+from batch.driver.packing import InstancePacker, pack_jobs
+from batch.driver.worker_jobs import create_jobs_on_worker
+from batch.worker.image_cache import ImageCache, layer_sizes
+from batch.worker.jvm_pool import JVMPool, encode_job, jar_has_entryway
+from batch.worker.status_reporter import JobStatusReporter
+from batch.worker.log_uploader import LogUploader
+from batch.batch_changes import BatchChangeListener, BatchChangeLog
+from batch.batch_format_version import BatchFormatVersion
+from batch.semaphore import FIFOWeightedSemaphore
+from batch.file_store import FileStore
+from batch.utils import parse_byte_range, parse_content_range
+from hailtop.aiotools import BackgroundTaskManager, LocalAsyncFS
 
 
 def test_packability():
@@ -23,3 +46,437 @@ def test_memory_str_to_bytes():
     assert parse_memory_in_bytes('7') == 7
     assert parse_memory_in_bytes('1K') == 1000
     assert parse_memory_in_bytes('1Ki') == 1024
+
+
+def test_pack_jobs_best_fit_decreasing():
+    packer = InstancePacker([('a', 4000, 'us-central1-a'), ('b', 1000, 'us-central1-b'), ('c', 2000, 'us-central1-b')])
+    jobs = [('j1', 1000, None), ('j2', 4000, None), ('j3', 2000, 'us-central1-a'), ('j4', 1000, None), ('j5', 500, None)]
+    placed, unplaced = pack_jobs(packer, jobs, cores_mcpu=lambda j: j[1], location=lambda j: j[2])
+    assert {job[0]: instance for job, instance in placed} == {'j2': 'a', 'j1': 'b', 'j4': 'c', 'j5': 'c'}
+    assert [job[0] for job in unplaced] == ['j3']
+    assert packer.free_cores_mcpu('a') == 0
+    assert packer.free_cores_mcpu('b') == 0
+    assert packer.free_cores_mcpu('c') == 500
+    assert packer.place(250, 'us-central1-a') is None
+    assert packer.place(250, 'us-central1-b') == 'c'
+    assert packer.place(500) is None
+
+
+def test_pack_jobs_admits_by_placed_cores():
+    packer = InstancePacker([('a', 1000, 'us-central1-a'), ('b', 500, 'us-central1-a')])
+    jobs = [('j1', 1200), ('j2', 1000), ('j3', 500), ('j4', 250)]
+    admitted = []
+
+    def admit(job, placed_cores_mcpu):
+        admitted.append((job[0], placed_cores_mcpu))
+        return placed_cores_mcpu + job[1] <= 1500
+
+    placed, unplaced = pack_jobs(packer, jobs, cores_mcpu=lambda j: j[1], admit=admit)
+    assert {job[0]: instance for job, instance in placed} == {'j2': 'a', 'j3': 'b'}
+    assert [job[0] for job in unplaced] == ['j1', 'j4']
+    # j1 did not fit, so it does not count against the share
+    assert admitted == [('j1', 0), ('j2', 0), ('j3', 1000), ('j4', 1500)]
+
+
+class FakeWorkerSession:
+    """Answers job creation requests like a worker, with or without the bulk
+    endpoint, and counts the responses not yet released."""
+
+    def __init__(self, *, has_create_many, statuses):
+        self.has_create_many = has_create_many
+        self.statuses = statuses
+        self.urls = []
+        self.n_unreleased = 0
+
+    @contextlib.asynccontextmanager
+    async def post(self, url, json, timeout):  # pylint: disable=unused-argument
+        self.urls.append(url)
+        if url.endswith('/create_many'):
+            status = 200 if self.has_create_many else 404
+            result = {'statuses': [self.statuses[body['job_id']] for body in json['jobs']]}
+        else:
+            status = self.statuses[json['job_id']]
+            result = None
+        if status != 200:
+            raise aiohttp.ClientResponseError(None, (), status=status)
+        response = FakeResponse(result)
+        self.n_unreleased += 1
+        try:
+            yield response
+        finally:
+            self.n_unreleased -= 1
+
+
+class FakeResponse:
+    def __init__(self, result):
+        self.result = result
+
+    async def json(self):
+        return self.result
+
+
+class FakeInstance:
+    ip_address = '10.0.0.1'
+
+
+@pytest.mark.asyncio
+async def test_create_jobs_on_worker_with_one_request():
+    session = FakeWorkerSession(has_create_many=True, statuses={1: 200, 2: 403, 3: 200})
+    statuses = await create_jobs_on_worker(session, FakeInstance(), [{'job_id': i} for i in (1, 2, 3)])
+    assert statuses == [200, 403, 200]
+    assert session.urls == ['http://10.0.0.1:5000/api/v1alpha/batches/jobs/create_many']
+    assert session.n_unreleased == 0
+
+
+@pytest.mark.asyncio
+async def test_create_jobs_on_worker_falls_back_to_one_request_per_job():
+    session = FakeWorkerSession(has_create_many=False, statuses={1: 200, 2: 403, 3: 503})
+    statuses = await create_jobs_on_worker(session, FakeInstance(), [{'job_id': i} for i in (1, 2, 3)])
+    assert statuses == [200, 403, 503]
+    assert session.urls == [
+        'http://10.0.0.1:5000/api/v1alpha/batches/jobs/create_many'
+    ] + ['http://10.0.0.1:5000/api/v1alpha/batches/jobs/create'] * 3
+    assert session.n_unreleased == 0
+
+
+def test_image_cache_evicts_least_recently_used_unshared_bytes():
+    cache = ImageCache(max_bytes=1000, pinned=['worker'])
+    cache.add('worker', [('base', 100)], 100)
+    cache.add('old', [('base', 100), ('old-layer', 200)], 300)
+    cache.add('new', [('base', 100), ('new-layer', 200)], 300)
+    assert cache.size_bytes() == 500 + 700
+    assert cache.cached_layer_bytes([('base', 100), ('other', 50)]) == 100
+    assert cache.layer_hit_ratio() == 200 / 700
+
+    cache.acquire('new', hit=True)
+    cache.acquire('old', hit=True)
+    cache.release('new')
+    assert cache.eviction_candidates() == ['new']
+    cache.release('old')
+    cache.images['old'].last_accessed = 2
+    cache.images['new'].last_accessed = 1
+    # evicting new alone frees its 200 byte layer and its 300 byte root filesystem
+    assert cache.eviction_candidates() == ['new']
+    cache.images['old'].last_accessed = 0
+    assert cache.eviction_candidates() == ['old']
+
+    cache.remove('new')
+    assert cache.size_bytes() == 300 + 400
+    assert cache.eviction_candidates() == []
+    assert cache.hit_ratio() == 1.0
+
+
+def test_layer_sizes():
+    history = [{'Size': 0}, {'Size': 20}, {'Size': 0}, {'Size': 10}]
+    assert layer_sizes(['a', 'b'], history, 30) == [('a', 10), ('b', 20)]
+    assert layer_sizes(['a', 'b', 'c'], history, 30) == [('a', 10), ('b', 10), ('c', 10)]
+    assert layer_sizes([], history, 30) == []
+
+
+class FakeJVM:
+    def __init__(self, key):
+        self.key = key
+        self.n_jobs = 0
+        self.rss = 0
+        self.mcpu = 0
+        self.alive = True
+        self.closed = False
+
+    def rss_bytes(self):
+        return self.rss
+
+    async def close(self):
+        self.closed = True
+
+
+@pytest.mark.asyncio
+async def test_jvm_pool_reuses_and_recycles_jvms():
+    started = []
+
+    async def create_jvm(key, command):
+        assert command == ['java', key[1], str(key[2])]
+        jvm = FakeJVM(key)
+        started.append(jvm)
+        return jvm
+
+    pool = JVMPool(lambda revision, heap_size: ['java', revision, str(heap_size)], BackgroundTaskManager(),
+                   FIFOWeightedSemaphore(4000), 1000,
+                   max_idle=2, non_heap_bytes=500, max_jobs_per_jvm=2, create_jvm=create_jvm)
+    first = await pool.acquire('a', 'rev', 100)
+    await asyncio.sleep(0)
+    # a JVM is started for the next job
+    assert len(started) == 2 and pool.idle == [started[1]]
+    first.n_jobs = 1
+    first.rss = 550
+    pool.release(first)
+    assert pool.take_idle('a', 'rev', 100) is first
+    assert pool.n_warm_starts == 1 and pool.n_cold_starts == 1
+
+    # recycled after max_jobs_per_jvm jobs or past its heap and non-heap memory
+    first.n_jobs = 2
+    pool.release(first)
+    second = await pool.acquire('a', 'rev', 100)
+    second.n_jobs = 1
+    second.rss = 700
+    pool.release(second)
+    await asyncio.sleep(0)
+    assert first.closed and second.closed
+
+    # JVMs are not shared between users
+    other = await pool.acquire('b', 'rev', 100)
+    assert other.key == ('b', 'rev', 100)
+    await asyncio.sleep(0)
+    assert len(pool.idle) == 2
+
+    await pool.close()
+    assert all(jvm.closed for jvm in started if jvm is not other)
+
+
+@pytest.mark.asyncio
+async def test_jvm_pool_idle_jvms_hold_cores():
+    async def create_jvm(key, command):  # pylint: disable=unused-argument
+        return FakeJVM(key)
+
+    cpu_sem = FIFOWeightedSemaphore(1000)
+    pool = JVMPool(lambda revision, heap_size: [], BackgroundTaskManager(), cpu_sem, 1000,
+                   max_idle=8, non_heap_bytes=1000, max_jobs_per_jvm=10, create_jvm=create_jvm)
+    jvms = [await pool.acquire(user, 'rev', 600) for user in ['a', 'b', 'c']]
+    await asyncio.sleep(0)
+    # an idle JVM holds the cores of its resident memory, up to its heap
+    for jvm, rss in zip(jvms, [400, 800, 300]):
+        jvm.rss = rss
+        pool.release(jvm)
+    await asyncio.sleep(0)
+    # the least recently used JVMs are closed until one fits
+    assert jvms[0].closed and not jvms[1].closed and not jvms[2].closed
+    assert (jvms[1].mcpu, jvms[2].mcpu, cpu_sem.value) == (600, 300, 100)
+
+    # and when a job needs their cores
+    pool.make_room(700)
+    await asyncio.sleep(0)
+    assert jvms[1].closed and cpu_sem.value == 700
+    assert pool.take_idle('c', 'rev', 600) is jvms[2]
+    assert cpu_sem.value == 1000
+
+    # JVMs are not kept idle in the cores of jobs
+    await cpu_sem.acquire(1000)
+    pool.release(jvms[2])
+    await asyncio.sleep(0)
+    assert jvms[2].closed
+    await pool.close()
+
+
+def test_jar_has_entryway(tmp_path):
+    with zipfile.ZipFile(tmp_path / 'new.jar', 'w') as jar:
+        jar.writestr('is/hail/backend/service/JVMEntryway.class', b'')
+    with zipfile.ZipFile(tmp_path / 'old.jar', 'w') as jar:
+        jar.writestr('is/hail/backend/service/Worker.class', b'')
+    assert jar_has_entryway(str(tmp_path / 'new.jar'))
+    assert not jar_has_entryway(str(tmp_path / 'old.jar'))
+
+
+def test_encode_job():
+    encoded = encode_job({'A': 'b'}, '/log', ['Main', 'é'])
+    assert encoded == (struct.pack('>i', 1) + struct.pack('>i', 1) + b'A' + struct.pack('>i', 1) + b'b'
+                       + struct.pack('>i', 4) + b'/log'
+                       + struct.pack('>i', 2) + struct.pack('>i', 4) + b'Main' + struct.pack('>i', 2) + 'é'.encode())
+
+
+@pytest.mark.asyncio
+async def test_job_status_reporter_coalesces_statuses():
+    bodies = []
+    failed = False
+
+    async def post(body):
+        nonlocal failed
+        if not failed:
+            failed = True
+            raise ConnectionError()
+        bodies.append(body)
+
+    reporter = JobStatusReporter(post, flush_interval_secs=0.01, max_statuses=3)
+    task = asyncio.ensure_future(reporter.run())
+    try:
+        started = [reporter.started({'job_id': i}) for i in range(2)]
+        complete = [reporter.complete({'job_id': i}) for i in range(3)]
+        await asyncio.wait_for(asyncio.gather(*started, *complete), 5)
+
+        # the failed request was retried, and complete statuses wait for
+        # the started statuses before them
+        assert bodies == [
+            {'started': [{'job_id': 0}, {'job_id': 1}], 'complete': [{'job_id': 0}]},
+            {'started': [], 'complete': [{'job_id': 1}, {'job_id': 2}]},
+        ]
+        assert reporter.n_requests == 3
+
+        await asyncio.wait_for(reporter.complete({'job_id': 3}), 5)
+        assert bodies[-1] == {'started': [], 'complete': [{'job_id': 3}]}
+    finally:
+        task.cancel()
+
+
+@pytest.mark.asyncio
+async def test_job_status_reporter_drops_rejected_statuses():
+    bodies = []
+
+    async def post(body):
+        if {'job_id': 2} in body['complete']:
+            raise aiohttp.ClientResponseError(None, (), status=400)
+        bodies.append(body)
+
+    reporter = JobStatusReporter(post, flush_interval_secs=0, max_statuses=10)
+    started = [reporter.started({'job_id': i}) for i in range(2)]
+    complete = [reporter.complete({'job_id': i}) for i in range(4)]
+    await reporter.flush()
+
+    # the body is split until the bad status is posted alone
+    assert bodies == [
+        {'started': [{'job_id': 0}, {'job_id': 1}], 'complete': [{'job_id': 0}]},
+        {'started': [], 'complete': [{'job_id': 1}]},
+        {'started': [], 'complete': [{'job_id': 3}]},
+    ]
+    assert all(fut.result() is None for fut in started + complete[:2] + complete[3:])
+    with pytest.raises(aiohttp.ClientResponseError):
+        complete[2].result()
+
+
+@pytest.mark.asyncio
+async def test_job_status_reporter_defers_statuses_the_driver_fails_on():
+    bodies = []
+    broken = True
+
+    async def post(body):
+        if broken and {'job_id': 1} in body['complete']:
+            raise aiohttp.ClientResponseError(None, (), status=500)
+        bodies.append(body)
+
+    reporter = JobStatusReporter(post, flush_interval_secs=0, max_statuses=10, max_server_errors=1)
+    complete = [reporter.complete({'job_id': i}) for i in range(3)]
+    await reporter.flush()
+
+    # the body is split until the status the driver fails on is posted
+    # alone, which is posted again at the next flush
+    assert bodies == [{'started': [], 'complete': [{'job_id': 0}]}, {'started': [], 'complete': [{'job_id': 2}]}]
+    assert not complete[1].done() and reporter._pending.is_set()
+
+    broken = False
+    await reporter.flush()
+    assert bodies[-1] == {'started': [], 'complete': [{'job_id': 1}]}
+    assert complete[1].result() is None and not reporter._pending.is_set()
+
+
+def test_parse_byte_range():
+    assert parse_byte_range(None, 10) == (0, 10)
+    assert parse_byte_range('bytes=2-4', 10) == (2, 5)
+    assert parse_byte_range('bytes=2-100', 10) == (2, 10)
+    assert parse_byte_range('bytes=7-', 10) == (7, 10)
+    assert parse_byte_range('bytes=-3', 10) == (7, 10)
+    assert parse_byte_range('bytes=-30', 10) == (0, 10)
+    for range_header, size in [('bytes=10-', 10), ('bytes=-0', 10), ('bytes=-3', 0), ('bytes=4-2', 10)]:
+        with pytest.raises(web.HTTPRequestRangeNotSatisfiable):
+            parse_byte_range(range_header, size)
+    with pytest.raises(web.HTTPBadRequest):
+        parse_byte_range('bytes=1-2,4-5', 10)
+
+    assert parse_content_range(None, 4) == (0, 4, 4)
+    assert parse_content_range('bytes 2-4/10', 3) == (2, 5, 10)
+
+
+@pytest.mark.asyncio
+async def test_log_uploader_writes_chunked_log(tmp_path):
+    with concurrent.futures.ThreadPoolExecutor() as pool:
+        file_store = FileStore(LocalAsyncFS(pool), str(tmp_path / 'logs'), 'instance')
+        format_version = BatchFormatVersion(7)
+        log_path = str(tmp_path / 'container.log')
+        uploader = LogUploader(
+            file_store, format_version, 1, 2, 'abc123', 'main', log_path, pool, upload_interval_secs=60, chunk_size=4
+        )
+        log_dir = os.path.dirname(file_store.log_path(format_version, 1, 2, 'abc123', 'main'))
+        # object stores have no directories
+        os.makedirs(log_dir)
+
+        async def read(range_header):
+            index = await file_store.read_log_index(format_version, 1, 2, 'abc123', 'main')
+            start, end = parse_byte_range(range_header, index['size'])
+            return await file_store.read_log_range(format_version, 1, 2, 'abc123', 'main', index, start, end)
+
+        # a log that has not been written yet is empty
+        await uploader.upload()
+        assert await read(None) == b''
+
+        with open(log_path, 'wb') as f:
+            f.write(b'0123456')
+        await uploader.upload()
+        assert await read(None) == b'0123456'
+        assert await read('bytes=-2') == b'56'
+
+        with open(log_path, 'ab') as f:
+            f.write(b'789abcdef')
+        await uploader.close()
+        assert await read(None) == b'0123456789abcdef'
+        assert await read('bytes=3-9') == b'3456789'
+        assert await read('bytes=-5') == b'bcdef'
+        assert await file_store.read_log_file(format_version, 1, 2, 'abc123', 'main') == '0123456789abcdef'
+        # only the index and the four chunks
+        assert sorted(os.listdir(log_dir)) == ['log.0.gz', 'log.1.gz', 'log.2.gz', 'log.3.gz', 'log.index']
+
+
+@pytest.mark.asyncio
+async def test_batch_change_log():
+    change_log = BatchChangeLog(max_batches=3)
+    epoch = change_log.epoch
+
+    # a listener of another driver process is told any batch may have changed
+    changes = await change_log.wait(None, 0, timeout=0, coalesce_secs=0)
+    assert changes == {'epoch': epoch, 'seq': 0, 'batch_ids': None}
+
+    # nothing changed
+    changes = await change_log.wait(epoch, 0, timeout=0.01, coalesce_secs=0)
+    assert changes == {'epoch': epoch, 'seq': 0, 'batch_ids': []}
+
+    waiting = asyncio.ensure_future(change_log.wait(epoch, 0, timeout=5, coalesce_secs=0.01))
+    await asyncio.sleep(0)
+    change_log.changed(1)
+    change_log.changed(2)
+    change_log.changed(1)
+    assert await waiting == {'epoch': epoch, 'seq': 3, 'batch_ids': [1, 2]}
+    assert change_log.changes_since(epoch, 2) == [1]
+
+    for batch_id in [3, 4, 5]:
+        change_log.changed(batch_id)
+    # the changes of batches 1 and 2 are forgotten
+    assert change_log.changes_since(epoch, 0) is None
+    assert change_log.changes_since(epoch, 2) is None
+    assert change_log.changes_since(epoch, 3) == [5, 4, 3]
+    assert change_log.changes_since(epoch, 6) == []
+
+
+@pytest.mark.asyncio
+async def test_batch_change_listener():
+    change_log = BatchChangeLog()
+    failed = False
+
+    async def get_changes(epoch, seq):
+        nonlocal failed
+        if not failed:
+            failed = True
+            raise ConnectionError()
+        return await change_log.wait(epoch, seq, timeout=5, coalesce_secs=0)
+
+    listener = BatchChangeListener(get_changes, retry_secs=0.01)
+    task = asyncio.ensure_future(listener.run())
+    try:
+        with listener.subscribe(1) as batch_1_changed, listener.subscribe(2) as batch_2_changed:
+            # woken while the driver cannot be reached
+            await asyncio.wait_for(batch_1_changed.wait(), 5)
+            while listener.epoch is None:
+                await asyncio.sleep(0.01)
+            batch_1_changed.clear()
+            batch_2_changed.clear()
+
+            change_log.changed(2)
+            await asyncio.wait_for(batch_2_changed.wait(), 5)
+            assert not batch_1_changed.is_set()
+        assert not listener._subscribers
+    finally:
+        task.cancel()
@@ -0,0 +1,118 @@
+"""Simulate a pool scheduling pass under load and report jobs scheduled per
+second, for the scheduler placing jobs one at a time and querying each
+running batch separately, and for the scheduler fetching the Ready jobs of
+all users in one query and packing them onto instances in memory.
+
+Database round trips are simulated with a fixed latency.
+
+    python3 benchmark_scheduler.py --instances 2000 --users 50 --batches-per-user 40 --jobs 30000
+"""
+import argparse
+import random
+import time
+
+import sortedcontainers
+
+from batch.driver.packing import InstancePacker, pack_jobs
+
+LOCATIONS = ['us-central1-a', 'us-central1-b', 'us-central1-c', 'us-central1-f']
+JOB_CORES_MCPU = [250, 500, 1000, 2000, 4000]
+
+
+class Instance:
+    def __init__(self, name, free_cores_mcpu, location):
+        self.name = name
+        self.free_cores_mcpu = free_cores_mcpu
+        self.location = location
+
+
+def simulated_load(args):
+    rng = random.Random(args.seed)
+    instances = [
+        Instance(f'instance-{i}', rng.choice(range(0, 16001, 250)), rng.choice(LOCATIONS))
+        for i in range(args.instances)
+    ]
+    users = [f'user-{i}' for i in range(args.users - 1)] + ['ci']
+    jobs = [
+        {
+            'user': rng.choice(users),
+            'batch_id': rng.randrange(args.batches_per_user),
+            'cores_mcpu': rng.choice(JOB_CORES_MCPU),
+        }
+        for _ in range(args.jobs)
+    ]
+    jobs_by_user = {user: [] for user in users}
+    for job in jobs:
+        jobs_by_user[job['user']].append(job)
+    return instances, jobs_by_user
+
+
+def schedule_one_at_a_time(instances, jobs_by_user, args):
+    # one query per running batch, then a bisection, a location check and a
+    # linear scan when the location does not match, per job
+    healthy_instances_by_free_cores = sortedcontainers.SortedSet(
+        instances, key=lambda instance: (instance.free_cores_mcpu, instance.name)
+    )
+    n_scheduled = 0
+    scheduled_cores_mcpu = 0
+    n_queries = 0
+    for user, jobs in jobs_by_user.items():
+        n_queries += 1 + 2 * args.batches_per_user
+        for job in jobs:
+            cores_mcpu = job['cores_mcpu']
+            i = healthy_instances_by_free_cores.bisect_key_left((cores_mcpu, ''))
+            while i < len(healthy_instances_by_free_cores):
+                instance = healthy_instances_by_free_cores[i]
+                if user != 'ci' or instance.location == LOCATIONS[0]:
+                    healthy_instances_by_free_cores.remove(instance)
+                    instance.free_cores_mcpu -= cores_mcpu
+                    healthy_instances_by_free_cores.add(instance)
+                    n_scheduled += 1
+                    scheduled_cores_mcpu += cores_mcpu
+                    break
+                i += 1
+    return n_scheduled, scheduled_cores_mcpu, n_queries
+
+
+def schedule_packed(instances, jobs_by_user, args):
+    packer = InstancePacker((instance, instance.free_cores_mcpu, instance.location) for instance in instances)
+    placed = []
+    for jobs in jobs_by_user.values():
+        user_placed, _ = pack_jobs(
+            packer,
+            jobs,
+            cores_mcpu=lambda job: job['cores_mcpu'],
+            location=lambda job: LOCATIONS[0] if job['user'] == 'ci' else None,
+        )
+        placed.extend(user_placed)
+    return len(placed), sum(job['cores_mcpu'] for job, _ in placed), 1
+
+
+def run(name, schedule, args):
+    instances, jobs_by_user = simulated_load(args)
+    free_cores_mcpu = sum(instance.free_cores_mcpu for instance in instances)
+    start = time.perf_counter()
+    n_scheduled, scheduled_cores_mcpu, n_queries = schedule(instances, jobs_by_user, args)
+    elapsed = time.perf_counter() - start + n_queries * args.query_latency_ms / 1000
+    print(
+        f'{name}: scheduled {n_scheduled} of {args.jobs} jobs with {n_queries} queries in {elapsed:.3f}s: '
+        f'{n_scheduled / elapsed:.0f} jobs/s, {scheduled_cores_mcpu / free_cores_mcpu:.1%} of free cores used'
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--instances', type=int, default=2000)
+    parser.add_argument('--users', type=int, default=50)
+    parser.add_argument('--batches-per-user', type=int, default=40)
+    parser.add_argument('--jobs', type=int, default=30000)
+    parser.add_argument('--query-latency-ms', type=float, default=2.0)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    run('one at a time', schedule_one_at_a_time, args)
+    run('packed', schedule_packed, args)
+
+
+if __name__ == '__main__':
+    main()
@@ -6,6 +6,8 @@ from . import linalg_benchmarks
 from . import shuffle_benchmarks
 from . import combiner_benchmarks
 from . import sentinel_benchmarks
+from . import decoding_benchmarks
+from . import ir_benchmarks
 
 __all__ = [
     'run_all',
@@ -18,4 +20,6 @@ __all__ = [
     'methods_benchmarks',
     'shuffle_benchmarks',
     'combiner_benchmarks',
-    'sentinel_benchmarks']
+    'sentinel_benchmarks',
+    'decoding_benchmarks',
+    'ir_benchmarks']
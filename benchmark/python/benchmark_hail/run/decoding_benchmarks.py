@@ -0,0 +1,78 @@
+import numpy as np
+
+import hail as hl
+from hail.utils.byte_reader import ByteReader
+
+from .utils import benchmark
+
+
+def _encode_array(n, element_dtype, elements):
+    # array encoding: int32 length, missing bits, then the present elements
+    header = np.array([n], dtype='=i4').tobytes() + bytes((n + 7) // 8)
+    encoded_elements = np.empty(n, dtype=element_dtype)
+    for name, values in elements.items():
+        encoded_elements[name] = values
+    return header + encoded_elements.tobytes()
+
+
+def int64_array_encoding():
+    n = 10_000_000
+    buf = _encode_array(n, np.dtype([('x', '=i8')]), {'x': np.arange(n)})
+    return hl.tarray(hl.tint64), buf
+
+
+def struct_array_encoding():
+    n = 1_000_000
+    # each struct is encoded as one byte of missing bits followed by its fields
+    element_dtype = np.dtype([('missing', 'u1'), ('idx', '=i4'), ('x', '=f8'), ('flag', '?')])
+    buf = _encode_array(n, element_dtype, {'missing': 0,
+                                           'idx': np.arange(n),
+                                           'x': np.arange(n) / 2,
+                                           'flag': np.arange(n) % 2 == 0})
+    return hl.tarray(hl.tstruct(idx=hl.tint32, x=hl.tfloat64, flag=hl.tbool)), buf
+
+
+def string_struct_array_encoding():
+    n = 1_000_000
+    element_dtype = np.dtype([('missing', 'u1'), ('idx', '=i4'), ('len', '=i4'), ('s', 'S8')])
+    buf = _encode_array(n, element_dtype, {'missing': 0,
+                                           'idx': np.arange(n),
+                                           'len': 8,
+                                           's': b'abcdefgh'})
+    return hl.tarray(hl.tstruct(idx=hl.tint32, s=hl.tstr)), buf
+
+
+@benchmark()
+def decode_int64_array_per_element():
+    t, buf = int64_array_encoding()
+    t._convert_from_encoding(ByteReader(memoryview(buf)))
+
+
+@benchmark()
+def decode_int64_array_bulk():
+    t, buf = int64_array_encoding()
+    t._from_encoding(buf)
+
+
+@benchmark()
+def decode_struct_array_per_element():
+    t, buf = struct_array_encoding()
+    t._convert_from_encoding(ByteReader(memoryview(buf)))
+
+
+@benchmark()
+def decode_struct_array_bulk():
+    t, buf = struct_array_encoding()
+    t._from_encoding(buf)
+
+
+@benchmark()
+def decode_string_struct_array_per_element():
+    t, buf = string_struct_array_encoding()
+    t._convert_from_encoding(ByteReader(memoryview(buf)))
+
+
+@benchmark()
+def decode_string_struct_array_bulk():
+    t, buf = string_struct_array_encoding()
+    t._from_encoding(buf)
@@ -0,0 +1,33 @@
+import hail.ir as ir
+from hail.ir.renderer import CSERenderer
+
+from .utils import benchmark
+
+
+def ir_with_10k_nodes():
+    nodes = [ir.I32(i) for i in range(5_000)]
+    while len(nodes) > 1:
+        pairs = [ir.ApplyBinaryPrimOp('+', left, right) for left, right in zip(nodes[::2], nodes[1::2])]
+        nodes = pairs + nodes[len(pairs) * 2:]
+    return nodes[0]
+
+
+@benchmark()
+def render_10k_node_ir():
+    CSERenderer()(ir_with_10k_nodes())
+
+
+@benchmark()
+def render_10k_node_ir_repeatedly():
+    x = ir_with_10k_nodes()
+    for _ in range(1_000):
+        CSERenderer()(x)
+
+
+@benchmark()
+def render_10k_node_ir_with_new_roots():
+    x = ir_with_10k_nodes()
+    for i in range(100):
+        x = ir.ApplyBinaryPrimOp('+', x, ir.I32(i))
+        str(x)
+        hash(x)
@@ -11,6 +11,35 @@ class Backend(abc.ABC):
     def execute(self, ir, timed=False):
         pass
 
+    def execute_as_completed(self, irs, *, parallelism=10):
+        """Execute several independent IRs, yielding ``(index, result)`` pairs
+        in the order in which the results become available.
+
+        Backends that can run queries concurrently keep at most `parallelism`
+        of them in flight; by default, the IRs are executed one at a time.
+        """
+        for i, ir in enumerate(irs):
+            yield i, self.execute(ir)
+
+    def execute_many(self, irs, *, parallelism=10):
+        """Execute several independent IRs, returning their results in order."""
+        irs = list(irs)
+        results = [None] * len(irs)
+        for i, result in self.execute_as_completed(irs, parallelism=parallelism):
+            results[i] = result
+        return results
+
+    def _execute_iter(self, ir):
+        """Execute an array-valued `ir`, iterating over the elements of the
+        result. Backends receiving results in chunks yield elements as they
+        arrive, without holding the whole result in memory."""
+        return iter(self.execute(ir))
+
+    def _execute_numpy(self, ir):
+        """Execute `ir`, decoding arrays of primitives in the fields of a struct
+        result to NumPy arrays, as described in :meth:`.tarray._numpy_decoder`."""
+        return ir.typ._to_numpy(self.execute(ir))
+
     @abc.abstractmethod
     def value_type(self, ir):
         pass
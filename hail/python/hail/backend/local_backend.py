@@ -17,7 +17,7 @@ from hail.ir import JavaIR
 from hail.ir.renderer import CSERenderer
 from hail.utils.java import scala_package_object, scala_object
 from .py4j_backend import Py4JBackend, handle_java_exception
-from ..fs.local_fs import LocalFS
+from ..fs.router_fs import RouterFS
 from ..hail_logging import Logger
 from hailtop.utils import find_spark_home
 
@@ -157,7 +157,7 @@ class LocalBackend(Py4JBackend):
                                f"  JAR:    {jar_version}\n"
                                f"  Python: {py_version}")
 
-        self._fs = LocalFS()
+        self._fs = RouterFS()
         self._logger = None
 
         if not quiet:
@@ -175,6 +175,7 @@ class LocalBackend(Py4JBackend):
     def stop(self):
         self._jhc.stop()
         self._jhc = None
+        self._fs.close()
         # FIXME stop gateway?
         uninstall_exception_handler()
 
@@ -79,15 +79,21 @@ class Py4JBackend(Backend):
             jbody)
 
     def execute(self, ir, timed=False):
+        result, timings = self._execute_encoded(ir)
+        value = ir.typ._from_encoding(result)
+        return (value, timings) if timed else value
+
+    def _execute_numpy(self, ir):
+        result, _ = self._execute_encoded(ir)
+        return ir.typ._numpy_from_encoding(result)
+
+    def _execute_encoded(self, ir):
         jir = self._to_java_value_ir(ir)
         stream_codec = '{"name":"StreamBufferSpec"}'
         # print(self._hail_package.expr.ir.Pretty.apply(jir, True, -1))
         try:
             result_tuple = self._jhc.backend().executeEncode(jir, stream_codec)
-            (result, timings) = (result_tuple._1(), result_tuple._2())
-            value = ir.typ._from_encoding(result)
-
-            return (value, timings) if timed else value
+            return (result_tuple._1(), result_tuple._2())
         except FatalError as e:
             error_id = e._error_id
 
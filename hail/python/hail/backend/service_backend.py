@@ -1,5 +1,11 @@
-from typing import Optional
+from typing import Awaitable, Dict, List, Optional, Sequence, Tuple, TypeVar
+import asyncio
+import collections
+import concurrent.futures
+import itertools
 import os
+import threading
+import time
 import aiohttp
 import json
 import warnings
@@ -12,33 +18,90 @@ from hail.expr.blockmatrix_type import tblockmatrix
 
 from hailtop.config import get_deploy_config, get_user_config, DeployConfig
 from hailtop.auth import service_auth_headers
-from hailtop.utils import async_to_blocking, retry_transient_errors, secret_alnum_string, TransientError
+from hailtop.utils import retry_transient_errors, secret_alnum_string, TransientError
+from hail.ir import (TableRead, MatrixRead, BlockMatrixRead, TableNativeReader, MatrixNativeReader,
+                     MatrixRangeReader, BlockMatrixNativeReader, TableFromBlockMatrixNativeReader)
 from hail.ir.renderer import CSERenderer
 
 from .backend import Backend
 from ..hail_logging import PythonOnlyLogger
-from ..fs.google_fs import GoogleCloudStorageFS
+from ..fs.router_fs import RouterFS
+
+T = TypeVar('T')
 
 
 class ServiceSocket:
-    def __init__(self, *, deploy_config: Optional[DeployConfig] = None):
+    """Client of the query service.
+
+    Requests are sent over websockets to the service's ``session`` endpoint,
+    which answers any number of requests, one at a time, on one connection.
+    Idle websockets are kept open and reused, so only the first requests pay
+    for connection setup and the TLS handshake. Nothing reads an idle
+    websocket, so it cannot answer the service's heartbeat, and the service
+    closes it once a heartbeat goes unanswered. Websockets idle for longer
+    than `MAX_IDLE_SECS` are closed rather than reused. Messages are
+    compressed with permessage-deflate.
+
+    All network IO happens on an event loop running in a background thread,
+    so blocking requests can be made whether or not the calling thread is
+    running an event loop of its own, as it is in a notebook.
+    """
+
+    # the service sends a heartbeat every 30 seconds
+    MAX_IDLE_SECS = 20
+
+    def __init__(self, *, deploy_config: Optional[DeployConfig] = None, max_idle_connections: int = 10):
         if not deploy_config:
             deploy_config = get_deploy_config()
         self.deploy_config = deploy_config
         self.url = deploy_config.base_url('query')
+        self.max_idle_connections = max_idle_connections
         self._session: Optional[aiohttp.ClientSession] = None
+        # with the time each was released, least recently released first
+        self._idle_sockets: List[Tuple[aiohttp.ClientWebSocketResponse, float]] = []
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+
+    def _event_loop(self) -> asyncio.AbstractEventLoop:
+        if self._loop is None:
+            self._loop = asyncio.new_event_loop()
+            self._thread = threading.Thread(target=self._loop.run_forever, name='hail-service-socket', daemon=True)
+            self._thread.start()
+        return self._loop
+
+    def submit(self, coro: Awaitable[T]) -> 'concurrent.futures.Future[T]':
+        """Run `coro` on the background event loop."""
+        return asyncio.run_coroutine_threadsafe(coro, self._event_loop())
+
+    def run(self, coro: Awaitable[T]) -> T:
+        """Run `coro` on the background event loop and wait for its result."""
+        return self.submit(coro).result()
 
     async def session(self) -> aiohttp.ClientSession:
         if self._session is None:
             self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(keepalive_timeout=60),
                 headers=service_auth_headers(self.deploy_config, 'query'))
         return self._session
 
-    def close(self):
+    async def _close(self):
+        sockets, self._idle_sockets = self._idle_sockets, []
+        for socket, _ in sockets:
+            await socket.close()
         if self._session is not None:
-            async_to_blocking(self._session.close())
+            await self._session.close()
             self._session = None
 
+    def close(self):
+        if self._loop is None:
+            return
+        self.run(self._close())
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._loop.close()
+        self._loop = None
+        self._thread = None
+
     def handle_response(self, resp):
         if resp.type == aiohttp.WSMsgType.CLOSE:
             raise aiohttp.ServerDisconnectedError('Socket was closed by server. (code={resp.data})')
@@ -47,32 +110,179 @@ class ServiceSocket:
         assert resp.type == aiohttp.WSMsgType.TEXT, resp.type
         return resp.data
 
+    async def _connect(self) -> aiohttp.ClientWebSocketResponse:
+        while self._idle_sockets:
+            socket, released = self._idle_sockets.pop()
+            if socket.closed:
+                continue
+            if time.monotonic() - released > ServiceSocket.MAX_IDLE_SECS:
+                # without waiting for the service to acknowledge
+                asyncio.ensure_future(socket.close())
+                continue
+            return socket
+        session = await self.session()
+        return await session.ws_connect(f'{self.url}/api/v1alpha/session',
+                                        compress=15,
+                                        max_msg_size=0)
+
+    async def _release(self, socket: aiohttp.ClientWebSocketResponse, reusable: bool):
+        if reusable and not socket.closed and len(self._idle_sockets) < self.max_idle_connections:
+            self._idle_sockets.append((socket, time.monotonic()))
+        else:
+            await socket.close()
+
+    @staticmethod
+    def _check_text_response(response, endpoint, data):
+        if response.type == aiohttp.WSMsgType.ERROR:
+            raise ValueError(f'bad response: {endpoint}; {data}; {response}')
+        if response.type in (aiohttp.WSMsgType.CLOSE,
+                             aiohttp.WSMsgType.CLOSING,
+                             aiohttp.WSMsgType.CLOSED):
+            warnings.warn(f'retrying after losing connection {endpoint}; {data}; {response}')
+            raise TransientError()
+        assert response.type == aiohttp.WSMsgType.TEXT, response.type
+
+    @staticmethod
+    def _result_value(response):
+        result = json.loads(response.data)
+        if result['status'] != 200:
+            raise FatalError(f'Error from server: {result["value"]}')
+        return result['value']
+
     async def async_request(self, endpoint, **data):
+        data['endpoint'] = endpoint
         data['token'] = secret_alnum_string()
-        session = await self.session()
-        async with session.ws_connect(f'{self.url}/api/v1alpha/{endpoint}') as socket:
+        socket = await self._connect()
+        reusable = False
+        try:
             await socket.send_str(json.dumps(data))
             response = await socket.receive()
-            await socket.send_str('bye')
-            if response.type == aiohttp.WSMsgType.ERROR:
-                raise ValueError(f'bad response: {endpoint}; {data}; {response}')
-            if response.type in (aiohttp.WSMsgType.CLOSE,
-                                 aiohttp.WSMsgType.CLOSED):
-                warnings.warn(f'retrying after losing connection {endpoint}; {data}; {response}')
-                raise TransientError()
-            assert response.type == aiohttp.WSMsgType.TEXT
-            result = json.loads(response.data)
-            if result['status'] != 200:
-                raise FatalError(f'Error from server: {result["value"]}')
-            return result['value']
+            self._check_text_response(response, endpoint, data)
+            reusable = True
+        finally:
+            await self._release(socket, reusable)
+        return self._result_value(response)
+
+    async def async_request_stream(self, endpoint, **data):
+        """Request from an endpoint streaming its result, yielding the header
+        of the result and then the chunks of bytes making up the result, as
+        they arrive."""
+        data['endpoint'] = endpoint
+        data['token'] = secret_alnum_string()
+        socket = await self._connect()
+        reusable = False
+        try:
+            await socket.send_str(json.dumps(data))
+            response = await socket.receive()
+            self._check_text_response(response, endpoint, data)
+            header = self._result_value(response)
+            yield header
+            # the chunks are followed by the result of the request, which is
+            # None unless it failed
+            while True:
+                response = await socket.receive()
+                if response.type != aiohttp.WSMsgType.BINARY:
+                    self._check_text_response(response, endpoint, data)
+                    self._result_value(response)
+                    break
+                yield response.data
+            reusable = True
+        finally:
+            await self._release(socket, reusable)
+
+    def request_stream(self, endpoint, **data):
+        """Blocking version of :meth:`.async_request_stream`."""
+        chunks = self.async_request_stream(endpoint, **data)
+        try:
+            while True:
+                try:
+                    yield self.run(chunks.__anext__())
+                except StopAsyncIteration:
+                    return
+        finally:
+            self.run(chunks.aclose())
 
     def request(self, endpoint, **data):
-        return async_to_blocking(retry_transient_errors(self.async_request, endpoint, **data))
+        return self.run(retry_transient_errors(self.async_request, endpoint, **data))
+
+
+class TypeCache:
+    """A least-recently-used cache of the responses of the query service's
+    type endpoints, keyed by the Hail version, the kind of IR, its structural
+    hash and the modification times of the files it reads.
+
+    The cache holds the JSON responses, so it can be saved to and loaded from
+    a file to carry inferred types from one session to the next. Types are
+    rendered and parsed differently by other versions of Hail, so entries of
+    other versions are never used.
+    """
+
+    def __init__(self, max_size: int = 4096, version: str = ''):
+        self.max_size = max_size
+        self.version = version
+        self._cache: Dict[str, object] = collections.OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def key(self, ir, kind: str, modification_times: Sequence[str] = ()) -> str:
+        return ':'.join([self.version, kind, ir._structural_hash(), *modification_times])
+
+    def __len__(self):
+        return len(self._cache)
+
+    def __contains__(self, key):
+        return key in self._cache
+
+    def get(self, key):
+        resp = self._cache.get(key)
+        if resp is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._cache.move_to_end(key)
+        return resp
+
+    def put(self, key, resp):
+        self._cache[key] = resp
+        self._cache.move_to_end(key)
+        while len(self._cache) > self.max_size:
+            self._cache.popitem(last=False)
+
+    def load(self, path: str):
+        if not os.path.exists(path):
+            return
+        with open(path) as f:
+            entries = json.load(f)
+        for key, resp in entries:
+            if key.startswith(f'{self.version}:'):
+                self.put(key, resp)
+
+    def save(self, path: str):
+        tmp_path = f'{path}.{secret_alnum_string(5)}.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(list(self._cache.items()), f)
+        os.replace(tmp_path, path)
+
+
+def _type_files(ir) -> Optional[List[str]]:
+    """The files that determine the types of the reads in `ir`, the metadata
+    of native datasets, or None if a read's type depends on other files."""
+    files = []
+    for read in ir.base_search(lambda x: isinstance(x, (TableRead, MatrixRead, BlockMatrixRead))):
+        reader = read.reader
+        if isinstance(reader, (TableNativeReader, MatrixNativeReader)):
+            files.append(f'{reader.path}/metadata.json.gz')
+        elif isinstance(reader, (BlockMatrixNativeReader, TableFromBlockMatrixNativeReader)):
+            files.append(f'{reader.path}/metadata.json')
+        elif not isinstance(reader, MatrixRangeReader):
+            return None
+    return files
 
 
 class ServiceBackend(Backend):
     def __init__(self, billing_project: str = None, bucket: str = None, *, deploy_config=None,
-                 skip_logging_configuration: bool = False):
+                 skip_logging_configuration: bool = False, type_cache_file: str = None,
+                 type_cache_size: int = 4096):
         if billing_project is None:
             billing_project = get_user_config().get('batch', 'billing_project', fallback=None)
         if billing_project is None:
@@ -101,42 +311,120 @@ class ServiceBackend(Backend):
 
         self.socket = ServiceSocket(deploy_config=deploy_config)
 
+        if type_cache_file is None:
+            type_cache_file = get_user_config().get('query', 'type_cache_file', fallback=None)
+        if type_cache_file is None:
+            type_cache_file = os.environ.get('HAIL_QUERY_TYPE_CACHE_FILE')
+        self._type_cache_file = type_cache_file
+        from hail.context import version
+        self._type_cache = TypeCache(type_cache_size, version())
+        if type_cache_file is not None:
+            self._type_cache.load(type_cache_file)
+
     @property
     def logger(self):
         return self._logger
 
     @property
-    def fs(self) -> GoogleCloudStorageFS:
+    def fs(self) -> RouterFS:
         if self._fs is None:
-            from hail.fs.google_fs import GoogleCloudStorageFS
-            self._fs = GoogleCloudStorageFS()
+            self._fs = RouterFS()
         return self._fs
 
     def stop(self):
+        if self._type_cache_file is not None:
+            self._type_cache.save(self._type_cache_file)
         self.socket.close()
+        if self._fs is not None:
+            self._fs.close()
+            self._fs = None
 
     def _render(self, ir):
         r = CSERenderer()
         assert len(r.jirs) == 0
         return r(ir)
 
+    def _execute_request(self, code):
+        return dict(code=code,
+                    billing_project=self._billing_project,
+                    bucket=self._bucket,
+                    buffer_spec='{"name":"StreamBufferSpec"}')
+
+    async def _async_execute_encoded(self, code):
+        chunks = self.socket.async_request_stream('execute/encoded', **self._execute_request(code))
+        try:
+            header = await chunks.__anext__()
+            encoding = bytearray()
+            async for chunk in chunks:
+                encoding += chunk
+        finally:
+            await chunks.aclose()
+        return dtype(header['type']), encoding
+
+    def _execute_encoded(self, ir):
+        return self.socket.run(retry_transient_errors(self._async_execute_encoded, self._render(ir)))
+
     def execute(self, ir, timed=False):
-        resp = self.socket.request('execute',
-                                   code=self._render(ir),
-                                   billing_project=self._billing_project,
-                                   bucket=self._bucket)
-        typ = dtype(resp['type'])
-        if typ == tvoid:
-            value = None
-        else:
-            value = typ._convert_from_json_na(resp['value'])
+        typ, encoding = self._execute_encoded(ir)
+        value = None if typ == tvoid else typ._from_encoding(encoding)
         # FIXME put back timings
 
         return (value, None) if timed else value
 
+    def _execute_numpy(self, ir):
+        typ, encoding = self._execute_encoded(ir)
+        return typ._numpy_from_encoding(encoding)
+
+    def _execute_iter(self, ir):
+        chunks = self.socket.request_stream('execute/encoded', **self._execute_request(self._render(ir)))
+        try:
+            header = next(chunks)
+            yield from dtype(header['type'])._iter_from_encoding(chunks)
+        finally:
+            chunks.close()
+
+    async def _async_execute(self, i, code):
+        typ, encoding = await retry_transient_errors(self._async_execute_encoded, code)
+        return i, None if typ == tvoid else typ._from_encoding(encoding)
+
+    def execute_as_completed(self, irs, *, parallelism=10):
+        if parallelism < 1:
+            raise ValueError(f"'parallelism' must be at least 1, found {parallelism}")
+        irs = enumerate(irs)
+        pending = set()
+        try:
+            while True:
+                for i, ir in itertools.islice(irs, parallelism - len(pending)):
+                    pending.add(self.socket.submit(self._async_execute(i, self._render(ir))))
+                if not pending:
+                    break
+                done, pending = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+                for f in done:
+                    yield f.result()
+        finally:
+            for f in pending:
+                f.cancel()
+
     def _request_type(self, ir, kind):
-        code = self._render(ir)
-        return self.socket.request(f'type/{kind}', code=code)
+        # a file read may have been rewritten since its type was cached, so
+        # types are cached only if the files they depend on have known
+        # modification times
+        files = _type_files(ir)
+        modification_times = None
+        if files is not None:
+            try:
+                modification_times = [stat['modification_time'] for stat in self.fs.stat_many(files)]
+            except Exception:  # pylint: disable=broad-except
+                # the service reports missing files
+                pass
+        if modification_times is None or None in modification_times:
+            return self.socket.request(f'type/{kind}', code=self._render(ir))
+        key = self._type_cache.key(ir, kind, [str(t) for t in modification_times])
+        resp = self._type_cache.get(key)
+        if resp is None:
+            resp = self.socket.request(f'type/{kind}', code=self._render(ir))
+            self._type_cache.put(key, resp)
+        return resp
 
     def value_type(self, ir):
         resp = self._request_type(ir, 'value')
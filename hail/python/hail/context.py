@@ -269,7 +269,8 @@ def init(sc=None, app_name='Hail', master=None, local='local[*]',
     local_tmpdir=nullable(str),
     default_reference=enumeration('GRCh37', 'GRCh38', 'GRCm38', 'CanFam3'),
     global_seed=nullable(int),
-    skip_logging_configuration=bool)
+    skip_logging_configuration=bool,
+    type_cache_file=nullable(str))
 def init_service(
         billing_project: str = None,
         bucket: str = None,
@@ -280,9 +281,11 @@ def init_service(
         local_tmpdir=None,
         default_reference='GRCh37',
         global_seed=6348563392232659379,
-        skip_logging_configuration=False):
+        skip_logging_configuration=False,
+        type_cache_file=None):
     from hail.backend.service_backend import ServiceBackend
-    backend = ServiceBackend(billing_project, bucket, skip_logging_configuration=skip_logging_configuration)
+    backend = ServiceBackend(billing_project, bucket, skip_logging_configuration=skip_logging_configuration,
+                             type_cache_file=type_cache_file)
 
     log = _get_log(log)
     if tmpdir is None:
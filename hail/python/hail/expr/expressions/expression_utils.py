@@ -147,7 +147,16 @@ def eval_timed(expression):
     """
     from hail.utils.java import Env
 
-    analyze('eval_timed', expression, Indices(expression._indices.source))
+    (tupled_ans, timing) = Env.backend().execute(_eval_ir('eval_timed', expression), True)
+    return tupled_ans[0], timing
+
+
+def _eval_ir(caller, expression):
+    """The IR of a one-tuple holding the value of `expression`, which may refer
+    to the globals of its source."""
+    from hail.utils.java import Env
+
+    analyze(caller, expression, Indices(expression._indices.source))
 
     tupled_expression = hl.tuple([expression])
     if tupled_expression._indices.source is None:
@@ -155,13 +164,9 @@ def eval_timed(expression):
         expression_type = expression.dtype
         if ir_type != expression.dtype:
             raise ExpressionException(f'Expression type and IR type differed: \n{ir_type}\n vs \n{expression_type}')
-        (tupled_ans, timing) = Env.backend().execute(tupled_expression._ir, True)
-    else:
-        uid = Env.get_uid()
-        ir = tupled_expression._indices.source.select_globals(**{uid: tupled_expression}).index_globals()[uid]._ir
-        (tupled_ans, timing) = Env.backend().execute(ir, True)
-
-    return tupled_ans[0], timing
+        return tupled_expression._ir
+    uid = Env.get_uid()
+    return tupled_expression._indices.source.select_globals(**{uid: tupled_expression}).index_globals()[uid]._ir
 
 
 @typecheck(expression=expr_any)
@@ -194,6 +199,41 @@ def eval(expression):
     return eval_timed(expression)[0]
 
 
+@typecheck(expressions=expr_any, parallelism=int)
+def eval_many(*expressions, parallelism=10):
+    """Evaluate several independent Hail expressions, returning their results.
+
+    Backends that can run several queries at once, like the service backend,
+    submit up to `parallelism` of the expressions at a time, so the time taken
+    approaches that of the slowest expression rather than the sum of them all.
+
+    Examples
+    --------
+
+    >>> hl.eval_many(hl.sum(hl.range(10)), hl.str(5))
+    [45, '5']
+
+    Parameters
+    ----------
+    expressions : varargs of :class:`.Expression`
+        Expressions to evaluate, each subject to the same restrictions as the
+        argument of :func:`.eval`.
+    parallelism : :obj:`int`
+        The maximum number of expressions evaluated at the same time.
+
+    Returns
+    -------
+    :obj:`list`
+        The results of evaluating `expressions`, in the same order.
+    """
+    from hail.utils.java import Env
+
+    if parallelism < 1:
+        raise ValueError(f"'parallelism' must be at least 1, found {parallelism}")
+    irs = [_eval_ir('eval_many', expression) for expression in expressions]
+    return [tupled_ans[0] for tupled_ans in Env.backend().execute_many(irs, parallelism=parallelism)]
+
+
 @typecheck(expression=expr_any)
 def eval_typed(expression):
     """Evaluate a Hail expression, returning the result and the type of the result.
@@ -1,6 +1,9 @@
 import abc
+import functools
+import gc
 import json
 import math
+import operator
 from collections.abc import Mapping, Sequence
 import pprint
 
@@ -15,7 +18,7 @@ from hail.typecheck import typecheck, typecheck_method, oneof, transformed
 from hail.utils.java import escape_parsable
 from hail.utils import frozendict
 from hail.utils.misc import lookup_bit
-from hail.utils.byte_reader import ByteReader
+from hail.utils.byte_reader import ByteReader, ChunkedByteReader
 
 __all__ = [
     'dtype',
@@ -265,11 +268,34 @@ class HailType(object):
         return x
 
     def _from_encoding(self, encoding):
-        return self._convert_from_encoding(ByteReader(memoryview(encoding)))
+        return _decode(self._decoder(), encoding)
+
+    def _numpy_from_encoding(self, encoding):
+        return _decode(self._numpy_decoder(), encoding)
 
     def _convert_from_encoding(self, byte_reader):
         raise ValueError("Not implemented yet")
 
+    def _decoder(self):
+        """Function decoding a value of this type from a :class:`.ByteReader`.
+
+        Decoders are built once per type by :meth:`._build_decoder` and cached.
+        """
+        return _compile_decoder(self)
+
+    def _build_decoder(self):
+        return self._convert_from_encoding
+
+    def _numpy_decoder(self):
+        """Like :meth:`._decoder`, but arrays (in structs) are decoded to NumPy
+        arrays, see :meth:`.tarray._numpy_decoder`."""
+        return self._decoder()
+
+    def _to_numpy(self, x):
+        """Convert a decoded value to the value :meth:`._numpy_decoder` would
+        have produced."""
+        return x
+
     def _traverse(self, obj, f):
         """Traverse a nested type and object.
 
@@ -306,6 +332,94 @@ class HailType(object):
 hail_type = oneof(HailType, transformed((str, dtype)))
 
 
+@functools.lru_cache(maxsize=256)
+def _compile_decoder(t):
+    return t._build_decoder()
+
+
+def _decode(decoder, encoding):
+    # Every object allocated while decoding is part of the result, so
+    # cyclic garbage collections triggered by those allocations are wasted.
+    gc_was_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        return decoder(ByteReader(memoryview(encoding)))
+    finally:
+        if gc_was_enabled:
+            gc.enable()
+
+
+def _object_array(values):
+    # np.array would turn nested sequences into extra dimensions
+    a = np.empty(len(values), dtype=object)
+    for i, v in enumerate(values):
+        a[i] = v
+    return a
+
+
+def _fields_decoder(decoders):
+    """Decoder for a missing-bit prefixed sequence of fields, as encoded for
+    structs and tuples. Returns the list of decoded field values."""
+    n_missing_bytes = (len(decoders) + 7) >> 3
+    indexed_decoders = list(enumerate(decoders))
+
+    def decode(byte_reader):
+        missing_bytes = byte_reader.read_bytes_view(n_missing_bytes)
+        if not any(missing_bytes):
+            return [d(byte_reader) for d in decoders]
+        return [None if (missing_bytes[i >> 3] >> (i & 7)) & 1 else d(byte_reader)
+                for i, d in indexed_decoders]
+    return decode
+
+
+def _fixed_width_elements_decoder(t):
+    """Decoder for a run of `n` consecutive structs or tuples of type `t`, or
+    ``None`` if `t` has fields that are not fixed-width primitives.
+
+    Runs of elements in which no field is missing have a constant stride and
+    are decoded column-wise with NumPy. An element with missing fields is
+    decoded on its own and ends the run.
+    """
+    types = t.types
+    if len(types) == 0 or any(type(ft) not in _numeric_types for ft in types):
+        return None
+
+    n_missing_bytes = (len(types) + 7) >> 3
+    missing_names = [f'm{i}' for i in range(n_missing_bytes)]
+    field_names = [f'f{i}' for i in range(len(types))]
+    row_dtype = np.dtype([(m, np.uint8) for m in missing_names]
+                         + [(f, ft.to_numpy()) for f, ft in zip(field_names, types)])
+    decode_one = _fields_decoder([ft._decoder() for ft in types])
+    if isinstance(t, tstruct):
+        fields = t._fields
+        from_dict = hl.utils.Struct._from_dict
+
+        def construct(values):
+            return from_dict(dict(zip(fields, values)))
+    else:
+        construct = tuple
+
+    def decode(byte_reader, n):
+        decoded = []
+        window = 1024
+        while len(decoded) < n:
+            rows = byte_reader.peek_numpy(row_dtype, min(n - len(decoded), window))
+            has_missing = np.zeros(len(rows), dtype=np.bool_)
+            for m in missing_names:
+                has_missing |= rows[m] != 0
+            run_length = int(np.argmax(has_missing)) if has_missing.any() else len(rows)
+            if run_length > 0:
+                columns = [rows[f][:run_length].tolist() for f in field_names]
+                decoded.extend([construct(values) for values in zip(*columns)])
+                byte_reader.skip(run_length * row_dtype.itemsize)
+            # keep the work spent peeking proportional to the elements decoded
+            window = run_length * 2 + 64
+            if run_length < len(rows) or len(rows) == 0:
+                decoded.append(construct(decode_one(byte_reader)))
+        return decoded
+    return decode
+
+
 class _tvoid(HailType):
     def __init__(self):
         super(_tvoid, self).__init__()
@@ -384,6 +498,9 @@ class _tint32(HailType):
     def _convert_from_encoding(self, byte_reader):
         return byte_reader.read_int32()
 
+    def _build_decoder(self):
+        return operator.methodcaller('read_int32')
+
     def _byte_size(self):
         return 4
 
@@ -439,6 +556,9 @@ class _tint64(HailType):
     def _convert_from_encoding(self, byte_reader):
         return byte_reader.read_int64()
 
+    def _build_decoder(self):
+        return operator.methodcaller('read_int64')
+
     def _byte_size(self):
         return 8
 
@@ -477,6 +597,9 @@ class _tfloat32(HailType):
     def _convert_from_encoding(self, byte_reader):
         return byte_reader.read_float32()
 
+    def _build_decoder(self):
+        return operator.methodcaller('read_float32')
+
     def unify(self, t):
         return t == tfloat32
 
@@ -539,6 +662,9 @@ class _tfloat64(HailType):
     def _convert_from_encoding(self, byte_reader):
         return byte_reader.read_float64()
 
+    def _build_decoder(self):
+        return operator.methodcaller('read_float64')
+
     def _byte_size(self):
         return 8
 
@@ -580,6 +706,11 @@ class _tstr(HailType):
 
         return str_literal
 
+    def _build_decoder(self):
+        def decode(byte_reader):
+            return str(byte_reader.read_bytes_view(byte_reader.read_int32()), 'utf-8')
+        return decode
+
 
 class _tbool(HailType):
     """Hail type for Boolean (``True`` or ``False``) values.
@@ -621,6 +752,9 @@ class _tbool(HailType):
     def _convert_from_encoding(self, byte_reader):
         return byte_reader.read_bool()
 
+    def _build_decoder(self):
+        return operator.methodcaller('read_bool')
+
 
 class tndarray(HailType):
     """Hail type for n-dimensional arrays.
@@ -752,6 +886,20 @@ class tndarray(HailType):
             np_type = self.element_type.to_numpy()
             return np.ndarray(shape=shape, buffer=np.array(elements, dtype=np_type), dtype=np_type, order="F")
 
+    def _build_decoder(self):
+        if type(self.element_type) not in _numeric_types:
+            return self._convert_from_encoding
+
+        ndim = self.ndim
+        np_type = self.element_type.to_numpy()
+
+        def decode(byte_reader):
+            shape = [byte_reader.read_int64() for i in range(ndim)]
+            total_num_elements = int(np.prod(shape, dtype=np.int64))
+            # elements are encoded in column major order
+            return byte_reader.read_numpy(np_type, total_num_elements).reshape(shape, order='F').copy(order='F')
+        return decode
+
 
 class tarray(HailType):
     """Hail type for variable-length arrays of elements.
@@ -857,6 +1005,103 @@ class tarray(HailType):
             i += 1
         return decoded
 
+    def _numpy_decoder(self):
+        """Decoder producing a NumPy array instead of a list.
+
+        Arrays of numeric primitives are read directly from the encoded buffer
+        without creating Python objects for their elements. If any element is
+        missing, the result is a :class:`numpy.ma.MaskedArray` masking the
+        missing elements. Arrays of other types decode to object arrays with
+        ``None`` for missing elements.
+        """
+        if type(self.element_type) not in _numeric_types:
+            decode_list = self._decoder()
+
+            def decode_objects(byte_reader):
+                return _object_array(decode_list(byte_reader))
+            return decode_objects
+
+        np_type = self.element_type.to_numpy()
+
+        def decode(byte_reader):
+            length = byte_reader.read_int32()
+            missing = byte_reader.read_missing_bits(length)
+            if missing is None:
+                return byte_reader.read_numpy(np_type, length)
+            data = np.zeros(length, dtype=np_type)
+            data[~missing] = byte_reader.read_numpy(np_type, length - int(np.count_nonzero(missing)))
+            return np.ma.MaskedArray(data, mask=missing)
+        return decode
+
+    def _to_numpy(self, x):
+        if x is None:
+            return x
+        if type(self.element_type) not in _numeric_types:
+            return _object_array(x)
+        missing = np.array([elt is None for elt in x], dtype=np.bool_)
+        if not missing.any():
+            return np.array(x, dtype=self.element_type.to_numpy())
+        data = np.array([0 if elt is None else elt for elt in x], dtype=self.element_type.to_numpy())
+        return np.ma.MaskedArray(data, mask=missing)
+
+    def _build_decoder(self):
+        if type(self.element_type) in _numeric_types:
+            np_type = self.element_type.to_numpy()
+
+            def decode_numeric(byte_reader):
+                length = byte_reader.read_int32()
+                missing = byte_reader.read_missing_bits(length)
+                if missing is None:
+                    return byte_reader.read_numpy(np_type, length).tolist()
+                present = ~missing
+                values = byte_reader.read_numpy(np_type, int(np.count_nonzero(present)))
+                decoded = np.empty(length, dtype=object)
+                decoded[present] = values
+                return decoded.tolist()
+            return decode_numeric
+
+        if isinstance(self.element_type, (tstruct, ttuple)):
+            decode_elements = _fixed_width_elements_decoder(self.element_type)
+            if decode_elements is not None:
+                def decode_fixed_width(byte_reader):
+                    length = byte_reader.read_int32()
+                    missing = byte_reader.read_missing_bits(length)
+                    if missing is None:
+                        return decode_elements(byte_reader, length)
+                    present = iter(decode_elements(byte_reader, length - int(np.count_nonzero(missing))))
+                    return [None if m else next(present) for m in missing.tolist()]
+                return decode_fixed_width
+
+        decode_element = self.element_type._decoder()
+
+        def decode(byte_reader):
+            length = byte_reader.read_int32()
+            missing_bytes = byte_reader.read_bytes_view((length + 7) >> 3)
+            if not any(missing_bytes):
+                return [decode_element(byte_reader) for i in range(length)]
+            return [None if (missing_bytes[i >> 3] >> (i & 7)) & 1 else decode_element(byte_reader)
+                    for i in range(length)]
+        return decode
+
+    def _iter_from_encoding(self, chunks):
+        """Decode an encoded array from an iterable of consecutive chunks of its
+        encoding, yielding each element as soon as the chunks holding it have
+        arrived.
+
+        The decoder reads from a :class:`.ChunkedByteReader`, which takes the
+        next chunk when the decoder needs it, so every byte is decoded once
+        and only the unread part of the encoding is kept.
+        """
+        decode_element = self.element_type._decoder()
+        byte_reader = ChunkedByteReader(chunks)
+        length = byte_reader.read_int32()
+        missing_bytes = byte_reader.read_bytes((length + 7) >> 3)
+        for i in range(length):
+            if (missing_bytes[i >> 3] >> (i & 7)) & 1:
+                yield None
+            else:
+                yield decode_element(byte_reader)
+
 
 class tstream(HailType):
     @typecheck_method(element_type=hail_type)
@@ -987,6 +1232,13 @@ class tset(HailType):
     def _convert_from_encoding(self, byte_reader):
         return frozenset(self._array_repr._convert_from_encoding(byte_reader))
 
+    def _build_decoder(self):
+        decode_array = self._array_repr._decoder()
+
+        def decode(byte_reader):
+            return frozenset(decode_array(byte_reader))
+        return decode
+
     def _propagate_jtypes(self, jtype):
         self._element_type._add_jtype(jtype.elementType())
 
@@ -1096,6 +1348,14 @@ class tdict(HailType):
         array_of_pairs = self._array_repr._convert_from_encoding(byte_reader)
         return frozendict({pair.key: pair.value for pair in array_of_pairs})
 
+    def _build_decoder(self):
+        # pairs are encoded as structs, which share their encoding with tuples
+        decode_pairs = tarray(ttuple(self.key_type, self.value_type))._decoder()
+
+        def decode(byte_reader):
+            return frozendict(dict(decode_pairs(byte_reader)))
+        return decode
+
     def _propagate_jtypes(self, jtype):
         self._key_type._add_jtype(jtype.keyType())
         self._value_type._add_jtype(jtype.valueType())
@@ -1270,6 +1530,29 @@ class tstruct(HailType, Mapping):
 
         return hl.utils.Struct(**kwargs)
 
+    def _build_decoder(self):
+        decode_fields = _fields_decoder([t._decoder() for t in self.types])
+        fields = self._fields
+        from_dict = hl.utils.Struct._from_dict
+
+        def decode(byte_reader):
+            return from_dict(dict(zip(fields, decode_fields(byte_reader))))
+        return decode
+
+    def _numpy_decoder(self):
+        decode_fields = _fields_decoder([t._numpy_decoder() for t in self.types])
+        fields = self._fields
+        from_dict = hl.utils.Struct._from_dict
+
+        def decode(byte_reader):
+            return from_dict(dict(zip(fields, decode_fields(byte_reader))))
+        return decode
+
+    def _to_numpy(self, x):
+        if x is None:
+            return x
+        return hl.utils.Struct(**{f: t._to_numpy(x[f]) for f, t in self.items()})
+
     def _is_prefix_of(self, other):
         return (isinstance(other, tstruct)
                 and len(self._fields) <= len(other._fields)
@@ -1544,6 +1827,13 @@ class ttuple(HailType, Sequence):
 
         return tuple(answer)
 
+    def _build_decoder(self):
+        decode_fields = _fields_decoder([t._decoder() for t in self.types])
+
+        def decode(byte_reader):
+            return tuple(decode_fields(byte_reader))
+        return decode
+
     def unify(self, t):
         if not (isinstance(t, ttuple) and len(self.types) == len(t.types)):
             return False
@@ -1756,6 +2046,15 @@ class tlocus(HailType):
         as_struct = tlocus.struct_repr._convert_from_encoding(byte_reader)
         return genetics.Locus(as_struct.contig, as_struct.pos, self.reference_genome)
 
+    def _build_decoder(self):
+        decode_fields = _fields_decoder([t._decoder() for t in tlocus.struct_repr.types])
+        reference_genome = self.reference_genome
+
+        def decode(byte_reader):
+            contig, pos = decode_fields(byte_reader)
+            return genetics.Locus(contig, pos, reference_genome)
+        return decode
+
     def unify(self, t):
         return isinstance(t, tlocus) and self.reference_genome == t.reference_genome
 
@@ -1849,6 +2148,15 @@ class tinterval(HailType):
         interval_as_struct = self._struct_repr._convert_from_encoding(byte_reader)
         return hl.Interval(interval_as_struct.start, interval_as_struct.end, interval_as_struct.includes_start, interval_as_struct.includes_end, point_type=self.point_type)
 
+    def _build_decoder(self):
+        decode_fields = _fields_decoder([t._decoder() for t in self._struct_repr.types])
+        point_type = self.point_type
+
+        def decode(byte_reader):
+            start, end, includes_start, includes_end = decode_fields(byte_reader)
+            return hl.Interval(start, end, includes_start, includes_end, point_type=point_type)
+        return decode
+
     def unify(self, t):
         return isinstance(t, tinterval) and self.point_type.unify(t.point_type)
 
@@ -36,6 +36,23 @@ class FS(abc.ABC):
     def ls(self, path: str) -> List[Dict]:
         pass
 
+    def ls_recursive(self, path: str) -> List[Dict]:
+        """The files under `path` at any depth, or `path` if it is a file."""
+        files = []
+        for entry in self.ls(path):
+            if entry['is_dir']:
+                files.extend(self.ls_recursive(entry['path']))
+            else:
+                files.append(entry)
+        return files
+
+    def stat_many(self, paths: List[str]) -> List[Dict]:
+        return [self.stat(path) for path in paths]
+
+    def copy_many(self, srcs: List[str], dests: List[str]):
+        for src, dest in zip(srcs, dests):
+            self.copy(src, dest)
+
     @abc.abstractmethod
     def mkdir(self, path: str):
         """Ensure files can be created whose dirname is `path`.
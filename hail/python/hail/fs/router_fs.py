@@ -0,0 +1,280 @@
+from typing import Any, Dict, List, Optional
+import asyncio
+import concurrent.futures
+import functools
+import io
+import os
+import threading
+import urllib.parse
+
+from hurry.filesize import size
+from hailtop.aiotools import Copier, FileListEntry, ReadAheadStream, RouterAsyncFS, Transfer
+from hailtop.utils import bounded_gather
+
+from .fs import FS
+from .local_fs import LocalFS
+
+
+class _BackgroundLoop:
+    """An event loop running on a daemon thread, on which the file systems
+    of every :class:`.RouterFS` run their coroutines."""
+
+    def __init__(self):
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, name='hail-fs', daemon=True)
+        self._thread.start()
+
+    def submit(self, coro) -> concurrent.futures.Future:
+        return asyncio.run_coroutine_threadsafe(coro, self._loop)
+
+    def run(self, coro):
+        return self.submit(coro).result()
+
+
+_background_loop: Optional[_BackgroundLoop] = None
+_background_loop_lock = threading.Lock()
+
+
+def _get_background_loop() -> _BackgroundLoop:
+    global _background_loop
+    with _background_loop_lock:
+        if _background_loop is None:
+            _background_loop = _BackgroundLoop()
+        return _background_loop
+
+
+class _SeekableReader(io.RawIOBase):
+    """Reads a :class:`.ReadAheadStream` of the background loop."""
+
+    def __init__(self, loop: _BackgroundLoop, stream: ReadAheadStream):
+        super().__init__()
+        self._loop = loop
+        self._stream = stream
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        return self._stream.seek(offset, whence)
+
+    def tell(self):
+        return self._stream.tell()
+
+    def readinto(self, b):
+        data = self._loop.run(self._stream.read(len(b)))
+        n = len(data)
+        b[:n] = data
+        return n
+
+    def close(self):
+        if not self.closed:
+            self._loop.run(self._stream.wait_closed())
+        super().close()
+
+
+class _Writer(io.RawIOBase):
+    def __init__(self, loop: _BackgroundLoop, create_cm):
+        super().__init__()
+        self._loop = loop
+        self._create_cm = create_cm
+        self._stream = loop.run(create_cm.__aenter__())
+
+    def writable(self):
+        return True
+
+    def write(self, b):
+        self._loop.run(self._stream.write(bytes(b)))
+        return len(b)
+
+    def close(self):
+        if not self.closed:
+            self._loop.run(self._create_cm.__aexit__(None, None, None))
+        super().close()
+
+
+def _is_local(path: str) -> bool:
+    return urllib.parse.urlparse(path).scheme in ('', 'file')
+
+
+def _local_path(path: str) -> str:
+    parsed = urllib.parse.urlparse(path)
+    if parsed.scheme == 'file':
+        return parsed.path
+    return path
+
+
+def _dir_stat(url: str) -> Dict:
+    return {
+        'is_dir': True,
+        'size_bytes': 0,
+        'size': size(0),
+        'path': url.rstrip('/'),
+        'owner': None,
+        'modification_time': None,
+    }
+
+
+async def _file_stat(url: str, status) -> Dict:
+    async def get(key: str) -> Any:
+        try:
+            return await status[key]
+        except KeyError:
+            return None
+
+    size_bytes = await status.size()
+    return {
+        'is_dir': False,
+        'size_bytes': size_bytes,
+        'size': size(size_bytes),
+        'path': url,
+        'owner': await get('bucket'),
+        'modification_time': await get('updated'),
+    }
+
+
+class RouterFS(FS):
+    """A file system over the async file systems of :mod:`hailtop.aiotools`.
+
+    Requests run on a background event loop shared by every instance, so
+    listing, stat-ing and copying many files are each one call that runs
+    the requests concurrently. Remote files are seekable and read with
+    :class:`.ReadAheadStream`: ``READ_AHEAD_BLOCKS`` ranged reads of
+    ``READ_AHEAD_BLOCK_BYTES`` each run ahead of the position. Local paths
+    are handled directly by :class:`.LocalFS`.
+    """
+
+    READ_AHEAD_BLOCK_BYTES = 8 * 1024 * 1024
+    READ_AHEAD_BLOCKS = 8
+    READ_BUFFER_BYTES = 1024 * 1024
+    PARALLELISM = 50
+
+    def __init__(self, *, gcs_kwargs: Optional[Dict[str, Any]] = None):
+        self._loop = _get_background_loop()
+        self.afs = RouterAsyncFS('file', gcs_kwargs=gcs_kwargs)
+        self._local = LocalFS()
+
+    def _run(self, coro):
+        return self._loop.run(coro)
+
+    def open(self, path: str, mode: str = 'r', buffer_size: int = 8192):
+        if _is_local(path):
+            path = _local_path(path)
+            if 'r' not in mode:
+                os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            return self._local.open(path, mode, buffer_size)
+
+        f: io.IOBase
+        if 'r' in mode:
+            stream = self._run(self.afs.open_read_ahead(path,
+                                                        block_size=RouterFS.READ_AHEAD_BLOCK_BYTES,
+                                                        window=RouterFS.READ_AHEAD_BLOCKS))
+            # each read of the raw stream is a round trip to the background loop
+            f = io.BufferedReader(_SeekableReader(self._loop, stream),
+                                  max(buffer_size, RouterFS.READ_BUFFER_BYTES))
+        else:
+            if 'a' in mode:
+                raise ValueError(f'cannot append to remote file: {path}')
+            if 'x' in mode and self.exists(path):
+                raise FileExistsError(path)
+            f = io.BufferedWriter(_Writer(self._loop, self._run(self.afs.create(path))), buffer_size)
+        if 'b' not in mode:
+            f = io.TextIOWrapper(f, encoding='utf-8')
+        return f
+
+    def copy(self, src: str, dest: str):
+        if _is_local(src) and _is_local(dest):
+            self._local.copy(_local_path(src), _local_path(dest))
+        else:
+            self.copy_many([src], [dest])
+
+    def copy_many(self, srcs: List[str], dests: List[str]):
+        async def copy():
+            sema = asyncio.Semaphore(RouterFS.PARALLELISM)
+            async with sema:
+                await Copier.copy(self.afs, sema, [Transfer(src, dest) for src, dest in zip(srcs, dests)])
+
+        self._run(copy())
+
+    def exists(self, path: str) -> bool:
+        if _is_local(path):
+            return self._local.exists(_local_path(path))
+        return self.is_file(path) or self.is_dir(path)
+
+    def is_file(self, path: str) -> bool:
+        if _is_local(path):
+            return self._local.is_file(_local_path(path))
+        return self._run(self.afs.isfile(path))
+
+    def is_dir(self, path: str) -> bool:
+        if _is_local(path):
+            return self._local.is_dir(_local_path(path))
+        return self._run(self.afs.isdir(path.rstrip('/') + '/'))
+
+    async def _stat(self, path: str) -> Dict:
+        if _is_local(path):
+            return self._local.stat(_local_path(path))
+        try:
+            return await _file_stat(path, await self.afs.statfile(path))
+        except FileNotFoundError:
+            if await self.afs.isdir(path.rstrip('/') + '/'):
+                return _dir_stat(path)
+            raise
+
+    def stat(self, path: str) -> Dict:
+        return self._run(self._stat(path))
+
+    def stat_many(self, paths: List[str]) -> List[Dict]:
+        return self._run(bounded_gather(*[functools.partial(self._stat, path) for path in paths],
+                                        parallelism=RouterFS.PARALLELISM))
+
+    async def _ls(self, path: str, recursive: bool) -> List[Dict]:
+        try:
+            it = await self.afs.listfiles(path, recursive=recursive)
+        except FileNotFoundError:
+            return [await self._stat(path)]
+        entries = [entry async for entry in it]
+
+        async def entry_stat(entry: FileListEntry) -> Dict:
+            if await entry.is_dir():
+                return _dir_stat(await entry.url())
+            return await _file_stat(await entry.url(), await entry.status())
+
+        return await bounded_gather(*[functools.partial(entry_stat, entry) for entry in entries],
+                                    parallelism=RouterFS.PARALLELISM)
+
+    def ls(self, path: str) -> List[Dict]:
+        if _is_local(path):
+            return self._local.ls(_local_path(path))
+        return self._run(self._ls(path, False))
+
+    def ls_recursive(self, path: str) -> List[Dict]:
+        if _is_local(path):
+            return self._local.ls_recursive(_local_path(path))
+        return self._run(self._ls(path, True))
+
+    def mkdir(self, path: str):
+        if _is_local(path):
+            self._local.mkdir(_local_path(path))
+        else:
+            self._run(self.afs.makedirs(path, exist_ok=True))
+
+    def remove(self, path: str):
+        if _is_local(path):
+            self._local.remove(_local_path(path))
+        else:
+            self._run(self.afs.remove(path))
+
+    def rmtree(self, path: str):
+        if _is_local(path):
+            self._local.rmtree(_local_path(path))
+        else:
+            self._run(self.afs.rmtree(None, path))
+
+    def supports_scheme(self, scheme: str) -> bool:
+        return scheme in ('', 'file', 'gs', 's3', 'hail-az')
+
+    def close(self):
+        self._run(self.afs.close())
@@ -1,4 +1,5 @@
 import abc
+import hashlib
 
 from hail.utils.java import Env
 from .renderer import Renderer, PlainRenderer, Renderable
@@ -26,6 +27,14 @@ def _env_bind(env, bindings):
 
 
 class BaseIR(Renderable):
+    # Render caches, see RenderCache. Set on the class so that they are
+    # present on every node, whatever its constructor does.
+    _render_cacheable = True
+    _render_fragments = None
+    _render_str = None
+    _cse_render_str = None
+    _structural_hash_str = None
+
     def __init__(self, *children):
         super().__init__()
         self._type = None
@@ -93,6 +102,17 @@ class BaseIR(Renderable):
     def __hash__(self):
         return 31 + hash(str(self))
 
+    def _structural_hash(self) -> str:
+        """Hash of the rendered IR which, unlike :meth:`__hash__`, is stable
+        across Python sessions."""
+        if self._structural_hash_str is not None:
+            return self._structural_hash_str
+        structural_hash = hashlib.sha256(str(self).encode()).hexdigest()
+        # the rendering is final once cached, see RenderCache
+        if self._render_str is not None:
+            self._structural_hash_str = structural_hash
+        return structural_hash
+
     def new_block(self, i: int) -> bool:
         return self.renderable_new_block(self.renderable_idx_of_child(i))
 
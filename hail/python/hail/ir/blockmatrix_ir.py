@@ -377,6 +377,9 @@ class BlockMatrixRandom(BlockMatrixIR):
 
 
 class JavaBlockMatrix(BlockMatrixIR):
+    # rendered as a reference registered with the renderer
+    _render_cacheable = False
+
     def __init__(self, jbm):
         super().__init__()
         self.jir = Env.hail().expr.ir.BlockMatrixLiteral(jbm)
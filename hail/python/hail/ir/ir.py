@@ -540,6 +540,9 @@ class MakeArray(IR):
         super().__init__(*args)
         self.args = args
         self._type = type
+        # the rendering changes once the type is inferred
+        if type is None:
+            self._render_cacheable = False
 
     def copy(self, *args):
         return MakeArray(args, self._type)
@@ -2740,6 +2743,9 @@ class Join(IR):
 
 
 class JavaIR(IR):
+    # rendered as a reference registered with the renderer
+    _render_cacheable = False
+
     def __init__(self, jir):
         super(JavaIR, self).__init__()
         self._jir = jir
@@ -636,6 +636,9 @@ class MatrixFilterIntervals(MatrixIR):
 
 
 class JavaMatrix(MatrixIR):
+    # rendered as a reference registered with the renderer
+    _render_cacheable = False
+
     def __init__(self, jir):
         super().__init__()
         self._jir = jir
@@ -108,6 +108,13 @@ class PlainRenderer(Renderer):
         return jir_id
 
     def __call__(self, x: 'Renderable'):
+        if not self.stop_at_jir and isinstance(x, ir.BaseIR):
+            if x._render_str is not None:
+                return x._render_str
+            if RenderCache.fill(self, x):
+                x._render_str = RenderCache.flatten(x)
+                return x._render_str
+
         stack = RQStack()
         builder = []
 
@@ -143,6 +150,93 @@ class PlainRenderer(Renderer):
         return ''.join(builder)
 
 
+class RenderCache:
+    """Structural cache of plain renderings.
+
+    Each :class:`.BaseIR` caches its rendering as a tuple of fragments in
+    ``_render_fragments``. A fragment is either a string or a child
+    :class:`.BaseIR`, which stands for that child's own fragments, so shared
+    subtrees are rendered once and a cached rendering takes space linear in
+    the size of the node, not of its subtree.
+
+    IR nodes are immutable once built, and copies are new nodes with empty
+    caches. Nodes whose rendering depends on the renderer (those referring to
+    JVM objects through :meth:`.Renderer.add_jir`) or on a type inferred after
+    they are built (a :class:`.MakeArray` without a type) and their ancestors
+    are never cached.
+    """
+
+    class Frame:
+        __slots__ = ['node', 'children', 'child_idx', 'fragments']
+
+        def __init__(self, node, children, fragments):
+            self.node = node
+            self.children = children
+            self.child_idx = 0
+            self.fragments = fragments
+
+    @staticmethod
+    def fill(r: 'PlainRenderer', root: 'ir.BaseIR') -> bool:
+        """Fill the fragment caches of `root` and its descendants. Returns
+        ``False`` if `root` cannot be cached."""
+        if root._render_fragments is not None:
+            return True
+        if not root._render_cacheable:
+            return False
+
+        def push(node, fragments):
+            head = node.render_head(r)
+            if head != '':
+                fragments.append(head)
+            stack.append(RenderCache.Frame(node, node.render_children(r), fragments))
+
+        stack: List[RenderCache.Frame] = []
+        push(root, [])
+        while stack:
+            frame = stack[-1]
+            if frame.child_idx == len(frame.children):
+                stack.pop()
+                frame.fragments.append(frame.node.render_tail(r))
+                if isinstance(frame.node, ir.BaseIR):
+                    frame.node._render_fragments = tuple(frame.fragments)
+                    if stack:
+                        stack[-1].fragments.append(frame.node)
+                continue
+
+            child = frame.children[frame.child_idx]
+            frame.child_idx += 1
+            frame.fragments.append(' ')
+            if isinstance(child, ir.BaseIR):
+                if child._render_fragments is not None:
+                    frame.fragments.append(child)
+                    continue
+                if not child._render_cacheable:
+                    for f in stack:
+                        if isinstance(f.node, ir.BaseIR):
+                            f.node._render_cacheable = False
+                    return False
+                push(child, [])
+            else:
+                # other renderables are inlined into the enclosing IR's fragments
+                push(child, frame.fragments)
+        return True
+
+    @staticmethod
+    def flatten(root: 'ir.BaseIR') -> str:
+        builder = []
+        stack = [iter(root._render_fragments)]
+        while stack:
+            for fragment in stack[-1]:
+                if isinstance(fragment, str):
+                    builder.append(fragment)
+                else:
+                    stack.append(iter(fragment._render_fragments))
+                    break
+            else:
+                stack.pop()
+        return ''.join(builder)
+
+
 Vars = Dict[str, int]
 Context = (Vars, Vars, Vars)
 
@@ -180,14 +274,25 @@ class CSERenderer(Renderer):
         self.memo[id(node)] = jref
 
     def __call__(self, root: 'ir.BaseIR') -> str:
-        binding_sites = CSEAnalysisPass(self)(root)
-        return CSEPrintPass(self)(root, binding_sites)
+        if not self.stop_at_jir and root._cse_render_str is not None:
+            return root._cse_render_str
+        jir_count = self.jir_count
+        analysis = CSEAnalysisPass(self)
+        binding_sites = analysis(root)
+        rendered = CSEPrintPass(self)(root, binding_sites)
+        # the rendering only depends on 'root' unless it refers to JVM objects,
+        # and is final unless a node in it is not cacheable, see RenderCache
+        if not self.stop_at_jir and self.jir_count == jir_count and analysis.cacheable:
+            root._cse_render_str = rendered
+        return rendered
 
 
 class CSEAnalysisPass:
     def __init__(self, renderer: CSERenderer):
         self.renderer = renderer
         self.uid_count = 0
+        # whether every node visited can cache its rendering
+        self.cacheable = True
 
     def uid(self) -> str:
         self.uid_count += 1
@@ -219,6 +324,9 @@ class CSEAnalysisPass:
             child_idx = frame.child_idx
 
             if child_idx >= len(node.children):
+                if not node._render_cacheable:
+                    self.cacheable = False
+
                 # mark node as visited at potential let insertion site
                 if not node.is_effectful():
                     bind_depth = frame.bind_depth()
@@ -689,6 +689,9 @@ class BlockMatrixToTable(TableIR):
 
 
 class JavaTable(TableIR):
+    # rendered as a reference registered with the renderer
+    _render_cacheable = False
+
     def __init__(self, jir):
         super().__init__()
         self._jir = jir
@@ -1,8 +1,16 @@
 import os
 
+import asyncio
+import concurrent.futures
+import functools
+import io
 import itertools
 import math
 import re
+import shutil
+import tempfile
+import urllib.parse
+from contextlib import contextmanager
 import numpy as np
 import scipy.linalg as spla
 
@@ -31,6 +39,8 @@ from hail.typecheck import (typecheck, typecheck_method, nullable, oneof,
 from hail.utils import (new_temp_file, new_local_temp_file, local_path_uri,
                         storage_level, with_local_temp_file)
 from hail.utils.java import Env
+from hailtop.aiotools import RouterAsyncFS, blocking_readable_stream_to_async
+from hailtop.utils import async_to_blocking, bounded_gather
 
 block_matrix_type = lazy()
 
@@ -284,7 +294,8 @@ class BlockMatrix(object):
         func:`numpy.tofile` to be a valid binary input to :meth:`.fromfile`.
         This is not checked.
 
-        The number of entries must be less than :math:`2^{31}`.
+        The number of entries in a row of blocks must be less than
+        :math:`2^{31}`.
 
         Parameters
         ----------
@@ -326,7 +337,9 @@ class BlockMatrix(object):
         -----
         The ndarray must have two dimensions, each of non-zero size.
 
-        The number of entries must be less than :math:`2^{31}`.
+        The ndarray is read into the JVM one row of blocks at a time, so the
+        number of entries is not limited to :math:`2^{31}`, but the number of
+        entries in a row of blocks must be less than :math:`2^{31}`.
 
         Parameters
         ----------
@@ -1189,8 +1202,8 @@ class BlockMatrix(object):
         writer = BlockMatrixBinaryWriter(uri)
         Env.backend().execute(BlockMatrixWrite(self._bmir, writer))
 
-    @typecheck_method(_force_blocking=bool)
-    def to_numpy(self, _force_blocking=False):
+    @typecheck_method(out=nullable(np.ndarray), _force_blocking=bool)
+    def to_numpy(self, out=None, _force_blocking=False):
         """Collects the block matrix into a `NumPy ndarray
         <https://docs.scipy.org/doc/numpy/reference/generated/numpy.ndarray.html>`__.
 
@@ -1199,24 +1212,42 @@ class BlockMatrix(object):
         >>> bm = BlockMatrix.random(10, 20)
         >>> a = bm.to_numpy()
 
+        To collect a block matrix that does not fit in memory, write it to a
+        memory-mapped file:
+
+        >>> out = np.memmap('/local/file', dtype=np.float64, mode='w+', shape=(10, 20)) # doctest: +SKIP
+        >>> bm.to_numpy(out=out) # doctest: +SKIP
+
         Notes
         -----
         The resulting ndarray will have the same shape as the block matrix.
 
+        Parameters
+        ----------
+        out: :class:`numpy.ndarray`, optional
+            Array of float64 with the shape of the block matrix to write the
+            entries into, for example a :class:`numpy.memmap`.
+
         Returns
         -------
         :class:`numpy.ndarray`
+            `out`, if given.
         """
+        if out is not None:
+            _check_out(out, (self.n_rows, self.n_cols))
 
         if self.n_rows * self.n_cols > 1 << 31 or _force_blocking:
             path = new_temp_file()
             self.export_blocks(path, binary=True)
-            return BlockMatrix.rectangles_to_numpy(path, binary=True)
+            return BlockMatrix.rectangles_to_numpy(path, binary=True, out=out)
 
-        with with_local_temp_file() as path:
+        with _with_shared_memory_temp_file(8 * self.n_rows * self.n_cols) as path:
             uri = local_path_uri(path)
             self.tofile(uri)
-            return np.fromfile(path).reshape((self.n_rows, self.n_cols))
+            if out is None:
+                return np.fromfile(path).reshape((self.n_rows, self.n_cols))
+            async_to_blocking(_read_rectangles_into(out, [[0, 0, self.n_rows, 0, self.n_cols]], [uri], True))
+            return out
 
     def to_ndarray(self):
         """Collects a BlockMatrix into a local hail ndarray expression on driver. This should not
@@ -2230,8 +2261,8 @@ class BlockMatrix(object):
         self.export_rectangles(path_out, rectangles, delimiter, binary)
 
     @staticmethod
-    @typecheck(path=str, binary=bool)
-    def rectangles_to_numpy(path, binary=False):
+    @typecheck(path=str, binary=bool, out=nullable(np.ndarray))
+    def rectangles_to_numpy(path, binary=False, out=None):
         """Instantiates a NumPy ndarray from files of rectangles written out using
         :meth:`.export_rectangles` or :meth:`.export_blocks`. For any given
         dimension, the ndarray will have length equal to the upper bound of that dimension
@@ -2257,11 +2288,20 @@ class BlockMatrix(object):
             4.0 5.0
             7.0 0.0
 
+        To assemble rectangles that do not fit in memory, read them into a
+        memory-mapped file:
+
+        >>> out = np.memmap('/local/file', dtype=np.float64, mode='w+', shape=(3, 2)) # doctest: +SKIP
+        >>> BlockMatrix.rectangles_to_numpy('output/example', out=out) # doctest: +SKIP
+
         Notes
         -----
         If exporting to binary files, note that they are not platform independent. No byte-order
         or data-type information is saved.
 
+        Rectangles are read concurrently and written directly into the result,
+        without an intermediate copy on local disk.
+
         See Also
         --------
         :meth:`.export_rectangles`
@@ -2273,10 +2313,15 @@ class BlockMatrix(object):
             Path to directory where rectangles were written.
         binary: :obj:`bool`
             If true, reads the files as binary, otherwise as text delimited.
+        out: :class:`numpy.ndarray`, optional
+            Array of float64 to read the rectangles into, for example a
+            :class:`numpy.memmap`. Its shape must be the shape of the result.
+            Entries not covered by any rectangle are left unchanged.
 
         Returns
         -------
         :class:`numpy.ndarray`
+            `out`, if given.
         """
         def parse_rects(fname):
             rect_idx_and_bounds = [int(i) for i in re.findall(r'\d+', fname)]
@@ -2290,17 +2335,12 @@ class BlockMatrix(object):
         n_rows = max(rects, key=lambda r: r[2])[2]
         n_cols = max(rects, key=lambda r: r[4])[4]
 
-        nd = np.zeros(shape=(n_rows, n_cols))
-        with with_local_temp_file() as f:
-            uri = local_path_uri(f)
-            for rect, file_path in zip(rects, rect_files):
-                hl.utils.hadoop_copy(file_path, uri)
-                if binary:
-                    rect_data = np.reshape(np.fromfile(f), (rect[2] - rect[1], rect[4] - rect[3]))
-                else:
-                    rect_data = np.loadtxt(f, ndmin=2)
-                nd[rect[1]:rect[2], rect[3]:rect[4]] = rect_data
-        return nd
+        if out is None:
+            out = np.zeros(shape=(n_rows, n_cols))
+        else:
+            _check_out(out, (n_rows, n_cols))
+        async_to_blocking(_read_rectangles_into(out, rects, rect_files, binary))
+        return out
 
     @typecheck_method(compute_uv=bool,
                       complexity_bound=int)
@@ -2555,14 +2595,14 @@ def _jarray_from_ndarray(nd):
         raise ValueError(f'size of ndarray must be less than 2^31, found {nd.size}')
 
     nd = _ndarray_as_float64(nd)
-    with with_local_temp_file() as path:
+    with _with_shared_memory_temp_file(nd.nbytes) as path:
         uri = local_path_uri(path)
         nd.tofile(path)
         return Env.hail().utils.richUtils.RichArray.importFromDoubles(Env.spark_backend('_jarray_from_ndarray').fs._jfs, uri, nd.size)
 
 
 def _ndarray_from_jarray(ja):
-    with with_local_temp_file() as path:
+    with _with_shared_memory_temp_file(8 * len(ja)) as path:
         uri = local_path_uri(path)
         Env.hail().utils.richUtils.RichArray.exportToDoubles(Env.spark_backend('_ndarray_from_jarray').fs._jfs, uri, ja)
         return np.fromfile(path)
@@ -2574,6 +2614,85 @@ def _breeze_fromfile(uri, n_rows, n_cols):
     return Env.hail().utils.richUtils.RichDenseMatrixDouble.importFromDoubles(Env.spark_backend('_breeze_fromfile').fs._jfs, uri, n_rows, n_cols, True)
 
 
+# dense matrices are passed between Python and the JVM through a file in
+# shared memory, if there is room for it, so the transfer never touches disk
+_SHARED_MEMORY_DIR = '/dev/shm'
+
+
+@contextmanager
+def _with_shared_memory_temp_file(n_bytes):
+    if not os.path.isdir(_SHARED_MEMORY_DIR) or shutil.disk_usage(_SHARED_MEMORY_DIR).free <= n_bytes:
+        with with_local_temp_file() as path:
+            yield path
+        return
+
+    fd, path = tempfile.mkstemp(prefix='hail-', dir=_SHARED_MEMORY_DIR)
+    os.close(fd)
+    try:
+        yield path
+    finally:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+def _check_out(out, shape):
+    if out.dtype != np.float64:
+        raise ValueError(f'out: expected an ndarray of float64, found {out.dtype}')
+    if out.shape != shape:
+        raise ValueError(f'out: expected an ndarray of shape {shape}, found {out.shape}')
+
+
+# files with these schemes are read with hailtop.aiotools, others through
+# the Hail file system on a thread pool
+_ASYNC_FS_SCHEMES = {'', 'file', 'gs'}
+
+_RECTANGLE_READ_PARALLELISM = 16
+
+_RECTANGLE_READ_BYTES = 8 * 1024 * 1024
+
+
+async def _read_rectangles_into(out, rects, rect_files, binary):
+    """Read the files of `rects`, [index, start_row, end_row, start_col,
+    end_col], concurrently into their ranges of `out`.
+
+    Binary rectangles are read in chunks of whole rows and copied straight
+    into `out`, so only a chunk per rectangle being read is held in memory.
+    """
+    async with RouterAsyncFS('file') as fs:
+        with concurrent.futures.ThreadPoolExecutor(max_workers=_RECTANGLE_READ_PARALLELISM) as thread_pool:
+            async def open_rectangle(file_path):
+                if urllib.parse.urlparse(file_path).scheme in _ASYNC_FS_SCHEMES:
+                    return await fs.open(file_path)
+                f = await asyncio.get_event_loop().run_in_executor(
+                    thread_pool, lambda: hl.hadoop_open(file_path, 'rb'))
+                return blocking_readable_stream_to_async(thread_pool, f)
+
+            async def read_rectangle(rect, file_path):
+                _, start_row, end_row, start_col, end_col = rect
+                n_cols = end_col - start_col
+                async with await open_rectangle(file_path) as f:
+                    if not binary:
+                        data = await f.read()
+                        out[start_row:end_row, start_col:end_col] = np.loadtxt(io.StringIO(data.decode()), ndmin=2)
+                        return
+                    if n_cols == 0:
+                        return
+                    row_bytes = 8 * n_cols
+                    rows_per_read = max(1, _RECTANGLE_READ_BYTES // row_bytes)
+                    row = start_row
+                    while row < end_row:
+                        n = min(rows_per_read, end_row - row)
+                        data = await f.readexactly(n * row_bytes)
+                        out[row:row + n, start_col:end_col] = np.frombuffer(data).reshape((n, n_cols))
+                        row += n
+
+            await bounded_gather(*[functools.partial(read_rectangle, rect, file_path)
+                                   for rect, file_path in zip(rects, rect_files)],
+                                 parallelism=_RECTANGLE_READ_PARALLELISM)
+
+
 def _check_entries_size(n_rows, n_cols):
     n_entries = n_rows * n_cols
     if n_entries >= 1 << 31:
@@ -2588,7 +2707,7 @@ def _breeze_from_ndarray(nd):
     nd = _ndarray_as_float64(nd)
     n_rows, n_cols = nd.shape
 
-    with with_local_temp_file() as path:
+    with _with_shared_memory_temp_file(nd.nbytes) as path:
         uri = local_path_uri(path)
         nd.tofile(path)
         return _breeze_fromfile(uri, n_rows, n_cols)
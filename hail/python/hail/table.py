@@ -1,5 +1,6 @@
 import collections
 import itertools
+import numpy as np
 import pandas
 import pyspark
 from typing import Optional, Dict, Callable
@@ -26,6 +27,26 @@ import hail as hl
 
 table_type = lazy()
 
+# a single result is limited to the 2 GiB of a JVM byte array, so
+# Table._collect_columns collects about this many values at a time
+_COLLECT_COLUMNS_CHUNK_VALUES = 1 << 24
+
+
+def _concatenate_columns(columns):
+    if any(isinstance(values, np.ma.MaskedArray) for values in columns):
+        return np.ma.concatenate(columns)
+    return np.concatenate(columns)
+
+
+def _pandas_column(values):
+    if not isinstance(values, np.ma.MaskedArray):
+        return values
+    if values.dtype.kind == 'f':
+        return values.filled(np.nan)
+    if values.dtype.kind == 'b':
+        return pandas.arrays.BooleanArray(values.data, values.mask)
+    return pandas.arrays.IntegerArray(values.data, values.mask)
+
 
 class TableIndexKeyError(Exception):
     def __init__(self, key_type, index_expressions):
@@ -1885,8 +1906,8 @@ class Table(ExprContainer):
         """
         return Env.backend().unpersist_table(self)
 
-    @typecheck_method(_localize=bool)
-    def collect(self, _localize=True):
+    @typecheck_method(_localize=bool, _iterate=bool)
+    def collect(self, _localize=True, *, _iterate=False):
         """Collect the rows of the table into a local list.
 
         Examples
@@ -1916,11 +1937,52 @@ class Table(ExprContainer):
             t = self
         rows_ir = ir.GetField(ir.TableCollect(t._tir), 'rows')
         e = construct_expr(rows_ir, hl.tarray(t.row.dtype))
+        if _iterate:
+            return Env.backend()._execute_iter(e._ir)
         if _localize:
             return Env.backend().execute(e._ir)
         else:
             return e
 
+    def _collect_columns(self, max_chunk_values=_COLLECT_COLUMNS_CHUNK_VALUES):
+        """Collect the rows of the table column-wise.
+
+        Returns a :class:`.Struct` with a NumPy array for each row field, see
+        :meth:`.Backend._execute_numpy`. Numeric and boolean fields are
+        decoded without creating a Python object per value.
+
+        The partitions are collected in chunks of about `max_chunk_values`
+        values (rows times row fields), found from the number of rows in each
+        partition, and the arrays of the chunks concatenated.
+        """
+        def collect(t):
+            if len(t.key) > 0:
+                t = t.order_by(*t.key)
+            rows = construct_expr(ir.GetField(ir.TableCollect(t._tir), 'rows'), hl.tarray(t.row.dtype))
+            columns = hl.rbind(rows, lambda rows: hl.struct(**{f: rows.map(lambda r: r[f]) for f in t.row}))
+            return Env.backend()._execute_numpy(columns._ir)
+
+        partition_counts = [
+            r.n for r in self.key_by().select()._map_partitions(
+                lambda rows: hl.array([hl.struct(n=hl.len(rows))])).collect()]
+        row_values = max(len(self.row), 1)
+        chunks = [[]]
+        chunk_values = 0
+        for i, n in enumerate(partition_counts):
+            if n == 0:
+                continue
+            if chunks[-1] and chunk_values + n * row_values > max_chunk_values:
+                chunks.append([])
+                chunk_values = 0
+            chunks[-1].append(i)
+            chunk_values += n * row_values
+
+        # the partitions of a keyed table are in key order
+        columns = [collect(self._filter_partitions(parts)) for parts in chunks]
+        if len(columns) == 1:
+            return columns[0]
+        return hl.utils.Struct(**{f: _concatenate_columns([c[f] for c in columns]) for f in self.row})
+
     def describe(self, handler=print, *, widget=False):
         """Print information about the fields in the table.
 
@@ -2084,8 +2146,8 @@ class Table(ExprContainer):
 
         return Table(ir.TableUnion([table._tir for table in all_tables]))
 
-    @typecheck_method(n=int, _localize=bool)
-    def take(self, n, _localize=True):
+    @typecheck_method(n=int, _localize=bool, _iterate=bool)
+    def take(self, n, _localize=True, *, _iterate=False):
         """Collect the first `n` rows of the table into a local list.
 
         Examples
@@ -2118,7 +2180,7 @@ class Table(ExprContainer):
             List of row structs.
         """
 
-        return self.head(n).collect(_localize)
+        return self.head(n).collect(_localize, _iterate=_iterate)
 
     @typecheck_method(n=int)
     def head(self, n) -> 'Table':
@@ -3241,10 +3303,16 @@ class Table(ExprContainer):
     def to_pandas(self, flatten=True):
         """Converts this table to a Pandas DataFrame.
 
-        Because conversion to Pandas is done through Spark, and Spark
-        cannot represent complex types, types are expanded before
+        Complex types are expanded (see :meth:`expand_types`) before
         flattening or conversion.
 
+        Notes
+        -----
+        Numeric and boolean fields are transferred column-wise as NumPy
+        arrays, without creating a Python object per value. Missing
+        floating-point values become ``NaN``; integer and boolean fields with
+        missing values use the Pandas nullable integer and ``boolean`` dtypes.
+
         Parameters
         ----------
         flatten : :obj:`bool`
@@ -3255,7 +3323,12 @@ class Table(ExprContainer):
         :class:`.pandas.DataFrame`
 
         """
-        return Env.spark_backend('to_pandas').to_pandas(self, flatten)
+        t = self.expand_types()
+        if flatten:
+            t = t.flatten()
+        columns = t._collect_columns()
+        return pandas.DataFrame({f: _pandas_column(values) for f, values in columns.items()},
+                                columns=list(t.row))
 
     @staticmethod
     @typecheck(df=pandas.DataFrame,
@@ -1,5 +1,12 @@
 import struct
 
+import numpy as np
+
+_int32 = struct.Struct('=i')
+_int64 = struct.Struct('=q')
+_float32 = struct.Struct('=f')
+_float64 = struct.Struct('=d')
+
 
 class ByteReader:
     def __init__(self, byte_memview, offset=0):
@@ -7,12 +14,12 @@ class ByteReader:
         self._offset = offset
 
     def read_int32(self) -> int:
-        res = struct.unpack('=i', self._memview[self._offset:self._offset + 4])[0]
+        res = _int32.unpack_from(self._memview, self._offset)[0]
         self._offset += 4
         return res
 
     def read_int64(self) -> int:
-        res = struct.unpack('=q', self._memview[self._offset:self._offset + 8])[0]
+        res = _int64.unpack_from(self._memview, self._offset)[0]
         self._offset += 8
         return res
 
@@ -22,12 +29,12 @@ class ByteReader:
         return res
 
     def read_float32(self) -> float:
-        res = struct.unpack('=f', self._memview[self._offset:self._offset + 4])[0]
+        res = _float32.unpack_from(self._memview, self._offset)[0]
         self._offset += 4
         return res
 
     def read_float64(self) -> float:
-        res = struct.unpack('=d', self._memview[self._offset:self._offset + 8])[0]
+        res = _float64.unpack_from(self._memview, self._offset)[0]
         self._offset += 8
         return res
 
@@ -38,3 +45,108 @@ class ByteReader:
 
     def read_bytes(self, num_bytes):
         return self.read_bytes_view(num_bytes).tobytes()
+
+    def read_numpy(self, dtype, count) -> np.ndarray:
+        """Read `count` contiguous values of `dtype` as a read-only view of the
+        underlying buffer."""
+        dtype = np.dtype(dtype)
+        res = np.frombuffer(self._memview, dtype=dtype, count=count, offset=self._offset)
+        self._offset += dtype.itemsize * count
+        return res
+
+    def peek_numpy(self, dtype, max_count) -> np.ndarray:
+        """Like :meth:`read_numpy`, but reads at most as many values as remain
+        in the buffer and does not advance the reader."""
+        dtype = np.dtype(dtype)
+        count = min(max_count, (len(self._memview) - self._offset) // dtype.itemsize)
+        return np.frombuffer(self._memview, dtype=dtype, count=count, offset=self._offset)
+
+    def skip(self, num_bytes):
+        self._offset += num_bytes
+
+    def read_missing_bits(self, n):
+        """Read the missing bits of `n` elements.
+
+        Returns ``None`` if no element is missing, otherwise a boolean array of
+        length `n` which is ``True`` at missing elements.
+        """
+        num_bytes = (n + 7) >> 3
+        missing_bytes = np.frombuffer(self._memview, dtype=np.uint8, count=num_bytes, offset=self._offset)
+        self._offset += num_bytes
+        if not missing_bytes.any():
+            return None
+        return np.unpackbits(missing_bytes, count=n, bitorder='little').view(np.bool_)
+
+
+class ChunkedByteReader(ByteReader):
+    """A :class:`.ByteReader` over an iterable of consecutive chunks of bytes,
+    which takes more chunks as the values read need them.
+
+    The bytes already read are dropped whenever more chunks are taken, so
+    memory use is bounded by the chunk size and the size of the largest
+    value read.
+    """
+
+    def __init__(self, chunks):
+        super().__init__(memoryview(b''))
+        self._chunks = iter(chunks)
+
+    def _fill(self, num_bytes) -> bool:
+        """Buffer at least `num_bytes` unread bytes, if the chunks have them."""
+        have = len(self._memview) - self._offset
+        if have >= num_bytes:
+            return True
+        pieces = [self._memview[self._offset:]]
+        while have < num_bytes:
+            chunk = next(self._chunks, None)
+            if chunk is None:
+                break
+            pieces.append(chunk)
+            have += len(chunk)
+        self._memview = memoryview(b''.join(pieces))
+        self._offset = 0
+        return have >= num_bytes
+
+    def _require(self, num_bytes):
+        if not self._fill(num_bytes):
+            raise ValueError('encoding ended before the end of the value')
+
+    def read_int32(self) -> int:
+        self._require(4)
+        return super().read_int32()
+
+    def read_int64(self) -> int:
+        self._require(8)
+        return super().read_int64()
+
+    def read_bool(self) -> bool:
+        self._require(1)
+        return super().read_bool()
+
+    def read_float32(self) -> float:
+        self._require(4)
+        return super().read_float32()
+
+    def read_float64(self) -> float:
+        self._require(8)
+        return super().read_float64()
+
+    def read_bytes_view(self, num_bytes):
+        self._require(num_bytes)
+        return super().read_bytes_view(num_bytes)
+
+    def read_numpy(self, dtype, count) -> np.ndarray:
+        self._require(np.dtype(dtype).itemsize * count)
+        return super().read_numpy(dtype, count)
+
+    def peek_numpy(self, dtype, max_count) -> np.ndarray:
+        self._fill(np.dtype(dtype).itemsize * max_count)
+        return super().peek_numpy(dtype, max_count)
+
+    def skip(self, num_bytes):
+        self._require(num_bytes)
+        super().skip(num_bytes)
+
+    def read_missing_bits(self, n):
+        self._require((n + 7) >> 3)
+        return super().read_missing_bits(n)
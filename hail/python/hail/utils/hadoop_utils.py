@@ -1,7 +1,7 @@
-from typing import Dict, List
+from typing import Dict, List, Union
 from hail.fs.hadoop_fs import HadoopFS
 from hail.utils.java import Env
-from hail.typecheck import typecheck, enumeration
+from hail.typecheck import typecheck, enumeration, oneof, sequenceof
 
 
 @typecheck(path=str,
@@ -84,8 +84,8 @@ def hadoop_open(path: str, mode: str = 'r', buffer_size: int = 8192):
     return fs.open(path, mode, buffer_size)
 
 
-@typecheck(src=str,
-           dest=str)
+@typecheck(src=oneof(str, sequenceof(str)),
+           dest=oneof(str, sequenceof(str)))
 def hadoop_copy(src, dest):
     """Copy a file through the Hadoop filesystem API.
     Supports distributed file systems like hdfs, gs, and s3.
@@ -97,6 +97,11 @@ def hadoop_copy(src, dest):
     >>> hadoop_copy('gs://hail-common/LCR.interval_list',
     ...             'file:///mnt/data/LCR.interval_list') # doctest: +SKIP
 
+    Copy many files at once:
+
+    >>> hadoop_copy(['gs://my-bucket/a.tsv', 'gs://my-bucket/b.tsv'],
+    ...             ['file:///mnt/data/a.tsv', 'file:///mnt/data/b.tsv']) # doctest: +SKIP
+
     Notes
     ----
 
@@ -109,14 +114,22 @@ def hadoop_copy(src, dest):
     The provided source and destination file paths must be URIs
     (uniform resource identifiers).
 
+    If `src` and `dest` are lists of the same length, each file in `src` is
+    copied to the corresponding path in `dest`. Where the file system
+    supports it, the files are copied concurrently.
+
     Parameters
     ----------
-    src: :class:`str`
-        Source file URI.
-    dest: :class:`str`
-        Destination file URI.
+    src: :class:`str` or :obj:`list` of :class:`str`
+        Source file URI, or URIs.
+    dest: :class:`str` or :obj:`list` of :class:`str`
+        Destination file URI, or URIs.
     """
-    return Env.fs().copy(src, dest)
+    if isinstance(src, str) and isinstance(dest, str):
+        return Env.fs().copy(src, dest)
+    if isinstance(src, str) or isinstance(dest, str) or len(src) != len(dest):
+        raise ValueError('hadoop_copy: src and dest must both be strings, or lists of the same length')
+    return Env.fs().copy_many(list(src), list(dest))
 
 
 def hadoop_exists(path: str) -> bool:
@@ -161,7 +174,8 @@ def hadoop_is_dir(path: str) -> bool:
     return Env.fs().is_dir(path)
 
 
-def hadoop_stat(path: str) -> Dict:
+@typecheck(path=oneof(str, sequenceof(str)))
+def hadoop_stat(path: Union[str, List[str]]) -> Union[Dict, List[Dict]]:
     """Returns information about the file or directory at a given path.
 
     Notes
@@ -177,18 +191,25 @@ def hadoop_stat(path: str) -> Dict:
     - owner (:class:`str`) -- Owner.
     - path (:class:`str`) -- Path.
 
+    If `path` is a list of paths, returns a list with a dictionary for each
+    path. Where the file system supports it, the paths are stat-ed
+    concurrently.
+
     Parameters
     ----------
-    path : :class:`str`
+    path : :class:`str` or :obj:`list` of :class:`str`
 
     Returns
     -------
-    :obj:`dict`
+    :obj:`dict` or :obj:`list` [:obj:`dict`]
     """
-    return Env.fs().stat(path)
+    if isinstance(path, str):
+        return Env.fs().stat(path)
+    return Env.fs().stat_many(list(path))
 
 
-def hadoop_ls(path: str) -> List[Dict]:
+@typecheck(path=str, recursive=bool)
+def hadoop_ls(path: str, recursive: bool = False) -> List[Dict]:
     """Returns information about files at `path`.
 
     Notes
@@ -196,8 +217,11 @@ def hadoop_ls(path: str) -> List[Dict]:
     Raises an error if `path` does not exist.
 
     If `path` is a file, returns a list with one element. If `path` is a
-    directory, returns an element for each file contained in `path` (does not
-    search recursively).
+    directory, returns an element for each file contained in `path`. If
+    `recursive` is true, returns an element for each file under `path` at
+    any depth, and none for directories. Where the file system supports
+    it, the listing is done with one request per page of files rather than
+    one per directory.
 
     Each dict element of the result list contains the following data:
 
@@ -211,11 +235,15 @@ def hadoop_ls(path: str) -> List[Dict]:
     Parameters
     ----------
     path : :class:`str`
+    recursive : :obj:`bool`
+        List the files in subdirectories too.
 
     Returns
     -------
     :obj:`list` [:obj:`dict`]
     """
+    if recursive:
+        return Env.fs().ls_recursive(path)
     return Env.fs().ls(path)
 
 
@@ -47,6 +47,13 @@ class Struct(Mapping):
         # Set this way to avoid an infinite recursion in `__getattr__`.
         self.__dict__["_fields"] = kwargs
 
+    @staticmethod
+    def _from_dict(fields):
+        # Takes ownership of `fields`, avoiding the copy made by keyword arguments.
+        s = Struct.__new__(Struct)
+        s.__dict__["_fields"] = fields
+        return s
+
     def __contains__(self, item):
         return item in self._fields
 
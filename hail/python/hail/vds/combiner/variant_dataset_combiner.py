@@ -1,4 +1,5 @@
 import collections
+import concurrent.futures
 import hashlib
 import itertools
 import json
@@ -7,7 +8,7 @@ import sys
 import uuid
 
 from math import floor, log
-from typing import Collection, Dict, List, Optional, Union
+from typing import Collection, Deque, Dict, List, Optional, Tuple, Union
 
 import hail as hl
 
@@ -192,7 +193,17 @@ class VariantDatasetCombiner:  # pylint: disable=too-many-instance-attributes
             print()
             raise e
 
-    def run(self):
+    def run(self, *, concurrent_writes: Optional[int] = None):
+        """Run the combiner to completion, saving the plan before each step.
+
+        With `concurrent_writes`, GVCFs are combined as a stream: each step's
+        worth of GVCFs is split into `concurrent_writes` writes, which run as
+        concurrent queries while the next GVCFs are imported and transformed.
+        The plan is saved as each write finishes, so a resumed combiner only
+        redoes the writes that were in flight.
+        """
+        if concurrent_writes is not None and concurrent_writes < 1:
+            raise ValueError(f"'concurrent_writes' must be at least 1, found {concurrent_writes}")
         flagname = 'no_ir_logging'
         prev_flag_value = hl._get_flags(flagname).get(flagname)
         hl._set_flags(**{flagname: '1'})
@@ -203,6 +214,10 @@ class VariantDatasetCombiner:  # pylint: disable=too-many-instance-attributes
              f'    GVCF arguments: {len(self.gvcfs)} inputs/samples\n'
              f'    Branch factor: {self.branch_factor}\n'
              f'    GVCF merge batch size: {self.gvcf_batch_size}')
+        # a single merged dataset is written straight to the output by step
+        if concurrent_writes is not None and (self.vdses or len(self.gvcfs) > self.branch_factor):
+            self.save()
+            self._stream_gvcfs(concurrent_writes)
         while not self.finished:
             self.save()
             self.step()
@@ -324,6 +339,81 @@ class VariantDatasetCombiner:  # pylint: disable=too-many-instance-attributes
             self.gvcf_sample_names = self.gvcf_sample_names[self.gvcf_batch_size * step:]
         else:
             sample_names = None
+        merge_vds, merge_metadata = self._import_gvcfs(files_to_merge, sample_names)
+        if self.finished and len(merge_vds) == 1:
+            merge_vds[0].write(self.output_path)
+            return
+
+        paths = [md.path for md in merge_metadata]
+        hl.vds.write_variant_datasets(merge_vds, paths, overwrite=True, codec_spec=FAST_CODEC_SPEC)
+        for md in merge_metadata:
+            self.vdses[max(1, floor(log(md.n_samples, self.branch_factor)))].append(md)
+
+    def _stream_gvcfs(self, concurrent_writes: int):
+        step = self.branch_factor
+        n_gvcfs_per_write = max(1, -(-self.gvcf_batch_size // concurrent_writes)) * step
+        # write index -> (GVCFs, sample names) of the writes not yet finished,
+        # which are the GVCFs left in the saved plan
+        unwritten = collections.OrderedDict()
+        for i, start in enumerate(range(0, len(self.gvcfs), n_gvcfs_per_write)):
+            names = None if self.gvcf_sample_names is None \
+                else self.gvcf_sample_names[start:start + n_gvcfs_per_write]
+            unwritten[i] = (self.gvcfs[start:start + n_gvcfs_per_write], names)
+        # submitted writes, in write index order, as (write index, future,
+        # metadata of the datasets written); a write is committed only once
+        # every earlier write is, so the datasets, and so the samples, are
+        # merged in the same order as in a serial run
+        writes: Deque[Tuple[int, concurrent.futures.Future, List[VDSMetadata]]] = collections.deque()
+
+        def commit_next():
+            i, fut, merge_metadata = writes[0]
+            fut.result()
+            writes.popleft()
+            del unwritten[i]
+            self.gvcfs = [path for paths, _ in unwritten.values() for path in paths]
+            if self.gvcf_sample_names is not None:
+                self.gvcf_sample_names = [name for _, names in unwritten.values() for name in names]
+            for md in merge_metadata:
+                self.vdses[max(1, floor(log(md.n_samples, self.branch_factor)))].append(md)
+            self.save()
+
+        def commit_finished():
+            while writes and writes[0][1].done():
+                commit_next()
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=concurrent_writes) as pool:
+            try:
+                for i, (files_to_merge, sample_names) in list(unwritten.items()):
+                    info(f'GVCF combine (job {self._job_id}): merging {len(files_to_merge)} GVCFs into '
+                         f'{(len(files_to_merge) + step - 1) // step} datasets')
+                    # imported while the previous writes run
+                    merge_vds, merge_metadata = self._import_gvcfs(files_to_merge, sample_names)
+                    self._job_id += 1
+                    commit_finished()
+                    running = [fut for _, fut, _ in writes if not fut.done()]
+                    while len(running) >= concurrent_writes:
+                        concurrent.futures.wait(running, return_when=concurrent.futures.FIRST_COMPLETED)
+                        commit_finished()
+                        running = [fut for _, fut, _ in writes if not fut.done()]
+                    fut = pool.submit(hl.vds.write_variant_datasets, merge_vds, [md.path for md in merge_metadata],
+                                      overwrite=True, codec_spec=FAST_CODEC_SPEC)
+                    writes.append((i, fut, merge_metadata))
+                while writes:
+                    concurrent.futures.wait([writes[0][1]])
+                    commit_next()
+            except BaseException:
+                # keep the writes that finish before the first one that fails,
+                # so that they are not redone
+                concurrent.futures.wait([fut for _, fut, _ in writes])
+                try:
+                    while writes:
+                        commit_next()
+                except Exception:  # pylint: disable=broad-except
+                    pass
+                raise
+
+    def _import_gvcfs(self, files_to_merge: List[str], sample_names: Optional[List[str]]):
+        step = self.branch_factor
         merge_vds = []
         merge_n_samples = []
         vcfs = [transform_gvcf(vcf,
@@ -340,19 +430,13 @@ class VariantDatasetCombiner:  # pylint: disable=too-many-instance-attributes
             merging, vcfs = vcfs[:step], vcfs[step:]
             merge_vds.append(combine_variant_datasets(merging))
             merge_n_samples.append(len(merging))
-        if self.finished and len(merge_vds) == 1:
-            merge_vds[0].write(self.output_path)
-            return
 
         temp_path = self._temp_out_path(f'gvcf-combine_job{self._job_id}/dataset_')
         pad = len(str(len(merge_vds) - 1))
         merge_metadata = [VDSMetadata(path=temp_path + str(count).rjust(pad, '0') + '.vds',
                                       n_samples=n_samples)
                           for count, n_samples in enumerate(merge_n_samples)]
-        paths = [md.path for md in merge_metadata]
-        hl.vds.write_variant_datasets(merge_vds, paths, overwrite=True, codec_spec=FAST_CODEC_SPEC)
-        for md in merge_metadata:
-            self.vdses[max(1, floor(log(md.n_samples, self.branch_factor)))].append(md)
+        return merge_vds, merge_metadata
 
     def _temp_out_path(self, extra):
         return os.path.join(self.temp_path, 'combiner-intermediates', f'{self._uuid}_{extra}')
@@ -533,6 +533,13 @@ class GoogleStorageAsyncFS(AsyncFS):
         return await self._storage_client.get_object(
             bucket, name, headers={'Range': f'bytes={start}-'})
 
+    async def read_range(self, url: str, start: int, end: int) -> bytes:
+        # a bounded range, so the connection is not left with unread bytes
+        bucket, name = self._get_bucket_name(url)
+        async with await self._storage_client.get_object(
+                bucket, name, headers={'Range': f'bytes={start}-{end}'}) as f:
+            return await f.readexactly(end - start + 1)
+
     async def create(self, url: str, *, retry_writes: bool = True) -> WritableStream:
         bucket, name = self._get_bucket_name(url)
         params = {
@@ -1,14 +1,16 @@
 from .fs import (FileStatus, FileListEntry, AsyncFS, Transfer, MultiPartCreate,
                  FileAndDirectoryError, UnexpectedEOFError, Copier, ReadableStream,
-                 WritableStream, blocking_readable_stream_to_async, blocking_writable_stream_to_async)
+                 ReadAheadStream, WritableStream, blocking_readable_stream_to_async, blocking_writable_stream_to_async)
 from .local_fs import LocalAsyncFS
 from .router_fs import RouterAsyncFS
+from .staging_cache import StagingCache
 from .utils import FeedableAsyncIterable, WriteBuffer
 from .tasks import BackgroundTaskManager
 from .weighted_semaphore import WeightedSemaphore
 
 __all__ = [
     'ReadableStream',
+    'ReadAheadStream',
     'WritableStream',
     'blocking_readable_stream_to_async',
     'blocking_writable_stream_to_async',
@@ -17,6 +19,7 @@ __all__ = [
     'AsyncFS',
     'LocalAsyncFS',
     'RouterAsyncFS',
+    'StagingCache',
     'FeedableAsyncIterable',
     'BackgroundTaskManager',
     'Transfer',
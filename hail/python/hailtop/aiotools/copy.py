@@ -1,11 +1,11 @@
 from typing import List, Optional
 import json
-import urllib
+import urllib.parse
 import asyncio
 import logging
 import argparse
 from concurrent.futures import ThreadPoolExecutor
-from hailtop.aiotools import RouterAsyncFS, Transfer, Copier
+from hailtop.aiotools import RouterAsyncFS, Transfer, Copier, StagingCache
 from hailtop.utils import tqdm
 
 
@@ -41,7 +41,9 @@ async def copy(*,
                gcs_kwargs: Optional[dict] = None,
                azure_kwargs: Optional[dict] = None,
                s3_kwargs: Optional[dict] = None,
-               transfers: List[Transfer]
+               transfers: List[Transfer],
+               cache_dir: Optional[str] = None,
+               cache_max_bytes: int = 0
                ) -> None:
 
     schemes = referenced_schemes(transfers)
@@ -63,6 +65,11 @@ async def copy(*,
                                  gcs_kwargs=gcs_kwargs,
                                  azure_kwargs=azure_kwargs,
                                  s3_kwargs=s3_kwargs) as fs:
+            if cache_dir is not None:
+                transfers = await stage_through_cache(StagingCache(fs, cache_dir, cache_max_bytes), transfers)
+                if not transfers:
+                    return
+
             sema = asyncio.Semaphore(50)
             async with sema:
                 with tqdm(desc='files', leave=False, position=0, unit='file') as file_pbar, \
@@ -76,12 +83,40 @@ async def copy(*,
                 copy_report.summarize()
 
 
+async def stage_through_cache(cache: StagingCache, transfers: List[Transfer]) -> List[Transfer]:
+    """Stage the single file transfers to local destinations through `cache`
+    and return the transfers left to copy."""
+    def is_cacheable(transfer):
+        return (isinstance(transfer.src, str)
+                and not transfer.src.endswith('/')
+                and transfer.treat_dest_as == Transfer.DEST_IS_TARGET
+                and urllib.parse.urlparse(transfer.dest).scheme in ('', 'file'))
+
+    async def stage(transfer):
+        try:
+            return await cache.stage(transfer.src, urllib.parse.urlparse(transfer.dest).path)
+        except Exception:  # pylint: disable=broad-except
+            logging.getLogger('copy').info(f'could not stage {transfer.src} through the cache', exc_info=True)
+            return None
+
+    cacheable = [transfer for transfer in transfers if is_cacheable(transfer)]
+    staged = await asyncio.gather(*[stage(transfer) for transfer in cacheable])
+    cache.evict()
+    print(cache.summary())
+    staged_transfers = {id(transfer) for transfer, hit in zip(cacheable, staged) if hit is not None}
+    return [transfer for transfer in transfers if id(transfer) not in staged_transfers]
+
+
 async def main() -> None:
     parser = argparse.ArgumentParser(description='Hail copy tool')
     parser.add_argument('requester_pays_project', type=str,
                         help='a JSON string indicating the Google project to which to charge egress costs')
     parser.add_argument('files', type=str,
                         help='a JSON array of JSON objects indicating from where and to where to copy files')
+    parser.add_argument('--cache-dir', type=str, default=None,
+                        help='a local directory in which to cache copied files between runs')
+    parser.add_argument('--cache-max-bytes', type=int, default=0,
+                        help='the size above which least recently used files are evicted from the cache')
     parser.add_argument('-v', '--verbose', action='store_const',
                         const=True, default=False,
                         help='show logging information')
@@ -96,7 +131,9 @@ async def main() -> None:
 
     await copy(
         gcs_kwargs=gcs_kwargs,
-        transfers=[Transfer(f['from'], f['to'], treat_dest_as=Transfer.DEST_IS_TARGET) for f in files]
+        transfers=[Transfer(f['from'], f['to'], treat_dest_as=Transfer.DEST_IS_TARGET) for f in files],
+        cache_dir=args.cache_dir,
+        cache_max_bytes=args.cache_max_bytes
     )
 
 
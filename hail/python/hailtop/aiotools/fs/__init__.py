@@ -1,7 +1,7 @@
 from .fs import AsyncFS, MultiPartCreate, FileListEntry, FileStatus
 from .copier import Copier, CopyReport, SourceCopier, SourceReport, Transfer, TransferReport
 from .exceptions import UnexpectedEOFError, FileAndDirectoryError
-from .stream import ReadableStream, WritableStream, blocking_readable_stream_to_async, blocking_writable_stream_to_async
+from .stream import ReadableStream, ReadAheadStream, WritableStream, blocking_readable_stream_to_async, blocking_writable_stream_to_async
 
 __all__ = [
     'AsyncFS',
@@ -12,6 +12,7 @@ __all__ = [
     'Transfer',
     'TransferReport',
     'ReadableStream',
+    'ReadAheadStream',
     'WritableStream',
     'blocking_readable_stream_to_async',
     'blocking_writable_stream_to_async',
@@ -3,7 +3,7 @@ from types import TracebackType
 import abc
 import asyncio
 from hailtop.utils import retry_transient_errors, OnlineBoundedGather2
-from .stream import ReadableStream, WritableStream
+from .stream import ReadableStream, ReadAheadStream, WritableStream
 from .exceptions import FileAndDirectoryError
 
 
@@ -184,6 +184,25 @@ class AsyncFS(abc.ABC):
         async with await self.open_from(url, start) as f:
             return await f.readexactly(n)
 
+    async def open_read_ahead(self,
+                              url: str,
+                              start: int = 0,
+                              *,
+                              block_size: int = 8 * 1024 * 1024,
+                              window: int = 8,
+                              max_cached_blocks: int = 8) -> ReadAheadStream:
+        '''Open `url` for random access, with `window` concurrent ranged reads
+        of `block_size` bytes ahead of the position.  See
+        :class:`.ReadAheadStream`.'''
+        size = await (await self.statfile(url)).size()
+        return ReadAheadStream(
+            lambda start, end: retry_transient_errors(self.read_range, url, start, end),
+            size,
+            start,
+            block_size=block_size,
+            window=window,
+            max_cached_blocks=max_cached_blocks)
+
     async def write(self, url: str, data: bytes) -> None:
         async def _write() -> None:
             async with await self.create(url, retry_writes=False) as f:
@@ -1,6 +1,8 @@
-from typing import BinaryIO, List, Optional, Tuple, Type
+from typing import Awaitable, BinaryIO, Callable, List, Optional, Tuple, Type
 from types import TracebackType
 import abc
+import asyncio
+import collections
 import io
 import os
 from concurrent.futures import ThreadPoolExecutor
@@ -54,6 +56,113 @@ class ReadableStream(abc.ABC):
         await self.wait_closed()
 
 
+class ReadAheadStream(ReadableStream):
+    """A seekable stream over `size` bytes read in blocks of `block_size` bytes
+    by `read_range(start, end)`, which returns the bytes from `start` to `end`
+    inclusive.
+
+    Reading at a position fetches its block and the `window - 1` blocks after
+    it concurrently, so a sequential reader keeps `window` ranged reads in
+    flight. Up to `max_cached_blocks` further blocks are kept, least recently
+    used evicted first, so reading again or seeking back over them costs no
+    requests.
+    """
+
+    def __init__(self,
+                 read_range: Callable[[int, int], Awaitable[bytes]],
+                 size: int,
+                 start: int = 0,
+                 *,
+                 block_size: int = 8 * 1024 * 1024,
+                 window: int = 8,
+                 max_cached_blocks: int = 8):
+        super().__init__()
+        assert block_size > 0 and window > 0 and max_cached_blocks >= 0
+        self._read_range = read_range
+        self._size = size
+        self._pos = start
+        self._block_size = block_size
+        self._window = window
+        self._max_cached_blocks = max_cached_blocks
+        self._n_blocks = (size + block_size - 1) // block_size
+        # block index -> read of the block, least recently used first
+        self._blocks: 'collections.OrderedDict[int, asyncio.Future]' = collections.OrderedDict()
+
+    @property
+    def size(self) -> int:
+        return self._size
+
+    def tell(self) -> int:
+        return self._pos
+
+    def seek(self, offset: int, whence: int = os.SEEK_SET) -> int:
+        if whence == os.SEEK_SET:
+            pos = offset
+        elif whence == os.SEEK_CUR:
+            pos = self._pos + offset
+        elif whence == os.SEEK_END:
+            pos = self._size + offset
+        else:
+            raise ValueError(f'invalid whence: {whence}')
+        if pos < 0:
+            raise ValueError(f'negative seek position {pos}')
+        self._pos = pos
+        return pos
+
+    def _block(self, i: int) -> asyncio.Future:
+        fut = self._blocks.get(i)
+        if fut is None:
+            start = i * self._block_size
+            end = min(start + self._block_size, self._size) - 1
+            fut = asyncio.ensure_future(self._read_range(start, end))
+            self._blocks[i] = fut
+        else:
+            self._blocks.move_to_end(i)
+        return fut
+
+    def _read_ahead(self, i: int) -> asyncio.Future:
+        window = range(i, min(i + self._window, self._n_blocks))
+        for j in reversed(window):
+            self._block(j)
+        # the block at the position is now the most recently used
+        n_evictable = len(self._blocks) - len(window) - self._max_cached_blocks
+        for j in list(self._blocks):
+            if n_evictable <= 0:
+                break
+            if j not in window:
+                self._blocks.pop(j).cancel()
+                n_evictable -= 1
+        return self._blocks[i]
+
+    async def read(self, n: int = -1) -> bytes:
+        assert not self._closed
+        if n == -1:
+            n = self._size - self._pos
+        n = min(n, self._size - self._pos)
+        chunks = []
+        while n > 0:
+            i, offset = divmod(self._pos, self._block_size)
+            block = await asyncio.shield(self._read_ahead(i))
+            chunk = block[offset:offset + n]
+            chunks.append(chunk)
+            self._pos += len(chunk)
+            n -= len(chunk)
+        return b''.join(chunks)
+
+    async def readexactly(self, n: int) -> bytes:
+        assert not self._closed and n >= 0
+        if self._size - self._pos < n:
+            raise UnexpectedEOFError()
+        return await self.read(n)
+
+    async def _wait_closed(self) -> None:
+        futs = list(self._blocks.values())
+        self._blocks.clear()
+        for fut in futs:
+            fut.cancel()
+        await asyncio.gather(*futs, return_exceptions=True)
+
+
 class WritableStream(abc.ABC):
     def __init__(self):
         self._closed = False
@@ -79,6 +79,10 @@ class RouterAsyncFS(AsyncFS):
         fs = self._get_fs(url)
         return await fs.open_from(url, start)
 
+    async def read_range(self, url: str, start: int, end: int) -> bytes:
+        fs = self._get_fs(url)
+        return await fs.read_range(url, start, end)
+
     async def create(self, url: str, retry_writes: bool = True) -> AsyncContextManager[WritableStream]:
         fs = self._get_fs(url)
         return await fs.create(url, retry_writes=retry_writes)
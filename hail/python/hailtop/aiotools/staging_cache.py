@@ -0,0 +1,171 @@
+from typing import Dict, Optional
+import asyncio
+import hashlib
+import logging
+import os
+import secrets
+import shutil
+import stat
+import urllib.parse
+
+from .fs import AsyncFS, Copier, Transfer
+
+log = logging.getLogger('staging_cache')
+
+
+def _local_path(url: str) -> Optional[str]:
+    parsed = urllib.parse.urlparse(url)
+    if parsed.scheme == '':
+        return os.path.realpath(os.path.expanduser(url))
+    if parsed.scheme == 'file':
+        return parsed.path
+    return None
+
+
+def evict_least_recently_used(cache_dir: str, max_bytes: int) -> int:
+    """Remove the least recently used files under `cache_dir` until the files
+    left total at most `max_bytes`. Returns the number of bytes removed.
+
+    A file's modification time is its last use.
+    """
+    entries = []
+    for dirpath, _, filenames in os.walk(cache_dir):
+        for filename in filenames:
+            path = os.path.join(dirpath, filename)
+            try:
+                st = os.stat(path)
+            except FileNotFoundError:
+                continue
+            entries.append((st.st_mtime_ns, st.st_size, path))
+
+    excess = sum(size for _, size, _ in entries) - max_bytes
+    n_bytes_removed = 0
+    for _, size, path in sorted(entries):
+        if excess <= 0:
+            break
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            continue
+        excess -= size
+        n_bytes_removed += size
+    return n_bytes_removed
+
+
+class StagingCache:
+    """A local cache of input files, keyed by URL and version.
+
+    The version of a local file is its modification time and size, and the
+    version of an object in cloud storage is its etag. Staging a file copies
+    the cached file to the destination, so a file read by many jobs is
+    transferred once, and a job changing its input does not change the
+    cached file.
+
+    Files are evicted least recently used first once the cache exceeds
+    `max_bytes`. Evicting a file does not affect destinations staged from it.
+    """
+
+    def __init__(self, fs: AsyncFS, cache_dir: str, max_bytes: int):
+        self.fs = fs
+        self.cache_dir = cache_dir.rstrip('/')
+        self.max_bytes = max_bytes
+        self.n_hits = 0
+        self.n_misses = 0
+        self.n_bytes_hit = 0
+        self._locks: Dict[str, asyncio.Lock] = {}
+        self._sema = asyncio.Semaphore(10)
+
+    async def key(self, url: str) -> Optional[str]:
+        """The cache key of the file at `url`, or ``None`` if it cannot be
+        cached because it is a directory or its version is unknown."""
+        path = _local_path(url)
+        if path is not None:
+            try:
+                st = os.stat(path)
+            except FileNotFoundError:
+                return None
+            if not stat.S_ISREG(st.st_mode):
+                return None
+            version = f'{st.st_mtime_ns}:{st.st_size}'
+            url = path
+        else:
+            try:
+                status = await self.fs.statfile(url)
+            except FileNotFoundError:
+                return None
+            version = None
+            for name in ('etag', 'ETag'):
+                try:
+                    version = await status[name]
+                    break
+                except KeyError:
+                    pass
+            if version is None:
+                return None
+        return hashlib.sha256(f'{url}\0{version}'.encode()).hexdigest()
+
+    def path(self, key: str) -> str:
+        return f'{self.cache_dir}/{key[:2]}/{key}'
+
+    async def stage(self, url: str, dest: str) -> Optional[bool]:
+        """Put the file at `url` at the local path `dest` through the cache.
+
+        Returns whether the file was already cached, or ``None`` if it cannot
+        be cached, in which case nothing is staged.
+        """
+        key = await self.key(url)
+        if key is None:
+            return None
+        path = self.path(key)
+
+        lock = self._locks.setdefault(key, asyncio.Lock())
+        async with lock:
+            try:
+                os.utime(path)
+                hit = True
+            except FileNotFoundError:
+                hit = False
+            if not hit:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                tmp_path = f'{path}.{secrets.token_hex(8)}.tmp'
+                try:
+                    await Copier.copy(self.fs, self._sema, Transfer(url, tmp_path, treat_dest_as=Transfer.DEST_IS_TARGET))
+                    os.chmod(tmp_path, 0o444)
+                    os.replace(tmp_path, path)
+                finally:
+                    if os.path.exists(tmp_path):
+                        os.remove(tmp_path)
+            await asyncio.get_event_loop().run_in_executor(None, self._copy, path, dest)
+            size = os.stat(dest).st_size
+
+        if hit:
+            self.n_hits += 1
+            self.n_bytes_hit += size
+        else:
+            self.n_misses += 1
+        return hit
+
+    @staticmethod
+    def _copy(path: str, dest: str):
+        os.makedirs(os.path.dirname(dest), exist_ok=True)
+        if os.path.lexists(dest):
+            os.remove(dest)
+        # not a hard link: jobs run as root, so the cached file's mode would
+        # not stop a job changing it for every later job
+        shutil.copyfile(path, dest)
+
+    def evict(self) -> int:
+        n_bytes_removed = evict_least_recently_used(self.cache_dir, self.max_bytes)
+        if n_bytes_removed:
+            log.info(f'evicted {n_bytes_removed} bytes from the staging cache {self.cache_dir}')
+        return n_bytes_removed
+
+    def hit_rate(self) -> Optional[float]:
+        n = self.n_hits + self.n_misses
+        return self.n_hits / n if n else None
+
+    def summary(self) -> str:
+        n = self.n_hits + self.n_misses
+        hit_rate = self.n_hits / n if n else 0
+        return (f'Input cache: {self.n_hits} of {n} input files were cached ({hit_rate:.0%}), '
+                f'{self.n_bytes_hit} bytes not transferred.')
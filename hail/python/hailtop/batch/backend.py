@@ -1,6 +1,10 @@
-from typing import Optional, Dict, Any, TypeVar, Generic
+from typing import Optional, Dict, Any, TypeVar, Generic, List, Set, Tuple, Deque
 import sys
 import abc
+import asyncio
+import codecs
+import collections
+import concurrent.futures
 import os
 import subprocess as sp
 import uuid
@@ -14,10 +18,10 @@ import warnings
 from hailtop.config import get_deploy_config, get_user_config
 from hailtop.utils import is_google_registry_domain, parse_docker_image_reference, async_to_blocking, bounded_gather, tqdm
 from hailtop.batch.hail_genetics_images import HAIL_GENETICS_IMAGES
-from hailtop.batch_client.parse import parse_cpu_in_mcpu
+from hailtop.batch_client.parse import parse_cpu_in_mcpu, parse_memory_in_bytes, parse_storage_in_bytes
 import hailtop.batch_client.client as bc
 from hailtop.batch_client.client import BatchClient
-from hailtop.aiotools import RouterAsyncFS, AsyncFS
+from hailtop.aiotools import RouterAsyncFS, AsyncFS, StagingCache
 
 from . import resource, batch, job as _job  # pylint: disable=unused-import
 from .exceptions import BatchException
@@ -32,6 +36,16 @@ enables the user to monitor the asynchronous execution of a Batch.
 
 SelfType = TypeVar('SelfType')
 
+MEMORY_RATIOS = {'lowmem': 1024**3, 'standard': 4 * 1024**3, 'highmem': 7 * 1024**3}
+
+
+def _physical_memory_in_bytes() -> int:
+    try:
+        return os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_PHYS_PAGES')
+    except (AttributeError, ValueError, OSError):
+        # memory requests are not limited where the memory cannot be determined
+        return sys.maxsize
+
 
 class Backend(abc.ABC, Generic[RunningBatchType]):
     """
@@ -104,14 +118,56 @@ class LocalBackend(Backend[None]):
         Additional flags to pass to `docker run`. Only used if a job specifies
         a docker image. This option will override the value set by the environment
         variable `HAIL_BATCH_EXTRA_DOCKER_RUN_FLAGS`.
+    cores:
+        Number of cores available to jobs. Jobs whose dependencies have completed
+        run concurrently as long as their total `cpu` requests fit. Jobs that do
+        not request `cpu` use one core. Defaults to the number of cores of this
+        computer.
+    memory:
+        Memory available to jobs, for example ``'64Gi'``. Jobs whose dependencies
+        have completed run concurrently as long as their total `memory` requests fit.
+        Defaults to the memory of this computer.
+    input_cache_dir:
+        Directory in which to cache input files between batches. Defaults to
+        the ``batch/input_cache`` folder of `tmp_dir`.
+    input_cache_size:
+        Size of the input cache, for example ``'100Gi'``. If set, input files
+        from cloud storage are copied into the cache once and copied from it
+        into each batch, and least recently used input files are evicted once
+        the cache is larger. By default, input files are not cached.
     """
 
     def __init__(self,
                  tmp_dir: str = '/tmp/',
                  gsa_key_file: Optional[str] = None,
-                 extra_docker_run_flags: Optional[str] = None):
+                 extra_docker_run_flags: Optional[str] = None,
+                 cores: Optional[int] = None,
+                 memory: Optional[str] = None,
+                 input_cache_dir: Optional[str] = None,
+                 input_cache_size: Optional[str] = None):
         self._tmp_dir = tmp_dir.rstrip('/')
 
+        if input_cache_dir is None:
+            input_cache_dir = f'{self._tmp_dir}/batch/input_cache'
+        self._input_cache_dir = input_cache_dir
+        self._input_cache_bytes: Optional[int] = None
+        if input_cache_size is not None:
+            self._input_cache_bytes = parse_storage_in_bytes(input_cache_size)
+            if self._input_cache_bytes is None:
+                raise BatchException(f'invalid value for input_cache_size: {input_cache_size}')
+
+        if cores is None:
+            cores = os.cpu_count() or 1
+        self._cores_mcpu = cores * 1000
+
+        if memory is None:
+            self._memory_bytes = _physical_memory_in_bytes()
+        else:
+            memory_bytes = parse_memory_in_bytes(memory)
+            if memory_bytes is None:
+                raise BatchException(f'invalid value for memory: {memory}')
+            self._memory_bytes = memory_bytes
+
         flags = ''
 
         if extra_docker_run_flags is not None:
@@ -180,7 +236,8 @@ class LocalBackend(Backend[None]):
                     print(e.output)
                     raise
 
-        copied_input_resource_files = set()
+        copied_input_resource_files: Set[resource.InputResourceFile] = set()
+        input_cache: Optional[StagingCache] = None
         os.makedirs(tmpdir + '/inputs/', exist_ok=True)
 
         if batch.requester_pays_project:
@@ -250,9 +307,23 @@ class LocalBackend(Backend[None]):
 
             for job in batch._jobs:
                 async_to_blocking(job._compile(tmpdir, tmpdir))
-
                 os.makedirs(f'{tmpdir}/{job._dirname}/', exist_ok=True)
 
+            # inputs are staged before any job runs, as jobs sharing an input may run concurrently
+            if not dry_run and self._input_cache_bytes is not None:
+                input_cache = StagingCache(self._fs, self._input_cache_dir, self._input_cache_bytes)
+                self._stage_cached_inputs(batch, input_cache, tmpdir, copied_input_resource_files)
+
+            copy_inputs = [x for job in batch._jobs for r in job._inputs for x in copy_input(job, r)]
+            if copy_inputs:
+                code = new_code_block()
+                code += ["# Copy input resources"]
+                code += copy_inputs
+                code += ['\n']
+                run_code(code)
+
+            job_code = {}
+            for job in batch._jobs:
                 code = new_code_block()
 
                 code.append(f"# {job._job_id}: {job.name if job.name else ''}")
@@ -262,7 +333,6 @@ class LocalBackend(Backend[None]):
                     user_code = [f'# {line}' for cmd in job._user_code for line in cmd.split('\n')]
                     code.append('\n'.join(user_code))
 
-                code += [x for r in job._inputs for x in copy_input(job, r)]
                 code += [x for r in job._mentioned for x in symlink_input_resource_group(r)]
 
                 env = {**job._env, 'BATCH_TMPDIR': tmpdir}
@@ -280,12 +350,11 @@ class LocalBackend(Backend[None]):
 
                     memory = job._memory
                     if memory is not None:
-                        memory_ratios = {'lowmem': 1024**3, 'standard': 4 * 1024**3, 'highmem': 7 * 1024**3}
-                        if memory in memory_ratios:
+                        if memory in MEMORY_RATIOS:
                             if job._cpu is not None:
                                 mcpu = parse_cpu_in_mcpu(job._cpu)
                                 if mcpu is not None:
-                                    memory = str(int(memory_ratios[memory] * (mcpu / 1000)))
+                                    memory = str(int(MEMORY_RATIOS[memory] * (mcpu / 1000)))
                                 else:
                                     raise BatchException(f'invalid value for cpu: {job._cpu}')
                             else:
@@ -309,13 +378,182 @@ class LocalBackend(Backend[None]):
                 code += [x for r in job._external_outputs for x in copy_external_output(r)]
                 code += ['\n']
 
-                run_code(code)
+                job_code[job] = '\n'.join(code)
+
+            if dry_run:
+                for job in batch._jobs:
+                    print(job_code[job])
+            else:
+                async_to_blocking(self._run_jobs(batch._jobs, job_code, tmpdir))
         finally:
+            if input_cache is not None:
+                input_cache.evict()
             if delete_scratch_on_exit:
                 sp.run(f'rm -rf {tmpdir}', shell=True, check=False)
 
+        if input_cache is not None and input_cache.hit_rate() is not None:
+            print(input_cache.summary())
+
         print('Batch completed successfully!')
 
+    def _stage_cached_inputs(self,
+                             batch: 'batch.Batch',
+                             input_cache: StagingCache,
+                             tmpdir: str,
+                             copied_input_resource_files: Set['resource.InputResourceFile']):
+        """Stage the input files from cloud storage through `input_cache` and
+        add them to `copied_input_resource_files`. Local input files would
+        only be copied twice. Files the cache cannot stage are left to be
+        copied."""
+        if batch.requester_pays_project:
+            return
+
+        async def stage(r):
+            try:
+                return await input_cache.stage(r._input_path, r._get_path(os.path.expanduser(tmpdir)))
+            except Exception:  # pylint: disable=broad-except
+                return None
+
+        inputs = list({r for job in batch._jobs for r in job._inputs
+                       if isinstance(r, resource.InputResourceFile) and r._input_path.startswith('gs://')})
+        staged = async_to_blocking(bounded_gather(*[functools.partial(stage, r) for r in inputs], parallelism=10))
+        for r, hit in zip(inputs, staged):
+            if hit is not None:
+                copied_input_resource_files.add(r)
+
+    def _job_resources(self, job: '_job.Job') -> Tuple[int, int]:
+        mcpu = 1000
+        if job._cpu is not None:
+            parsed_mcpu = parse_cpu_in_mcpu(job._cpu)
+            if parsed_mcpu is None:
+                raise BatchException(f'invalid value for cpu: {job._cpu}')
+            mcpu = parsed_mcpu
+
+        memory_bytes = 0
+        if job._memory is not None:
+            if job._memory in MEMORY_RATIOS:
+                memory_bytes = MEMORY_RATIOS[job._memory] * mcpu // 1000
+            else:
+                memory_bytes = parse_memory_in_bytes(job._memory) or 0
+
+        # a job larger than this computer runs by itself
+        return min(mcpu, self._cores_mcpu), min(memory_bytes, self._memory_bytes)
+
+    async def _run_jobs(self, jobs: List['_job.Job'], job_code: Dict['_job.Job', str], tmpdir: str):
+        """Run `jobs`, given in topological order, each as soon as its
+        dependencies have succeeded and its cores and memory are free. The jobs
+        that depend on a failed job are cancelled, and the first failure is
+        raised once no job is running."""
+        children: Dict['_job.Job', List['_job.Job']] = collections.defaultdict(list)
+        n_pending_parents = {}
+        for job in jobs:
+            n_pending_parents[job] = len(job._dependencies)
+            for parent in job._dependencies:
+                children[parent].append(job)
+
+        resources = {job: self._job_resources(job) for job in jobs}
+        free_mcpu = self._cores_mcpu
+        free_memory_bytes = self._memory_bytes
+
+        ready = [job for job in jobs if n_pending_parents[job] == 0]
+        running: Dict[asyncio.Future, '_job.Job'] = {}
+        cancelled: Set['_job.Job'] = set()
+        errors: List[sp.CalledProcessError] = []
+
+        def cancel_descendants(job):
+            stack = list(children[job])
+            while stack:
+                child = stack.pop()
+                if child not in cancelled:
+                    print(f'Cancelling job {child._job_id} because job {job._job_id} failed.')
+                    cancelled.add(child)
+                    stack.extend(children[child])
+
+        # one thread per running job copies its output
+        output_pool = concurrent.futures.ThreadPoolExecutor(max_workers=max(1, len(jobs)))
+        try:
+            while ready or running:
+                waiting = []
+                for job in ready:
+                    mcpu, memory_bytes = resources[job]
+                    if mcpu <= free_mcpu and memory_bytes <= free_memory_bytes:
+                        free_mcpu -= mcpu
+                        free_memory_bytes -= memory_bytes
+                        running[asyncio.ensure_future(self._run_job(job, job_code[job], tmpdir, output_pool))] = job
+                    else:
+                        waiting.append(job)
+                ready = waiting
+                assert running
+
+                done, _ = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+                newly_ready = []
+                for task in done:
+                    job = running.pop(task)
+                    mcpu, memory_bytes = resources[job]
+                    free_mcpu += mcpu
+                    free_memory_bytes += memory_bytes
+                    try:
+                        task.result()
+                    except sp.CalledProcessError as e:
+                        errors.append(e)
+                        cancel_descendants(job)
+                        continue
+                    for child in children[job]:
+                        n_pending_parents[child] -= 1
+                        if n_pending_parents[child] == 0 and child not in cancelled:
+                            newly_ready.append(child)
+                ready = sorted(ready + newly_ready, key=lambda job: job._job_id)
+        finally:
+            for task in running:
+                task.cancel()
+            if running:
+                await asyncio.wait(running)
+            output_pool.shutdown()
+
+        if errors:
+            raise errors[0]
+
+    async def _run_job(self, job: '_job.Job', code: str, tmpdir: str,
+                       output_pool: concurrent.futures.ThreadPoolExecutor):
+        """Run the code of `job`, writing its output to a log file in its
+        directory and to standard output, each line prefixed with the job."""
+        prefix = f'[{job._job_id}: {job.name}] ' if job.name else f'[{job._job_id}] '
+
+        def copy_output(proc):
+            # output is read on a thread, rather than through an asyncio
+            # subprocess, whose pipes are not reliably connected when
+            # nest_asyncio reenters the event loop
+            decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+            at_line_start = True
+            with proc.stdout, open(f'{tmpdir}/{job._dirname}/log', 'wb') as log:
+                while True:
+                    data = proc.stdout.read1(64 * 1024)
+                    if not data:
+                        break
+                    log.write(data)
+                    lines = []
+                    for line in decoder.decode(data).splitlines(keepends=True):
+                        if at_line_start:
+                            lines.append(prefix)
+                        lines.append(line)
+                        at_line_start = line.endswith('\n')
+                    sys.stdout.write(''.join(lines))
+                    sys.stdout.flush()
+            return proc.wait()
+
+        proc = sp.Popen(code, shell=True, stdout=sp.PIPE, stderr=sp.STDOUT)
+        try:
+            returncode = await asyncio.get_event_loop().run_in_executor(output_pool, copy_output, proc)
+        finally:
+            if proc.poll() is None:
+                proc.kill()
+                proc.wait()
+
+        if returncode != 0:
+            e = sp.CalledProcessError(returncode, code)
+            print(f'{prefix}{e}')
+            raise e
+
     def _get_scratch_dir(self):
         def _get_random_name():
             dir = f'{self._tmp_dir}/batch/{uuid.uuid4().hex[:6]}'
@@ -369,6 +607,9 @@ class ServiceBackend(Backend[bc.Batch]):
 
     """
 
+    # the number of jobs compiled, and their code uploaded, at once
+    COMPILE_PARALLELISM = 150
+
     def __init__(self,
                  *args,
                  billing_project: Optional[str] = None,
@@ -582,15 +823,9 @@ class ServiceBackend(Backend[bc.Batch]):
                         f"You must specify 'image' for Python jobs if you are using a Python version other than 3.6, 3.7, or 3.8 (you are using {version})")
                 job._image = f'hailgenetics/python-dill:{version.major}.{version.minor}-slim'
 
-        with tqdm(total=len(batch._jobs), desc='upload code', disable=disable_progress_bar) as pbar:
-            async def compile_job(job):
-                used_remote_tmpdir = await job._compile(local_tmpdir, batch_remote_tmpdir, dry_run=dry_run)
-                pbar.update(1)
-                return used_remote_tmpdir
-            used_remote_tmpdir_results = await bounded_gather(*[functools.partial(compile_job, j) for j in batch._jobs], parallelism=150)
-            used_remote_tmpdir |= any(used_remote_tmpdir_results)
+        def create_job(job):
+            nonlocal used_remote_tmpdir, n_jobs_submitted
 
-        for job in tqdm(batch._jobs, desc='create job objects', disable=disable_progress_bar):
             inputs = [x for r in job._inputs for x in copy_input(r)]
 
             outputs = [x for r in job._internal_outputs for x in copy_internal_output(r)]
@@ -634,7 +869,7 @@ class ServiceBackend(Backend[bc.Batch]):
 ================================================================================
 '''
                 commands.append(formatted_command)
-                continue
+                return
 
             parents = [job_to_client_job_mapping[j] for j in job._dependencies]
 
@@ -683,31 +918,77 @@ class ServiceBackend(Backend[bc.Batch]):
             jobs_to_command[j] = cmd
 
         if dry_run:
+            with tqdm(total=len(batch._jobs), desc='upload code', disable=disable_progress_bar) as pbar:
+                async def compile_job(job):
+                    await job._compile(local_tmpdir, batch_remote_tmpdir, dry_run=dry_run)
+                    pbar.update(1)
+                await bounded_gather(*[functools.partial(compile_job, j) for j in batch._jobs], parallelism=150)
+
+            for job in tqdm(batch._jobs, desc='create job objects', disable=disable_progress_bar):
+                create_job(job)
+
             print("\n\n".join(commands))
             return None
 
-        if delete_scratch_on_exit and used_remote_tmpdir:
-            parents = list(jobs_to_command.keys())
-            rm_cmd = f'gsutil -m rm -r {batch_remote_tmpdir}'
-            cmd = f'''
+        # the number of jobs is fixed when the batch is created, before any
+        # job is compiled, so whether the remote tmpdir is used must be known
+        # up front
+        used_remote_tmpdir |= any(job._uploads_code() or job._internal_outputs for job in batch._jobs)
+        remove_tmpdir = delete_scratch_on_exit and used_remote_tmpdir
+        n_jobs = n_jobs_submitted + len(batch._jobs) + (1 if remove_tmpdir else 0)
+
+        async def compile_and_create_jobs():
+            nonlocal n_jobs_submitted
+            # jobs are compiled concurrently and created in order, each as soon
+            # as it and every job before it have compiled, so the specs of
+            # compiled jobs are submitted while later jobs are still compiling
+            with tqdm(total=len(batch._jobs), desc='upload code', disable=disable_progress_bar) as pbar:
+                async def compile_job(job):
+                    await job._compile(local_tmpdir, batch_remote_tmpdir, dry_run=dry_run)
+                    pbar.update(1)
+
+                compiling: Deque[Tuple[_job.Job, asyncio.Future]] = collections.deque()
+                try:
+                    for job in batch._jobs:
+                        if len(compiling) == ServiceBackend.COMPILE_PARALLELISM:
+                            compiled_job, task = compiling.popleft()
+                            await task
+                            create_job(compiled_job)
+                        compiling.append((job, asyncio.ensure_future(compile_job(job))))
+                    while compiling:
+                        compiled_job, task = compiling.popleft()
+                        await task
+                        create_job(compiled_job)
+                except:
+                    for _, task in compiling:
+                        task.cancel()
+                    raise
+
+            if remove_tmpdir:
+                parents = list(jobs_to_command.keys())
+                rm_cmd = f'gsutil -m rm -r {batch_remote_tmpdir}'
+                cmd = f'''
 {bash_flags}
 {activate_service_account}
 {rm_cmd}
 '''
-            j = bc_batch.create_job(
-                image='gcr.io/google.com/cloudsdktool/cloud-sdk:310.0.0-alpine',
-                command=['/bin/bash', '-c', cmd],
-                parents=parents,
-                attributes={'name': 'remove_tmpdir'},
-                always_run=True)
-            jobs_to_command[j] = cmd
-            n_jobs_submitted += 1
+                j = bc_batch.create_job(
+                    image='gcr.io/google.com/cloudsdktool/cloud-sdk:310.0.0-alpine',
+                    command=['/bin/bash', '-c', cmd],
+                    parents=parents,
+                    attributes={'name': 'remove_tmpdir'},
+                    always_run=True)
+                jobs_to_command[j] = cmd
+                n_jobs_submitted += 1
 
-        if verbose:
-            print(f'Built DAG with {n_jobs_submitted} jobs in {round(time.time() - build_dag_start, 3)} seconds.')
+            if verbose:
+                print(f'Built DAG with {n_jobs} jobs in {round(time.time() - build_dag_start, 3)} seconds.')
 
         submit_batch_start = time.time()
-        batch_handle = bc_batch.submit(disable_progress_bar=disable_progress_bar)
+        async_batch = await bc_batch._async_builder.submit(disable_progress_bar=disable_progress_bar,
+                                                           n_jobs=n_jobs,
+                                                           create_jobs=compile_and_create_jobs)
+        batch_handle = bc.Batch.from_async_batch(async_batch)
 
         jobs_to_command = {j.id: cmd for j, cmd in jobs_to_command.items()}
 
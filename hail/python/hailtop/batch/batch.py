@@ -1,7 +1,8 @@
+import asyncio
 import os
 import warnings
 import re
-from typing import Optional, Dict, Union, List, Any, Set
+from typing import Optional, Dict, Union, List, Any, Set, Tuple
 
 from hailtop.utils import secret_alnum_string
 from hailtop.aiotools import AsyncFS, RouterAsyncFS
@@ -116,6 +117,12 @@ class Batch:
         self._resource_map: Dict[str, _resource.Resource] = {}
         self._allocated_files: Set[str] = set()
         self._input_resources: Set[_resource.InputResourceFile] = set()
+        # url -> (input resource, upload) of the pickled functions and
+        # arguments of Python jobs
+        self._python_blobs: Dict[str, Tuple[_resource.InputResourceFile, Optional[asyncio.Future]]] = {}
+        # (id, out of band) -> (object, digest, chunks) of the pickled
+        # functions and arguments of Python jobs
+        self._python_serializations: Dict[Tuple[int, bool], Tuple[Any, str, List[Any]]] = {}
         self._uid = Batch._get_uid()
         self._job_tokens: Set[str] = set()
 
@@ -570,6 +577,8 @@ class Batch:
                     raise BatchException("cycle detected in dependency graph")
 
         self._jobs = ordered_jobs
+        # the functions and arguments of Python jobs may have changed since the last run
+        self._python_serializations.clear()
         run_result = self._backend._run(self, dry_run, verbose, delete_scratch_on_exit, **backend_kwargs)  # pylint: disable=assignment-from-no-return
         if self._DEPRECATED_fs is not None:
             # best effort only because this is deprecated
@@ -1,13 +1,15 @@
-from typing import Optional, Callable, Type, Union, List, Any, Iterable
+from typing import Optional, Callable, Type, Union, List, Any, Iterable, Dict
 from types import TracebackType
 from io import BytesIO
 import asyncio
 import concurrent
 import dill
 import functools
+import itertools
 import sys
+import time
 
-from hailtop.utils import secret_alnum_string, partition
+from hailtop.utils import secret_alnum_string, bounded_gather, sleep_and_backoff
 import hailtop.batch_client.aioclient as low_level_batch_client
 from hailtop.batch_client.parse import parse_cpu_in_mcpu
 from hailtop.aiocloud import aiogoogle
@@ -32,16 +34,17 @@ def cpu_spec_to_float(spec: Union[int, str]) -> float:
     return float(spec)
 
 
-def chunk(fn):
-    def chunkedfn(*args):
-        return [fn(*arglist) for arglist in zip(*args)]
-    return chunkedfn
-
-
 def async_to_blocking(coro):
     return asyncio.get_event_loop().run_until_complete(coro)
 
 
+def function_name(fn: Callable) -> str:
+    try:
+        return fn.__name__
+    except AttributeError:
+        return '<anonymous>'
+
+
 class BatchPoolExecutor:
     """An executor which executes Python functions in the cloud.
 
@@ -135,7 +138,9 @@ class BatchPoolExecutor:
         self.fs = aiogoogle.GoogleStorageAsyncFS(project=project)
         self.futures: List[BatchPoolFuture] = []
         self.finished_future_count = 0
+        self.maps: List[BatchPoolMap] = []
         self._shutdown = False
+        self._cleaned_up = False
         version = sys.version_info
         if image is None:
             if version.major != 3 or version.minor not in (6, 7, 8):
@@ -155,13 +160,21 @@ class BatchPoolExecutor:
             fn: Callable,
             *iterables: Iterable[Any],
             timeout: Optional[Union[int, float]] = None,
-            chunksize: int = 1):
+            chunksize: Optional[int] = None,
+            buffersize: Optional[int] = None,
+            ordered: bool = True):
         """Call `fn` on cloud machines with arguments from `iterables`.
 
         This function returns a generator which will produce each result in the
         same order as the `iterables`, only blocking if the result is not yet
         ready. You can convert the generator to a list with :class:`.list`.
 
+        Tasks are grouped into chunks, each run by one job. The arguments of a
+        chunk are uploaded as one object and its results are downloaded as one
+        object, and `fn` is uploaded once for all chunks. Results are fetched
+        as chunks complete, by watching the status of each batch of chunks
+        rather than each job.
+
         Examples
         --------
 
@@ -190,6 +203,12 @@ class BatchPoolExecutor:
         ...     list(bpe.map(random_product, range(4)))
         [24.440006386777277, 23.325755364428026, 23.920184804993806, 25.47912882125101]
 
+        Square a billion numbers, holding at most a million arguments and
+        results in memory at a time:
+
+        >>> with BatchPoolExecutor() as bpe:  # doctest: +SKIP
+        ...     total = sum(bpe.map(lambda x: x * x, range(10 ** 9), buffersize=10 ** 6))
+
         Parameters
         ----------
         fn:
@@ -202,19 +221,30 @@ class BatchPoolExecutor:
         timeout:
             This is roughly a timeout on how long we wait on each function
             call. Specifically, each call to the returned generator's
-            :class:`.BatchPoolFuture`
-            :meth:`.iterator.__next__` invokes :meth:`.BatchPoolFuture.result` with this
-            `timeout`.
+            :meth:`.iterator.__next__` raises :class:`.concurrent.futures.TimeoutError` if
+            no result arrives within `timeout` seconds.
         chunksize:
             The number of tasks to schedule in the same docker container. Docker
             containers take about 5 seconds to start. Ideally, each task should
-            take an order of magnitude more time than start-up time. You can
-            make the chunksize larger to reduce parallelism but increase the
-            amount of meaningful work done per-container.
+            take an order of magnitude more time than start-up time. If
+            unspecified, the first few chunks double in size and later chunks
+            are sized from the measured time per task so that each takes about
+            a minute.
+        buffersize:
+            The maximum number of tasks whose arguments have been read from
+            `iterables` but whose results have not yet been produced by the
+            generator. If unspecified, every chunk is submitted before this
+            function returns; without a `chunksize`, that is once the first
+            chunk completes and the rest can be sized.
+        ordered:
+            If ``True`` or unspecified, results are produced in the order of
+            `iterables`. If ``False``, results are produced as their chunks
+            complete.
         """
 
         agen = async_to_blocking(
-            self.async_map(fn, iterables, timeout=timeout, chunksize=chunksize))
+            self.async_map(fn, iterables, timeout=timeout, chunksize=chunksize,
+                           buffersize=buffersize, ordered=ordered))
 
         def generator_from_async_generator(aiter):
             try:
@@ -222,54 +252,35 @@ class BatchPoolExecutor:
                     yield async_to_blocking(aiter.__anext__())
             except StopAsyncIteration:
                 return
+            finally:
+                async_to_blocking(aiter.aclose())
         return generator_from_async_generator(agen.__aiter__())
 
     async def async_map(self,
                         fn: Callable,
                         iterables: Iterable[Iterable[Any]],
                         timeout: Optional[Union[int, float]] = None,
-                        chunksize: int = 1):
+                        chunksize: Optional[int] = None,
+                        buffersize: Optional[int] = None,
+                        ordered: bool = True):
         """Aysncio compatible version of :meth:`.map`."""
-        if not iterables:
-            return iter([])
-
-        if chunksize > 1:
-            list_per_argument = [list(x) for x in iterables]
-            n = len(list_per_argument[0])
-            assert all(n == len(x) for x in list_per_argument)
-            n_chunks = (n + chunksize - 1) // chunksize
-            iterables_chunks = [list(partition(n_chunks, x)) for x in list_per_argument]
-            iterables_chunks = [
-                chunk for chunk in iterables_chunks if len(chunk) > 0]
-            fn = chunk(fn)
-            iterables = iterables_chunks
-
-        submit_tasks = [asyncio.ensure_future(self.async_submit(fn, *arguments))
-                        for arguments in zip(*iterables)]
+        if self._shutdown:
+            raise RuntimeError('BatchPoolExecutor has already been shutdown.')
+        if chunksize is not None and chunksize < 1:
+            raise ValueError(f'chunksize must be at least 1, not {chunksize}')
+        if buffersize is not None and buffersize < 1:
+            raise ValueError(f'buffersize must be at least 1, not {buffersize}')
+
+        bp_map = BatchPoolMap(self, fn, iterables, timeout=timeout, chunksize=chunksize,
+                              buffersize=buffersize, ordered=ordered)
         try:
-            bp_futures = [await t for t in submit_tasks]
+            await bp_map.submit()
+            if buffersize is None:
+                await bp_map.submit_after_probe()
         except:
-            for t in submit_tasks:
-                if t.done() and not t.exception():
-                    await t.result().async_cancel()
-                elif not t.done():
-                    t.cancel()
+            await bp_map.async_cancel()
             raise
-
-        async def async_result_or_cancel_all(future):
-            try:
-                return await future.async_result(timeout=timeout)
-            except:
-                await asyncio.gather(*[bp_fut.async_cancel() for bp_fut in bp_futures], return_exceptions=True)
-                raise
-
-        if chunksize > 1:
-            return (val
-                    for future in bp_futures
-                    for val in await async_result_or_cancel_all(future))
-
-        return (await async_result_or_cancel_all(future)
-                for future in bp_futures)
+        return bp_map.results()
 
     def submit(self,
                fn: Callable,
@@ -340,11 +351,7 @@ class BatchPoolExecutor:
         if self._shutdown:
             raise RuntimeError('BatchPoolExecutor has already been shutdown.')
 
-        try:
-            name = unapplied.__name__
-        except AttributeError:
-            name = '<anonymous>'
-        name = f'{name}-{secret_alnum_string(4)}'
+        name = f'{function_name(unapplied)}-{secret_alnum_string(4)}'
         batch = Batch(name=self.name + '-' + name,
                       backend=self.backend,
                       default_image=self.image)
@@ -358,15 +365,7 @@ class BatchPoolExecutor:
         await self.fs.write(pickledfun_remote, pipe.getvalue())
         pickledfun_local = batch.read_input(pickledfun_remote)
 
-        thread_limit = "1"
-        if self.cpus_per_job:
-            j.cpu(self.cpus_per_job)
-            thread_limit = str(int(max(1.0, cpu_spec_to_float(self.cpus_per_job))))
-        j.env("OMP_NUM_THREADS", thread_limit)
-        j.env("OPENBLAS_NUM_THREADS", thread_limit)
-        j.env("MKL_NUM_THREADS", thread_limit)
-        j.env("VECLIB_MAXIMUM_THREADS", thread_limit)
-        j.env("NUMEXPR_NUM_THREADS", thread_limit)
+        self._configure_job(j)
 
         j.command('set -ex')
         j.command(f'''python3 -c "
@@ -396,6 +395,17 @@ with open(\\"{j.ofile}\\", \\"wb\\") as out:
             await backend_batch.cancel()
             raise
 
+    def _configure_job(self, j):
+        thread_limit = "1"
+        if self.cpus_per_job:
+            j.cpu(self.cpus_per_job)
+            thread_limit = str(int(max(1.0, cpu_spec_to_float(self.cpus_per_job))))
+        j.env("OMP_NUM_THREADS", thread_limit)
+        j.env("OPENBLAS_NUM_THREADS", thread_limit)
+        j.env("MKL_NUM_THREADS", thread_limit)
+        j.env("VECLIB_MAXIMUM_THREADS", thread_limit)
+        j.env("NUMEXPR_NUM_THREADS", thread_limit)
+
     def __exit__(self,
                  exc_type: Optional[Type[BaseException]],
                  exc_value: Optional[BaseException],
@@ -407,9 +417,20 @@ with open(\\"{j.ofile}\\", \\"wb\\") as out:
 
     def _finish_future(self):
         self.finished_future_count += 1
-        if self._shutdown and self.finished_future_count == len(self.futures):
+        if self._shutdown and not self._running():
+            self._cleanup()
+
+    def _add_map(self, m):
+        self.maps.append(m)
+
+    def _finish_map(self):
+        if self._shutdown and not self._running():
             self._cleanup()
 
+    def _running(self):
+        return (self.finished_future_count < len(self.futures)
+                or any(m.running() for m in self.maps))
+
     def shutdown(self, wait: bool = True):
         """Allow temporary resources to be cleaned up.
 
@@ -430,12 +451,16 @@ with open(\\"{j.ofile}\\", \\"wb\\") as out:
                 except Exception:
                     pass
             async_to_blocking(
-                asyncio.gather(*[ignore_exceptions(f) for f in self.futures]))
-        if self.finished_future_count == len(self.futures):
+                asyncio.gather(*[ignore_exceptions(f) for f in self.futures],
+                               *[m.async_wait() for m in self.maps]))
+        if not self._running():
             self._cleanup()
         self._shutdown = True
 
     def _cleanup(self):
+        if self._cleaned_up:
+            return
+        self._cleaned_up = True
         if self.cleanup_bucket:
             async_to_blocking(self.fs.rmtree(None, self.directory))
         async_to_blocking(self.fs.close())
@@ -568,3 +593,293 @@ class BatchPoolFuture:
         """NOT IMPLEMENTED
         """
         raise NotImplementedError()
+
+
+class MapChunk:
+    def __init__(self, index: int, args: List[tuple], directory: str):
+        self.index = index
+        self.n_tasks = len(args)
+        self.args: Optional[List[tuple]] = args
+        self.input_file = directory + f'{index}/args'
+        self.output_file = directory + f'{index}/output'
+        self.batch: Optional[low_level_batch_client.Batch] = None
+        self.job_id: Optional[int] = None
+        self.state: Optional[str] = None
+        self.values: List[Any] = []
+        self.error: Optional[str] = None
+        self.seconds: Optional[float] = None
+
+
+class MapWave:
+    """The chunks submitted together in one batch."""
+
+    def __init__(self, batch: low_level_batch_client.Batch, chunks: List[MapChunk]):
+        self.batch = batch
+        self.running_chunks: Dict[int, MapChunk] = {}
+        for job_id, c in enumerate(chunks, start=1):
+            c.batch = batch
+            c.job_id = job_id
+            self.running_chunks[job_id] = c
+        self.n_completed = 0
+        self.complete = False
+
+
+class BatchPoolMap:
+    """The tasks of one call to :meth:`.BatchPoolExecutor.map`.
+
+    Tasks are read from the iterables in chunks, as buffer space allows, and
+    each chunk is run by one job. Without a fixed chunk size, the first
+    chunks double in size until one completes, and later chunks are sized
+    from the measured time per task to take about `TARGET_CHUNK_SECONDS`.
+    Without a buffer size, all chunks are submitted up front, like
+    :meth:`concurrent.futures.Executor.map`.
+    """
+
+    TARGET_CHUNK_SECONDS = 60
+    MAX_PROBE_CHUNKS = 4
+
+    def __init__(self,
+                 executor: BatchPoolExecutor,
+                 fn: Callable,
+                 iterables: Iterable[Iterable[Any]],
+                 *,
+                 timeout: Optional[Union[int, float]],
+                 chunksize: Optional[int],
+                 buffersize: Optional[int],
+                 ordered: bool):
+        self.executor = executor
+        self.fn = fn
+        self.name = f'{function_name(fn)}-{secret_alnum_string(4)}'
+        self.directory = executor.inputs + f'{self.name}/'
+        self.fn_file = self.directory + 'fn'
+        self.fn_uploaded = False
+        self.args = zip(*iterables)
+        self.exhausted = False
+        self.timeout = timeout
+        self.chunksize = chunksize
+        self.buffersize = buffersize
+        self.ordered = ordered
+        self.seconds_per_task: Optional[float] = None
+        self.n_chunks = 0
+        # tasks read from the iterables whose results have not been produced
+        self.n_tasks_buffered = 0
+        self.waves: List[MapWave] = []
+        self.completed_chunks: Dict[int, MapChunk] = {}
+        self.next_chunk_index = 0
+        executor._add_map(self)
+
+    def running(self) -> bool:
+        return any(not wave.complete for wave in self.waves)
+
+    def next_chunksize(self) -> int:
+        if self.chunksize is not None:
+            return self.chunksize
+        if self.seconds_per_task is None:
+            return 2 ** self.n_chunks
+        return max(1, int(self.TARGET_CHUNK_SECONDS / max(self.seconds_per_task, 1e-6)))
+
+    def can_submit(self) -> bool:
+        if self.exhausted:
+            return False
+        if self.buffersize is not None and self.n_tasks_buffered >= self.buffersize:
+            return False
+        if self.chunksize is None and self.seconds_per_task is None:
+            return self.n_chunks < self.MAX_PROBE_CHUNKS
+        return True
+
+    async def submit(self):
+        chunks = []
+        while self.can_submit():
+            size = self.next_chunksize()
+            if self.buffersize is not None:
+                size = min(size, self.buffersize - self.n_tasks_buffered)
+            args = list(itertools.islice(self.args, size))
+            if len(args) < size:
+                self.exhausted = True
+            if not args:
+                break
+            chunks.append(MapChunk(self.n_chunks, args, self.directory))
+            self.n_chunks += 1
+            self.n_tasks_buffered += len(args)
+        if not chunks:
+            return
+        if self.executor._shutdown:
+            raise RuntimeError('BatchPoolExecutor has already been shutdown.')
+
+        executor = self.executor
+        if not self.fn_uploaded:
+            pipe = BytesIO()
+            dill.dump(self.fn, pipe, recurse=True)
+            await executor.fs.write(self.fn_file, pipe.getvalue())
+            self.fn_uploaded = True
+
+        async def upload(c):
+            await executor.fs.write(c.input_file, dill.dumps(c.args, recurse=True))
+            c.args = None
+
+        await bounded_gather(*[functools.partial(upload, c) for c in chunks], parallelism=10)
+
+        batch = Batch(name=executor.name + '-' + self.name,
+                      backend=executor.backend,
+                      default_image=executor.image)
+        executor.batches.append(batch)
+        fn_local = batch.read_input(self.fn_file)
+        for c in chunks:
+            j = batch.new_job(f'{self.name}-{c.index}')
+            args_local = batch.read_input(c.input_file)
+            executor._configure_job(j)
+            j.command('set -ex')
+            j.command(f'''python3 -c "
+import dill
+import time
+import traceback
+with open(\\"{fn_local}\\", \\"rb\\") as f:
+    fn = dill.load(f)
+with open(\\"{args_local}\\", \\"rb\\") as f:
+    args = dill.load(f)
+values = []
+error = None
+start = time.time()
+for arguments in args:
+    try:
+        values.append(fn(*arguments))
+    except Exception as e:
+        print(\\"BatchPoolExecutor encountered an exception:\\")
+        traceback.print_exc()
+        error = traceback.format_exception(type(e), e, e.__traceback__)
+        break
+with open(\\"{j.ofile}\\", \\"wb\\") as out:
+    dill.dump((values, error, time.time() - start), out, recurse=True)
+"''')
+            batch.write_output(j.ofile, c.output_file)
+        backend_batch = batch.run(wait=False,
+                                  disable_progress_bar=True)._async_batch
+        self.waves.append(MapWave(backend_batch, chunks))
+
+    async def submit_after_probe(self):
+        """Wait until a probe chunk has measured the time per task, then
+        submit every remaining chunk."""
+        delay = 0.1
+        waiting_since = time.monotonic()
+        while self.seconds_per_task is None and self.waves and not self.exhausted:
+            for c in await self.poll():
+                self.completed_chunks[c.index] = c
+            if self.seconds_per_task is None:
+                if self.timeout is not None and time.monotonic() - waiting_since > self.timeout:
+                    raise concurrent.futures.TimeoutError()
+                delay = await sleep_and_backoff(delay, max_delay=5.0)
+        while self.can_submit():
+            await self.submit()
+
+    async def poll(self) -> List[MapChunk]:
+        """Collect the chunks that completed since the last poll, with one
+        status request per running batch."""
+        async def completed_chunks(wave):
+            status = await wave.batch.status()
+            if status['n_completed'] == wave.n_completed:
+                return []
+            chunks = []
+            async for j in wave.batch.jobs(q='done'):
+                c = wave.running_chunks.pop(j['job_id'], None)
+                if c is not None:
+                    c.state = j['state']
+                    chunks.append(c)
+            wave.n_completed = status['n_completed']
+            return chunks
+
+        waves = [wave for wave in self.waves if wave.running_chunks]
+        chunks = [c
+                  for wave_chunks in await asyncio.gather(*[completed_chunks(wave) for wave in waves])
+                  for c in wave_chunks]
+        self.waves = [wave for wave in self.waves if wave.running_chunks]
+        await bounded_gather(*[functools.partial(self.fetch, c) for c in chunks], parallelism=10)
+        return chunks
+
+    async def fetch(self, c: MapChunk):
+        fs = self.executor.fs
+        try:
+            if c.state != 'Success':
+                raise FileNotFoundError(c.output_file)
+            c.values, traceback, c.seconds = dill.loads(await fs.read(c.output_file))
+            if traceback is not None:
+                c.error = 'submitted job failed:\n' + ''.join(traceback)
+        except FileNotFoundError:
+            assert c.batch is not None
+            job = await c.batch.get_job(c.job_id)
+            job_status = job._status.get('status') or {}
+            main_container_status = job_status.get('container_statuses', {}).get('main')
+            if main_container_status is None:
+                c.error = f"submitted job did not run: {c.state}"
+            elif main_container_status['state'] == 'error':
+                c.error = f"submitted job failed:\n{main_container_status['error']}"
+            else:
+                job_log = await job.log()
+                c.error = f"submitted job did not write output:\n{main_container_status}\n\nLog:\n{job_log}"
+        finally:
+            await asyncio.gather(fs.remove(c.input_file), fs.remove(c.output_file), return_exceptions=True)
+
+        n_tasks_run = len(c.values) + (1 if c.error is not None else 0)
+        if c.seconds is not None and n_tasks_run > 0:
+            seconds_per_task = c.seconds / n_tasks_run
+            if self.seconds_per_task is None:
+                self.seconds_per_task = seconds_per_task
+            else:
+                self.seconds_per_task = (self.seconds_per_task + seconds_per_task) / 2
+
+    def ready_chunks(self) -> List[MapChunk]:
+        if not self.ordered:
+            chunks = list(self.completed_chunks.values())
+            self.completed_chunks = {}
+            return chunks
+        chunks = []
+        while self.next_chunk_index in self.completed_chunks:
+            chunks.append(self.completed_chunks.pop(self.next_chunk_index))
+            self.next_chunk_index += 1
+        return chunks
+
+    async def results(self):
+        try:
+            delay = 0.1
+            waiting_since = time.monotonic()
+            while True:
+                await self.submit()
+                if not self.waves and not self.completed_chunks:
+                    assert self.exhausted
+                    return
+                for c in await self.poll():
+                    self.completed_chunks[c.index] = c
+                chunks = self.ready_chunks()
+                if not chunks:
+                    if self.timeout is not None and time.monotonic() - waiting_since > self.timeout:
+                        raise concurrent.futures.TimeoutError()
+                    delay = await sleep_and_backoff(delay, max_delay=5.0)
+                    continue
+                delay = 0.1
+                for c in chunks:
+                    self.n_tasks_buffered -= c.n_tasks
+                    for value in c.values:
+                        yield value
+                    if c.error is not None:
+                        raise ValueError(c.error)
+                waiting_since = time.monotonic()
+        except:
+            await self.async_cancel()
+            raise
+        finally:
+            self.executor._finish_map()
+
+    async def async_cancel(self):
+        await asyncio.gather(*[wave.batch.cancel() for wave in self.waves if wave.running_chunks],
+                             return_exceptions=True)
+        self.waves = []
+
+    async def async_wait(self):
+        """Wait until every submitted chunk has completed, without fetching
+        the results."""
+        async def wait(wave):
+            try:
+                await wave.batch.wait(disable_progress_bar=True)
+            finally:
+                wave.complete = True
+        await asyncio.gather(*[wait(wave) for wave in self.waves if not wave.complete],
+                             return_exceptions=True)
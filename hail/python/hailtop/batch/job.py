@@ -1,13 +1,20 @@
 import re
+import asyncio
+import base64
 import dill
+import hashlib
 import os
-import functools
 import inspect
+import struct
+import sys
 import textwrap
-from shlex import quote as shq
 from io import BytesIO
+from shlex import quote as shq
 from typing import Union, Optional, Dict, List, Set, Tuple, Callable, Any, cast
 
+from hailtop.aiotools import AsyncFS
+from hailtop.utils import retry_transient_errors
+
 from . import backend, resource as _resource, batch  # pylint: disable=cyclic-import
 from .exceptions import BatchException
 from .globals import DEFAULT_SHELL
@@ -36,6 +43,77 @@ def opt_str(x):
     return str(x)
 
 
+class _OutOfBandPickler(dill.Pickler):
+    def reducer_override(self, obj):  # pylint: disable=no-self-use
+        # dill pickles numpy arrays with their data in the pickle; reduce them
+        # as numpy does so protocol 5 can hand their buffers out-of-band
+        t = type(obj)
+        if t.__module__ == 'numpy' and t.__name__ == 'ndarray':
+            return obj.__reduce_ex__(5)
+        return NotImplemented
+
+
+_PYTHON_DILL_IMAGE_REGEX = re.compile(r'(?:.*/)?python-dill:(?P<major>\d+)\.(?P<minor>\d+)(?:-.*)?')
+
+# buffers smaller than this are cheaper to copy into the pickle
+_MIN_OUT_OF_BAND_BYTES = 64 * 1024
+
+
+def _image_supports_out_of_band(image: Optional[str]) -> bool:
+    """Whether the Python in `image` can load protocol 5 pickles.
+
+    Only the python-dill images, which the service backend uses by default,
+    have a known Python version; any other image may run Python 3.6 or 3.7.
+    """
+    if image is None or sys.version_info < (3, 8):
+        return False
+    match = _PYTHON_DILL_IMAGE_REGEX.fullmatch(image)
+    if match is None:
+        return False
+    return (int(match['major']), int(match['minor'])) >= (3, 8)
+
+
+def _serialize_out_of_band(obj: Any, out_of_band: bool) -> Tuple[str, List[Any]]:
+    """Pickle `obj` into a blob and return its digest and its chunks.
+
+    If `out_of_band`, large buffers such as numpy arrays are pickled
+    out-of-band with protocol 5 and written after the pickle as they are,
+    without being copied into it. A blob is a header with the number of
+    buffers, the size of the pickle and the sizes of the buffers, followed by
+    the pickle and the buffers.
+    """
+    buffers: List[Any] = []
+    if out_of_band:
+        def buffer_callback(buffer):
+            if buffer.raw().nbytes < _MIN_OUT_OF_BAND_BYTES:
+                return True
+            buffers.append(buffer)
+            return False
+
+        f = BytesIO()
+        _OutOfBandPickler(f, protocol=5, buffer_callback=buffer_callback, recurse=True).dump(obj)
+        payload = f.getvalue()
+    else:
+        payload = dill.dumps(obj, recurse=True)
+    raw_buffers = [buffer.raw() for buffer in buffers]
+    sizes = [len(payload)] + [raw.nbytes for raw in raw_buffers]
+    chunks = [struct.pack(f'<{len(sizes) + 1}Q', len(raw_buffers), *sizes), payload, *raw_buffers]
+    digest = hashlib.sha256()
+    for chunk in chunks:
+        digest.update(chunk)
+    return digest.hexdigest(), chunks
+
+
+async def _write_blob(fs: AsyncFS, url: str, chunks: List[Any]):
+    async def write():
+        async with await fs.create(url, retry_writes=False) as f:
+            for chunk in chunks:
+                await f.write(chunk)
+
+    await fs.makedirs(os.path.dirname(url), exist_ok=True)
+    await retry_transient_errors(write)
+
+
 class Job:
     """
     Object representing a single job to execute.
@@ -422,6 +500,11 @@ class Job:
     async def _compile(self, local_tmpdir, remote_tmpdir, *, dry_run=False):
         raise NotImplementedError
 
+    def _uploads_code(self) -> bool:
+        """Whether :meth:`._compile` writes code to the remote temporary
+        directory. It is known before the job is compiled."""
+        raise NotImplementedError
+
     def _interpolate_command(self, command, allow_python_results=False):
         def handler(match_obj):
             groups = match_obj.groupdict()
@@ -514,6 +597,9 @@ class BashJob(Job):
     or :meth:`.Batch.new_bash_job` instead.
     """
 
+    # longer commands are uploaded and sourced by the job
+    _MAX_INLINE_COMMAND_BYTES = 10 * 1024
+
     def __init__(self,
                  batch: 'batch.Batch',
                  token: str,
@@ -685,24 +771,29 @@ class BashJob(Job):
         self._command.append(command)
         return self
 
-    async def _compile(self, local_tmpdir, remote_tmpdir, *, dry_run=False):
-        if len(self._command) == 0:
-            return False
-
+    def _job_command(self) -> str:
         job_shell = self._shell if self._shell else DEFAULT_SHELL
 
         job_command = [cmd.strip() for cmd in self._command]
         job_command = [f'{{\n{x}\n}}' for x in job_command]
         job_command = '\n'.join(job_command)
 
-        job_command = f'''
+        return f'''
 #! {job_shell}
 {job_command}
 '''
 
+    def _uploads_code(self) -> bool:
+        return len(self._command) > 0 and len(self._job_command().encode()) > BashJob._MAX_INLINE_COMMAND_BYTES
+
+    async def _compile(self, local_tmpdir, remote_tmpdir, *, dry_run=False):
+        if len(self._command) == 0:
+            return False
+
+        job_command = self._job_command()
         job_command_bytes = job_command.encode()
 
-        if len(job_command_bytes) <= 10 * 1024:
+        if len(job_command_bytes) <= BashJob._MAX_INLINE_COMMAND_BYTES:
             self._wrapper_code.append(job_command)
             return False
 
@@ -763,6 +854,10 @@ class PythonJob(Job):
     instead.
     """
 
+    # arguments that pickle to more bytes than this are uploaded as blobs
+    # rather than inlined in the job command
+    _MAX_INLINE_ARGUMENT_BYTES = 1024
+
     def __init__(self,
                  batch: 'batch.Batch',
                  token: str,
@@ -971,9 +1066,40 @@ class PythonJob(Job):
 
         return result
 
+    def _serialize(self, obj: Any, out_of_band: bool) -> Tuple[str, List[Any]]:
+        # an object shared by the jobs of a batch is pickled once; it is kept
+        # so that its id is not reused
+        serialized = self._batch._python_serializations.get((id(obj), out_of_band))
+        if serialized is None:
+            serialized = (obj, *_serialize_out_of_band(obj, out_of_band))
+            self._batch._python_serializations[(id(obj), out_of_band)] = serialized
+        _, digest, chunks = serialized
+        return digest, chunks
+
+    async def _blob_input(self, remote_tmpdir: str, digest: str, chunks: List[Any], dry_run: bool) -> '_resource.InputResourceFile':
+        # blobs are uploaded once per batch and shared by the jobs that use them
+        url = f'{remote_tmpdir}/python-blobs/{digest}'
+        blobs = self._batch._python_blobs
+        if url not in blobs:
+            upload = None if dry_run else asyncio.ensure_future(_write_blob(self._batch._fs, url, chunks))
+            blobs[url] = (self._batch.read_input(url), upload)
+        blob, upload = blobs[url]
+        if upload is not None:
+            await asyncio.shield(upload)
+        return blob
+
     async def _compile(self, local_tmpdir, remote_tmpdir, *, dry_run=False):
-        for i, (result, unapplied, args, kwargs) in enumerate(self._functions):
-            def prepare_argument_for_serialization(arg):
+        out_of_band = _image_supports_out_of_band(self._image)
+        for result, unapplied, args, kwargs in self._functions:
+            blobs: List[_resource.InputResourceFile] = []
+
+            async def blob_index(digest, chunks):
+                blob = await self._blob_input(remote_tmpdir, digest, chunks, dry_run)
+                if blob not in blobs:
+                    blobs.append(blob)
+                return blobs.index(blob)
+
+            async def prepare_argument_for_serialization(arg):
                 if isinstance(arg, _resource.PythonResult):
                     return ('py_path', arg._get_path(local_tmpdir))
                 if isinstance(arg, _resource.ResourceFile):
@@ -981,78 +1107,82 @@ class PythonJob(Job):
                 if isinstance(arg, _resource.ResourceGroup):
                     return ('dict_path', {name: resource._get_path(local_tmpdir)
                                           for name, resource in arg._resources.items()})
-                return ('value', arg)
-
-            def deserialize_argument(arg):
-                typ, val = arg
-                if typ == 'py_path':
-                    return dill.load(open(val, 'rb'))
-                if typ in ('path', 'dict_path'):
-                    return val
-                assert typ == 'value'
-                return val
-
-            def wrap(f):
-                @functools.wraps(f)
-                def wrapped(*args, **kwargs):
-                    args = [deserialize_argument(arg) for arg in args]
-                    kwargs = {kw: deserialize_argument(arg) for kw, arg in kwargs.items()}
-                    return f(*args, **kwargs)
-                return wrapped
+                digest, chunks = self._serialize(arg, out_of_band)
+                if sum(len(chunk) for chunk in chunks) <= PythonJob._MAX_INLINE_ARGUMENT_BYTES:
+                    return ('value', arg)
+                return ('blob', await blob_index(digest, chunks))
 
-            args = [prepare_argument_for_serialization(arg) for arg in args]
-            kwargs = {kw: prepare_argument_for_serialization(arg) for kw, arg in kwargs.items()}
-
-            pipe = BytesIO()
-            dill.dump(functools.partial(wrap(unapplied), *args, **kwargs), pipe, recurse=True)
-            pipe.seek(0)
-
-            job_path = os.path.dirname(result._get_path(remote_tmpdir))
-            code_path = f'{job_path}/code{i}.p'
-
-            if not dry_run:
-                await self._batch._fs.makedirs(os.path.dirname(code_path), exist_ok=True)
-                await self._batch._fs.write(code_path, pipe.getvalue())
-
-            code = self._batch.read_input(code_path)
+            fn = await blob_index(*self._serialize(unapplied, out_of_band))
+            prepared_args = [await prepare_argument_for_serialization(arg) for arg in args]
+            prepared_kwargs = {kw: await prepare_argument_for_serialization(arg) for kw, arg in kwargs.items()}
+            call = base64.b64encode(dill.dumps((fn, prepared_args, prepared_kwargs), recurse=True)).decode()
+            blob_paths = ', '.join(f'\\"{blob}\\"' for blob in blobs)
 
             json_write = ''
             if result._json:
                 json_write = f'''
-            with open(\\"{result._json}\\", \\"w\\") as out:
-                out.write(json.dumps(result) + \\"\\n\\")
+        with open(\\"{result._json}\\", \\"w\\") as out:
+            out.write(json.dumps(result) + \\"\\n\\")
 '''
 
             str_write = ''
             if result._str:
                 str_write = f'''
-            with open(\\"{result._str}\\", \\"w\\") as out:
-                out.write(str(result) + \\"\\n\\")
+        with open(\\"{result._str}\\", \\"w\\") as out:
+            out.write(str(result) + \\"\\n\\")
 '''
 
             repr_write = ''
             if result._repr:
                 repr_write = f'''
-            with open(\\"{result._repr}\\", \\"w\\") as out:
-                out.write(repr(result) + \\"\\n\\")
+        with open(\\"{result._repr}\\", \\"w\\") as out:
+            out.write(repr(result) + \\"\\n\\")
 '''
 
             wrapper_code = f'''python3 -c "
-import os
 import base64
 import dill
-import traceback
 import json
-import sys
+import os
+import struct
+import traceback
+
+def load_blob(path):
+    data = bytearray(os.path.getsize(path))
+    with open(path, \\"rb\\") as f:
+        f.readinto(data)
+    view = memoryview(data)
+    n_buffers, = struct.unpack_from(\\"<Q\\", view, 0)
+    sizes = struct.unpack_from(\\"<%dQ\\" % (n_buffers + 1), view, 8)
+    offset = 8 * (n_buffers + 2)
+    parts = []
+    for size in sizes:
+        parts.append(view[offset:offset + size])
+        offset += size
+    if n_buffers == 0:
+        return dill.loads(parts[0])
+    return dill.loads(parts[0], buffers=parts[1:])
+
+blobs = [{blob_paths}]
+
+def deserialize_argument(arg):
+    typ, val = arg
+    if typ == \\"py_path\\":
+        return dill.load(open(val, \\"rb\\"))
+    if typ == \\"blob\\":
+        return load_blob(blobs[val])
+    return val
 
 with open(\\"{result}\\", \\"wb\\") as dill_out:
     try:
-        with open(\\"{code}\\", \\"rb\\") as f:
-            result = dill.load(f)()
-            dill.dump(result, dill_out, recurse=True)
-            {json_write}
-            {str_write}
-            {repr_write}
+        fn, args, kwargs = dill.loads(base64.b64decode(\\"{call}\\"))
+        args = [deserialize_argument(arg) for arg in args]
+        kwargs = {{kw: deserialize_argument(arg) for kw, arg in kwargs.items()}}
+        result = load_blob(blobs[fn])(*args, **kwargs)
+        dill.dump(result, dill_out, recurse=True)
+        {json_write}
+        {str_write}
+        {repr_write}
     except Exception as e:
         traceback.print_exc()
         dill.dump((e, traceback.format_exception(type(e), e, e.__traceback__)), dill_out, recurse=True)
@@ -1063,10 +1193,13 @@ with open(\\"{result}\\", \\"wb\\") as dill_out:
             self._wrapper_code.append(wrapper_code)
 
             self._user_code.append(textwrap.dedent(inspect.getsource(unapplied)))
-            args = ', '.join([f'{arg!r}' for _, arg in args])
-            kwargs = ', '.join([f'{k}={v!r}' for k, (_, v) in kwargs.items()])
+            args = ', '.join([f'{arg!r}' for arg in args])
+            kwargs = ', '.join([f'{k}={v!r}' for k, v in kwargs.items()])
             separator = ', ' if args and kwargs else ''
             func_call = f'{unapplied.__name__}({args}{separator}{kwargs})'
             self._user_code.append(self._interpolate_command(func_call, allow_python_results=True))
 
         return True
+
+    def _uploads_code(self) -> bool:
+        return True
@@ -1,22 +1,25 @@
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, AsyncIterator, Awaitable, Callable, List
 import math
 import random
 import logging
 import json
-import functools
 import asyncio
 import aiohttp
 import secrets
 
 from hailtop.config import get_deploy_config, DeployConfig
 from hailtop.auth import service_auth_headers
-from hailtop.utils import bounded_gather, request_retry_transient_errors, tqdm, TQDM_DEFAULT_DISABLE
+from hailtop.utils import (request_retry_transient_errors, is_transient_error, sleep_and_backoff, tqdm,
+                           TQDM_DEFAULT_DISABLE)
 from hailtop import httpx
 
 from .globals import tasks, complete_states
 
 log = logging.getLogger('batch_client.aioclient')
 
+# how long a request to wait for a batch or job to change waits for it
+WAIT_TIMEOUT_SECS = 30
+
 
 class Job:
     @staticmethod
@@ -291,16 +294,32 @@ class SubmittedJob:
         self._status = await resp.json()
         return self._status
 
+    async def _wait_for_change(self):
+        resp = await self._batch._client._wait(f'/api/v1alpha/batches/{self.batch_id}/jobs/{self.job_id}/wait')
+        if resp is None:
+            return None
+        self._status = await resp.json()
+        return self._status
+
     async def wait(self):
         i = 0
+        long_poll = True
+        status = await self.status()
         while True:
-            if await self.is_complete():
-                return self._status
+            if status['state'] in complete_states:
+                return status
+            if long_poll:
+                new_status = await self._wait_for_change()
+                if new_status is not None:
+                    status = new_status
+                    continue
+                long_poll = False
             j = random.randrange(math.floor(1.1 ** i))
             await asyncio.sleep(0.100 * j)
             # max 44.5s
             if i < 64:
                 i = i + 1
+            status = await self.status()
 
     async def log(self):
         resp = await self._batch._client._get(f'/api/v1alpha/batches/{self.batch_id}/jobs/{self.job_id}/log')
@@ -339,6 +358,29 @@ class Batch:
             if last_job_id is None:
                 break
 
+    async def jobs_bulk(self, state: Optional[str] = None) -> AsyncIterator[Dict[str, Any]]:
+        # all the jobs in `state`, one of the states `jobs` accepts in `q`, in
+        # job id order, streamed in one request which is resumed after the
+        # last job received if the connection fails
+        last_job_id = 0
+        delay = 0.1
+        while True:
+            params: Dict[str, Any] = {'last_job_id': last_job_id}
+            if state is not None:
+                params['state'] = state
+            try:
+                resp = await self._client._get_stream(f'/api/v1alpha/batches/{self.id}/jobs/export', params=params)
+                async with resp:
+                    async for line in resp.content:
+                        job = json.loads(line)
+                        last_job_id = job['job_id']
+                        yield job
+                return
+            except Exception as e:
+                if not is_transient_error(e):
+                    raise
+                delay = await sleep_and_backoff(delay)
+
     async def get_job(self, job_id: int) -> Job:
         return await self._client.get_job(self.id, job_id)
 
@@ -376,21 +418,38 @@ class Batch:
             return await self.status()  # updates _last_known_status
         return self._last_known_status
 
+    async def _wait_for_change(self, n_completed):
+        resp = await self._client._wait(f'/api/v1alpha/batches/{self.id}/wait', params={'n_completed': n_completed})
+        if resp is None:
+            return None
+        self._last_known_status = await resp.json()
+        return self._last_known_status
+
     async def wait(self, *, disable_progress_bar=TQDM_DEFAULT_DISABLE):
         i = 0
+        long_poll = True
         with tqdm(total=self.n_jobs,
                   disable=disable_progress_bar,
                   desc='completed jobs') as pbar:
+            status = await self.status()
             while True:
-                status = await self.status()
                 pbar.update(status['n_completed'] - pbar.n)
                 if status['complete']:
                     return status
+                # the batch service responds when the batch changes, older
+                # ones are polled
+                if long_poll:
+                    new_status = await self._wait_for_change(status['n_completed'])
+                    if new_status is not None:
+                        status = new_status
+                        continue
+                    long_poll = False
                 j = random.randrange(math.floor(1.1 ** i))
                 await asyncio.sleep(0.100 * j)
                 # max 44.5s
                 if i < 64:
                     i = i + 1
+                status = await self.status()
 
     async def debug_info(self):
         batch_status = await self.status()
@@ -410,6 +469,7 @@ class BatchBuilder:
         self._job_specs = []
         self._jobs = []
         self._submitted = False
+        self._job_spec_queue: Optional[asyncio.Queue] = None
         self.attributes = attributes
         self.callback = callback
 
@@ -505,6 +565,8 @@ class BatchBuilder:
             job_spec['user_code'] = user_code
 
         self._job_specs.append(job_spec)
+        if self._job_spec_queue is not None:
+            self._job_spec_queue.put_nowait(job_spec)
 
         j = Job.unsubmitted_job(self, self._job_idx)
         self._jobs.append(j)
@@ -532,8 +594,53 @@ class BatchBuilder:
                 b, content_type='application/json', encoding='utf-8'))
         pbar.update(n_jobs)
 
-    async def _create(self):
-        n_jobs = len(self._job_specs)
+    async def _submit_job_specs(self, batch_id, job_specs: AsyncIterator[dict], max_bunch_bytesize, max_bunch_size,
+                                pbar, parallelism=6):
+        # bunches are submitted as soon as they fill, with at most
+        # `parallelism` requests in flight
+        sema = asyncio.Semaphore(parallelism)
+        tasks: List[asyncio.Future] = []
+
+        async def submit_bunch(bunch):
+            try:
+                await self._submit_jobs(batch_id, bunch, len(bunch), pbar)
+            finally:
+                sema.release()
+
+        async def start_bunch(bunch):
+            await sema.acquire()
+            for t in tasks:
+                if t.done() and t.exception() is not None:
+                    sema.release()
+                    raise t.exception()
+            tasks.append(asyncio.ensure_future(submit_bunch(bunch)))
+
+        try:
+            bunch: List[bytes] = []
+            bunch_n_bytes = 0
+            async for job_spec in job_specs:
+                spec = json.dumps(job_spec).encode('utf-8')
+                n_bytes = len(spec)
+                assert n_bytes < max_bunch_bytesize, (
+                    f'every job spec must be less than max_bunch_bytesize,'
+                    f' { max_bunch_bytesize }B, but {spec!r} is larger')
+                if bunch and (bunch_n_bytes + n_bytes >= max_bunch_bytesize or len(bunch) >= max_bunch_size):
+                    await start_bunch(bunch)
+                    bunch = []
+                    bunch_n_bytes = 0
+                bunch.append(spec)
+                bunch_n_bytes += n_bytes
+            if bunch:
+                await start_bunch(bunch)
+            await asyncio.gather(*tasks)
+        except:
+            for t in tasks:
+                t.cancel()
+            raise
+
+    async def _create(self, n_jobs: Optional[int] = None):
+        if n_jobs is None:
+            n_jobs = len(self._job_specs)
         batch_spec = {'billing_project': self._client.billing_project,
                       'n_jobs': n_jobs,
                       'token': self.token}
@@ -553,47 +660,78 @@ class BatchBuilder:
     async def submit(self,
                      max_bunch_bytesize=MAX_BUNCH_BYTESIZE,
                      max_bunch_size=MAX_BUNCH_SIZE,
-                     disable_progress_bar=TQDM_DEFAULT_DISABLE):
+                     disable_progress_bar=TQDM_DEFAULT_DISABLE,
+                     *,
+                     n_jobs: Optional[int] = None,
+                     create_jobs: Optional[Callable[[], Awaitable[None]]] = None):
+        """Create the batch, submit its jobs and close it.
+
+        If `create_jobs` is given, the batch is created with `n_jobs` jobs up
+        front and `create_jobs` is awaited while the jobs it creates with
+        :meth:`create_job` are submitted, so jobs are sent to the service as
+        they are created rather than once all of them exist. It must create
+        exactly `n_jobs` jobs. If it raises, the batch is deleted.
+        """
         assert max_bunch_bytesize > 0
         assert max_bunch_size > 0
         if self._submitted:
             raise ValueError("cannot submit an already submitted batch")
-        batch = await self._create()
+        if create_jobs is None:
+            n_jobs = len(self._job_specs)
+        elif n_jobs is None:
+            raise ValueError("n_jobs is required with create_jobs")
+        batch = await self._create(n_jobs)
         id = batch.id
         log.info(f'created batch {id}')
-        byte_job_specs = [json.dumps(job_spec).encode('utf-8')
-                          for job_spec in self._job_specs]
-        byte_job_specs_bunches = []
-        bunch_sizes = []
-        bunch = []
-        bunch_n_bytes = 0
-        bunch_n_jobs = 0
-        for spec in byte_job_specs:
-            n_bytes = len(spec)
-            assert n_bytes < max_bunch_bytesize, (
-                f'every job spec must be less than max_bunch_bytesize,'
-                f' { max_bunch_bytesize }B, but {spec} is larger')
-            if bunch_n_bytes + n_bytes < max_bunch_bytesize and len(bunch) < max_bunch_size:
-                bunch.append(spec)
-                bunch_n_bytes += n_bytes
-                bunch_n_jobs += 1
-            else:
-                byte_job_specs_bunches.append(bunch)
-                bunch_sizes.append(bunch_n_jobs)
-                bunch = [spec]
-                bunch_n_bytes = n_bytes
-                bunch_n_jobs = 1
-        if bunch:
-            byte_job_specs_bunches.append(bunch)
-            bunch_sizes.append(bunch_n_jobs)
-
-        with tqdm(total=len(self._job_specs),
+
+        with tqdm(total=n_jobs,
                   disable=disable_progress_bar,
                   desc='jobs submitted to queue') as pbar:
-            await bounded_gather(
-                *[functools.partial(self._submit_jobs, id, bunch, size, pbar)
-                  for bunch, size in zip(byte_job_specs_bunches, bunch_sizes)],
-                parallelism=6)
+            if create_jobs is None:
+                async def job_specs():
+                    for job_spec in self._job_specs:
+                        yield job_spec
+                await self._submit_job_specs(id, job_specs(), max_bunch_bytesize, max_bunch_size, pbar)
+            else:
+                queue: asyncio.Queue = asyncio.Queue()
+                self._job_spec_queue = queue
+                for job_spec in self._job_specs:
+                    queue.put_nowait(job_spec)
+
+                async def created_job_specs():
+                    while True:
+                        job_spec = await queue.get()
+                        if job_spec is None:
+                            return
+                        yield job_spec
+
+                async def create_all_jobs():
+                    try:
+                        await create_jobs()
+                    finally:
+                        self._job_spec_queue = None
+                        queue.put_nowait(None)
+                    if self._job_idx != n_jobs:
+                        raise ValueError(f'expected {n_jobs} jobs but {self._job_idx} were created')
+
+                submit_task = asyncio.ensure_future(
+                    self._submit_job_specs(id, created_job_specs(), max_bunch_bytesize, max_bunch_size, pbar))
+                try:
+                    try:
+                        await create_all_jobs()
+                    except:
+                        submit_task.cancel()
+                        raise
+                    await submit_task
+                except:
+                    # the batch was created before its jobs, so do not leave
+                    # it open with only some of them
+                    try:
+                        await batch.delete()
+                        log.info(f'deleted batch {id} after failing to create its jobs')
+                    except Exception:
+                        log.exception(f'could not delete batch {id} after failing to create its jobs')
+                    raise
 
         await self._client._patch(f'/api/v1alpha/batches/{id}/close')
         log.info(f'closed batch {id}')
@@ -649,6 +787,26 @@ class BatchClient:
             self._session, 'GET',
             self.url + path, params=params, headers=self._headers)
 
+    async def _get_stream(self, path, params=None) -> aiohttp.ClientResponse:
+        # the body is read as it is streamed, so only reads time out
+        return await request_retry_transient_errors(
+            self._session, 'GET',
+            self.url + path, params=params, headers=self._headers,
+            timeout=aiohttp.ClientTimeout(total=None, sock_read=60))
+
+    async def _wait(self, path, params=None) -> Optional[aiohttp.ClientResponse]:
+        # None if the batch service does not have the endpoint
+        params = {**(params or {}), 'timeout': WAIT_TIMEOUT_SECS}
+        try:
+            return await request_retry_transient_errors(
+                self._session, 'GET',
+                self.url + path, params=params, headers=self._headers,
+                timeout=aiohttp.ClientTimeout(total=WAIT_TIMEOUT_SECS + 30))
+        except aiohttp.ClientResponseError as e:
+            if e.status == 404:
+                return None
+            raise
+
     async def _post(self, path, data=None, json=None):
         return await request_retry_transient_errors(
             self._session, 'POST',
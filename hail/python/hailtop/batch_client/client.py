@@ -159,6 +159,9 @@ class Batch:
     def jobs(self, q=None):
         return agen_to_blocking(self._async_batch.jobs(q=q))
 
+    def jobs_bulk(self, state=None):
+        return agen_to_blocking(self._async_batch.jobs_bulk(state=state))
+
     def get_job(self, job_id: int) -> Job:
         j = async_to_blocking(self._async_batch.get_job(job_id))
         return Job.from_async_job(j)
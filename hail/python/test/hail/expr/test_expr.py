@@ -40,6 +40,16 @@ class Tests(unittest.TestCase):
     def collect_unindexed_expression(self):
         self.assertEqual(hl.array([4,1,2,3]).collect(), [4,1,2,3])
 
+    def test_eval_many(self):
+        ht = hl.utils.range_table(10)
+        ht = ht.annotate_globals(x=5)
+        self.assertEqual(hl.eval_many(hl.sum(hl.range(10)), hl.str(5), ht.x + 1, hl.missing(hl.tint32),
+                                      parallelism=2),
+                         [45, '5', 6, None])
+        self.assertEqual(hl.eval_many(), [])
+        with self.assertRaises(ValueError):
+            hl.eval_many(hl.str(5), parallelism=0)
+
     def test_key_by_random(self):
         ht = hl.utils.range_table(10, 4)
         ht = ht.annotate(new_key=hl.rand_unif(0, 1))
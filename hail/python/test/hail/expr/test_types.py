@@ -1,5 +1,7 @@
 import unittest
 
+import numpy as np
+
 from hail.expr import coercer_from_dtype
 from hail.expr.types import *
 from ..helpers import *
@@ -142,3 +144,50 @@ class Tests(unittest.TestCase):
         for types, rgs in types_and_rgs:
             for t in types:
                 self.assertEqual(t.get_context().references, rgs)
+
+    @skip_when_service_backend('encodes through the JVM')
+    def test_bulk_decoder_matches_per_element_decoder(self):
+        from hail.experimental.codec import encode
+        from hail.utils.byte_reader import ByteReader
+
+        r = hl.range(3000)
+        exprs = [
+            create_all_values().drop('nd'),
+            r.map(lambda i: hl.or_missing(i % 7 != 0, i)),
+            r.map(lambda i: hl.int64(i)),
+            r.map(lambda i: hl.or_missing(i % 3 != 0, hl.float32(i) / 2)),
+            r.map(lambda i: hl.or_missing(i % 5 != 0, i % 2 == 0)),
+            r.map(lambda i: hl.or_missing(i % 5 != 0, hl.str(i))),
+            r.map(lambda i: hl.or_missing(i % 11 != 0, hl.struct(a=hl.or_missing(i % 13 != 0, i),
+                                                                 b=hl.float64(i),
+                                                                 c=i % 2 == 0))),
+            r.map(lambda i: hl.tuple([hl.int64(i), hl.or_missing(i != 2999, hl.float32(i))])),
+            r.map(lambda i: hl.struct(a=i, s=hl.str(i), l=hl.locus('1', i + 1))),
+            hl.dict(r.map(lambda i: (hl.str(i), hl.or_missing(i % 2 == 0, i)))),
+            hl.set(r),
+            hl.empty_array(hl.tstruct(a=hl.tint32)),
+            hl.nd.array([[1.0, 2.0, 3.0], [4.0, 5.0, 6.0]]),
+        ]
+        for expr in exprs:
+            t = expr.dtype
+            encoded = encode(expr)
+            bulk = t._from_encoding(encoded)
+            per_element = t._convert_from_encoding(ByteReader(memoryview(encoded)))
+            if isinstance(t, tndarray):
+                np.testing.assert_array_equal(bulk, per_element)
+            else:
+                self.assertEqual(bulk, per_element)
+
+    @skip_when_service_backend('encodes through the JVM')
+    def test_iter_from_encoding(self):
+        from hail.experimental.codec import encode
+
+        expr = hl.range(500).map(lambda i: hl.or_missing(i % 11 != 0, hl.struct(a=i, s=hl.str(i), r=hl.range(i % 7))))
+        t = expr.dtype
+        encoded = encode(expr)
+        expected = t._from_encoding(encoded)
+        for chunk_size in [1, 7, 1000, len(encoded)]:
+            chunks = (encoded[i:i + chunk_size] for i in range(0, len(encoded), chunk_size))
+            self.assertEqual(list(t._iter_from_encoding(chunks)), expected)
+        with self.assertRaises(ValueError):
+            list(t._iter_from_encoding([encoded[:-1]]))
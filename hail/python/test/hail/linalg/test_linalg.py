@@ -6,6 +6,8 @@ from hail.utils import local_path_uri, FatalError, HailUserError
 from ..helpers import *
 import numpy as np
 import math
+import os
+import tempfile
 from hail.expr.expressions import ExpressionException
 
 setUpModule = startTestHailContext
@@ -200,6 +202,26 @@ class Tests(unittest.TestCase):
 
         self._assert_eq(bm.to_numpy(_force_blocking=True), a)
 
+    @fails_service_backend()
+    @fails_local_backend()
+    def test_to_numpy_out(self):
+        a = np.arange(0, 60, dtype=np.float64).reshape((6, 10))
+        bm = BlockMatrix.from_numpy(a, block_size=4)
+
+        with tempfile.TemporaryDirectory() as d:
+            out = np.memmap(os.path.join(d, 'a'), dtype=np.float64, mode='w+', shape=(6, 10))
+            self.assertIs(bm.to_numpy(out=out), out)
+            self._assert_eq(np.array(out), a)
+
+            out[:] = 0
+            self.assertIs(bm.to_numpy(out=out, _force_blocking=True), out)
+            self._assert_eq(np.array(out), a)
+
+        with self.assertRaises(ValueError):
+            bm.to_numpy(out=np.zeros((10, 6)))
+        with self.assertRaises(ValueError):
+            bm.to_numpy(out=np.zeros((6, 10), dtype=np.float32))
+
     @fails_service_backend()
     @fails_local_backend()
     def test_to_table(self):
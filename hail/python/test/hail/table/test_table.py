@@ -639,6 +639,46 @@ https://hail.zulipchat.com/#narrow/stream/123011-Hail-Dev/topic/test_drop/near/2
 
         self.assertTrue(t._same(t2))
 
+    def test_to_pandas(self):
+        ht = hl.utils.range_table(5)
+        ht = ht.key_by(k=4 - ht.idx)
+        ht = ht.annotate(i64=hl.int64(ht.idx),
+                         mi=hl.or_missing(ht.idx % 2 == 0, ht.idx),
+                         f=hl.or_missing(ht.idx != 1, hl.float64(ht.idx) / 2),
+                         b=hl.or_missing(ht.idx != 3, ht.idx < 2),
+                         s=hl.or_missing(ht.idx != 0, hl.str(ht.idx)),
+                         a=hl.range(ht.idx),
+                         x=hl.struct(y=ht.idx))
+        df = ht.to_pandas()
+        assert list(df.columns) == ['idx', 'k', 'i64', 'mi', 'f', 'b', 's', 'a', 'x.y']
+        assert df['k'].tolist() == [0, 1, 2, 3, 4]
+        assert df['idx'].tolist() == [4, 3, 2, 1, 0]
+        assert df['i64'].dtype == 'int64'
+        assert df['mi'].tolist() == [4, pd.NA, 2, pd.NA, 0]
+        assert df['f'].isna().tolist() == [False, True, False, False, False]
+        assert df['f'].tolist()[0] == 2.0
+        assert df['b'].tolist() == [False, pd.NA, True, True, True]
+        assert df['s'].tolist() == ['4', '3', '2', '1', None]
+        assert df['a'].tolist() == [[0, 1, 2, 3], [0, 1, 2], [0, 1], [0], []]
+        assert df['x.y'].tolist() == [4, 3, 2, 1, 0]
+
+    def test_to_pandas_collects_in_chunks(self):
+        ht = hl.utils.range_table(10, n_partitions=4)
+        ht = ht.annotate(mi=hl.or_missing(ht.idx != 7, ht.idx), s=hl.str(ht.idx))
+        ht = ht.filter(ht.idx < 3, keep=False)
+        columns = ht._collect_columns(max_chunk_values=6)
+        assert columns.idx.tolist() == list(range(3, 10))
+        assert columns.mi.tolist() == [3, 4, 5, 6, None, 8, 9]
+        assert columns.s.tolist() == [str(i) for i in range(3, 10)]
+
+    def test_collect_iterate(self):
+        ht = hl.utils.range_table(10)
+        ht = ht.annotate(s=hl.str(ht.idx))
+        rows = ht.collect(_iterate=True)
+        assert not isinstance(rows, list)
+        assert list(rows) == ht.collect()
+        assert list(ht.take(3, _iterate=True)) == ht.take(3)
+
     def test_rename(self):
         kt = hl.utils.range_table(10)
         kt = kt.annotate_globals(foo=5, fi=3)
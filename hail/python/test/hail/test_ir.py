@@ -1,7 +1,7 @@
 import unittest
 import hail as hl
 import hail.ir as ir
-from hail.ir.renderer import CSERenderer
+from hail.ir.renderer import CSERenderer, PlainRenderer
 from hail.expr import construct_expr
 from hail.expr.types import tint32
 from hail.utils.java import Env
@@ -506,3 +506,40 @@ class CSETests(unittest.TestCase):
                     ' (bar (GetField idx (Ref row)))))'
         )
         assert expected == CSERenderer()(x)
+
+
+class RenderCacheTests(unittest.TestCase):
+    def test_cached_rendering_matches_uncached(self):
+        x = ir.I32(5)
+        sum = ir.ApplyBinaryPrimOp('+', x, x)
+        s = ir.MakeStruct([('a', sum), ('b', ir.MakeArray([sum, ir.I32(1)], None))])
+        # renderers stopping at JVM IRs never use the cache
+        expected = PlainRenderer(stop_at_jir=True)(s)
+        # render a shared subtree first, so the root reuses its cached rendering
+        assert str(sum) == PlainRenderer(stop_at_jir=True)(sum)
+        assert str(s) == expected
+        assert str(s) == expected
+        assert s._structural_hash() == s.copy(*s.children)._structural_hash()
+
+    def test_cse_rendering_is_cached(self):
+        x = ir.I32(5)
+        x = ir.ApplyBinaryPrimOp('+', x, x)
+        rendered = CSERenderer()(x)
+        assert x._cse_render_str == rendered
+        assert CSERenderer()(x) is rendered
+        assert x.copy(*x.children)._cse_render_str is None
+
+    def test_inferred_type_is_rendered(self):
+        a = ir.MakeArray([ir.I32(1)], None)
+        s = ir.MakeStruct([('a', a)])
+        before = str(s)
+        cse_before = CSERenderer()(s)
+        assert s.typ == hl.tstruct(a=hl.tarray(hl.tint32))
+        # renderings from before the type was inferred are not reused
+        assert str(s) == PlainRenderer(stop_at_jir=True)(s) != before
+        assert 'Array[Int32]' in CSERenderer()(s) and 'Array[Int32]' not in cse_before
+        assert s._structural_hash() == s.copy(*s.children)._structural_hash()
+
+    def test_wide_ir(self):
+        x = ir.MakeArray([ir.I32(i) for i in range(10_000)], hl.tarray(hl.tint32))
+        assert str(x) == PlainRenderer(stop_at_jir=True)(x)
@@ -6,3 +6,37 @@ from .helpers import *
 class Tests(unittest.TestCase):
     def test_get_reference_before_init(self):
         hl.get_reference('GRCh37') # Should be no error
+
+    def test_service_type_cache(self):
+        import os
+        import tempfile
+        from hail.backend.service_backend import TypeCache, _type_files
+
+        cache = TypeCache(max_size=2, version='0.2.1')
+        irs = [hl.ir.I32(i) for i in range(3)]
+        for i, ir in enumerate(irs):
+            cache.put(cache.key(ir, 'value'), f'int32 {i}')
+        self.assertEqual(len(cache), 2)
+        self.assertIsNone(cache.get(cache.key(irs[0], 'value')))
+        self.assertEqual(cache.get(cache.key(hl.ir.I32(1), 'value')), 'int32 1')
+        self.assertIsNone(cache.get(cache.key(irs[1], 'table')))
+        self.assertNotEqual(cache.key(irs[1], 'value', ['1']), cache.key(irs[1], 'value', ['2']))
+
+        with tempfile.TemporaryDirectory() as d:
+            path = os.path.join(d, 'types.json')
+            cache.save(path)
+            loaded = TypeCache(version='0.2.1')
+            loaded.load(path)
+            self.assertEqual(loaded.get(loaded.key(irs[2], 'value')), 'int32 2')
+            self.assertEqual(len(loaded), 2)
+
+            # types of other versions of Hail are not loaded
+            other_version = TypeCache(version='0.2.2')
+            other_version.load(path)
+            self.assertEqual(len(other_version), 0)
+
+        native = hl.ir.TableRead(hl.ir.TableNativeReader('/data/t.ht', None, False))
+        self.assertEqual(_type_files(native), ['/data/t.ht/metadata.json.gz'])
+        text = hl.ir.TableRead(hl.ir.StringTableReader('/data/t.txt', None))
+        self.assertIsNone(_type_files(text))
+        self.assertEqual(_type_files(irs[0]), [])
@@ -143,6 +143,28 @@ class Tests(unittest.TestCase):
         with self.assertRaisesRegex(Exception, "FileNotFound"):
             hl.hadoop_ls('a_file_that_does_not_exist')
 
+    def test_hadoop_ls_recursive(self):
+        ls = hl.hadoop_ls(resource('ls_test'), recursive=True)
+        ls_dict = {x['path'].split("/")[-1]: x for x in ls}
+        self.assertEqual(set(ls_dict), {'f_50', 'f_100', 'f_0'})
+        self.assertEqual(ls_dict['f_100']['size_bytes'], 100)
+        self.assertTrue(all(not x['is_dir'] for x in ls))
+
+    def test_hadoop_stat_many(self):
+        stats = hl.hadoop_stat([resource('ls_test/f_50'), resource('ls_test/f_100'), resource('ls_test')])
+        self.assertEqual([stat['size_bytes'] for stat in stats[:2]], [50, 100])
+        self.assertTrue(stats[2]['is_dir'])
+
+    def test_hadoop_copy_many(self):
+        with hl.TemporaryDirectory() as d:
+            hl.hadoop_copy([resource('ls_test/f_50'), resource('ls_test/f_100')],
+                           [f'{d}/f_50', f'{d}/f_100'])
+            self.assertEqual([stat['size_bytes'] for stat in hl.hadoop_stat([f'{d}/f_50', f'{d}/f_100'])],
+                             [50, 100])
+
+        with self.assertRaises(ValueError):
+            hl.hadoop_copy([resource('ls_test/f_50')], 'dest')
+
     def test_linked_list(self):
         ll = LinkedList(int)
         self.assertEqual(list(ll), [])
@@ -140,6 +140,35 @@ def test_combiner_run():
     assert hl.vds.read_vds(final_path_1)._same(hl.vds.read_vds(final_path_2))
 
 
+@fails_local_backend
+@fails_service_backend
+def test_combiner_run_concurrent_writes():
+    tmpdir = new_temp_file()
+    samples = all_samples[:5]
+
+    input_paths = [resource(os.path.join('gvcfs', '1kg_chr22', f'{s}.hg38.g.vcf.gz')) for s in samples]
+    final_path_1 = os.path.join(tmpdir, 'final1.vds')
+    final_path_2 = os.path.join(tmpdir, 'final2.vds')
+
+    parts = hl.eval([hl.parse_locus_interval('chr22:start-end', reference_genome='GRCh38')])
+
+    combiner = hl.vds.new_combiner(output_path=final_path_1, intervals=parts, temp_path=tmpdir,
+                                   gvcf_paths=input_paths,
+                                   reference_genome='GRCh38',
+                                   branch_factor=2, batch_size=2)
+    combiner.run()
+
+    combiner2 = hl.vds.new_combiner(output_path=final_path_2, intervals=parts, temp_path=tmpdir,
+                                    gvcf_paths=input_paths,
+                                    reference_genome='GRCh38',
+                                    branch_factor=2, batch_size=2, force=True)
+    combiner2.run(concurrent_writes=2)
+    assert combiner2.finished
+    assert load_combiner(combiner2.save_path).finished
+
+    assert hl.vds.read_vds(final_path_1)._same(hl.vds.read_vds(final_path_2))
+
+
 @fails_local_backend
 @fails_service_backend
 def test_combiner_manual_filtration():
@@ -0,0 +1,46 @@
+import os
+import pytest
+
+from hailtop.aiotools import LocalAsyncFS, StagingCache
+from hailtop.aiotools.staging_cache import evict_least_recently_used
+
+
+pytestmark = pytest.mark.asyncio
+
+
+async def test_stage_local_file(tmp_path):
+    src = tmp_path / 'src'
+    src.write_bytes(b'abc')
+
+    async with LocalAsyncFS() as fs:
+        cache = StagingCache(fs, str(tmp_path / 'cache'), 1024)
+        assert await cache.stage(str(src), str(tmp_path / 'a' / 'dest')) is False
+        assert await cache.stage(str(src), str(tmp_path / 'b' / 'dest')) is True
+        assert (tmp_path / 'b' / 'dest').read_bytes() == b'abc'
+        assert cache.hit_rate() == 0.5
+        assert cache.n_bytes_hit == 3
+
+        # changing a staged file does not change the cached file
+        (tmp_path / 'b' / 'dest').write_bytes(b'xyz')
+        assert await cache.stage(str(src), str(tmp_path / 'f' / 'dest')) is True
+        assert (tmp_path / 'f' / 'dest').read_bytes() == b'abc'
+
+        # a changed file is a new version
+        src.write_bytes(b'abcd')
+        os.utime(src, ns=(0, 0))
+        assert await cache.stage(str(src), str(tmp_path / 'c' / 'dest')) is False
+        assert (tmp_path / 'c' / 'dest').read_bytes() == b'abcd'
+
+        assert await cache.stage(str(tmp_path), str(tmp_path / 'd' / 'dest')) is None
+        assert await cache.stage(str(tmp_path / 'does-not-exist'), str(tmp_path / 'e' / 'dest')) is None
+
+
+async def test_evict_least_recently_used(tmp_path):
+    for i, name in enumerate(['old', 'middle', 'new']):
+        path = tmp_path / name
+        path.write_bytes(b'x' * 10)
+        os.utime(path, ns=(i, i))
+
+    assert evict_least_recently_used(str(tmp_path), 20) == 10
+    assert sorted(os.listdir(tmp_path)) == ['middle', 'new']
+    assert evict_least_recently_used(str(tmp_path), 20) == 0
@@ -6,6 +6,7 @@ import tempfile
 from shlex import quote as shq
 import uuid
 import re
+import numpy as np
 
 from hailtop.batch import Batch, ServiceBackend, LocalBackend
 from hailtop.batch.exceptions import BatchException
@@ -388,11 +389,59 @@ class LocalTests(unittest.TestCase):
             res = b.run()
             assert self.read(output_file.name) == '3\n5\n30\n{\"x\": 3, \"y\": 5}'
 
+    def test_python_job_shares_function_and_argument_uploads(self):
+        with tempfile.NamedTemporaryFile('w') as output_file:
+            b = self.batch()
+            data = np.zeros(100_000)
+
+            def count(data, x):
+                return int((data == x).sum())
+
+            j1 = b.new_python_job()
+            r1 = j1.call(count, data, 0)
+            j2 = b.new_python_job()
+            r2 = j2.call(count, data, 1)
+
+            tail = b.new_job()
+            tail.command(f'cat {r1.as_str()} {r2.as_str()} > {tail.ofile}')
+            b.write_output(tail.ofile, output_file.name)
+            b.run()
+
+            # one upload each for the function and the argument, pickled once
+            assert len(b._python_blobs) == 2
+            assert len(b._python_serializations) == 4
+            assert self.read(output_file.name) == '100000\n0'
+
     def test_backend_context_manager(self):
         with LocalBackend() as backend:
             b = Batch(backend=backend)
             b.run()
 
+    def test_independent_jobs_run_concurrently(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            b = Batch(backend=LocalBackend(cores=2))
+            for name, other in [('a', 'b'), ('b', 'a')]:
+                j = b.new_job(name)
+                j.command(f'touch {tmpdir}/{name}')
+                j.command(f'for i in $(seq 100); do test -e {tmpdir}/{other} && break; sleep 0.1; done')
+                j.command(f'test -e {tmpdir}/{other}')
+            b.run()
+
+    def test_failed_job_cancels_dependent_jobs(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            b = Batch(backend=LocalBackend(cores=2))
+            failing = b.new_job('failing')
+            failing.command('exit 1')
+            dependent = b.new_job('dependent')
+            dependent.depends_on(failing)
+            dependent.command(f'touch {tmpdir}/dependent')
+            independent = b.new_job('independent')
+            independent.command(f'touch {tmpdir}/independent')
+            with self.assertRaises(sp.CalledProcessError):
+                b.run()
+            assert not os.path.exists(f'{tmpdir}/dependent')
+            assert os.path.exists(f'{tmpdir}/independent')
+
 
 class ServiceTests(unittest.TestCase):
     def setUp(self):
@@ -883,3 +932,45 @@ class ServiceTests(unittest.TestCase):
         long_str = secrets.token_urlsafe(15 * 1024)
         j1.command(f'echo "{long_str}"')
         b.run()
+
+    def test_many_jobs_submitted_while_compiling(self):
+        b = self.batch(default_python_image=PYTHON_DILL_IMAGE)
+        tails = []
+        for i in range(10):
+            prev = None
+            for k in range(30):
+                j = b.new_job(f'{i}-{k}')
+                if prev is None:
+                    j.command(f'echo "{i}" > {j.ofile}')
+                else:
+                    j.command(f'cat {prev.ofile} > {j.ofile}')
+                prev = j
+            tails.append(prev)
+
+        def add(*xs):
+            return sum(int(open(x).read()) for x in xs)
+
+        p = b.new_python_job()
+        total = p.call(add, *[tail.ofile for tail in tails])
+        summary = b.new_job()
+        summary.command(f'cat {total.as_str()}')
+
+        res = b.run()
+        res_status = res.status()
+        assert res_status['state'] == 'success', str((res_status, res.debug_info()))
+        assert res.get_job_log(res_status['n_jobs'] - 1)['main'] == '45\n', str(res.debug_info())
+
+    def test_compile_failure_deletes_batch(self):
+        token = secrets.token_urlsafe(16)
+        b = Batch(backend=self.backend,
+                  default_image=DOCKER_ROOT_IMAGE,
+                  attributes={'compile_failure': token},
+                  default_python_image=PYTHON_DILL_IMAGE)
+        b.new_job().command('true')
+        unpicklable = (x for x in range(3))
+        p = b.new_python_job()
+        p.call(lambda xs: list(xs), unpicklable)
+        with self.assertRaises(Exception):
+            b.run()
+        batches = list(self.backend._batch_client.list_batches(q=f'compile_failure={token}'))
+        assert batches == [], str([b.id for b in batches])
@@ -135,6 +135,46 @@ def test_map_chunksize(backend):
         0,  4,  8, 12, 16]
 
 
+def test_map_unordered(backend):
+    with BatchPoolExecutor(backend=backend, project='hail-vdc', image=PYTHON_DILL_IMAGE) as bpe:
+        actual = list(bpe.map(lambda x: x * 3, range(20), chunksize=3, ordered=False))
+    assert sorted(actual) == [x * 3 for x in range(20)]
+
+
+def test_map_buffersize(backend):
+    def args():
+        for x in range(20):
+            yield x
+
+    with BatchPoolExecutor(backend=backend, project='hail-vdc', image=PYTHON_DILL_IMAGE) as bpe:
+        actual = list(bpe.map(lambda x: x + 1, args(), buffersize=4))
+    assert actual == list(range(1, 21))
+
+
+def test_map_adaptive_chunksize(backend):
+    with BatchPoolExecutor(backend=backend, project='hail-vdc', image=PYTHON_DILL_IMAGE) as bpe:
+        actual = list(bpe.map(lambda x: x * x, range(1000)))
+    assert actual == [x * x for x in range(1000)]
+
+
+def test_map_adaptive_chunksize_submits_eagerly(backend):
+    n_read = 0
+
+    def args():
+        nonlocal n_read
+        for i in range(100):
+            n_read += 1
+            yield i
+
+    with BatchPoolExecutor(backend=backend, project='hail-vdc', image=PYTHON_DILL_IMAGE) as bpe:
+        results = bpe.map(lambda x: x + 1, args())
+        # every input was read and submitted before map returned
+        assert n_read == 100
+        results = list(results)
+    assert len(results) == 100
+    assert results == list(range(1, 101))
+
+
 def test_map_timeout(backend):
     with BatchPoolExecutor(backend=backend, project='hail-vdc', image=PYTHON_DILL_IMAGE) as bpe:
         def sleep_forever():
@@ -195,6 +195,33 @@ async def test_write_read_range(filesystem, file_data):
     assert expected == actual
 
 
+@pytest.mark.asyncio
+async def test_open_read_ahead(filesystem):
+    sema, fs, base = filesystem
+
+    file = f'{base}foo'
+    data = secrets.token_bytes(1_000)
+    await fs.write(file, data)
+
+    async with await fs.open_read_ahead(file, 10, block_size=64, window=3, max_cached_blocks=2) as f:
+        assert await f.read(100) == data[10:110]
+        assert f.tell() == 110
+        assert await f.read() == data[110:]
+        assert await f.read() == b''
+
+        f.seek(-5, os.SEEK_END)
+        try:
+            await f.readexactly(6)
+        except UnexpectedEOFError:
+            pass
+        else:
+            assert False
+        assert await f.readexactly(5) == data[-5:]
+
+        f.seek(63)
+        assert await f.readexactly(2) == data[63:65]
+
+
 @pytest.mark.asyncio
 async def test_isfile(filesystem):
     sema, fs, base = filesystem
@@ -1,5 +1,6 @@
 package is.hail.annotations
 
+import is.hail.backend.service.JVMEntryway
 import is.hail.expr.ir.LongArrayBuilder
 import is.hail.utils._
 
@@ -16,13 +17,12 @@ object RegionPool {
 
   def scoped[T](f: RegionPool => T): T = using(RegionPool(false))(f)
 
-  lazy val maxRegionPoolSize: Long = {
-    val s = System.getenv("HAIL_WORKER_OFF_HEAP_MEMORY_PER_CORE_MB")
-    if (s != null && s.nonEmpty)
-      s.toLong * 1024 * 1024
-    else
-      Long.MaxValue
-  }
+  // read for each pool, as a pooled JVM runs jobs with different environments
+  def maxRegionPoolSize: Long =
+    JVMEntryway.getenv("HAIL_WORKER_OFF_HEAP_MEMORY_PER_CORE_MB") match {
+      case Some(s) if s.nonEmpty => s.toLong * 1024 * 1024
+      case _ => Long.MaxValue
+    }
 }
 
 final class RegionPool private(strictMemoryCheck: Boolean, threadName: String, threadID: Long) extends AutoCloseable {
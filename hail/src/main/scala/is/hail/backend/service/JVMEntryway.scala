@@ -0,0 +1,131 @@
+package is.hail.backend.service
+
+import java.io._
+import java.lang.reflect.InvocationTargetException
+import java.net._
+import java.nio.charset.StandardCharsets
+import java.security.SecureRandom
+
+import org.apache.log4j.{ConsoleAppender, Logger}
+
+import scala.collection.mutable
+
+// A JVM started ahead of the jobs it runs. The batch worker starts it,
+// reads "<port> <token>" from its standard output and connects to the port
+// on the loopback interface, sending the token. It then sends jobs, one at a
+// time, as
+//
+//   int nEnv, nEnv * (string key, string value), string logFile, int nArgs, nArgs * string
+//
+// where a string is an int length followed by that many bytes of UTF-8 and
+// the first argument is the main class. The job's environment overrides the
+// JVM's environment for `getenv`, its standard output and error, including
+// log4j console output, go to `logFile`, and the exit code, 0 if the main
+// method returned and 1 if it threw, is sent back as an int.
+object JVMEntryway {
+  private[this] val log = Logger.getLogger(getClass.getName())
+
+  @volatile private[this] var jobEnv: Map[String, String] = Map()
+
+  // The environment of the running job, falling back to that of the JVM.
+  def getenv(name: String): Option[String] =
+    jobEnv.get(name).orElse(sys.env.get(name))
+
+  private[this] def readString(in: DataInputStream): String = {
+    val bytes = new Array[Byte](in.readInt())
+    in.readFully(bytes)
+    new String(bytes, StandardCharsets.UTF_8)
+  }
+
+  private[this] def followSystemStreams(): Unit = {
+    val appenders = Logger.getRootLogger.getAllAppenders
+    while (appenders.hasMoreElements) {
+      appenders.nextElement() match {
+        case appender: ConsoleAppender =>
+          appender.setFollow(true)
+          appender.activateOptions()
+        case _ =>
+      }
+    }
+  }
+
+  private[this] def runJob(env: Map[String, String], logFile: String, args: Array[String]): Int = {
+    val stdout = System.out
+    val stderr = System.err
+    val out = new PrintStream(new FileOutputStream(logFile, true), true)
+    jobEnv = env
+    System.setOut(out)
+    System.setErr(out)
+    try {
+      val main = Class.forName(args(0)).getMethod("main", classOf[Array[String]])
+      Console.withOut(out) {
+        Console.withErr(out) {
+          main.invoke(null, args.drop(1))
+        }
+      }
+      0
+    } catch {
+      case e: InvocationTargetException =>
+        e.getCause.printStackTrace()
+        1
+      case e: Exception =>
+        e.printStackTrace()
+        1
+    } finally {
+      out.flush()
+      System.setOut(stdout)
+      System.setErr(stderr)
+      jobEnv = Map()
+      out.close()
+    }
+  }
+
+  def main(args: Array[String]): Unit = {
+    followSystemStreams()
+
+    val tokenBytes = new Array[Byte](16)
+    new SecureRandom().nextBytes(tokenBytes)
+    val token = tokenBytes.map("%02x".format(_)).mkString
+
+    val server = new ServerSocket(0, 1, InetAddress.getLoopbackAddress)
+    println(s"${ server.getLocalPort } $token")
+    System.out.flush()
+
+    val socket = try {
+      server.accept()
+    } finally {
+      server.close()
+    }
+    socket.setTcpNoDelay(true)
+    val in = new DataInputStream(new BufferedInputStream(socket.getInputStream))
+    val out = new DataOutputStream(new BufferedOutputStream(socket.getOutputStream))
+    if (readString(in) != token) {
+      log.error("connection with an invalid token, exiting")
+      System.exit(1)
+    }
+
+    var nJobs = 0
+    while (true) {
+      val nEnv = try {
+        in.readInt()
+      } catch {
+        case _: EOFException =>
+          log.info(s"worker disconnected after $nJobs jobs, exiting")
+          System.exit(0)
+          throw new AssertionError()
+      }
+      val env = mutable.Map[String, String]()
+      (0 until nEnv).foreach { _ =>
+        val key = readString(in)
+        env(key) = readString(in)
+      }
+      val logFile = readString(in)
+      val jobArgs = Array.fill(in.readInt())(readString(in))
+
+      val exitCode = runJob(env.toMap, logFile, jobArgs)
+      nJobs += 1
+      out.writeInt(exitCode)
+      out.flush()
+    }
+  }
+}
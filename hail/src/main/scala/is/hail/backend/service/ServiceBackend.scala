@@ -7,11 +7,13 @@ import is.hail.backend.{Backend, BackendContext, BroadcastValue, ExecuteContext,
 import is.hail.expr.JSONAnnotationImpex
 import is.hail.expr.ir.lowering._
 import is.hail.expr.ir.{Compile, IR, IRParser, MakeTuple, SortField}
+import is.hail.io.{BufferSpec, TypedCodecSpec}
 import is.hail.io.fs.{FS, GoogleStorageFS}
 import is.hail.linalg.BlockMatrix
 import is.hail.services._
 import is.hail.services.batch_client.BatchClient
 import is.hail.types._
+import is.hail.types.encoded.EType
 import is.hail.types.physical._
 import is.hail.types.physical.stypes.PTypeReferenceSingleCodeType
 import is.hail.types.virtual._
@@ -225,7 +227,7 @@ class ServiceBackend(
     ReferenceGenome.getReference(name).toJSONString
   }
 
-  private[this] def execute(ctx: ExecuteContext, _x: IR): Option[(Annotation, PType)] = {
+  private[this] def executeToOffset(ctx: ExecuteContext, _x: IR): Option[(PTuple, Long)] = {
     val x = LoweringPipeline.darrayLowerer(true)(DArrayLowering.All).apply(ctx, _x)
       .asInstanceOf[IR]
     if (x.typ == TVoid) {
@@ -245,11 +247,15 @@ class ServiceBackend(
         optimize = true)
 
       val a = f(ctx.fs, 0, ctx.r)(ctx.r)
-      val retPType = pt.asInstanceOf[PBaseStruct]
-      Some((new UnsafeRow(retPType, ctx.r, a).get(0), retPType.types(0)))
+      Some((pt.asInstanceOf[PTuple], a))
     }
   }
 
+  private[this] def execute(ctx: ExecuteContext, _x: IR): Option[(Annotation, PType)] =
+    executeToOffset(ctx, _x).map { case (retPType, a) =>
+      (new UnsafeRow(retPType, ctx.r, a).get(0), retPType.types(0))
+    }
+
   def execute(username: String, sessionID: String, billingProject: String, bucket: String, code: String, token: String): String = {
     ExecutionTimer.logTime("ServiceBackend.execute") { timer =>
       userContext(username, timer) { ctx =>
@@ -269,6 +275,41 @@ class ServiceBackend(
     }
   }
 
+  def executeEncode(
+    username: String,
+    sessionID: String,
+    billingProject: String,
+    bucket: String,
+    code: String,
+    token: String,
+    bufferSpecString: String,
+    writeType: String => Unit,
+    out: OutputStream
+  ): Unit = {
+    ExecutionTimer.logTime("ServiceBackend.executeEncode") { timer =>
+      userContext(username, timer) { ctx =>
+        log.info(s"executing: ${token}")
+        ctx.backendContext = new ServiceBackendContext(username, sessionID, billingProject, bucket)
+
+        executeToOffset(ctx, IRParser.parse_value_ir(ctx, code)) match {
+          case Some((t, off)) =>
+            val elementType = t.types(0)
+            val codec = TypedCodecSpec(
+              EType.fromTypeAllOptional(elementType.virtualType), elementType.virtualType,
+              BufferSpec.parseOrDefault(bufferSpecString))
+            assert(t.isFieldDefined(off, 0))
+            writeType(elementType.virtualType.toString)
+            // encode into out as the result is read, rather than into an array
+            val enc = codec.buildEncoder(ctx, elementType)(out)
+            enc.writeRegionValue(t.loadField(off, 0))
+            enc.flush()
+          case None =>
+            writeType(TVoid.toString)
+        }
+      }
+    }
+  }
+
   def flags(): String = {
     JsonMethods.compact(JObject(HailContext.get.flags.available.toArray().map { case f: String =>
       val v = HailContext.getFlag(f)
@@ -346,8 +387,11 @@ class ServiceBackendSocketAPI(backend: ServiceBackend, socket: Socket) extends T
   private[this] val UNSET_FLAG = 10
   private[this] val SET_FLAG = 11
   private[this] val ADD_USER = 12
+  private[this] val EXECUTE_ENCODE = 13
   private[this] val GOODBYE = 254
 
+  private[this] val RESULT_CHUNK_SIZE = 1024 * 1024
+
   private[this] val in = socket.getInputStream
   private[this] val out = socket.getOutputStream
 
@@ -406,6 +450,45 @@ class ServiceBackendSocketAPI(backend: ServiceBackend, socket: Socket) extends T
 
   def writeString(s: String): Unit = writeBytes(s.getBytes(StandardCharsets.UTF_8))
 
+  // Writes the bytes written to it to the socket as chunks of at most
+  // chunkSize bytes, each preceded by its length. It does not close the socket.
+  private[this] class ChunkedOutputStream(chunkSize: Int) extends OutputStream {
+    private[this] val buf = new Array[Byte](chunkSize)
+    private[this] var n = 0
+
+    override def write(b: Int): Unit = {
+      if (n == chunkSize)
+        writeChunk()
+      buf(n) = b.toByte
+      n += 1
+    }
+
+    override def write(b: Array[Byte], off: Int, len: Int): Unit = {
+      var i = 0
+      while (i < len) {
+        if (n == chunkSize)
+          writeChunk()
+        val k = math.min(len - i, chunkSize - n)
+        System.arraycopy(b, off + i, buf, n, k)
+        n += k
+        i += k
+      }
+    }
+
+    private[this] def writeChunk(): Unit = {
+      if (n > 0) {
+        writeInt(n)
+        out.write(buf, 0, n)
+        n = 0
+      }
+    }
+
+    def finish(): Unit = {
+      writeChunk()
+      writeInt(0)
+    }
+  }
+
   def eventLoop(): Unit = {
     var continue = true
     while (continue) {
@@ -509,6 +592,37 @@ class ServiceBackendSocketAPI(backend: ServiceBackend, socket: Socket) extends T
               writeString(formatException(t))
           }
 
+        case EXECUTE_ENCODE =>
+          val username = readString()
+          val sessionId = readString()
+          val billingProject = readString()
+          val bucket = readString()
+          val code = readString()
+          val token = readString()
+          val bufferSpecString = readString()
+          // the result follows the type as length-prefixed chunks, ending
+          // with an empty chunk, or with -1 and the error if encoding fails
+          val chunks = new ChunkedOutputStream(RESULT_CHUNK_SIZE)
+          var started = false
+          try {
+            backend.executeEncode(username, sessionId, billingProject, bucket, code, token, bufferSpecString,
+              { typ =>
+                writeBool(true)
+                writeString(typ)
+                started = true
+              },
+              chunks)
+            chunks.finish()
+          } catch {
+            case t: Throwable =>
+              if (started) {
+                writeInt(-1)
+              } else {
+                writeBool(false)
+              }
+              writeString(formatException(t))
+          }
+
         case FLAGS =>
           try {
             val result = backend.flags()
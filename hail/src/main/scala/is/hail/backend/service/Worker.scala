@@ -46,9 +46,10 @@ class WorkerTimer() {
 object Worker {
   private[this] val log = Logger.getLogger(getClass.getName())
   private[this] val myRevision = HAIL_REVISION
-  private[this] val scratchDir = sys.env.get("HAIL_WORKER_SCRATCH_DIR").getOrElse("")
 
   def main(args: Array[String]): Unit = {
+    // read per job, as a JVMEntryway runs many jobs
+    val scratchDir = JVMEntryway.getenv("HAIL_WORKER_SCRATCH_DIR").getOrElse("")
     if (args.length != 4) {
       throw new IllegalArgumentException(s"expected at least four arguments, not: ${ args.length }")
     }
@@ -98,7 +99,7 @@ object Worker {
     timer.end("readInputs")
     timer.start("executeFunction")
 
-    val hailContext = HailContext(
+    val hailContext = HailContext.getOrCreate(
       // FIXME: workers should not have backends, but some things do need hail contexts
       new ServiceBackend(null), skipLoggingConfiguration = true, quiet = true)
     val htc = new ServiceTaskContext(i)
@@ -124,6 +124,37 @@ object BlockMatrix {
     BlockMatrix(gp, (gp, pi) => (gp.blockCoordinates(pi), localBlocksBc(pi).value))
   }
 
+  // reads a file of doubles in row-major order one block row at a time, so the
+  // matrix need not fit in a single array
+  def fromDoublesFile(fs: FS, path: String, nRows: Long, nCols: Long, blockSize: Int): M = {
+    val gp = GridPartitioner(blockSize, nRows, nCols)
+    require(gp.blockRowNRows(0) * nCols <= Int.MaxValue,
+      s"Number of values in a block row exceeds Int.MaxValue: ${ gp.blockRowNRows(0) * nCols }")
+
+    val localBlocksBc = new Array[BroadcastValue[BDM[Double]]](gp.nBlocks)
+    using(fs.open(path)) { is =>
+      val in = new DoubleInputBuffer(is, RichArray.defaultBufSize)
+      var i = 0
+      while (i < gp.nBlockRows) {
+        val blockRowNRows = gp.blockRowNRows(i)
+        val data = new Array[Double](blockRowNRows * nCols.toInt)
+        in.readDoubles(data)
+        val blockRow = RichDenseMatrixDouble(blockRowNRows, nCols.toInt, data, isTranspose = true)
+
+        var j = 0
+        while (j < gp.nBlockCols) {
+          val jOffset = j * blockSize
+          localBlocksBc(gp.coordinatesBlock(i, j)) =
+            HailContext.backend.broadcast(blockRow(::, jOffset until jOffset + gp.blockColNCols(j)).copy)
+          j += 1
+        }
+        i += 1
+      }
+    }
+
+    BlockMatrix(gp, (gp, pi) => (gp.blockCoordinates(pi), localBlocksBc(pi).value))
+  }
+
   def fromIRM(irm: IndexedRowMatrix): M =
     fromIRM(irm, defaultBlockSize)
 
@@ -3,6 +3,7 @@ package is.hail.services
 import java.io.{File, FileInputStream}
 import java.net._
 
+import is.hail.backend.service.JVMEntryway
 import is.hail.utils._
 import is.hail.services.tls._
 import org.json4s._
@@ -21,7 +22,7 @@ object DeployConfig {
     var file = file0
 
     if (file == null)
-      file = System.getenv("HAIL_DEPLOY_CONFIG_FILE")
+      file = JVMEntryway.getenv("HAIL_DEPLOY_CONFIG_FILE").orNull
 
     if (file == null) {
       val fromHome = s"${ System.getenv("HOME") }/.hail/deploy-config.json"
@@ -1,5 +1,6 @@
 package is.hail.services
 
+import is.hail.backend.service.JVMEntryway
 import is.hail.utils._
 import java.io.{File, FileInputStream}
 
@@ -27,7 +28,7 @@ object Tokens {
   }
 
   def getTokensFile(): String = {
-    val file = System.getenv("HAIL_TOKENS_FILE")
+    val file = JVMEntryway.getenv("HAIL_TOKENS_FILE").orNull
     if (file != null)
       file
     else if (DeployConfig.get.location == "external")
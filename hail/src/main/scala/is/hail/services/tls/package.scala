@@ -1,5 +1,6 @@
 package is.hail.services
 
+import is.hail.backend.service.JVMEntryway
 import is.hail.utils._
 import org.json4s.{DefaultFormats, Formats}
 import java.io.{File, FileInputStream}
@@ -32,7 +33,7 @@ package object tls {
   lazy val log: Logger = LogManager.getLogger("is.hail.tls")
 
   private[this] lazy val _getSSLConfig: SSLConfig = {
-    var configDir = System.getenv("HAIL_SSL_CONFIG_DIR")
+    var configDir = JVMEntryway.getenv("HAIL_SSL_CONFIG_DIR").orNull
     if (configDir == null)
       configDir = "/ssl-config"
     val configFile = s"$configDir/ssl-config.json"
@@ -10,6 +10,7 @@ import is.hail.expr.ir.{CompileAndEvaluate, GetField, TableCollect, TableLiteral
 import is.hail.types.virtual.{TFloat64, TInt64, TStruct}
 import is.hail.linalg.BlockMatrix.ops._
 import is.hail.utils._
+import is.hail.utils.richUtils.RichDenseMatrixDouble
 import is.hail.{HailSuite, TestUtils}
 import org.apache.spark.sql.Row
 import org.testng.annotations.Test
@@ -383,6 +384,20 @@ class BlockMatrixSuite extends HailSuite {
     assert(m.toBreezeMatrix() == BlockMatrix.read(fs, fname2).toBreezeMatrix())
   }
 
+  @Test
+  def fromDoublesFile() {
+    val lm = new BDM[Double](5, 7, (0 until 35).map(_.toDouble).toArray)
+
+    val fname = ctx.createTmpPath("test")
+    RichDenseMatrixDouble.exportToDoubles(fs, fname, lm, forceRowMajor = true)
+
+    for (blockSize <- Seq(1, 2, 3, 5, 8)) {
+      val m = BlockMatrix.fromDoublesFile(fs, fname, 5, 7, blockSize)
+      assert(m.blockSize == blockSize)
+      assert(m.toBreezeMatrix() == lm)
+    }
+  }
+
   @Test
   def readWriteIdentityTrivialTransposed() {
     val m = toBM(4, 4, Array[Double](
@@ -6,7 +6,9 @@ import concurrent
 import logging
 import uvloop
 import asyncio
+import json
 import signal
+import aiohttp
 from aiohttp import web
 import kubernetes_asyncio as kube
 from prometheus_async.aio.web import server_stats  # type: ignore
@@ -31,6 +33,10 @@ DEFAULT_NAMESPACE = os.environ['HAIL_DEFAULT_NAMESPACE']
 log = logging.getLogger(__name__)
 routes = web.RouteTableDef()
 
+RESULT_CHUNK_SIZE = 1024 * 1024
+# chunks of a streamed result read from Java but not yet sent to the client
+MAX_BUFFERED_RESULT_CHUNKS = 8
+
 
 async def add_user(app, userdata):
     username = userdata['username']
@@ -69,6 +75,22 @@ def blocking_execute(userdata, body):
         )
 
 
+def blocking_execute_encoded(userdata, body, put):
+    with connect_to_java() as java:
+        log.info(f'executing {body["token"]}')
+        for chunk in java.execute_encoded(
+            userdata['username'],
+            userdata['session_id'],
+            body['billing_project'],
+            body['bucket'],
+            body['code'],
+            body['token'],
+            body['buffer_spec'],
+            RESULT_CHUNK_SIZE,
+        ):
+            put(chunk)
+
+
 def blocking_load_references_from_dataset(userdata, body):
     with connect_to_java() as java:
         return java.load_references_from_dataset(
@@ -101,19 +123,35 @@ def blocking_get_reference(userdata, body):  # pylint: disable=unused-argument
         return java.reference_genome(userdata['username'], body['name'])
 
 
-async def handle_ws_response(request, userdata, endpoint, f):
+async def start_query(request, userdata, f, body) -> asyncio.Future:
     app = request.app
-    user_queries: Dict[str, asyncio.Future] = request.app['queries'][userdata['username']]
-
-    ws = web.WebSocketResponse(heartbeat=30, max_msg_size=0)
-    await ws.prepare(request)
-    body = await ws.receive_json()
+    user_queries: Dict[str, asyncio.Future] = app['queries'][userdata['username']]
 
     query = user_queries.get(body['token'])
     if query is None:
         await add_user(app, userdata)
         query = asyncio.ensure_future(retry_transient_errors(blocking_to_async, app['thread_pool'], f, userdata, body))
         user_queries[body['token']] = query
+    return query
+
+
+async def send_query_result(ws, query):
+    if query.exception() is not None:
+        exc = query.exception()
+        exc_str = traceback.format_exception(type(exc), exc, exc.__traceback__)
+        await ws.send_json({'status': 500, 'value': exc_str})
+    else:
+        await ws.send_json({'status': 200, 'value': query.result()})
+
+
+async def handle_ws_response(request, userdata, endpoint, f):
+    user_queries: Dict[str, asyncio.Future] = request.app['queries'][userdata['username']]
+
+    ws = web.WebSocketResponse(heartbeat=30, max_msg_size=0)
+    await ws.prepare(request)
+    body = await ws.receive_json()
+
+    query = await start_query(request, userdata, f, body)
 
     try:
         receive = asyncio.ensure_future(
@@ -126,12 +164,7 @@ async def handle_ws_response(request, userdata, endpoint, f):
             raise AssertionError(f'{endpoint}: client broke the protocol by sending: {response}')
         if not query.done():
             return
-        if query.exception() is not None:
-            exc = query.exception()
-            exc_str = traceback.format_exception(type(exc), exc, exc.__traceback__)
-            await ws.send_json({'status': 500, 'value': exc_str})
-        else:
-            await ws.send_json({'status': 200, 'value': query.result()})
+        await send_query_result(ws, query)
         assert (await receive) == 'bye'
         del user_queries[body['token']]
     finally:
@@ -141,6 +174,140 @@ async def handle_ws_response(request, userdata, endpoint, f):
     return ws
 
 
+async def stream_query(request, userdata, ws, receive, f, body) -> bool:
+    # f is called with a function it passes the type of the result, as a
+    # JSON-able header, and then the bytes of the result, in chunks. Chunks
+    # are buffered in a bounded queue, so a slow client slows down reading
+    # from Java rather than the result accumulating in memory.
+    app = request.app
+    loop = asyncio.get_event_loop()
+    chunks: asyncio.Queue = asyncio.Queue(maxsize=MAX_BUFFERED_RESULT_CHUNKS)
+    done = object()
+    abandoned = False
+
+    def put(chunk):
+        if abandoned:
+            raise ConnectionResetError('the client went away')
+        asyncio.run_coroutine_threadsafe(chunks.put(chunk), loop).result()
+
+    async def run():
+        try:
+            await blocking_to_async(app['thread_pool'], f, userdata, body, put)
+        finally:
+            if not abandoned:
+                await chunks.put(done)
+
+    await add_user(app, userdata)
+    query = asyncio.ensure_future(run())
+    try:
+        while True:
+            get = asyncio.ensure_future(chunks.get())
+            await asyncio.wait([get, receive], return_when=asyncio.FIRST_COMPLETED)
+            if not get.done():
+                get.cancel()
+                response = receive.result()
+                if response.type == aiohttp.WSMsgType.TEXT:
+                    # we expect no messages from the client until we respond
+                    raise AssertionError(f'session: client broke the protocol by sending: {response.data}')
+                # the client went away
+                return False
+            chunk = get.result()
+            if chunk is done:
+                break
+            try:
+                if isinstance(chunk, bytes):
+                    await ws.send_bytes(chunk)
+                else:
+                    await ws.send_json({'status': 200, 'value': chunk})
+            except ConnectionResetError:
+                # the client went away
+                return False
+        await asyncio.wait([query])
+        # the result of the query, None if it succeeded, ends the stream
+        await send_query_result(ws, query)
+        return True
+    finally:
+        if not query.done():
+            abandoned = True
+            while not chunks.empty():
+                chunks.get_nowait()
+            query.cancel()
+
+
+SESSION_ENDPOINTS = {
+    'execute': blocking_execute,
+    'load_references_from_dataset': blocking_load_references_from_dataset,
+    'type/value': blocking_value_type,
+    'type/table': blocking_table_type,
+    'type/matrix': blocking_matrix_type,
+    'type/blockmatrix': blocking_blockmatrix_type,
+    'references/get': blocking_get_reference,
+}
+
+# endpoints whose result is sent as a JSON header followed by binary chunks
+# and then the usual JSON response
+STREAMING_SESSION_ENDPOINTS = {
+    'execute/encoded': blocking_execute_encoded,
+}
+
+
+async def handle_ws_session(request, userdata):
+    # Like handle_ws_response, but answers requests one after another on the
+    # same websocket until the client says goodbye or goes away, so that
+    # clients can keep connections open between requests.
+    user_queries: Dict[str, asyncio.Future] = request.app['queries'][userdata['username']]
+
+    ws = web.WebSocketResponse(heartbeat=30, max_msg_size=0)
+    await ws.prepare(request)
+
+    receive = asyncio.ensure_future(ws.receive())
+    query = None
+    try:
+        while True:
+            message = await receive
+            if message.type != aiohttp.WSMsgType.TEXT or message.data == 'bye':
+                break
+            body = json.loads(message.data)
+
+            # receive automatically ping-pongs which keeps the socket alive
+            receive = asyncio.ensure_future(ws.receive())
+
+            endpoint = body['endpoint']
+            if endpoint in STREAMING_SESSION_ENDPOINTS:
+                if not await stream_query(request, userdata, ws, receive, STREAMING_SESSION_ENDPOINTS[endpoint], body):
+                    break
+                continue
+
+            query = await start_query(request, userdata, SESSION_ENDPOINTS[endpoint], body)
+            await asyncio.wait([receive, query], return_when=asyncio.FIRST_COMPLETED)
+            if receive.done():
+                response = receive.result()
+                if response.type == aiohttp.WSMsgType.TEXT:
+                    # we expect no messages from the client until we respond
+                    raise AssertionError(f'session: client broke the protocol by sending: {response.data}')
+                # the client went away
+                break
+            await send_query_result(ws, query)
+            del user_queries[body['token']]
+            query = None
+    finally:
+        receive.cancel()
+        if query is not None:
+            # the client went away or broke the protocol, so the query is
+            # abandoned
+            query.cancel()
+            if user_queries.get(body['token']) is query:
+                del user_queries[body['token']]
+        await ws.close()
+    return ws
+
+
+@routes.get('/api/v1alpha/session')
+@rest_authenticated_users_only
+async def ws_session(request, userdata):
+    return await handle_ws_session(request, userdata)
+
+
 @routes.get('/api/v1alpha/execute')
 @rest_authenticated_users_only
 async def execute(request, userdata):
@@ -29,6 +29,7 @@ class ServiceBackendSocketConnection:
     UNSET_FLAG = 10
     SET_FLAG = 11
     ADD_USER = 12
+    EXECUTE_ENCODE = 13
     GOODBYE = 254
 
     FNAME = '/sock/sock'
@@ -200,6 +201,39 @@ class ServiceBackendSocketConnection:
         jstacktrace = self.read_str()
         raise ValueError(jstacktrace)
 
+    def execute_encoded(self, username: str, session_id: str, billing_project: str, bucket: str, code: str,
+                        token: str, buffer_spec: str, chunk_size: int):
+        """Execute `code`, yielding the type of the result and then the result,
+        encoded according to `buffer_spec`, in chunks of at most `chunk_size`
+        bytes, as they are read from Java."""
+        self.write_int(ServiceBackendSocketConnection.EXECUTE_ENCODE)
+        self.write_str(username)
+        self.write_str(session_id)
+        self.write_str(billing_project)
+        self.write_str(bucket)
+        self.write_str(code)
+        self.write_str(token)
+        self.write_str(buffer_spec)
+        success = self.read_bool()
+        if not success:
+            jstacktrace = self.read_str()
+            raise ValueError(jstacktrace)
+        typ = self.read_str()
+        yield {'type': typ}
+        # Java encodes the result as it is read, in length-prefixed chunks,
+        # ending with an empty chunk, or with -1 and the error
+        while True:
+            left = self.read_int()
+            if left == 0:
+                return
+            if left < 0:
+                jstacktrace = self.read_str()
+                raise ValueError(jstacktrace)
+            while left > 0:
+                chunk = self.read(min(left, chunk_size))
+                left -= len(chunk)
+                yield bytes(chunk)
+
     def flags(self):
         self.write_int(ServiceBackendSocketConnection.FLAGS)
         success = self.read_bool()